@@ -5,8 +5,27 @@ from google.oauth2 import service_account
 from dotenv import load_dotenv
 import logging
 import json
+import threading
+from typing import Iterator
+from collections.abc import Sequence
+import asyncio
+import functools
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from datetime import date, datetime, time
 from google.api_core.exceptions import Forbidden, NotFound, BadRequest
 
+from .job_stats import job_labels, record_job
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow is optional — fall back to the REST/pandas path
+    pa = None
+    pc = None
+
 # טען את קובץ .env מהספרייה הנוכחית של הקובץ הזה
 dotenv_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path)
@@ -21,45 +40,573 @@ if BQ_DATA_FILE_PATH_RAW and not os.path.isabs(BQ_DATA_FILE_PATH_RAW):
 else:
     BQ_DATA_FILE_PATH = BQ_DATA_FILE_PATH_RAW
 
+# Size of the shared HTTP connection pool used by every BigQuery client
+BQ_HTTP_POOL_SIZE = int(os.getenv("BQ_HTTP_POOL_SIZE", "32"))
+
+# Max blocking BigQuery HTTP calls running at once for the async path
+BQ_ASYNC_WORKERS = int(os.getenv("BQ_ASYNC_WORKERS", "16"))
+
+# Job status polling backoff (seconds) for execute_query_async
+BQ_POLL_INITIAL = 0.2
+BQ_POLL_MAX = 2.0
+
+# Result fetch mode: "auto" (Storage Read API for large results), "arrow" (always), "rest" (never)
+BQ_FETCH_MODE = os.getenv("BQ_FETCH_MODE", "auto")
+
+# In "auto" mode, results smaller than this are fetched over REST (cheaper to start)
+BQ_STORAGE_MIN_ROWS = int(os.getenv("BQ_STORAGE_MIN_ROWS", "10000"))
+
+# Paged result consumption: REST page size, and hard caps on what a single result may hold in memory
+BQ_PAGE_SIZE = int(os.getenv("BQ_PAGE_SIZE", "5000"))
+BQ_MAX_RESULT_ROWS = int(os.getenv("BQ_MAX_RESULT_ROWS", "50000"))
+BQ_MAX_RESULT_BYTES = int(os.getenv("BQ_MAX_RESULT_BYTES", str(32 * 1024 ** 2)))
+
+# Hard ceiling for bytes billed per query job (0 = no ceiling). Default: 20 GB
+BQ_MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES_BILLED", str(20 * 1024 ** 3)))
+
+BQ_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+# "bigquery" (default) or "local" — emulated engine with synthetic data (see bq_local.py)
+BQ_BACKEND = os.getenv("BQ_BACKEND", "bigquery")
+
+
+# =========================
+# Shared client registry
+# =========================
+_registry_lock = threading.Lock()
+_creds_cache: dict = {}
+_clients: dict = {}
+_sessions: dict = {}
+_storage_clients: dict = {}
+
+
+def _load_credentials(path: str | None = None):
+    """
+    טוען credentials פעם אחת לכל תהליך ומחזיר (creds, sa_email, sa_project).
+    אם אין קובץ service account — נופלים ל-ADC.
+    """
+    path = path or BQ_DATA_FILE_PATH
+    with _registry_lock:
+        cached = _creds_cache.get(path)
+        if cached is not None:
+            return cached
+
+        if path:
+            with open(path, 'r') as f:
+                info = json.load(f)
+            creds = service_account.Credentials.from_service_account_info(info, scopes=BQ_SCOPES)
+            loaded = (creds, info.get("client_email"), info.get("project_id"))
+        else:
+            import google.auth
+            creds, adc_project = google.auth.default(scopes=BQ_SCOPES)
+            loaded = (creds, getattr(creds, "service_account_email", None), adc_project)
+
+        _creds_cache[path] = loaded
+        logging.info("BQ credentials loaded (sa_email=%s)", loaded[1])
+        return loaded
+
+
+def _build_http_session(creds):
+    """
+    AuthorizedSession מרענן את ה-token אוטומטית (על 401 / לפני תפוגה)
+    ומשתמש ב-connection pool משותף לכל הבקשות.
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(creds)
+    adapter = HTTPAdapter(pool_connections=BQ_HTTP_POOL_SIZE, pool_maxsize=BQ_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_bq_client(project: str = PROJECT_ID, location: str = BQ_LOCATION) -> bigquery.Client:
+    """
+    מחזיר bigquery.Client משותף לתהליך (אחד לכל project+location).
+    נוצר בעצלות, thread-safe, עם credentials ו-HTTP session משותפים.
+    """
+    key = (project, location)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    if BQ_BACKEND == "local":
+        from .bq_local import get_local_client
+        client = get_local_client()
+        with _registry_lock:
+            _clients[key] = client
+        return client
+
+    creds, sa_email, sa_project = _load_credentials()
+
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+        session = _sessions.get(id(creds))
+        if session is None:
+            session = _build_http_session(creds)
+            _sessions[id(creds)] = session
+
+        client = bigquery.Client(
+            project=project or sa_project,
+            location=location,
+            credentials=creds,
+            _http=session,
+        )
+        _clients[key] = client
+        logging.info("BQ shared client created project=%s location=%s sa_email=%s",
+                     project, location, sa_email)
+        return client
+
+
+def get_bqstorage_client():
+    """
+    BigQueryReadClient משותף (Storage Read API).
+    מחזיר None אם google-cloud-bigquery-storage / pyarrow לא מותקנים.
+    """
+    if pa is None or BQ_BACKEND == "local":
+        return None
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+
+    creds, _, _ = _load_credentials()
+    with _registry_lock:
+        client = _storage_clients.get(id(creds))
+        if client is None:
+            client = bigquery_storage.BigQueryReadClient(credentials=creds)
+            _storage_clients[id(creds)] = client
+            logging.info("BQ storage read client created")
+        return client
+
+
+def pool_stats() -> dict:
+    """כמה clients וכמה חיבורי HTTP חיים כרגע ב-registry."""
+    with _registry_lock:
+        connections = 0
+        idle = 0
+        for session in _sessions.values():
+            for adapter in session.adapters.values():
+                pool_manager = getattr(adapter, "poolmanager", None)
+                if pool_manager is None:
+                    continue
+                for pool_key in list(pool_manager.pools.keys()):
+                    pool = pool_manager.pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    connections += getattr(pool, "num_connections", 0)
+                    idle += pool.pool.qsize() if getattr(pool, "pool", None) else 0
+
+        return {
+            "clients": len(_clients),
+            "storage_clients": len(_storage_clients),
+            "http_sessions": len(_sessions),
+            "connections_opened": connections,
+            "connections_idle": idle,
+            "pool_size": BQ_HTTP_POOL_SIZE,
+        }
+
+
+# =========================
+# Async helpers
+# =========================
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BQ_ASYNC_WORKERS, thread_name_prefix="bq")
+    return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    מריץ קריאת BigQuery חוסמת ב-executor חסום בגודלו (BQ_ASYNC_WORKERS),
+    כך שה-event loop של FastAPI לא נתקע.
+    """
+    loop = asyncio.get_running_loop()
+    # carry context vars (e.g. the session used for job labels) into the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+# =========================
+# Cancellation metrics
+# =========================
+_cancel_lock = threading.Lock()
+_cancel_stats = {"jobs_cancelled": 0, "cancel_failures": 0, "bytes_saved_estimate": 0}
+
+
+def cancellation_stats() -> dict:
+    with _cancel_lock:
+        return dict(_cancel_stats)
+
+
+def reset_bq_clients():
+    """סוגר את כל ה-clients וה-sessions (לבדיקות / shutdown)."""
+    with _registry_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                logging.exception("Failed closing BQ client")
+        for session in _sessions.values():
+            try:
+                session.close()
+            except Exception:
+                logging.exception("Failed closing BQ http session")
+        _clients.clear()
+        _sessions.clear()
+        _storage_clients.clear()
+        _creds_cache.clear()
+
+    if BQ_BACKEND == "local":
+        from .bq_local import reset_local_client
+        reset_local_client()
+
+
+# =========================
+# Result conversion
+# =========================
+def _json_safe_value(v):
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def json_safe_records(records: list[dict]) -> list[dict]:
+    """Fallback (REST/pandas): ממיר date/datetime/Decimal לערכים שניתנים ל-JSON, ערך-ערך."""
+    return [{k: _json_safe_value(v) for k, v in row.items()} for row in records]
+
+
+class TruncatedRows(list):
+    """rows של collect_records שנעצרו בתקרת BQ_MAX_RESULT_ROWS / BQ_MAX_RESULT_BYTES — תוצאה חלקית."""
+
+
+def arrow_to_records(table) -> list[dict]:
+    """
+    ממיר pyarrow.Table לרשימת dicts שכבר בטוחה ל-JSON.
+    ההמרה נעשית עמודה-עמודה (וקטורית), רק עמודות זמן/Decimal עוברות טיפול נוסף.
+    """
+    names = table.column_names
+    if not names:
+        return []
+
+    columns = []
+    for col in table.columns:
+        t = col.type
+        if pa.types.is_date(t):
+            columns.append(pc.cast(col, pa.string()).to_pylist())
+        elif pa.types.is_timestamp(t) or pa.types.is_time(t):
+            columns.append([v.isoformat() if v is not None else None for v in col.to_pylist()])
+        elif pa.types.is_decimal(t):
+            columns.append(pc.cast(col, pa.float64()).to_pylist())
+        else:
+            columns.append(col.to_pylist())
+
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+class ArrowRows(Sequence):
+    """
+    תוצאה עמודתית (pyarrow.Table) שמתנהגת כמו list[dict] לקריאה.
+    ה-cache (כולל שכבת הזיכרון) וה-codec עובדים על ה-Table עצמו; dicts (בטוחים ל-JSON, ראו arrow_to_records)
+    נבנים רק בגישה לשורות — בגבול ה-JSON / markdown — ולא נשמרים באובייקט.
+    truncated — נעצרה בתקרת BQ_MAX_RESULT_ROWS / BQ_MAX_RESULT_BYTES (כמו TruncatedRows).
+    """
+
+    def __init__(self, table, truncated: bool = False):
+        self.table = table
+        self.truncated = truncated
+
+    def records(self) -> list[dict]:
+        return arrow_to_records(self.table)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, index):
+        # only the requested rows are converted (e.g. the markdown preview)
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return self.records()[index]
+            start, stop, _ = index.indices(len(self))
+            return arrow_to_records(self.table.slice(start, max(stop - start, 0)))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ArrowRows index out of range")
+        return arrow_to_records(self.table.slice(index, 1))[0]
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ArrowRows)):
+            return self.records() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ArrowRows(rows={len(self)}, columns={self.table.column_names}, truncated={self.truncated})"
+
+
+def is_truncated(rows) -> bool:
+    return isinstance(rows, TruncatedRows) or (isinstance(rows, ArrowRows) and rows.truncated)
+
+
+def as_records(rows) -> list[dict]:
+    """rows כרשימת dicts (לגבול ה-JSON): ArrowRows מומרות כאן, list נשארת כמו שהיא."""
+    return rows.records() if isinstance(rows, ArrowRows) else rows
+
 
 class BQClient:
-    def __init__(self):
+    def __init__(self, project: str = PROJECT_ID, location: str = BQ_LOCATION):
         self.path_of_bq_data_user = BQ_DATA_FILE_PATH
         self.creds, self.sa_email, self.sa_project = self._load_bq_creds()
-        self.project_id = PROJECT_ID or self.sa_project
-        self.bq_client = bigquery.Client(
-            location=BQ_LOCATION,
-            project=self.project_id,
-            credentials=self.creds
-        )
-        logging.info("BQ client project=%s location=%s sa_email=%s",
-                     self.project_id, BQ_LOCATION, self.sa_email)
+        self.project_id = project or self.sa_project
+        self.bq_client = get_bq_client(self.project_id, location)
+        logging.debug("BQ client project=%s location=%s sa_email=%s",
+                      self.project_id, location, self.sa_email)
+
+    def _job_config(self, maximum_bytes_billed: int | None = None, query_type: str | None = None):
+        limit = BQ_MAX_BYTES_BILLED if maximum_bytes_billed is None else maximum_bytes_billed
+        config = bigquery.QueryJobConfig(labels=job_labels(query_type) if query_type else {})
+        if limit:
+            config.maximum_bytes_billed = limit
+        return config
+
+    def dry_run(self, query) -> int:
+        """מריץ dry run (חינמי) ומחזיר כמה bytes השאילתה תסרוק."""
+        config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        try:
+            job = self.bq_client.query(query, job_config=config)
+        except (Forbidden, BadRequest, NotFound) as e:
+            raise self._translate_error(e) from e
+        return int(job.total_bytes_processed or 0)
 
-    def execute_query(self, query, query_type):
+    def execute_query(self, query, query_type, maximum_bytes_billed: int | None = None):
         logging.info('*********** QUERY %s START ***********', query_type)
         logging.info(query)
+        job = None
         try:
-            job = self.bq_client.query(query)
-            result = job.result()  # RowIterator
+            job = self.bq_client.query(query, job_config=self._job_config(maximum_bytes_billed, query_type))
+            result = job.result(page_size=BQ_PAGE_SIZE)  # RowIterator
+            record_job(job, query_type, query)
             logging.info('*********** QUERY %s DONE ***********', query_type)
             return result
-        except Forbidden as e:
-            raise PermissionError(
+        except (Forbidden, BadRequest, NotFound) as e:
+            record_job(job, query_type, query, error=e)
+            raise self._translate_error(e) from e
+
+    async def execute_query_async(
+        self,
+        query,
+        query_type,
+        maximum_bytes_billed: int | None = None,
+        estimated_bytes: int | None = None,
+    ):
+        """
+        גרסה לא-חוסמת של execute_query:
+        שולחת את ה-job, ואז בודקת סטטוס עם backoff ב-asyncio.sleep
+        (thread מה-executor תפוס רק לזמן קריאת ה-HTTP הקצרה, לא לכל זמן הריצה).
+        אם ה-task מבוטל (ניתוק לקוח / deadline) — ה-job מבוטל גם ב-BigQuery;
+        estimated_bytes (מה-dry run) משמש להערכת ה-bytes שנחסכו.
+        """
+        logging.info('*********** QUERY %s START (async) ***********', query_type)
+        logging.info(query)
+        # job_id is chosen up-front so the job can be cancelled even before query() returns
+        job_id = f"{query_type}_{uuid.uuid4().hex}"
+        job = None
+        try:
+            job = await run_blocking(
+                self.bq_client.query, query,
+                job_config=self._job_config(maximum_bytes_billed, query_type), job_id=job_id,
+            )
+
+            interval = BQ_POLL_INITIAL
+            while not await run_blocking(job.done):
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, BQ_POLL_MAX)
+
+            result = await run_blocking(job.result, page_size=BQ_PAGE_SIZE)  # RowIterator
+            record_job(job, query_type, query)
+            logging.info('*********** QUERY %s DONE (async) ***********', query_type)
+            return result
+        except asyncio.CancelledError:
+            # client disconnected / deadline: stop the job in BigQuery too (fire-and-forget)
+            logging.warning('*********** QUERY %s CANCELLED (job_id=%s) ***********', query_type, job_id)
+            _get_executor().submit(self._cancel_job, job_id, estimated_bytes)
+            raise
+        except (Forbidden, BadRequest, NotFound) as e:
+            record_job(job, query_type, query, error=e)
+            raise self._translate_error(e) from e
+
+    def _cancel_job(self, job_id: str, estimated_bytes: int | None = None):
+        try:
+            job = self.bq_client.cancel_job(job_id)
+        except Exception as e:
+            logging.warning("BQ cancel failed job_id=%s: %s", job_id, e)
+            with _cancel_lock:
+                _cancel_stats["cancel_failures"] += 1
+            return
+
+        processed = int(getattr(job, "total_bytes_processed", None) or 0)
+        saved = max(int(estimated_bytes or 0) - processed, 0)
+        with _cancel_lock:
+            _cancel_stats["jobs_cancelled"] += 1
+            _cancel_stats["bytes_saved_estimate"] += saved
+        logging.info("BQ job cancelled job_id=%s bytes_saved~%s", job_id, saved)
+
+    def fetch_arrow(self, row_iterator, mode: str | None = None):
+        """
+        מחזיר pyarrow.Table מה-RowIterator.
+        - "arrow": תמיד דרך Storage Read API
+        - "auto": Storage Read API רק כשיש לפחות BQ_STORAGE_MIN_ROWS שורות, אחרת REST
+        """
+        mode = mode or BQ_FETCH_MODE
+        total_rows = getattr(row_iterator, "total_rows", None) or 0
+        use_storage = mode == "arrow" or (mode == "auto" and total_rows >= BQ_STORAGE_MIN_ROWS)
+
+        storage_client = get_bqstorage_client() if use_storage else None
+        logging.info("BQ fetch: rows=%s via=%s", total_rows, "storage_api" if storage_client else "rest")
+        return row_iterator.to_arrow(
+            bqstorage_client=storage_client,
+            create_bqstorage_client=False,
+        )
+
+    def fetch_records(self, row_iterator, mode: str | None = None) -> list[dict]:
+        """
+        מחזיר את התוצאה כרשימת dicts בטוחה ל-JSON.
+        אם pyarrow לא זמין או mode="rest" — נופל ל-to_dataframe() הישן.
+        (נתיב השאילתות של ה-API עובר ב-collect_records, שמשאיר את התוצאה עמודתית.)
+        """
+        mode = mode or BQ_FETCH_MODE
+        if pa is None or mode == "rest":
+            df = row_iterator.to_dataframe(create_bqstorage_client=False)
+            return json_safe_records(df.to_dict(orient='records'))
+
+        return arrow_to_records(self.fetch_arrow(row_iterator, mode))
+
+    def iter_record_pages(self, row_iterator, mode: str | None = None) -> Iterator[tuple[list[dict], int]]:
+        """
+        Generator על דפי התוצאה: מחזיר (rows בטוחות ל-JSON, גודל משוער ב-bytes) לכל דף.
+        דפים נמשכים מ-BigQuery רק כשהצרכן מבקש אותם.
+        """
+        mode = mode or BQ_FETCH_MODE
+
+        if pa is None or mode == "rest":
+            for page in row_iterator.pages:
+                rows = json_safe_records([dict(row.items()) for row in page])
+                # estimate from one serialized row instead of serializing the whole page
+                approx = len(json.dumps(rows[0], default=str)) * len(rows) if rows else 0
+                yield rows, approx
+            return
+
+        for batch in self._arrow_batches(row_iterator, mode):
+            yield arrow_to_records(pa.Table.from_batches([batch])), batch.nbytes
+
+    def _arrow_batches(self, row_iterator, mode: str):
+        total_rows = getattr(row_iterator, "total_rows", None) or 0
+        use_storage = mode == "arrow" or (mode == "auto" and total_rows >= BQ_STORAGE_MIN_ROWS)
+        storage_client = get_bqstorage_client() if use_storage else None
+        return row_iterator.to_arrow_iterable(bqstorage_client=storage_client)
+
+    def collect_records(
+        self,
+        row_iterator,
+        max_rows: int | None = None,
+        max_bytes: int | None = None,
+        mode: str | None = None,
+    ) -> tuple[list[dict], bool]:
+        """
+        צורך דפים עד תקרת שורות / bytes ועוצר (לא מושך את שאר הדפים).
+        מחזיר (rows, truncated). עם pyarrow (mode != "rest") rows הן ArrowRows — התוצאה נשארת עמודתית
+        דרך ה-cache וה-codec; אחרת list[dict], ו-rows חלקיות הן TruncatedRows (כך שה-cache שומר אותן כחלקיות).
+        """
+        max_rows = BQ_MAX_RESULT_ROWS if max_rows is None else max_rows
+        max_bytes = BQ_MAX_RESULT_BYTES if max_bytes is None else max_bytes
+        mode = mode or BQ_FETCH_MODE
+        if pa is not None and mode != "rest":
+            return self._collect_arrow(row_iterator, max_rows, max_bytes, mode)
+
+        rows: list[dict] = []
+        consumed_bytes = 0
+        for page_rows, page_bytes in self.iter_record_pages(row_iterator, mode):
+            room = max_rows - len(rows)
+            if len(page_rows) > room:
+                rows.extend(page_rows[:room])
+                logging.warning("BQ result truncated at %s rows", max_rows)
+                return TruncatedRows(rows), True
+
+            rows.extend(page_rows)
+            consumed_bytes += page_bytes
+            if consumed_bytes > max_bytes:
+                logging.warning("BQ result truncated at ~%s bytes (%s rows)", consumed_bytes, len(rows))
+                return TruncatedRows(rows), True
+
+        return rows, False
+
+    def _collect_arrow(self, row_iterator, max_rows: int, max_bytes: int, mode: str) -> tuple[list[dict], bool]:
+        batches = []
+        row_count = consumed_bytes = 0
+        truncated = False
+        for batch in self._arrow_batches(row_iterator, mode):
+            room = max_rows - row_count
+            if batch.num_rows > room:
+                batches.append(batch.slice(0, room))
+                logging.warning("BQ result truncated at %s rows", max_rows)
+                truncated = True
+                break
+
+            batches.append(batch)
+            row_count += batch.num_rows
+            consumed_bytes += batch.nbytes
+            if consumed_bytes > max_bytes:
+                logging.warning("BQ result truncated at ~%s bytes (%s rows)", consumed_bytes, row_count)
+                truncated = True
+                break
+
+        if not batches:
+            return [], False
+        try:
+            table = pa.Table.from_batches(batches)
+        except pa.ArrowInvalid:
+            # pages typed separately (e.g. a column that is all NULL in one page): unify the schemas
+            table = pa.concat_tables([pa.Table.from_batches([b]) for b in batches], promote_options="default")
+        return ArrowRows(table, truncated), truncated
+
+    def fetch_dataframe(self, row_iterator, mode: str | None = None):
+        """כמו fetch_records אבל מחזיר DataFrame (ל-AnomalyAgent וסקריפטים)."""
+        mode = mode or BQ_FETCH_MODE
+        if pa is None or mode == "rest":
+            return row_iterator.to_dataframe(create_bqstorage_client=False)
+        return self.fetch_arrow(row_iterator, mode).to_pandas()
+
+    def _translate_error(self, e):
+        if isinstance(e, Forbidden):
+            return PermissionError(
                 f"BigQuery permission error for service account '{self.sa_email}' "
                 f"on project '{self.project_id}'. "
                 f"Ask an admin to grant at least roles/bigquery.jobUser (and dataViewer) "
                 f"on project {self.project_id}. Original error: {e}"
-            ) from e
-        except (BadRequest, NotFound) as e:
-            raise RuntimeError(f"BigQuery query failed: {e}") from e
+            )
+        return RuntimeError(f"BigQuery query failed: {e}")
 
     def _load_bq_creds(self):
-        with open(self.path_of_bq_data_user, 'r') as f:
-            info = json.load(f)
-        creds = service_account.Credentials.from_service_account_info(info)
-        sa_email = info.get("client_email")
-        sa_project = info.get("project_id")
-        return creds, sa_email, sa_project
+        if BQ_BACKEND == "local":
+            return None, "local-emulator", PROJECT_ID
+        return _load_credentials(self.path_of_bq_data_user)
 
 
 if __name__ == '__main__':
@@ -73,5 +620,6 @@ if __name__ == '__main__':
     FROM `practicode-2025.clicks_data_prac.partial_encoded_clicks`
     LIMIT 10
     """
-    df = bq_client.execute_query(qu, 'test_query').to_dataframe()  # add create_bqstorage_client=True later
-    print(df)
\ No newline at end of file
+    df = bq_client.fetch_dataframe(bq_client.execute_query(qu, "test_query"))
+    print(df)
+    print(pool_stats())
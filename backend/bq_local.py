@@ -0,0 +1,599 @@
+"""
+Local emulated BigQuery backend (BQ_BACKEND=local).
+
+מחליף את bigquery.Client מאחורי get_bq_client: אותו SQL (דיאלקט BigQuery) מתורגם עם sqlglot
+ורץ על SQLite בזיכרון, עם נתונים סינתטיים של partial_encoded_clicks_part ו-hourly_clicks_by_*.
+מיועד ל-benchmarks ולבדיקות בלי רשת — לא לתוצאות אמיתיות.
+"""
+import os
+import re
+import math
+import time
+import random
+import sqlite3
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+from google.api_core.exceptions import BadRequest, NotFound
+from google.cloud import bigquery
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # the local backend needs sqlglot to translate BigQuery SQL
+    sqlglot = None
+    exp = None
+
+logger = logging.getLogger(__name__)
+
+# Synthetic data size / shape
+BQ_LOCAL_ROWS = int(os.getenv("BQ_LOCAL_ROWS", "100000"))
+BQ_LOCAL_DAYS = int(os.getenv("BQ_LOCAL_DAYS", "3"))
+BQ_LOCAL_START_DATE = os.getenv("BQ_LOCAL_START_DATE", "2025-10-24")
+BQ_LOCAL_SEED = int(os.getenv("BQ_LOCAL_SEED", "42"))
+
+# Injected latency per job (every query, DML and dry run), to mimic BigQuery round trips
+BQ_LOCAL_LATENCY_MS = float(os.getenv("BQ_LOCAL_LATENCY_MS", "0"))
+BQ_LOCAL_JITTER_MS = float(os.getenv("BQ_LOCAL_JITTER_MS", "0"))
+
+# Dry-run estimate: bytes per referenced column per scanned row
+BYTES_PER_VALUE = 8
+
+# Jobs kept for cancel_job lookups
+MAX_TRACKED_JOBS = 1000
+
+RAW_TABLE = "clicks_data_prac__partial_encoded_clicks_part"
+
+SCHEMAS = {
+    RAW_TABLE: [
+        ("event_time", "BQTIMESTAMP"), ("hr", "INTEGER"), ("is_engaged_view", "BOOLEAN"),
+        ("is_retargeting", "BOOLEAN"), ("media_source", "TEXT"), ("partner", "TEXT"),
+        ("app_id", "TEXT"), ("site_id", "TEXT"), ("engagement_type", "TEXT"), ("total_events", "INTEGER"),
+    ],
+    "clicks_data_prac__hourly_clicks_by_app": [
+        ("event_date", "BQDATE"), ("hr", "INTEGER"), ("app_id", "TEXT"), ("total_events", "INTEGER"),
+    ],
+    "clicks_data_prac__hourly_clicks_by_media_source": [
+        ("event_date", "BQDATE"), ("hr", "INTEGER"), ("media_source", "TEXT"), ("total_events", "INTEGER"),
+    ],
+    "clicks_data_prac__hourly_clicks_by_site": [
+        ("event_date", "BQDATE"), ("hr", "INTEGER"), ("site_id", "TEXT"), ("total_events", "INTEGER"),
+    ],
+    "cache__cached_queries": [
+        ("key_hash", "TEXT"), ("key_bucket", "INTEGER"), ("intent_key", "TEXT"), ("sql", "TEXT"), ("result", "TEXT"),
+        ("last_updated", "BQTIMESTAMP"), ("use_count", "INTEGER"),
+    ],
+    "cache__cache_events": [
+        ("intent_key", "TEXT"), ("sql", "TEXT"), ("event_type", "TEXT"), ("result", "TEXT"),
+        ("result_time", "BQTIMESTAMP"), ("event_time", "BQTIMESTAMP"),
+        ("key_hash", "TEXT"), ("key_bucket", "INTEGER"),
+    ],
+}
+
+AGG_SOURCES = {
+    "clicks_data_prac__hourly_clicks_by_app": "app_id",
+    "clicks_data_prac__hourly_clicks_by_media_source": "media_source",
+    "clicks_data_prac__hourly_clicks_by_site": "site_id",
+}
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# SQLite column type -> BigQuery type (get_table)
+_BQ_TYPES = {"BQTIMESTAMP": "TIMESTAMP", "BQDATE": "DATE", "INTEGER": "INT64", "BOOLEAN": "BOOL", "REAL": "FLOAT64"}
+
+
+# =========================
+# SQLite types / functions
+# =========================
+def _parse_ts(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _format_ts(value) -> str | None:
+    parsed = _parse_ts(value)
+    return parsed.astimezone(timezone.utc).strftime(_TS_FORMAT) if parsed else None
+
+
+sqlite3.register_converter("BQTIMESTAMP", _parse_ts)
+sqlite3.register_converter("BQDATE", lambda v: date.fromisoformat(v.decode()))
+sqlite3.register_converter("BOOLEAN", lambda v: v not in (b"0", b""))
+
+
+class _StdDev:
+    def __init__(self, population: bool):
+        self.population = population
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(float(value))
+
+    def finalize(self):
+        n = len(self.values)
+        if n == 0 or (n == 1 and not self.population):
+            return None
+        mean = sum(self.values) / n
+        squares = sum((v - mean) ** 2 for v in self.values)
+        return math.sqrt(squares / (n if self.population else n - 1))
+
+
+class _StdDevSamp(_StdDev):
+    def __init__(self):
+        super().__init__(population=False)
+
+
+class _StdDevPop(_StdDev):
+    def __init__(self):
+        super().__init__(population=True)
+
+
+def _regexp_extract(value, pattern, group=1):
+    if value is None:
+        return None
+    m = re.search(pattern, value)
+    if not m:
+        return None
+    return m.group(group) if m.groups() else m.group(0)
+
+
+def _register_functions(conn):
+    conn.create_function("TIMESTAMP", 1, _format_ts, deterministic=True)
+    conn.create_function("REGEXP_EXTRACT", 2, _regexp_extract, deterministic=True)
+    conn.create_function("REGEXP_EXTRACT", 3, _regexp_extract, deterministic=True)
+    conn.create_aggregate("STDDEV", 1, _StdDevSamp)
+    conn.create_aggregate("STDDEV_SAMP", 1, _StdDevSamp)
+    conn.create_aggregate("STDDEV_POP", 1, _StdDevPop)
+
+
+# =========================
+# Synthetic data
+# =========================
+def _generate_raw_rows(n: int, days: int, start: date, seed: int):
+    rnd = random.Random(seed)
+    start_ts = datetime.combine(start, datetime.min.time())
+    span_seconds = days * 24 * 3600
+    for _ in range(n):
+        ts = start_ts + timedelta(seconds=rnd.randrange(span_seconds))
+        # a few hot media sources / apps, a long tail of cold ones
+        media = int(rnd.paretovariate(1.2)) % 200
+        yield (
+            ts.strftime(_TS_FORMAT),
+            ts.hour,
+            int(rnd.random() < 0.1),
+            int(rnd.random() < 0.2),
+            f"media_source_{media}",
+            f"partner_{rnd.randrange(20)}",
+            f"app_{int(rnd.paretovariate(1.1)) % 500}",
+            f"site_{rnd.randrange(1000)}",
+            rnd.choice(("click", "impression", "view")),
+            rnd.randint(1, 50),
+        )
+
+
+def _create_tables(conn):
+    for table, columns in SCHEMAS.items():
+        cols = ", ".join(f"{name} {type_}" for name, type_ in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+
+    # last_modified_time bookkeeping: per table, optionally overridden per partition (mark_modified)
+    conn.execute("CREATE TABLE IF NOT EXISTS _table_modified (table_name TEXT PRIMARY KEY, last_modified_time TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS _partition_modified "
+        "(table_name TEXT, partition_id TEXT, last_modified_time TEXT, PRIMARY KEY (table_name, partition_id))"
+    )
+
+    # INFORMATION_SCHEMA.PARTITIONS of clicks_data_prac (day partitions on event_time / event_date)
+    partitions = " UNION ALL ".join(
+        f"SELECT '{table.split('__', 1)[1]}' AS table_name, strftime('%Y%m%d', {column}) AS partition_id, "
+        f"COUNT(*) AS total_rows FROM {table} GROUP BY partition_id"
+        for table, column in [(RAW_TABLE, "event_time")] + [(t, "event_date") for t in AGG_SOURCES]
+    )
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS clicks_data_prac__information_schema__partitions AS
+        SELECT p.table_name, p.partition_id, p.total_rows,
+               COALESCE(pm.last_modified_time, tm.last_modified_time) AS last_modified_time
+        FROM ({partitions}) p
+        LEFT JOIN _table_modified tm ON tm.table_name = p.table_name
+        LEFT JOIN _partition_modified pm ON pm.table_name = p.table_name AND pm.partition_id = p.partition_id
+    """)
+
+
+def _load_synthetic_data(conn, rows: int, days: int, start: date, seed: int):
+    placeholders = ", ".join("?" for _ in SCHEMAS[RAW_TABLE])
+    conn.executemany(
+        f"INSERT INTO {RAW_TABLE} VALUES ({placeholders})",
+        _generate_raw_rows(rows, days, start, seed),
+    )
+    for table, identifier in AGG_SOURCES.items():
+        conn.execute(f"""
+            INSERT INTO {table}
+            SELECT DATE(event_time), hr, {identifier}, SUM(total_events)
+            FROM {RAW_TABLE}
+            GROUP BY DATE(event_time), hr, {identifier}
+        """)
+    conn.commit()
+
+
+# =========================
+# Results
+# =========================
+class LocalRowIterator:
+    """חלק מה-API של google.cloud.bigquery.table.RowIterator שהקוד שלנו משתמש בו."""
+
+    def __init__(self, rows: list[dict], columns: list[str], page_size: int | None = None):
+        self._rows = rows
+        self._columns = columns
+        self._page_size = page_size or max(len(rows), 1)
+        self.total_rows = len(rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    @property
+    def pages(self):
+        for i in range(0, len(self._rows), self._page_size):
+            yield self._rows[i:i + self._page_size]
+
+    def to_dataframe(self, **_):
+        import pandas as pd
+        return pd.DataFrame(self._rows, columns=self._columns)
+
+    def _arrow(self, rows):
+        import pyarrow as pa
+        if not rows:
+            return pa.table({c: pa.array([], pa.null()) for c in self._columns})
+        return pa.Table.from_pylist(rows)
+
+    def to_arrow(self, **_):
+        return self._arrow(self._rows)
+
+    def to_arrow_iterable(self, **_):
+        for page in self.pages:
+            yield from self._arrow(page).to_batches()
+
+
+class LocalQueryJob:
+    """
+    job מדומה: ה-SQL רץ כשה-latency המוזרק חלף (done() / result()),
+    כך ש-polling, ביטול והרצות מקבילות מתנהגים כמו מול BigQuery.
+    """
+
+    def __init__(self, client, query: str, job_config=None, job_id: str | None = None):
+        self._client = client
+        self._config = job_config
+        self.query = query
+        self.job_id = job_id or f"local_{uuid.uuid4().hex}"
+        self.labels = dict(getattr(job_config, "labels", None) or {})
+        self.created = datetime.now(timezone.utc)
+        self.started = None
+        self.ended = None
+        self.state = "PENDING"
+        self.cache_hit = False
+        self.total_bytes_processed = 0
+        self.total_bytes_billed = 0
+        self.slot_millis = 0
+        self.num_dml_affected_rows = None
+        self._latency = client.next_latency()
+        self._ready_at = time.monotonic() + self._latency
+        self._result = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        with self._lock:
+            if self.state == "DONE":
+                return
+            self.started = datetime.now(timezone.utc)
+            try:
+                self._result, self.total_bytes_processed, self.num_dml_affected_rows = self._client.execute(
+                    self.query, self._config
+                )
+            except Exception as e:
+                self._error = e
+            self.ended = datetime.now(timezone.utc)
+            self.total_bytes_billed = self.total_bytes_processed
+            self.slot_millis = int((self.ended - self.started).total_seconds() * 1000)
+            self.state = "DONE"
+
+    def done(self, *_, **__) -> bool:
+        if self.state == "DONE":
+            return True
+        if time.monotonic() < self._ready_at:
+            return False
+        self._run()
+        return True
+
+    def result(self, page_size: int | None = None, **_):
+        remaining = self._ready_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        self._run()
+        if self._error is not None:
+            raise self._error
+        rows, columns = self._result
+        return LocalRowIterator(rows, columns, page_size)
+
+    def __iter__(self):
+        return iter(self.result())
+
+    def cancel(self):
+        with self._lock:
+            if self.state != "DONE":
+                self.state = "DONE"
+                self._error = BadRequest(f"Job {self.job_id} was cancelled")
+                self._result = ([], [])
+        return True
+
+
+# =========================
+# Client
+# =========================
+class LocalBigQueryClient:
+    """מחליף את bigquery.Client: query / cancel_job / close מול SQLite בזיכרון."""
+
+    def __init__(
+        self,
+        rows: int = BQ_LOCAL_ROWS,
+        days: int = BQ_LOCAL_DAYS,
+        start_date: str = BQ_LOCAL_START_DATE,
+        latency_ms: float = BQ_LOCAL_LATENCY_MS,
+        jitter_ms: float = BQ_LOCAL_JITTER_MS,
+        seed: int = BQ_LOCAL_SEED,
+    ):
+        if sqlglot is None:
+            raise ImportError("BQ_BACKEND=local requires sqlglot (pip install sqlglot)")
+
+        self.project = "practicode-2025"
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict = OrderedDict()
+
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        _register_functions(self._conn)
+        _create_tables(self._conn)
+
+        started = time.perf_counter()
+        _load_synthetic_data(self._conn, rows, days, date.fromisoformat(start_date), seed)
+        logger.info("BQ local backend ready: %s raw rows over %s days (%.2fs)",
+                    rows, days, time.perf_counter() - started)
+
+        self._row_counts = {
+            table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in SCHEMAS
+        }
+        for table in SCHEMAS:
+            self.mark_modified(table)
+
+    def next_latency(self) -> float:
+        jitter = self._rnd.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.latency_ms + jitter, 0.0) / 1000
+
+    # ---- bigquery.Client API ----
+    def query(self, query: str, job_config=None, job_id: str | None = None, **_):
+        job = LocalQueryJob(self, query, job_config, job_id)
+
+        if getattr(job_config, "dry_run", False):
+            time.sleep(job._latency)
+            job.total_bytes_processed = self._estimate_bytes(self._translate(query))
+            job.state = "DONE"
+            return job
+
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+        return job
+
+    def cancel_job(self, job_id: str, **_):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise NotFound(f"Job {job_id} not found")
+        job.cancel()
+        return job
+
+    def get_table(self, table: str, **_):
+        """metadata של טבלה: ה-schema כמו שהיא ב-SQLite (כולל טבלה שבדיקה יצרה מחדש בפריסה אחרת)."""
+        local_name = "__".join(table.split(".")[-2:]).lower()
+        with self._lock:
+            columns = self._conn.execute(f"PRAGMA table_info({local_name})").fetchall()
+        if not columns:
+            raise NotFound(f"Table {table} not found")
+        schema = [bigquery.SchemaField(name, _BQ_TYPES.get(type_, "STRING")) for _, name, type_, *_ in columns]
+        return bigquery.Table(table, schema=schema)
+
+    def insert_rows_json(self, table: str, json_rows: list[dict], **_) -> list:
+        """streaming insert: מחזיר רשימת שגיאות (ריקה בהצלחה), כמו ב-BigQuery."""
+        local_name = "__".join(table.split(".")[-2:]).lower()
+        columns = SCHEMAS.get(local_name)
+        if columns is None:
+            raise NotFound(f"Table {table} not found")
+
+        def value(name, type_, row):
+            v = row.get(name)
+            return _format_ts(v) if type_ == "BQTIMESTAMP" else v
+
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO {local_name} ({', '.join(n for n, _ in columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                [[value(n, t, row) for n, t in columns] for row in json_rows],
+            )
+            self._conn.commit()
+        self.mark_modified(local_name)
+        return []
+
+    def close(self):
+        self._conn.close()
+
+    def mark_modified(self, table: str, partition_id: str | None = None, when: datetime | None = None):
+        """
+        מעדכן last_modified_time (כמו שכתיבה / backfill ב-BigQuery היו עושים).
+        table: שם מקומי (dataset__table) או מלא; partition_id (YYYYMMDD) => רק ה-partition הזה.
+        """
+        local_name = "__".join(table.split(".")[-2:]).lower() if "." in table else table
+        name = local_name.split("__", 1)[-1]
+        ts = _format_ts(when or datetime.now(timezone.utc))
+        with self._lock:
+            if partition_id is None:
+                self._conn.execute("INSERT OR REPLACE INTO _table_modified VALUES (?, ?)", (name, ts))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO _partition_modified VALUES (?, ?, ?)", (name, partition_id, ts))
+            self._conn.commit()
+
+    # ---- execution ----
+    def _translate(self, query: str):
+        """BigQuery SQL -> AST עם שמות הטבלאות המקומיים (dataset__table)."""
+        try:
+            tree = sqlglot.parse_one(query, read="bigquery")
+        except Exception as e:
+            raise BadRequest(f"Syntax error (local backend): {e}") from e
+
+        for table in tree.find_all(exp.Table):
+            parts = [p.name for p in table.parts]
+            if len(parts) < 2:
+                continue  # CTE / alias reference
+            local_name = "__".join(parts[1:] if len(parts) > 2 else parts).replace(".", "__").lower()
+            table.set("catalog", None)
+            table.set("db", None)
+            table.set("this", exp.to_identifier(local_name))
+        return tree
+
+    def _estimate_bytes(self, tree) -> int:
+        referenced = {c.name.lower() for c in tree.find_all(exp.Column)}
+        has_star = any(True for _ in tree.find_all(exp.Star))
+        total = 0
+        for table in tree.find_all(exp.Table):
+            columns = SCHEMAS.get(table.name)
+            if not columns:
+                continue
+            used = len(columns) if has_star else sum(1 for name, _ in columns if name in referenced)
+            total += self._row_counts.get(table.name, 0) * max(used, 1) * BYTES_PER_VALUE
+        return total
+
+    def _params(self, job_config) -> dict:
+        params = {}
+        for p in getattr(job_config, "query_parameters", None) or []:
+            value = p.value
+            if p.type_ == "TIMESTAMP" and value is not None:
+                value = _format_ts(value)
+            params[p.name] = value
+        return params
+
+    def execute(self, query: str, job_config=None):
+        """מריץ את ה-SQL ומחזיר ((rows, columns), bytes_processed, dml_affected_rows)."""
+        tree = self._translate(query)
+        params = self._params(job_config)
+        estimated = self._estimate_bytes(tree)
+
+        try:
+            with self._lock:
+                if isinstance(tree, (exp.Create, exp.Alter)) and tree.find(exp.Table).name in SCHEMAS:
+                    # emulated tables always exist with their current schema (BigQuery DDL options don't translate)
+                    return ([], []), 0, 0
+
+                if isinstance(tree, exp.Merge):
+                    affected = self._merge(tree, params)
+                    self._touch(tree)
+                    return ([], []), estimated, affected
+
+                cursor = self._conn.execute(tree.sql(dialect="sqlite"), params)
+                if cursor.description is None:
+                    self._conn.commit()
+                    self._touch(tree)
+                    return ([], []), estimated, cursor.rowcount
+
+                columns = [d[0] for d in cursor.description]
+                rows = [dict(zip(columns, r)) for r in cursor.fetchall()]
+                return (rows, columns), estimated, None
+        except sqlite3.Error as e:
+            raise BadRequest(f"Query error (local backend): {e}") from e
+
+    def _touch(self, tree):
+        """DML על טבלה => last_modified_time שלה (נקרא כשה-lock כבר תפוס)."""
+        if not isinstance(tree, (exp.Insert, exp.Update, exp.Delete, exp.Merge)):
+            return
+        target = tree.this.find(exp.Table) if not isinstance(tree.this, exp.Table) else tree.this
+        if target is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _table_modified VALUES (?, ?)",
+            (target.name.split("__", 1)[-1], _format_ts(datetime.now(timezone.utc))),
+        )
+        self._conn.commit()
+
+    def _merge(self, merge, params) -> int:
+        """
+        MERGE ... WHEN MATCHED THEN UPDATE / WHEN NOT MATCHED THEN INSERT
+        כ-UPDATE ... FROM + INSERT ... WHERE NOT EXISTS על טבלת מקור זמנית.
+        """
+        target = merge.this
+        target_name = target.name
+        t_alias = target.alias or target_name
+        source = merge.args["using"]
+        s_alias = source.alias or "S"
+        on = merge.args["on"].sql(dialect="sqlite")
+        source_sql = (source.this if isinstance(source, exp.Subquery) else exp.select("*").from_(source)).sql(
+            dialect="sqlite"
+        )
+
+        whens = merge.args["whens"].expressions
+        self._conn.execute("DROP TABLE IF EXISTS temp._merge_source")
+        self._conn.execute(f"CREATE TEMP TABLE _merge_source AS {source_sql}", params)
+
+        affected = 0
+        try:
+            for when in whens:
+                then = when.args["then"]
+                if when.args.get("matched") and isinstance(then, exp.Update):
+                    sets = ", ".join(e.sql(dialect="sqlite") for e in then.expressions)
+                    affected += self._conn.execute(
+                        f"UPDATE {target_name} AS {t_alias} SET {sets} "
+                        f"FROM _merge_source AS {s_alias} WHERE {on}",
+                        params,
+                    ).rowcount
+                elif not when.args.get("matched") and isinstance(then, exp.Insert):
+                    columns = ", ".join(c.sql(dialect="sqlite") for c in then.this.expressions)
+                    values = ", ".join(v.sql(dialect="sqlite") for v in then.expression.expressions)
+                    affected += self._conn.execute(
+                        f"INSERT INTO {target_name} ({columns}) "
+                        f"SELECT {values} FROM _merge_source AS {s_alias} "
+                        f"WHERE NOT EXISTS (SELECT 1 FROM {target_name} AS {t_alias} WHERE {on})",
+                        params,
+                    ).rowcount
+                else:
+                    raise BadRequest(f"MERGE clause not supported by the local backend: {when.sql()}")
+            self._conn.commit()
+        finally:
+            self._conn.execute("DROP TABLE IF EXISTS temp._merge_source")
+        return affected
+
+
+_local_client = None
+_local_lock = threading.Lock()
+
+
+def get_local_client() -> LocalBigQueryClient:
+    """client מקומי יחיד לתהליך (הנתונים הסינתטיים נטענים פעם אחת)."""
+    global _local_client
+    with _local_lock:
+        if _local_client is None:
+            _local_client = LocalBigQueryClient()
+        return _local_client
+
+
+def reset_local_client():
+    global _local_client
+    with _local_lock:
+        if _local_client is not None:
+            _local_client.close()
+        _local_client = None
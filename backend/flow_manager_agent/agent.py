@@ -9,18 +9,23 @@ import time
 
 import pytz
 from google.adk.agents import BaseAgent
-from google.adk.events import Event
+from google.adk.events import Event, EventActions
 from google.genai import types
 
 from .utils.json_utils import clean_json as _clean_json
+from .utils.llm_usage import LLM, record_turn
+from ..job_stats import set_session
 
 # --- Sub Agents ---
 from .sub_agents.intent_analyzer_agent import intent_analyzer_agent, BASE_NLU_SPEC
+from .sub_agents.intent_analyzer_agent.fast_path import INTENT_FAST_PATH, fast_parse
 from .sub_agents.react_visual_agent import react_visual_agent
 from .sub_agents.clarifier_orchestrator_agent import clarifier_agent
 from .sub_agents.protected_query_builder_agent import protected_query_builder_agent
-from .sub_agents.query_executor_agent import query_executor_agent
+from .sub_agents.protected_query_builder_agent.compiler import SQL_COMPILER, compile_query
+from .sub_agents.query_executor_agent import query_executor_agent_async
 from .sub_agents.response_insights_agent import response_insights_agent, INSIGHTS_SPEC
+from .sub_agents.response_insights_agent.templates import INSIGHTS_TEMPLATES, template_insights
 from .sub_agents.human_response_agent import human_response_agent
 
 logger = logging.getLogger(__name__)
@@ -36,6 +41,22 @@ def _text_event(message: str) -> Event:
     )
 
 
+def _user_text(context) -> str:
+    content = getattr(context, "user_content", None)
+    parts = getattr(content, "parts", None) or []
+    return " ".join(p.text for p in parts if getattr(p, "text", None)).strip()
+
+
+def _agent_output_event(agent, output_key: str, value: dict) -> Event:
+    """תוצאה דטרמיניסטית כאילו ה-LLM agent כתב אותה: הסוכנים הבאים קוראים אותה מהשיחה."""
+    text = json.dumps(value, ensure_ascii=False, default=str)
+    return Event(
+        author=agent.name,
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta={output_key: text}),
+    )
+
+
 def _extract_first_yyyy_mm_dd(text: str) -> Optional[str]:
     if not text:
         return None
@@ -82,6 +103,20 @@ def _extract_total_events_from_rows(sql_result: dict) -> Optional[int]:
             return None
 
 
+# The insights LLM only needs a sample of the table, not the whole result
+INSIGHTS_PREVIEW_ROWS = 20
+
+
+def _markdown_preview(markdown: Optional[str], max_rows: int = INSIGHTS_PREVIEW_ROWS) -> Optional[str]:
+    """Header + separator + first max_rows lines of a markdown table."""
+    if not markdown:
+        return markdown
+    lines = markdown.splitlines()
+    if len(lines) <= max_rows + 2:
+        return markdown
+    return "\n".join(lines[: max_rows + 2])
+
+
 def _compute_has_data(sql_result: dict) -> bool:
     """
     True if we have a meaningful numeric result (e.g. total_events not null),
@@ -112,8 +147,20 @@ class RootAgent(BaseAgent):
         super().__init__(name="root_agent")
 
     async def _run_async_impl(self, context) -> AsyncGenerator[Event, None]:
+        # how each stage ran this turn (LLM or deterministic) — see /admin/llm/usage
+        turn: dict = {}
+        try:
+            async for event in self._run_turn(context, turn):
+                yield event
+        finally:
+            record_turn(turn)
+
+    async def _run_turn(self, context, turn: dict) -> AsyncGenerator[Event, None]:
         session_state = context.session.state
 
+        # every BigQuery job issued for this turn is labelled with the session
+        set_session(context.session.id)
+
         # ============================================================
         # STEP 0 — Inject current date into NLU instruction
         # ============================================================
@@ -159,16 +206,29 @@ IMPORTANT OVERRIDE FOR ANOMALY:
         intent_analyzer_agent.instruction = dynamic_date_block + "\n\n" + BASE_NLU_SPEC
 
         # ============================================================
-        # STEP 1 — Intent Analyzer
+        # STEP 1 — Intent Analyzer (deterministic fast path; the LLM only when it isn't confident)
         # ============================================================
-        async for event in intent_analyzer_agent.run_async(context):
-            yield event
+        fast_intent = None
+        # a reply to a clarification question only makes sense with the conversation: the LLM combines them
+        if INTENT_FAST_PATH and not session_state.get("missing_fields"):
+            fast_intent = fast_parse(_user_text(context), today)
+
+        turn["intent"] = "rules" if fast_intent is not None else LLM
+        if fast_intent is not None:
+            logger.info(f"🔴 [RootAgent] intent fast path: {fast_intent.get('status')}")
+            session_state["intent_analysis"] = fast_intent
+            yield _agent_output_event(intent_analyzer_agent, "intent_analysis", fast_intent)
+        else:
+            async for event in intent_analyzer_agent.run_async(context):
+                yield event
 
         intent_analysis = _clean_json(session_state.get("intent_analysis"))
         status = (intent_analysis or {}).get("status")
 
         if status == "not relevant":
             status = "not_relevant"
+        if status != "clarification_needed":
+            session_state["missing_fields"] = []
 
         # ============================================================
         # STEP 1.5 — Hard stop future date (server-side enforcement)
@@ -185,6 +245,7 @@ IMPORTANT OVERRIDE FOR ANOMALY:
         # ============================================================
         if status == "clarification_needed":
             session_state["missing_fields"] = (intent_analysis or {}).get("missing_fields", [])
+            turn["clarifier"] = LLM
             async for event in clarifier_agent.run_async(context):
                 yield event
             return
@@ -204,10 +265,17 @@ IMPORTANT OVERRIDE FOR ANOMALY:
             intent_type = parsed_intent.get("intent")
 
             # ---------------------------
-            # SQL Builder
+            # SQL Builder (deterministic compiler; the LLM only for shapes it doesn't cover)
             # ---------------------------
-            async for event in protected_query_builder_agent.run_async(context):
-                yield event
+            compiled = compile_query(parsed_intent) if SQL_COMPILER else None
+            turn["sql"] = "compiler" if compiled is not None else LLM
+            if compiled is not None:
+                logger.info(f"🔴 [RootAgent] SQL compiled without the builder LLM: {compiled.get('status')}")
+                session_state["built_query"] = compiled
+                yield _agent_output_event(protected_query_builder_agent, "built_query", compiled)
+            else:
+                async for event in protected_query_builder_agent.run_async(context):
+                    yield event
 
             built_query_raw = session_state.get("built_query")
             built_query = self._parse_json_block(built_query_raw)
@@ -217,10 +285,13 @@ IMPORTANT OVERRIDE FOR ANOMALY:
                 return
 
             # ---------------------------
-            # Query Executor (Python function)
+            # Query Executor (Python function, non-blocking)
             # ---------------------------
-            logger.info("🔴 [RootAgent] Calling query_executor_agent with built_query")
-            sql_result = query_executor_agent(built_query)
+            # lets the cache answer roll-ups from a cached finer-grained breakdown
+            built_query["parsed_intent"] = parsed_intent
+
+            logger.info("🔴 [RootAgent] Calling query_executor_agent_async with built_query")
+            sql_result = await query_executor_agent_async(built_query)
             logger.info(f"🔴 [RootAgent] query_executor_agent returned: {json.dumps(sql_result, indent=2)[:900]}")
 
             session_state["execution_result"] = sql_result
@@ -236,7 +307,7 @@ IMPORTANT OVERRIDE FOR ANOMALY:
                 return
 
             # ---------------------------
-            # LLM INSIGHTS (MANDATORY)
+            # INSIGHTS (template for single numbers / no data / future dates, LLM otherwise)
             # Inject payload into the LLM instruction so it CANNOT miss the flags
             # ---------------------------
             requested_date = _extract_first_yyyy_mm_dd(sql_result.get("executed_sql", "") or "")
@@ -257,7 +328,8 @@ IMPORTANT OVERRIDE FOR ANOMALY:
                     "executed_sql": sql_result.get("executed_sql"),
                     # NOTE: we do NOT paste the markdown table in strings in the LLM output,
                     # but giving it here is fine as input. Still, keep it minimal:
-                    "result": sql_result.get("result"),
+                    "result": _markdown_preview(sql_result.get("result")),
+                    "truncated": bool(sql_result.get("truncated")),
                 },
                 "requested_date": requested_date,
                 "is_future_date": is_future_date,
@@ -272,17 +344,28 @@ IMPORTANT OVERRIDE FOR ANOMALY:
                 f"is_future_date={is_future_date} has_data={has_data} total_events={total_events_val}"
             )
 
-            # ✅ THIS is the key fix: put the input JSON inside the agent's instruction
-            response_insights_agent.instruction = (
-                "INSIGHTS_INPUT_JSON:\n"
-                + json.dumps(insights_payload, ensure_ascii=False)
-                + "\n\n"
-                + INSIGHTS_SPEC
+            # single numbers, no data and future dates need no interpretation: answered from a template
+            templated = (
+                template_insights(insights_payload, sql_result.get("rows"), parsed_intent)
+                if INSIGHTS_TEMPLATES else None
             )
-
-            logger.info("🔴 [RootAgent] Running response_insights_agent (LLM)...")
-            async for event in response_insights_agent.run_async(context):
-                yield event
+            turn["insights"] = "template" if templated is not None else LLM
+            if templated is not None:
+                logger.info("🔴 [RootAgent] insights from template (no LLM call)")
+                session_state["insights_result"] = templated
+                yield _agent_output_event(response_insights_agent, "insights_result", templated)
+            else:
+                # ✅ THIS is the key fix: put the input JSON inside the agent's instruction
+                response_insights_agent.instruction = (
+                    "INSIGHTS_INPUT_JSON:\n"
+                    + json.dumps(insights_payload, ensure_ascii=False)
+                    + "\n\n"
+                    + INSIGHTS_SPEC
+                )
+
+                logger.info("🔴 [RootAgent] Running response_insights_agent (LLM)...")
+                async for event in response_insights_agent.run_async(context):
+                    yield event
 
             # ---------------------------
             # Human Response Agent
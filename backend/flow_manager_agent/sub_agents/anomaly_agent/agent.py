@@ -11,6 +11,7 @@ from google.adk.events import Event
 from google.genai import types
 
 from backend.bq import BQClient
+from backend.flow_manager_agent.utils.sql_rewrite import rewrite_for_pruning
 
 
 logger = logging.getLogger(__name__)
@@ -25,14 +26,15 @@ def _text_event(msg: str) -> Event:
 
 
 # --- SQL loading ---
+# DATE(event_time) filters are rewritten to event_time ranges so the raw table is partition-pruned
 BASE_DIR = Path(__file__).parent
 
-SPIKE_SQL = (BASE_DIR / "queries" / "spike_clicks.sql").read_text(
+SPIKE_SQL = rewrite_for_pruning((BASE_DIR / "queries" / "spike_clicks.sql").read_text(
     encoding="utf-8"
-)
-DROP_SQL = (BASE_DIR / "queries" / "drop_clicks.sql").read_text(
+))
+DROP_SQL = rewrite_for_pruning((BASE_DIR / "queries" / "drop_clicks.sql").read_text(
     encoding="utf-8"
-)
+))
 
 
 class AnomalyAgent(BaseAgent):
@@ -60,9 +62,9 @@ class AnomalyAgent(BaseAgent):
         """
         logger.info("[AnomalyAgent] Pulling anomaly data from BQ")
 
-        spike_df = self._client.execute_query(
-            SPIKE_SQL, "anomaly_spike"
-        ).to_dataframe()
+        spike_df = self._client.fetch_dataframe(
+            self._client.execute_query(SPIKE_SQL, "anomaly_spike")
+        )
 
         # drop_df = self._client.execute_query(
         #     DROP_SQL, "anomaly_drop"
@@ -76,10 +78,12 @@ class AnomalyAgent(BaseAgent):
         זה מיועד לשימוש חיצוני (למשל סקריפט גרפים), לא ל-ADK Web.
         """
         logger.info("[AnomalyAgent] Fetching spike anomalies (direct)")
-        df = self._client.execute_query(
-            SPIKE_SQL,
-            "spike_anomalies_direct",
-        ).to_dataframe()
+        df = self._client.fetch_dataframe(
+            self._client.execute_query(
+                SPIKE_SQL,
+                "spike_anomalies_direct",
+            )
+        )
         return df
 
     # ------------------------------------------------------------------ #
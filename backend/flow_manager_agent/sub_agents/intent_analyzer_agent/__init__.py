@@ -1 +1,2 @@
-from .agent import intent_analyzer_agent, BASE_NLU_SPEC
\ No newline at end of file
+from .agent import intent_analyzer_agent, BASE_NLU_SPEC
+from .fast_path import fast_parse, fast_path_stats
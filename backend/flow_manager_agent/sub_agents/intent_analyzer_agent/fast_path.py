@@ -0,0 +1,296 @@
+"""
+Fast path ל-intent_analyzer_agent: parser דטרמיניסטי (regex + דקדוק קטן) לצורות השאלה הנפוצות.
+
+מכסה: ברכות / תודות, נרמול מזהים (app id 2 -> app_id_2), מילים נרדפות ל-total_events,
+breakdown לפי מימד יחיד, ותאריכים מפורשים / היום / אתמול / שלשום.
+מחזיר את אותו JSON כמו ה-LLM (intent_analysis), או None כשהוא לא בטוח — ואז RootAgent קורא ל-LLM.
+"בטוח" = כל מילה בהודעה זוהתה (ערך, תאריך, מימד, metric או מילת קישור); כל מילה אחרת -> None.
+"""
+import os
+import re
+import time
+import threading
+from datetime import date, timedelta
+
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "1") not in ("0", "false", "False")
+
+GREETING_MESSAGE = "Hi! How can I help you today?"
+THANKS_MESSAGE = "Happy to help!\nWant me to look into more data?"
+FUTURE_MESSAGE = "Future dates are not supported because no events have occurred yet."
+DATE_RANGE_MESSAGE = "Which date or date range would you like to analyze?"
+
+GREETINGS = {
+    "hi", "hello", "hey", "hi there", "hello there", "hey there", "good morning", "good evening", "yo",
+    "שלום", "היי", "הי", "הלו", "אהלן", "מה נשמע", "מה קורה", "בוקר טוב", "ערב טוב", "צהריים טובים",
+}
+THANKS = {
+    "thanks", "thank you", "thanks a lot", "thank you very much", "thx", "ty", "awesome", "great",
+    "appreciate it", "perfect",
+    "תודה", "תודה רבה", "תודה רבה רבה", "אלוף", "אלוף אתה", "מהמם", "עזרת לי", "מושלם", "סבבה תודה",
+}
+
+_L = r"(?<![a-z0-9])"  # Hebrew prefixes (ב / ל / של...) may stick to the token
+_R = r"(?![a-z0-9])"
+
+# bare numbers for id-like fields -> normalized values
+_IDS = [
+    ("media_source", re.compile(_L + r"media[\s_-]*source[\s_:#=-]*(\d+)(?![\d])(?![/.\-]\d)")),
+    ("app_id", re.compile(_L + r"app(?:[\s_-]*id)?[\s_:#=-]*(\d+)(?![\d])(?![/.\-]\d)")),
+    ("site_id", re.compile(_L + r"site(?:[\s_-]*id)?[\s_:#=-]*(\d+)(?![\d])(?![/.\-]\d)")),
+    ("partner", re.compile(_L + r"partner[\s_:#=-]*(\d+)(?![\d])(?![/.\-]\d)")),
+]
+
+_DIMENSIONS = {
+    "media_source": r"media[\s_-]*sources?|מדיה\s*סורס",
+    "app_id": r"app[\s_-]*ids?|apps?|אפליקציה|אפליקציות",
+    "site_id": r"site[\s_-]*ids?|sites?|אתר|אתרים",
+    "partner": r"partners?|שותף|שותפים",
+    "hr": r"hours?|hr|hourly|שעה|שעות",
+    "engagement_type": r"engagement[\s_-]*types?",
+}
+_BREAKDOWN = re.compile(
+    r"(?:(?<![a-z])(?:broken\s+down\s+by|breakdown\s+by|split\s+by|by|per|for\s+each)|לפי|פר)\s+(?:each\s+)?("
+    + "|".join(f"(?P<{f}>{p})" for f, p in _DIMENSIONS.items()) + r")" + _R
+)
+
+_METRIC = re.compile(
+    r"(?:" + _L + r"(?:total[\s_-]*events|number\s+of\s+(?:clicks|events)|clicks?|events?|count)" + _R + r")"
+    r"|(?:ה?קליקים|ה?קליק|ה?אירועים|כמות|סה\"?כ|סך\s+הכל)"
+)
+
+_MONTHS_EN = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTHS_HE = {
+    "ינואר": 1, "פברואר": 2, "מרץ": 3, "מרס": 3, "אפריל": 4, "מאי": 5, "יוני": 6,
+    "יולי": 7, "אוגוסט": 8, "ספטמבר": 9, "אוקטובר": 10, "נובמבר": 11, "דצמבר": 12,
+}
+_EN_MONTH = r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+_HE_MONTH = "|".join(_MONTHS_HE)
+_NOT_IN_DATE = r"(?<![\d/.])(?<!\d-)"
+
+# each pattern -> (year, month, day) groups by name
+_DATES = [
+    re.compile(_NOT_IN_DATE + r"(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})(?![\d])"),
+    re.compile(_NOT_IN_DATE + r"(?P<d>\d{1,2})[/.\-](?P<m>\d{1,2})(?:[/.\-](?P<y>\d{4}|\d{2}))?(?![\d])(?![/.\-]\d)"),
+    re.compile(_L + r"(?P<d>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<me>" + _EN_MONTH + r")\.?(?:,?\s+(?P<y>\d{4}))?" + _R),
+    re.compile(_L + r"(?P<me>" + _EN_MONTH + r")\.?\s+(?P<d>\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(?P<y>\d{4}))?" + _R),
+    re.compile(r"(?<![\d])(?P<d>\d{1,2})\s+(?:ב|ל)?(?P<mh>" + _HE_MONTH + r")(?:\s+(?P<y>\d{4}))?"),
+]
+_RELATIVE = [
+    ("day_before", re.compile(r"(?:the\s+)?day\s+before\s+yesterday|שלשום")),
+    ("yesterday", re.compile(_L + r"yesterday" + _R + r"|אתמול")),
+    ("today", re.compile(_L + r"today" + _R + r"|היום")),
+]
+
+# words joining two dates into a range
+_RANGE_WORDS = {"to", "until", "till", "through", "-", "–", "עד", "ועד"}
+# "and" / "ל" / "ו" join a range only in "between X and Y" / "בין X ל-Y" (otherwise two separate days)
+_BETWEEN_JOINERS = {"and", "ל", "ו"}
+_BETWEEN = re.compile(r"(?:between|בין)[\s\-]*(?:the\s+|ה[\s\-]*)?$")
+
+# filler words the parser may ignore (anything else -> not confident)
+_STOPWORDS = {
+    "how", "many", "much", "what", "was", "were", "is", "are", "there", "the", "a", "an", "for", "on", "in", "at",
+    "of", "from", "did", "do", "does", "we", "i", "have", "had", "get", "got", "show", "me", "give", "tell",
+    "please", "and", "with", "between", "to", "until", "till", "through", "total", "amount", "number", "date",
+    "pls", "plz", "can", "you", "us", "see", "receive", "received", "generated",
+    "כמה", "היו", "היה", "הייתה", "יש", "של", "עבור", "על", "תן", "תני", "לי", "תראה", "תראי", "מה", "את", "עם",
+    "בבקשה", "בין", "עד", "ועד", "ו", "ב", "ל", "מ", "ה", "תאריך", "בתאריך", "ביום", "יום", "מספר", "סך", "הכל",
+    "קיבלנו", "קיבל", "קיבלה", "רשמנו", "נרשמו",
+}
+_HE_PREFIXES = "בלוהמש"
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "handled": 0, "deferred": 0, "by_status": {}, "total_ms": 0.0, "max_ms": 0.0}
+
+
+def _normalize(message: str) -> str:
+    text = (message or "").strip().lower()
+    text = text.replace("״", '"').replace("׳", "'").replace("’", "'")
+    return re.sub(r"\s+", " ", text)
+
+
+def _bare(text: str) -> str:
+    """ההודעה בלי סימני פיסוק / אימוג'י — להשוואה מול ברכות ותודות."""
+    return " ".join(re.findall(r"[a-z0-9֐-׿]+", text))
+
+
+def _make_date(y, m, d, today: date) -> date | None:
+    year = int(y) if y else today.year
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, int(m), int(d))
+    except ValueError:
+        return None
+
+
+def _extract_dates(text: str, today: date) -> tuple[str, list] | None:
+    """מחליף כל תאריך ב-placeholder ⟦i⟧. None כשיש תאריך לא תקין (אז ה-LLM יבקש הבהרה)."""
+    found = []
+
+    def sub(value):
+        found.append(value)
+        return f" ⟦{len(found) - 1}⟧ "
+
+    for name, pattern in _RELATIVE:
+        offset = {"today": 0, "yesterday": 1, "day_before": 2}[name]
+        text = pattern.sub(lambda _: sub(today - timedelta(days=offset)), text)
+
+    invalid = False
+    for pattern in _DATES:
+        def repl(m):
+            nonlocal invalid
+            g = m.groupdict()
+            month = g.get("m")
+            if g.get("me"):
+                month = _MONTHS_EN[g["me"][:3]]
+            elif g.get("mh"):
+                month = _MONTHS_HE[g["mh"]]
+            value = _make_date(g.get("y"), month, g["d"], today)
+            if value is None:
+                invalid = True
+                return " "
+            return sub(value)
+
+        text = pattern.sub(repl, text)
+    return None if invalid else (text, found)
+
+
+def _date_range(text: str, dates: list) -> tuple[str, dict | None] | None:
+    if not dates:
+        return text, None
+    if len(dates) == 1:
+        return text.replace("⟦0⟧", " "), {"start_date": dates[0].isoformat(), "end_date": dates[0].isoformat()}
+    if len(dates) > 2:
+        return None
+
+    # placeholders are numbered by pattern, not by position
+    (first, a), (second, b) = sorted((text.index(f"⟦{i}⟧"), dates[i]) for i in range(2))
+    # "ל-26/10": the hyphen belongs to the prefix, not a range dash
+    words = {w or dash for w, dash in re.findall(r"([a-z֐-׿]+)-?|([-–])", text[first + 3:second])}
+    joined = words & _RANGE_WORDS or (words & _BETWEEN_JOINERS and _BETWEEN.search(text[:first]))
+    if not joined or a > b:
+        return None
+    text = text.replace("⟦0⟧", " ").replace("⟦1⟧", " ")
+    return text, {"start_date": a.isoformat(), "end_date": b.isoformat()}
+
+
+def _leftover_is_filler(text: str) -> bool:
+    for token in re.findall(r"[a-z0-9_'\-֐-׿]+|⟦\d+⟧", text):
+        token = token.strip("'-")
+        if not token or token in _STOPWORDS:
+            continue
+        if token[0] in _HE_PREFIXES and token[1:] in _STOPWORDS:
+            continue
+        return False
+    return True
+
+
+def _intent(metric, dimensions, filters, date_range) -> dict:
+    return {
+        "intent": "analytics",
+        "metric": metric,
+        "dimensions": dimensions,
+        "filters": filters,
+        "invalid_fields": [],
+        "date_range": date_range,
+        "number_of_rows": None,
+        "row_selection": None,
+    }
+
+
+def _parse(message: str, today: date) -> dict | None:
+    text = _normalize(message)
+    if not text:
+        return None
+
+    bare = _bare(text)
+    if bare in GREETINGS:
+        return {"status": "not_relevant", "message": GREETING_MESSAGE}
+    if bare in THANKS:
+        return {"status": "not_relevant", "message": THANKS_MESSAGE}
+
+    # an analytics question must name the metric; everything else (ranking, anomaly, retrieval...) is the LLM's
+    if not _METRIC.search(text):
+        return None
+
+    filters = {}
+    for field, pattern in _IDS:
+        for m in pattern.finditer(text):
+            value = f"{field}_{int(m.group(1))}"
+            if filters.get(field, value) != value:
+                return None  # two values for one field
+            filters[field] = value
+        text = pattern.sub(" ", text)
+
+    dimensions = []
+    for m in _BREAKDOWN.finditer(text):
+        dimensions.extend(f for f in _DIMENSIONS if m.group(f))
+    if len(dimensions) > 1:
+        return None
+    text = _BREAKDOWN.sub(" ", text)
+
+    extracted = _extract_dates(text, today)
+    if extracted is None:
+        return None
+    ranged = _date_range(*extracted)
+    if ranged is None:
+        return None
+    text, date_range = ranged
+
+    text = _METRIC.sub(" ", text)
+    if not _leftover_is_filler(text):
+        return None
+
+    if date_range and (date.fromisoformat(date_range["start_date"]) > today
+                       or date.fromisoformat(date_range["end_date"]) > today):
+        return {"status": "error", "message": FUTURE_MESSAGE, "parsed_intent": None}
+
+    intent = _intent("total_events", dimensions, filters, date_range)
+    if date_range is None:
+        return {
+            "status": "clarification_needed",
+            "missing_fields": ["date_range"],
+            "message": DATE_RANGE_MESSAGE,
+            "partial_intent": intent,
+        }
+    return {"status": "ok", "parsed_intent": intent}
+
+
+def fast_parse(message: str, today: date) -> dict | None:
+    """intent_analysis לשאלה, או None כשה-parser לא בטוח (אז ה-LLM מחליט)."""
+    start = time.perf_counter()
+    result = _parse(message, today)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+        if result is None:
+            _stats["deferred"] += 1
+        else:
+            _stats["handled"] += 1
+            _stats["by_status"][result["status"]] = _stats["by_status"].get(result["status"], 0) + 1
+    return result
+
+
+def fast_path_stats() -> dict:
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            "enabled": INTENT_FAST_PATH,
+            **_stats,
+            "by_status": dict(_stats["by_status"]),
+            "coverage": (_stats["handled"] / calls) if calls else 0.0,
+            "avg_ms": (_stats["total_ms"] / calls) if calls else 0.0,
+        }
+
+
+def reset_stats():
+    """לבדיקות."""
+    with _stats_lock:
+        _stats.update(calls=0, handled=0, deferred=0, by_status={}, total_ms=0.0, max_ms=0.0)
@@ -1 +1,2 @@
-from .agent import protected_query_builder_agent
\ No newline at end of file
+from .agent import protected_query_builder_agent
+from .compiler import compile_query, compiler_stats
@@ -0,0 +1,252 @@
+"""
+קומפיילר דטרמיניסטי parsed_intent -> built_query, לפי אותם כללים כמו ה-prompt של protected_query_builder_agent:
+בחירת טבלת agg, נפילה ל-raw כשפילטר לא נתמך, event_date מול event_time, CTE ל-find top/bottom ו-retrieval.
+literals לפי הטיפוס (hr מספר, boolean TRUE/FALSE, מחרוזות במרכאות עם escape).
+מחזיר None לצורות שלא מכוסות (anomaly, metric / שדה / ערך לא מוכר) — ואז RootAgent קורא ל-LLM.
+"""
+import os
+import re
+import time
+import threading
+from datetime import date
+
+from ...utils.query_guard import RAW_TABLE, AGG_TABLES, RAW_COLUMNS
+
+SQL_COMPILER = os.getenv("SQL_COMPILER", "1") not in ("0", "false", "False")
+
+INTEGER_COLUMNS = {"hr", "total_events"}
+BOOLEAN_COLUMNS = {"is_engaged_view", "is_retargeting"}
+STRING_COLUMNS = {"media_source", "partner", "app_id", "site_id", "engagement_type"}
+
+# columns of each hourly agg table (besides its identifier)
+AGG_COLUMNS = {"event_date", "hr", "total_events"}
+
+RETRIEVAL_COLUMNS = [
+    "event_time", "hr", "is_engaged_view", "is_retargeting",
+    "media_source", "partner", "app_id", "site_id", "engagement_type", "total_events",
+]
+
+ANALYTICS_LIMIT = 100
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "compiled": 0, "fallback": 0, "by_status": {}, "total_ms": 0.0, "max_ms": 0.0}
+
+
+class NotCovered(Exception):
+    """צורה שהקומפיילר לא מכסה — ה-LLM מחליט."""
+
+
+def _built(status: str = "ok", sql: str | None = None, message: str = "", invalid_fields=None) -> dict:
+    return {
+        "status": status,
+        "sql": sql,
+        "clarification_questions": [],
+        "invalid_fields": invalid_fields or [],
+        "message": message,
+    }
+
+
+# =========================
+# Literals
+# =========================
+def literal(column: str, value) -> str:
+    """literal לפי טיפוס העמודה בטבלה."""
+    if column in INTEGER_COLUMNS:
+        if isinstance(value, bool) or not re.fullmatch(r"-?\d+", str(value).strip()):
+            raise NotCovered(f"{column}={value!r} is not an integer")
+        return str(int(str(value).strip()))
+    if column in BOOLEAN_COLUMNS:
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        if str(value).strip().lower() in ("true", "false"):
+            return str(value).strip().upper()
+        raise NotCovered(f"{column}={value!r} is not a boolean")
+    if column in STRING_COLUMNS:
+        if not isinstance(value, (str, int)) or isinstance(value, bool):
+            raise NotCovered(f"{column}={value!r} is not a string")
+        escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+        return f"'{escaped}'"
+    raise NotCovered(f"unknown column {column}")
+
+
+def _date(value) -> str:
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise NotCovered(f"bad date {value!r}")
+
+
+def _date_range(parsed_intent: dict) -> tuple[str, str] | None:
+    dr = parsed_intent.get("date_range")
+    if not dr:
+        return None
+    if not isinstance(dr, dict) or not dr.get("start_date") or not dr.get("end_date"):
+        raise NotCovered(f"partial date_range {dr!r}")
+    start, end = _date(dr["start_date"]), _date(dr["end_date"])
+    if start > end:
+        raise NotCovered("date_range ends before it starts")
+    return start, end
+
+
+# =========================
+# Routing
+# =========================
+def _single_agg_filter(filters: dict) -> str | None:
+    """ה-identifier היחיד בפילטרים (hr לא נספר — קיים בכל טבלאות ה-agg)."""
+    keys = set(filters) - {"hr"}
+    if len(keys) == 1 and next(iter(keys)) in AGG_TABLES:
+        return next(iter(keys))
+    return None
+
+
+def route(intent: str, dimensions: list, filters: dict, has_date_range: bool) -> tuple[str, bool]:
+    """(source_table, uses_event_date) — כללי ROUTING + POST-ROUTING COMPATIBILITY של ה-prompt."""
+    agg_key = None
+    if intent == "retrieval":
+        agg_key = None
+    elif not dimensions:
+        agg_key = _single_agg_filter(filters) if has_date_range else None
+    elif dimensions == ["hr"]:
+        agg_key = _single_agg_filter(filters)
+    elif len(dimensions) == 1:
+        agg_key = dimensions[0] if dimensions[0] in AGG_TABLES else None
+
+    if agg_key is None:
+        return RAW_TABLE, False
+    supported = AGG_COLUMNS | {agg_key}
+    if any(k not in supported for k in filters) or any(d not in supported for d in dimensions):
+        return RAW_TABLE, False
+    return AGG_TABLES[agg_key], True
+
+
+def _where(filters: dict, dates: tuple[str, str] | None, uses_event_date: bool) -> str:
+    predicates = []
+    if dates:
+        start, end = dates
+        if uses_event_date:
+            predicates.append(f"event_date BETWEEN '{start}' AND '{end}'")
+        else:
+            predicates.append(f"event_time >= TIMESTAMP('{start} 00:00:00')")
+            predicates.append(f"event_time <= TIMESTAMP('{end} 23:59:59')")
+    predicates.extend(f"{column} = {literal(column, value)}" for column, value in filters.items())
+    return ("\nWHERE " + "\n  AND ".join(predicates)) if predicates else ""
+
+
+# =========================
+# Compile
+# =========================
+def _compile(parsed_intent: dict) -> dict:
+    if not isinstance(parsed_intent, dict):
+        raise NotCovered("no parsed_intent")
+
+    intent = parsed_intent.get("intent")
+    if intent not in ("analytics", "find top", "find bottom", "retrieval"):
+        raise NotCovered(f"intent {intent!r}")
+
+    invalid = parsed_intent.get("invalid_fields") or []
+    if invalid:
+        return _built(
+            "invalid_fields", invalid_fields=invalid,
+            message="The user referenced fields that do not exist in the schema.",
+        )
+
+    dimensions = parsed_intent.get("dimensions") or []
+    filters = parsed_intent.get("filters") or {}
+    if not isinstance(dimensions, list) or not isinstance(filters, dict):
+        raise NotCovered("unexpected dimensions / filters shape")
+    for column in [*dimensions, *filters]:
+        if column not in RAW_COLUMNS or column in ("event_time", "total_events"):
+            raise NotCovered(f"column {column!r}")
+    if len(set(dimensions)) != len(dimensions):
+        raise NotCovered("repeated dimension")
+
+    dates = _date_range(parsed_intent)
+    table, uses_event_date = route(intent, dimensions, filters, dates is not None)
+    where = _where(filters, dates, uses_event_date)
+
+    if intent == "retrieval":
+        rows = parsed_intent.get("number_of_rows")
+        if isinstance(rows, bool) or not isinstance(rows, int) or rows <= 0:
+            raise NotCovered(f"number_of_rows {rows!r}")
+        sql = (
+            f"SELECT {', '.join(RETRIEVAL_COLUMNS)}\n"
+            f"FROM `{table}`{where}\n"
+            f"ORDER BY event_time DESC\n"
+            f"LIMIT {rows}"
+        )
+        return _built(sql=sql)
+
+    metric = parsed_intent.get("metric")
+    if not metric:
+        return _built("error", message="No metrics provided.")
+    if metric != "total_events":
+        raise NotCovered(f"metric {metric!r}")
+
+    dims = ", ".join(dimensions)
+    if intent in ("find top", "find bottom"):
+        if not dimensions:
+            return _built("error", message="Ranking requires a dimension.")
+        pick = "MAX" if intent == "find top" else "MIN"
+        sql = (
+            f"WITH agg AS (\n"
+            f"  SELECT {dims}, SUM(total_events) AS total_events\n"
+            f"  FROM `{table}`{where.replace(chr(10), chr(10) + '  ')}\n"
+            f"  GROUP BY {dims}\n"
+            f")\n"
+            f"SELECT *\n"
+            f"FROM agg\n"
+            f"WHERE total_events = (SELECT {pick}(total_events) FROM agg)\n"
+            f"ORDER BY total_events DESC"
+        )
+        return _built(sql=sql)
+
+    if not dimensions:
+        return _built(sql=f"SELECT SUM(total_events) AS total_events\nFROM `{table}`{where}")
+
+    sql = (
+        f"SELECT {dims}, SUM(total_events) AS total_events\n"
+        f"FROM `{table}`{where}\n"
+        f"GROUP BY {dims}\n"
+        f"ORDER BY total_events DESC\n"
+        f"LIMIT {ANALYTICS_LIMIT}"
+    )
+    return _built(sql=sql)
+
+
+def compile_query(parsed_intent: dict) -> dict | None:
+    """built_query (אותו JSON כמו ה-LLM) ל-parsed_intent, או None כשהצורה לא מכוסה."""
+    start = time.perf_counter()
+    try:
+        built = _compile(parsed_intent)
+    except NotCovered:
+        built = None
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+        if built is None:
+            _stats["fallback"] += 1
+        else:
+            _stats["compiled"] += 1
+            _stats["by_status"][built["status"]] = _stats["by_status"].get(built["status"], 0) + 1
+    return built
+
+
+def compiler_stats() -> dict:
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            "enabled": SQL_COMPILER,
+            **_stats,
+            "by_status": dict(_stats["by_status"]),
+            "coverage": (_stats["compiled"] / calls) if calls else 0.0,
+            "avg_ms": (_stats["total_ms"] / calls) if calls else 0.0,
+        }
+
+
+def reset_stats():
+    """לבדיקות."""
+    with _stats_lock:
+        _stats.update(calls=0, compiled=0, fallback=0, by_status={}, total_ms=0.0, max_ms=0.0)
@@ -1 +1 @@
-from .agent import query_executor_agent
+from .agent import query_executor_agent, query_executor_agent_async
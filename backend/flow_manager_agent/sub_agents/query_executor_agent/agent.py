@@ -1,5 +1,9 @@
-from ....bq import BQClient
-from ...utils.cache import CacheService, normalize_intent_key
+from ....bq import BQClient, run_blocking, as_records
+from ...utils.cache import CacheService
+from ...utils.query_guard import guard_query, guard_query_async
+from ...utils.sql_canonical import canonicalize_sql
+from ...utils.sql_rewrite import prune_stage
+from ...utils.single_flight import SingleFlight
 import pandas as pd
 import logging
 import json
@@ -7,7 +11,51 @@ import json
 logger = logging.getLogger(__name__)
 
 
-def run_bigquery(query: str, intent_key: str | None = None):
+# The markdown table is for humans / the LLM — it never needs more than this many rows
+MARKDOWN_MAX_ROWS = 200
+
+# Identical concurrent requests (same cache key) share one cache lookup + BigQuery job
+_flights = SingleFlight()
+
+
+def single_flight_stats() -> dict:
+    return _flights.stats()
+
+
+def _build_result(query: str, rows, from_cache: bool, truncated: bool = False, stale: bool = False,
+                  derived: bool = False) -> dict:
+    # the JSON boundary: a columnar result (bq.ArrowRows) becomes dicts only here
+    rows = as_records(rows)
+    df_out = pd.DataFrame(rows[:MARKDOWN_MAX_ROWS])
+    markdown = df_out.to_markdown(index=False) if not df_out.empty else ""
+
+    return {
+        "status": "ok",
+        "result": markdown,
+        "rows": rows,                 # ✅ הוספה
+        "message": None,
+        "row_count": len(rows),
+        "executed_sql": query,
+        "from_cache": from_cache,
+        # served past the TTL (within the stale grace window) while a refresh runs in the background
+        "stale": stale,
+        # computed in process from a cached finer-grained result (filter + re-aggregate), no BigQuery job
+        "derived": derived,
+        # hit BQ_MAX_RESULT_ROWS / BQ_MAX_RESULT_BYTES (kept with the cache entry, so also on a hit)
+        "truncated": truncated,
+    }
+
+
+def _error_result(query: str, e: Exception) -> dict:
+    return {
+        "status": "error",
+        "result": None,
+        "message": f"BigQuery execution error: {e}",
+        "executed_sql": query,
+    }
+
+
+def run_bigquery(query: str, intent_key: str | None = None, parsed_intent: dict | None = None):
     """Executes a BigQuery SQL query and returns results as markdown, with cache in front."""
     logger.info("=" * 80)
     logger.info("🔵 run_bigquery called")
@@ -15,63 +63,168 @@ def run_bigquery(query: str, intent_key: str | None = None):
     logger.info("=" * 80)
 
     try:
-        # ✅ Cache FIRST (before BQClient is created)
+        # ✅ Cache FIRST (BQClient only wraps the shared pooled client)
         cs = CacheService()
 
+        # Canonical SQL is both what we submit and (if no intent_key) the cache key
+        query, sql_key = canonicalize_sql(query)
+
         # Prefer intent_key (parsed_intent-based) if provided
-        effective_intent_key = intent_key or normalize_intent_key(sql=query)
+        effective_intent_key = intent_key or sql_key
         logger.info(f"🔵 Cache key: {effective_intent_key[:200]}")
 
+        executed = {"sql": query}
+
         # Runner connects to BQ ONLY when needed
         def _runner(sql: str):
-            logger.info("🔵 _runner creating BQClient (only on cache miss)...")
+            logger.info("🔵 _runner using shared BQ client (only on cache miss)...")
             bq = BQClient()
 
+            # Sargable partition predicates / bounded retrieval (equivalent SQL, same cache key)
+            sql = prune_stage(sql, bq)
+
+            # Dry-run cost guard (may re-route raw -> agg, or raise QueryBudgetExceeded)
+            decision = guard_query(sql, bq=bq)
+            executed["sql"] = decision["sql"]
+
             logger.info("🔵 _runner executing query...")
-            it = bq.execute_query(sql, 'adk_query')
+            it = bq.execute_query(decision["sql"], 'adk_query')
 
-            logger.info("✅ Query executed, converting to dataframe...")
-            df = it.to_dataframe()
-            logger.info(f"✅ DataFrame created with {len(df)} rows")
-            return df.to_dict(orient='records')
+            logger.info("✅ Query executed, fetching rows (paged)...")
+            rows, truncated = bq.collect_records(it)
+            logger.info(f"✅ Fetched {len(rows)} rows (truncated={truncated})")
+            return rows
 
-        rows, from_cache = cs.run_or_cache(
-            intent_key=effective_intent_key,
-            sql=query,
-            run_bigquery_fn=_runner
-        )
+        def _fetch():
+            rows, from_cache = cs.run_or_cache(
+                intent_key=effective_intent_key,
+                sql=query,
+                run_bigquery_fn=_runner,
+                json_safe=True,
+                parsed_intent=parsed_intent,
+            )
+            return rows, from_cache, {
+                **executed,
+                "stale": cs.served_stale,
+                "derived": cs.served_derived,
+                "truncated": cs.served_truncated,
+            }
 
-        df_out = pd.DataFrame(rows)
-        markdown = df_out.to_markdown(index=False) if not df_out.empty else ""
-
-        result = {
-            "status": "ok",
-            "result": markdown,
-            "rows": rows,                 # ✅ הוספה
-            "message": None,
-            "row_count": len(rows),
-            "executed_sql": query,
-            "from_cache": from_cache,
-        }
+        (rows, from_cache, done), coalesced = _flights.do(effective_intent_key, _fetch)
+
+        result = _build_result(done["sql"], rows, from_cache, done["truncated"], done["stale"], done["derived"])
+        result["coalesced"] = coalesced
 
-        logger.info(f"✅ run_bigquery completed (rows={len(rows)}, from_cache={from_cache})")
+        logger.info(f"✅ run_bigquery completed (rows={len(rows)}, from_cache={from_cache}, coalesced={coalesced})")
         logger.info("=" * 80)
         return result
 
     except Exception as e:
         logger.exception("❌ BigQuery execution failed")
-        return {
+        return _error_result(query, e)
+
+
+async def run_bigquery_async(query: str, intent_key: str | None = None, parsed_intent: dict | None = None):
+    """Async version of run_bigquery — never blocks the event loop."""
+    logger.info("=" * 80)
+    logger.info("🔵 run_bigquery_async called")
+    logger.info("SQL to execute:\n%s", query)
+    logger.info("=" * 80)
+
+    try:
+        cs = CacheService()
+
+        query, sql_key = canonicalize_sql(query)
+        effective_intent_key = intent_key or sql_key
+        logger.info(f"🔵 Cache key: {effective_intent_key[:200]}")
+
+        executed = {"sql": query}
+
+        async def _runner(sql: str):
+            bq = BQClient()
+
+            sql = await run_blocking(prune_stage, sql, bq)
+            decision = await guard_query_async(sql, bq=bq)
+            executed["sql"] = decision["sql"]
+
+            logger.info("🔵 _runner executing query (async)...")
+            it = await bq.execute_query_async(
+                decision["sql"], 'adk_query', estimated_bytes=decision["estimated_bytes"]
+            )
+
+            rows, truncated = await run_blocking(bq.collect_records, it)
+            logger.info(f"✅ Fetched {len(rows)} rows (truncated={truncated})")
+            return rows
+
+        async def _fetch():
+            rows, from_cache = await cs.run_or_cache_async(
+                intent_key=effective_intent_key,
+                sql=query,
+                run_bigquery_fn_async=_runner,
+                json_safe=True,
+                parsed_intent=parsed_intent,
+            )
+            return rows, from_cache, {
+                **executed,
+                "stale": cs.served_stale,
+                "derived": cs.served_derived,
+                "truncated": cs.served_truncated,
+            }
+
+        (rows, from_cache, done), coalesced = await _flights.do_async(effective_intent_key, _fetch)
+
+        result = _build_result(done["sql"], rows, from_cache, done["truncated"], done["stale"], done["derived"])
+        result["coalesced"] = coalesced
+
+        logger.info(f"✅ run_bigquery_async completed (rows={len(rows)}, from_cache={from_cache}, coalesced={coalesced})")
+        logger.info("=" * 80)
+        return result
+
+    except Exception as e:
+        logger.exception("❌ BigQuery execution failed")
+        return _error_result(query, e)
+
+
+def _prepare_built_query(previous_output) -> tuple[dict | None, dict | None]:
+    """
+    מחלץ את built_query ומוודא שאפשר להריץ אותו.
+    מחזיר (built_query, None) או (None, error_dict).
+    """
+    if isinstance(previous_output, str):
+        previous_output = json.loads(previous_output)
+
+    built_query = previous_output.get("built_query", previous_output)
+
+    status = built_query.get("status")
+    if status != "ok":
+        return None, {
+            "status": "error",
+            "result": None,
+            "message": "SQL cannot be executed because status is not ok."
+        }
+
+    sql = built_query.get("sql")
+    if not sql:
+        return None, {
             "status": "error",
             "result": None,
-            "message": f"BigQuery execution error: {e}",
-            "executed_sql": query,
+            "message": "No SQL found in built_query"
         }
 
+    # ✅ Intent key from RootAgent (parsed_intent-based)
+    if built_query.get("intent_key"):
+        logger.info("🟢 Using intent_key provided by RootAgent (parsed_intent-based).")
+    else:
+        logger.warning("🟡 No intent_key provided; falling back to SQL-based key.")
+
+    return built_query, None
+
 
 def query_executor_agent(previous_output: dict) -> dict:
     """
     Executes SQL query from the previous agent's output.
-    Expects optional built_query['intent_key'] provided by RootAgent (parsed_intent-based).
+    Expects optional built_query['intent_key'] provided by RootAgent (parsed_intent-based),
+    and optional built_query['parsed_intent'] (lets roll-ups be derived from cached breakdowns).
     """
     logger.info("🟢" * 40)
     logger.info("🟢 query_executor_agent (Python function) called")
@@ -79,40 +232,44 @@ def query_executor_agent(previous_output: dict) -> dict:
     logger.info(f"🟢 Input: {json.dumps(previous_output, indent=2) if isinstance(previous_output, dict) else previous_output}")
 
     try:
-        if isinstance(previous_output, str):
-            previous_output = json.loads(previous_output)
+        built_query, error = _prepare_built_query(previous_output)
+        if error:
+            return error
 
-        built_query = previous_output.get("built_query", previous_output)
+        return run_bigquery(
+            built_query["sql"],
+            intent_key=built_query.get("intent_key"),
+            parsed_intent=built_query.get("parsed_intent"),
+        )
 
-        status = built_query.get("status")
-        if status != "ok":
-            return {
-                "status": "error",
-                "result": None,
-                "message": "SQL cannot be executed because status is not ok."
-            }
+    except Exception as e:
+        logger.exception("❌ query_executor_agent failed")
+        return {
+            "status": "error",
+            "result": None,
+            "message": f"Query executor error: {e}"
+        }
 
-        sql = built_query.get("sql")
-        if not sql:
-            return {
-                "status": "error",
-                "result": None,
-                "message": "No SQL found in built_query"
-            }
 
-        # ✅ Intent key from RootAgent (parsed_intent-based)
-        intent_key = built_query.get("intent_key")
-        if intent_key:
-            logger.info("🟢 Using intent_key provided by RootAgent (parsed_intent-based).")
-        else:
-            logger.warning("🟡 No intent_key provided; falling back to SQL-based key.")
+async def query_executor_agent_async(previous_output: dict) -> dict:
+    """Async version of query_executor_agent (used by RootAgent on the event loop)."""
+    logger.info("🟢 query_executor_agent_async called")
 
-        return run_bigquery(sql, intent_key=intent_key)
+    try:
+        built_query, error = _prepare_built_query(previous_output)
+        if error:
+            return error
+
+        return await run_bigquery_async(
+            built_query["sql"],
+            intent_key=built_query.get("intent_key"),
+            parsed_intent=built_query.get("parsed_intent"),
+        )
 
     except Exception as e:
-        logger.exception("❌ query_executor_agent failed")
+        logger.exception("❌ query_executor_agent_async failed")
         return {
             "status": "error",
             "result": None,
             "message": f"Query executor error: {e}"
-        }
\ No newline at end of file
+        }
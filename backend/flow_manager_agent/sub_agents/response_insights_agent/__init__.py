@@ -1,3 +1,4 @@
 from .agent import response_insights_agent, INSIGHTS_SPEC
+from .templates import template_insights, template_stats
 
-__all__ = ["response_insights_agent", "INSIGHTS_SPEC"]
\ No newline at end of file
+__all__ = ["response_insights_agent", "INSIGHTS_SPEC", "template_insights", "template_stats"]
@@ -0,0 +1,164 @@
+"""
+insights_result בלי LLM לתשובות שאין בהן מה לפרש: תאריך עתידי, אין נתונים, ושורה אחת עם total_events.
+אותה סכמה כמו response_insights_agent (summary / table_profile / insights / next_steps / presentation / final_text),
+כך ש-human_response_agent מציג אותן אותו דבר. breakdown של כמה שורות -> None (ה-LLM).
+"""
+import os
+import numbers
+import threading
+
+INSIGHTS_TEMPLATES = os.getenv("INSIGHTS_TEMPLATES", "1") not in ("0", "false", "False")
+
+FUTURE_TEXT = "Future dates are not supported because no events have occurred yet."
+DATASET_DATES = ("2025-10-24", "2025-10-25", "2025-10-26")
+DRILLDOWNS = ["media_source", "hr", "partner", "app_id", "site_id"]
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "templated": 0, "llm": 0, "by_case": {}}
+
+
+def _scope(parsed_intent: dict | None, requested_date: str | None) -> str:
+    """'for media_source=media_source_90 on 2025-10-25' — מה נשאל, בלי להמציא."""
+    parsed_intent = parsed_intent or {}
+    parts = [f"{k}={v}" for k, v in (parsed_intent.get("filters") or {}).items()]
+    text = f" for {', '.join(parts)}" if parts else ""
+
+    dr = parsed_intent.get("date_range") or {}
+    start, end = dr.get("start_date"), dr.get("end_date")
+    if start and end and start != end:
+        text += f" from {start} to {end}"
+    elif start or requested_date:
+        text += f" on {start or requested_date}"
+    return text
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def _result(*, asked: str, done: str, presence: str, row_count: int, rows: list, title: str, answer: str,
+            show_table: bool, final_text: str, questions: list, drilldowns: list, key_points: list,
+            quality_notes: list) -> dict:
+    columns = list(rows[0]) if rows else []
+    return {
+        "summary": {
+            "what_was_asked": asked,
+            "what_was_done": done,
+            "data_presence": presence,
+            "row_count": row_count,
+        },
+        "table_profile": {
+            "columns": columns,
+            "time_columns": [c for c in columns if c in ("event_time", "event_date")],
+            "numeric_columns": [c for c in columns if _is_number(rows[0][c])],
+            "dimension_columns": [c for c in columns if c not in ("event_time", "event_date") and not _is_number(rows[0][c])],
+            "preview_rows": rows[:3],
+        },
+        "insights": {
+            "key_points": key_points,
+            "anomalies": [],
+            "quality_notes": quality_notes,
+        },
+        "next_steps": {
+            "suggested_questions": questions,
+            "suggested_drilldowns": drilldowns,
+            "suggested_graphs": [],
+        },
+        "presentation": {
+            "title": title,
+            "show_table": show_table,
+            "sections": [{"heading": "Answer", "style": "sentence", "text": answer, "bullets": []}],
+        },
+        "final_text": final_text,
+    }
+
+
+def _future(scope: str) -> dict:
+    return _result(
+        asked=f"total_events{scope}", done="Checked the requested date against today.", presence="no_data",
+        row_count=0, rows=[], title="Future date", answer=FUTURE_TEXT, show_table=False, final_text=FUTURE_TEXT,
+        questions=[f"How many clicks were there on {DATASET_DATES[-1]}?"], drilldowns=[], key_points=[],
+        quality_notes=[],
+    )
+
+
+def _no_data(payload: dict, scope: str, parsed_intent: dict | None) -> dict:
+    requested = payload.get("requested_date")
+    other_dates = [d for d in DATASET_DATES if d != requested]
+    questions = [f"How many clicks were there on {other_dates[-1]}?"]
+    if (parsed_intent or {}).get("filters"):
+        questions.append("How many clicks were there without the filters, for the same dates?")
+    questions.append(f"Which media_source had the most clicks on {other_dates[0]}?")
+
+    text = f"No data was found{scope}."
+    return _result(
+        asked=f"total_events{scope}", done="Ran the query; it returned no matching events.", presence="no_data",
+        row_count=0, rows=[], title="No data found", answer=text, show_table=False,
+        final_text=f"{text} There were no matching events, or the filters are too restrictive.",
+        questions=questions[:3], drilldowns=[], key_points=[], quality_notes=[],
+    )
+
+
+def _single_value(payload: dict, rows: list, scope: str, parsed_intent: dict | None) -> dict:
+    value = payload["extracted_values"]["total_events"]
+    row = rows[0] if rows else {"total_events": value}
+    labels = [f"{k}={v}" for k, v in row.items() if k != "total_events" and v is not None]
+    where = f" ({', '.join(labels)})" if labels else ""
+
+    answer = f"total_events: {value}{scope}{where}."
+    used = set((parsed_intent or {}).get("dimensions") or []) | set((parsed_intent or {}).get("filters") or {})
+    drilldowns = [d for d in DRILLDOWNS if d not in used][:3]
+    quality = ["The result was truncated."] if payload.get("execution_result", {}).get("truncated") else []
+
+    return _result(
+        asked=f"total_events{scope}", done="Summed total_events for the request.", presence="has_data",
+        row_count=1, rows=[row], title="Total events", answer=answer, show_table=bool(labels),
+        final_text=f"There were {value:,} total_events{scope}{where}." if _is_number(value) else answer,
+        questions=[f"What is the breakdown of these clicks by {d}?" for d in drilldowns[:2]],
+        drilldowns=drilldowns, key_points=[answer], quality_notes=quality,
+    )
+
+
+def template_insights(payload: dict, rows: list | None = None, parsed_intent: dict | None = None) -> dict | None:
+    """
+    insights_result מתבנית, או None כשנדרש ה-LLM.
+    payload — ה-INSIGHTS_INPUT_JSON של RootAgent (requested_date, is_future_date, has_data, extracted_values...).
+    """
+    execution = payload.get("execution_result") or {}
+    scope = _scope(parsed_intent, payload.get("requested_date"))
+    rows = rows or []
+
+    case, result = None, None
+    if execution.get("status") == "ok":
+        if payload.get("is_future_date"):
+            case, result = "future_date", _future(scope)
+        elif not payload.get("has_data"):
+            case, result = "no_data", _no_data(payload, scope, parsed_intent)
+        elif (payload.get("extracted_values") or {}).get("total_events") is not None and execution.get("row_count") == 1:
+            case, result = "single_value", _single_value(payload, rows, scope, parsed_intent)
+
+    with _stats_lock:
+        _stats["calls"] += 1
+        if result is None:
+            _stats["llm"] += 1
+        else:
+            _stats["templated"] += 1
+            _stats["by_case"][case] = _stats["by_case"].get(case, 0) + 1
+    return result
+
+
+def template_stats() -> dict:
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            "enabled": INSIGHTS_TEMPLATES,
+            **_stats,
+            "by_case": dict(_stats["by_case"]),
+            "templated_share": (_stats["templated"] / calls) if calls else 0.0,
+        }
+
+
+def reset_stats():
+    """לבדיקות."""
+    with _stats_lock:
+        _stats.update(calls=0, templated=0, llm=0, by_case={})
@@ -0,0 +1,145 @@
+import os
+import math
+import hashlib
+import threading
+from array import array
+
+# Count-min sketch size: counters per row (rounded up to a power of two) and number of rows
+CACHE_SKETCH_WIDTH = int(os.getenv("CACHE_SKETCH_WIDTH", "8192"))
+CACHE_SKETCH_DEPTH = int(os.getenv("CACHE_SKETCH_DEPTH", "4"))
+# Aging: after this many recorded requests (x width) every counter is halved
+CACHE_SKETCH_SAMPLE_FACTOR = int(os.getenv("CACHE_SKETCH_SAMPLE_FACTOR", "10"))
+
+# Estimated requests a key needs before its result is stored (results up to CACHE_ADMIT_SIZE_UNIT bytes)
+CACHE_ADMIT_MIN_FREQ = int(os.getenv("CACHE_ADMIT_MIN_FREQ", "2"))
+# Each doubling of the result size above this adds one more required request
+CACHE_ADMIT_SIZE_UNIT = int(os.getenv("CACHE_ADMIT_SIZE_UNIT", str(1024 ** 2)))
+
+# Counters saturate here (frequencies above it don't change any decision)
+_MAX_COUNTER = 255
+
+
+class CountMinSketch:
+    """
+    מונה תדירויות משוער בזיכרון קבוע (depth שורות x width מונים), בלי לשמור את המפתחות עצמם.
+    הערכה = המינימום על פני השורות (לעולם לא מתחת לאמת); conservative update מקטין את הטעות.
+    aging: אחרי sample_size הוספות כל המונים מתחלקים ב-2, כך שתדירות ישנה דועכת.
+    """
+
+    def __init__(self, width: int = CACHE_SKETCH_WIDTH, depth: int = CACHE_SKETCH_DEPTH,
+                 sample_size: int | None = None):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.depth = depth
+        self.sample_size = sample_size or self.width * CACHE_SKETCH_SAMPLE_FACTOR
+        self._rows = [array("B", bytes(self.width)) for _ in range(depth)]
+        self._additions = 0
+        self.resets = 0
+        self._lock = threading.Lock()
+
+    def _indexes(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], "little")
+        h2 = int.from_bytes(digest[4:], "little") | 1
+        mask = self.width - 1
+        return [(h1 + i * h2) & mask for i in range(self.depth)]
+
+    def increment(self, key: str) -> int:
+        """מוסיף בקשה אחת ומחזיר את ההערכה אחרי ההוספה."""
+        idx = self._indexes(key)
+        with self._lock:
+            current = min(row[i] for row, i in zip(self._rows, idx))
+            if current < _MAX_COUNTER:
+                for row, i in zip(self._rows, idx):
+                    if row[i] == current:
+                        row[i] = current + 1
+                current += 1
+
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._age()
+                current = min(row[i] for row, i in zip(self._rows, idx))
+            return current
+
+    def estimate(self, key: str) -> int:
+        idx = self._indexes(key)
+        with self._lock:
+            return min(row[i] for row, i in zip(self._rows, idx))
+
+    def _age(self):
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] >>= 1
+        self._additions //= 2
+        self.resets += 1
+
+    def clear(self):
+        with self._lock:
+            for row in self._rows:
+                row[:] = array("B", bytes(self.width))
+            self._additions = 0
+
+
+class TinyLFUAdmission:
+    """
+    מדיניות admission בסגנון TinyLFU:
+    - כל בקשה שלא נענתה מה-cache נספרת ב-sketch (בזיכרון; שאילתה חד-פעמית לא משאירה שום רשומה)
+    - תוצאה נשמרת רק אם תדירות ה-key מגיעה לסף, שעולה עם גודל התוצאה
+    - אם השמירה תפנה רשומות משכבת הזיכרון — ה-key צריך להיות תדיר יותר מכל מי שיפונה
+    """
+
+    def __init__(self, sketch: CountMinSketch | None = None, min_freq: int = CACHE_ADMIT_MIN_FREQ,
+                 size_unit: int = CACHE_ADMIT_SIZE_UNIT):
+        self.sketch = sketch or CountMinSketch()
+        self.min_freq = min_freq
+        self.size_unit = size_unit
+        self._lock = threading.Lock()
+        self._stats = {"recorded": 0, "admitted": 0, "rejected_frequency": 0, "rejected_size": 0,
+                       "rejected_victims": 0}
+
+    def record(self, key: str) -> int:
+        with self._lock:
+            self._stats["recorded"] += 1
+        return self.sketch.increment(key)
+
+    def required_frequency(self, size: int) -> int:
+        if size <= self.size_unit:
+            return self.min_freq
+        return self.min_freq + math.ceil(math.log2(size / self.size_unit))
+
+    def frequent_enough(self, freq: int) -> bool:
+        """בדיקה זולה לפני קידוד התוצאה (לפני שהגודל ידוע)."""
+        if freq >= self.min_freq:
+            return True
+        with self._lock:
+            self._stats["rejected_frequency"] += 1
+        return False
+
+    def admit(self, key: str, size: int, victims=()) -> bool:
+        """האם לשמור את התוצאה של key (בגודל size bytes), כשהשמירה תפנה את victims."""
+        freq = self.sketch.estimate(key)
+        if freq < self.min_freq:
+            reason = "rejected_frequency"
+        elif freq < self.required_frequency(size):
+            reason = "rejected_size"
+        elif any(self.sketch.estimate(v) >= freq for v in victims):
+            reason = "rejected_victims"
+        else:
+            reason = "admitted"
+
+        with self._lock:
+            self._stats[reason] += 1
+        return reason == "admitted"
+
+    def clear(self):
+        self.sketch.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        decisions = stats["admitted"] + stats["rejected_frequency"] + stats["rejected_size"] + stats["rejected_victims"]
+        stats["admission_rate"] = (stats["admitted"] / decisions) if decisions else 0.0
+        stats["min_freq"] = self.min_freq
+        stats["sketch_width"] = self.sketch.width
+        stats["sketch_depth"] = self.sketch.depth
+        stats["sketch_resets"] = self.sketch.resets
+        return stats
@@ -1,10 +1,68 @@
+import os
 import json
+import atexit
+import asyncio
+import contextvars
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
-from google.cloud import bigquery
 import logging
 
+from ...bq import run_blocking, ArrowRows, is_truncated
+from .sql_canonical import canonical_key
+from .cache_events import CacheEventLog
+from .cache_codec import CachedPayload, encode_rows, codec_stats
+from .admission import TinyLFUAdmission
+from .source_versions import SourceVersions
+from .subsumption import RollupIndex, rollup_shape, intent_matches, derive_rows
+from .cache_keystats import KeyStats
+# the backend interface is part of this module's API; the implementations (sqlite / sockets / redis) live
+# next to it in cache_backends.py, like the events log and the codec
+from .cache_backends import (  # noqa: F401 (re-exported)
+    CACHE_BACKEND, CacheBackend, BigQueryBackend, MemoryBackend, DiskBackend, KVBackend, make_backend,
+)
+
 logger = logging.getLogger(__name__)
 
+# In-process tier in front of the BigQuery table
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 ** 2)))
+CACHE_MEMORY_MAX_ENTRY_BYTES = int(os.getenv("CACHE_MEMORY_MAX_ENTRY_BYTES", str(8 * 1024 ** 2)))
+
+# On a memory miss, also look in the BigQuery table (off = memory tier only for reads)
+CACHE_READ_THROUGH = os.getenv("CACHE_READ_THROUGH", "1") not in ("0", "false", "False")
+
+# "events" (default): use counts / results are append-only events, compacted in the background.
+# "dml": the original MERGE + SELECT + UPDATE on the request path.
+CACHE_BOOKKEEPING = os.getenv("CACHE_BOOKKEEPING", "events")
+
+# When a result gets stored:
+# "tinylfu" (default): in-memory frequency sketch + size-aware admission (see admission.py);
+#   misses leave no row / event behind until a key is admitted
+# "count": the original rule — a use_count row per key, store on the MAX_COUNT-th request
+CACHE_ADMISSION = os.getenv("CACHE_ADMISSION", "tinylfu")
+
+# How cached answers stay valid:
+# "source" (default): while none of the table partitions the query reads changed since the answer was
+#   computed (see source_versions.py) — no TTL. Answers that can't be tied to tables keep the TTL.
+# "ttl": the fixed CacheService.TTL for everything.
+CACHE_VALIDITY = os.getenv("CACHE_VALIDITY", "source")
+# Upper bound on the age of a source-validated answer: a safety cap in case a dependency was missed (0 = none)
+CACHE_SOURCE_MAX_AGE = timedelta(seconds=int(os.getenv("CACHE_SOURCE_MAX_AGE_SECONDS", str(24 * 3600))))
+
+# Stale-while-revalidate: for this long past the TTL an expired entry is still served
+# (flagged stale) while one background refresh re-runs the query. 0 disables.
+CACHE_STALE_GRACE = timedelta(seconds=int(os.getenv("CACHE_STALE_GRACE_SECONDS", "900")))
+# Hard cap on the age of a TTL-bound answer served stale, whatever the grace window says. Source-bound answers
+# are capped by CACHE_SOURCE_MAX_AGE instead (plus the memory tier's grace, like any entry)
+CACHE_MAX_STALENESS = timedelta(seconds=int(os.getenv("CACHE_MAX_STALENESS_SECONDS", "1800")))
+
+# Subsumption: on a miss, answer SUM(total_events) roll-ups by filtering / re-aggregating a cached
+# finer-grained breakdown of the same dates (see subsumption.py). "0" disables.
+CACHE_SUBSUMPTION = os.getenv("CACHE_SUBSUMPTION", "1") not in ("0", "false", "False")
+
+# Introspection: entries this close to their TTL count as "near expiry"
+CACHE_NEAR_EXPIRY = timedelta(seconds=int(os.getenv("CACHE_NEAR_EXPIRY_SECONDS", "60")))
+
 
 def _normalize_numbers(obj):
     """
@@ -36,14 +94,13 @@ def normalize_intent_key(
     בונה intent_key יציב ואחיד.
 
     עדיפות:
-    1) SQL מנורמל (רווחים)
+    1) hash של ה-SQL הקנוני (ראו sql_canonical)
     2) parsed_intent מנורמל (כולל scope, מספרים)
     3) user_message
     """
 
     if sql and sql.strip():
-        normalized_sql = " ".join(sql.strip().split())
-        return normalized_sql
+        return canonical_key(sql)
 
     base = parsed_intent or {}
     if isinstance(base, dict) and base:
@@ -63,15 +120,207 @@ def normalize_intent_key(
     return ""
 
 
+class MemoryTier:
+    """
+    LRU בזיכרון התהליך לפי intent_key, מוגבל ב-bytes (גודל ה-JSON של התוצאה).
+    תוקף נמדד מ-last_updated של הרשומה (כמו בטבלה), כך שהשכבה לא מאריכה את ה-TTL.
+    בתוך חלון ה-grace שאחרי ה-TTL הרשומה עוד מוחזרת, מסומנת stale=True.
+    כשחורגים מהתקציב — קודם נזרקות רשומות שפג תוקפן, אחר כך הכי פחות בשימוש.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, ttl: timedelta, grace: timedelta = timedelta(0)):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.grace = grace
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "rejected": 0}
+        self._listeners: list = []
+
+    def on_remove(self, fn):
+        """fn(key) נקרא לכל key שיצא מהשכבה (תפוגה, פינוי, ביטול, דחייה בגלל גודל)."""
+        self._listeners.append(fn)
+
+    def _removed(self, keys):
+        for key in keys:
+            for fn in self._listeners:
+                fn(key)
+
+    def _expired(self, entry: dict, now: datetime) -> bool:
+        return (now - entry["last_updated"]) > entry["ttl"] + self.grace
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def get(self, key: str, now: datetime | None = None) -> dict | None:
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and self._expired(entry, now)
+            if expired:
+                self._drop(key)
+                self._stats["expired"] += 1
+            elif entry is not None:
+                self._entries.move_to_end(key)
+                stale = (now - entry["last_updated"]) > entry["ttl"]
+                self._stats["stale_hits" if stale else "hits"] += 1
+                return {**entry, "stale": stale}
+            self._stats["misses"] += 1
+
+        if expired:
+            self._removed([key])
+        return None
+
+    def peek(self, key: str, now: datetime | None = None) -> dict | None:
+        """רשומה בתוקף (לא stale) בלי לספור hit / miss — לגזירת תשובה לבקשה אחרת."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (now - entry["last_updated"]) > entry["ttl"]:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, *, rows, executed_sql: str, last_updated: datetime, size: int,
+            ttl: timedelta | None = None, source_bound: bool = False, truncated: bool = False):
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self._stats["rejected"] += 1
+                stored = key in self._entries
+            if not stored:
+                self._removed([key])
+            return
+
+        entry = {
+            "rows": rows,
+            "executed_sql": executed_sql,
+            "row_count": len(rows),
+            "last_updated": last_updated,
+            "size": size + len(key),
+            # source-bound entries live until their tables change (invalidate) rather than for the TTL
+            "ttl": ttl or self.ttl,
+            "source_bound": source_bound,
+            # stopped at the row / byte cap: a partial result
+            "truncated": truncated,
+        }
+        now = datetime.now(timezone.utc)
+
+        removed = []
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry["size"]
+
+            if self._bytes > self.max_bytes:
+                for k in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                    self._drop(k)
+                    self._stats["expired"] += 1
+                    removed.append(k)
+            while self._bytes > self.max_bytes and self._entries:
+                k, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                self._stats["evictions"] += 1
+                removed.append(k)
+        self._removed(removed)
+
+    def describe(self, top_n: int = 10, near_expiry: timedelta = CACHE_NEAR_EXPIRY, now: datetime | None = None) -> dict:
+        """גילאים, גדלים ורשומות שעומדות לפוג — לכיול התקציב וה-TTL."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            snapshot = [
+                (k, e["size"], (now - e["last_updated"]).total_seconds(),
+                 (e["ttl"] - (now - e["last_updated"])).total_seconds(), e["source_bound"])
+                for k, e in self._entries.items()
+            ]
+
+        ages = [age for _, _, age, _, _ in snapshot]
+        sizes = [size for _, size, _, _, _ in snapshot]
+        largest = sorted(snapshot, key=lambda s: s[1], reverse=True)[:top_n]
+        return {
+            "entries": len(snapshot),
+            "bytes": sum(sizes),
+            "stale_entries": sum(1 for s in snapshot if s[3] < 0),
+            "near_expiry": sum(1 for s in snapshot if 0 <= s[3] <= near_expiry.total_seconds()),
+            "source_bound": sum(1 for s in snapshot if s[4]),
+            "age_seconds": {"avg": sum(ages) / len(ages) if ages else 0.0, "max": max(ages, default=0.0)},
+            "size_bytes": {"avg": sum(sizes) / len(sizes) if sizes else 0.0, "max": max(sizes, default=0)},
+            "largest": [
+                {"intent_key": k, "bytes": size, "age_seconds": round(age, 3),
+                 "expires_in_seconds": None if bound else round(remaining, 3)}
+                for k, size, age, remaining, bound in largest
+            ],
+        }
+
+    def eviction_candidates(self, size: int, now: datetime | None = None) -> list[str]:
+        """ה-keys שיפונו (לפי LRU) כדי לפנות מקום לרשומה בגודל size. רשומות שפג תוקפן לא נחשבות."""
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            over = self._bytes + size - self.max_bytes
+            victims = []
+            for k, e in self._entries.items():
+                if over <= 0:
+                    break
+                if not self._expired(e, now):
+                    victims.append(k)
+                over -= e["size"]
+            return victims
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._drop(key)
+        self._removed([key])
+
+    def clear(self):
+        with self._lock:
+            removed = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        self._removed(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["hits"] + self._stats["stale_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_tier_lock = threading.Lock()
+_bq_tier_stats = {"hits": 0, "misses": 0}
+
+# keys with a background refresh in flight (one refresh per key per process)
+_refreshing: set = set()
+_refresh_tasks: set = set()
+_swr_stats = {"stale_served": 0, "refreshes": 0, "refresh_failures": 0, "refresh_skipped": 0}
+
+
+def _stale_window(ttl: timedelta) -> timedelta:
+    """כמה זמן אחרי ה-TTL עוד מותר להגיש רשומה (grace, חסום ב-max staleness)."""
+    return max(timedelta(0), min(CACHE_STALE_GRACE, CACHE_MAX_STALENESS - ttl))
+
+
 class CacheService:
     """
     Cache מבוסס BigQuery.
     טבלה: practicode-2025.cache.cached_queries
 
     שדות:
-      intent_key   (STRING)
+      key_hash     (STRING)            # sha256(intent_key) באורך קבוע — הטבלה clustered לפיו (ראו cache_keys)
+      key_bucket   (INT64, nullable)   # hash mod CACHE_KEY_BUCKETS כשהטבלה גם partitioned
+      intent_key   (STRING)            # המפתח הקריא
       sql          (STRING)
-      result       (STRING, nullable)  # JSON string של rows
+      result       (STRING, nullable)  # payload של rows: Arrow דחוס או JSON (ראו cache_codec)
       last_updated (TIMESTAMP, nullable)
       use_count    (INT64)
     """
@@ -79,11 +328,25 @@ class CacheService:
     TTL = timedelta(seconds=300)
     MAX_COUNT = 3
 
-    def __init__(self):
+    # shared by every CacheService instance in the process
+    memory = MemoryTier(CACHE_MEMORY_MAX_BYTES, CACHE_MEMORY_MAX_ENTRY_BYTES, TTL, grace=_stale_window(TTL))
+    admission = TinyLFUAdmission()
+    rollups = RollupIndex()
+
+    def __init__(self, backend: CacheBackend | None = None):
         self.project = "practicode-2025"
         self.dataset = "cache"
         self.table = "cached_queries"
-        self.client = bigquery.Client(project=self.project, location="EU")
+        # the persistent tier behind memory (CACHE_BACKEND, see cache_backends)
+        self.backend = backend or make_backend(self.project, self.dataset, self.table)
+        # use_count as last read from the table (events mode adds this process's pending uses)
+        self._seen_use_counts: dict = {}
+        # whether the last run_or_cache answer was a stale entry (refresh running in the background)
+        self.served_stale = False
+        # whether it was derived from another cached (finer-grained) result
+        self.served_derived = False
+        # whether the answer stopped at the row / byte cap (fresh or as cached)
+        self.served_truncated = False
 
     # -------------------------------------------------------
     # Public: בדיקה אם יש תשובה בקאש (רק אם use_count==3 ו TTL בתוקף)
@@ -93,20 +356,42 @@ class CacheService:
         מחזירה dict עם rows/sql/row_count אם:
           - יש result
           - use_count == 3 (אצלנו capped ל-3)
-          - TTL בתוקף
+          - TTL בתוקף (או בתוך חלון ה-grace => stale=True)
           - JSON תקין
         אחרת None
+        קודם נבדקת שכבת הזיכרון; רק בהחטאה (ואם CACHE_READ_THROUGH) — הטבלה ב-BigQuery.
         """
+        hot = self.memory.get(intent_key)
+        if hot is not None and hot["source_bound"] and self._source_validity(hot["executed_sql"], hot["last_updated"]) != "valid":
+            # missed invalidation / metadata no longer fresh: re-check against the table tier
+            self.memory.invalidate(intent_key)
+            hot = None
+        if hot is not None:
+            return {
+                "rows": hot["rows"], "executed_sql": hot["executed_sql"],
+                "row_count": hot["row_count"], "stale": hot["stale"], "truncated": hot["truncated"], "tier": "memory",
+            }
+
+        if not CACHE_READ_THROUGH:
+            return None
+
+        cached = self._load_valid_entry(intent_key)
+        with _tier_lock:
+            _bq_tier_stats["hits" if cached else "misses"] += 1
+        return cached
+
+    def _load_valid_entry(self, intent_key: str):
         entry = self._load_entry(intent_key)
         if not entry:
             return None
 
         use_count = int(entry.get("use_count") or 0)
+        self._seen_use_counts[intent_key] = use_count
         if use_count < self.MAX_COUNT:
             return None
 
-        result_json = entry.get("result")
-        if not result_json:
+        result_payload = entry.get("result")
+        if not result_payload:
             return None
 
         last_updated = entry.get("last_updated")
@@ -116,29 +401,102 @@ class CacheService:
         if last_updated.tzinfo is None:
             last_updated = last_updated.replace(tzinfo=timezone.utc)
 
-        now = datetime.now(timezone.utc)
-        if (now - last_updated) > self.TTL:
+        validity = self._source_validity(entry.get("sql") or "", last_updated)
+        if validity == "changed":
+            return None  # a partition it reads was modified after it was computed
+
+        age = datetime.now(timezone.utc) - last_updated
+        if validity == "valid":
+            if CACHE_SOURCE_MAX_AGE and age > CACHE_SOURCE_MAX_AGE:
+                return None
+        elif age > self.TTL + _stale_window(self.TTL):
             return None
 
+        # header only until here; the body is decoded once the entry is known to be servable
         try:
-            rows = json.loads(result_json)
+            payload = CachedPayload(result_payload)
+            rows = payload.rows
         except Exception:
             return None
 
+        # warm the memory tier (same last_updated => same expiry as the table)
+        self._memory_put(
+            intent_key, rows=rows, sql=entry.get("sql") or "",
+            last_updated=last_updated, size=payload.decoded_bytes, validity=validity, truncated=payload.truncated,
+        )
+
         return {
             "rows": rows,
             "executed_sql": entry.get("sql") or "",
             "row_count": len(rows),
+            "stale": validity != "valid" and age > self.TTL,
+            "truncated": payload.truncated,
+            "tier": "bigquery",
         }
 
+    def _source_validity(self, sql: str, computed_at: datetime) -> str | None:
+        if CACHE_VALIDITY != "source":
+            return None
+        return source_versions.validity(sql, computed_at)
+
+    def _memory_put(self, intent_key: str, *, rows, sql: str, last_updated: datetime, size: int, validity,
+                    truncated: bool = False):
+        if validity == "valid":
+            source_versions.register(intent_key, sql)
+            self.memory.put(
+                intent_key, rows=rows, executed_sql=sql, last_updated=last_updated, size=size,
+                ttl=CACHE_SOURCE_MAX_AGE or timedelta(days=36500), source_bound=True, truncated=truncated,
+            )
+        else:
+            self.memory.put(
+                intent_key, rows=rows, executed_sql=sql, last_updated=last_updated, size=size, truncated=truncated,
+            )
+        key_stats.record_size(intent_key, size)
+
+        if CACHE_SUBSUMPTION:
+            if truncated:
+                self.rollups.forget(intent_key)  # a partial breakdown: totals derived from it would be wrong
+            else:
+                self.rollups.register(intent_key, sql, len(rows))
+
+    def get_derived_result(self, intent_key: str, sql: str, parsed_intent: dict | None = None):
+        """
+        תשובה שנגזרת מ-entry אחר בשכבת הזיכרון, כשה-dimensions והסינונים שלו מכילים את הבקשה
+        (למשל total לפי media_source => total של media_source אחד, או ה-total הכולל, לאותם ימים).
+        מסננים ומסכמים מחדש בתהליך. None אם אין entry כזה.
+        """
+        if not CACHE_SUBSUMPTION:
+            return None
+        request = rollup_shape(sql)
+        if request is None or not intent_matches(parsed_intent, request):
+            return None
+
+        for key, shape in self.rollups.candidates(request, exclude=intent_key):
+            entry = self.memory.peek(key)
+            if entry is None:
+                self.rollups.forget(key)
+                continue
+            if entry["source_bound"] and self._source_validity(entry["executed_sql"], entry["last_updated"]) != "valid":
+                self.memory.invalidate(key)
+                self.rollups.forget(key)
+                continue
+
+            rows = derive_rows(shape, entry["rows"], request)
+            self.rollups.record_derived()
+            logger.info(f"[CACHE] DERIVED from {len(entry['rows'])} cached rows. source={key[:80]}...")
+            return {"rows": rows, "executed_sql": sql, "row_count": len(rows), "derived_from": key}
+        return None
+
     # -------------------------------------------------------
     # Public: Pipeline ראשי לפי הדרישה שלך
     # -------------------------------------------------------
-    def run_or_cache(self, *, intent_key: str, sql: str, run_bigquery_fn):
+    def run_or_cache(self, *, intent_key: str, sql: str, run_bigquery_fn, json_safe: bool = False,
+                     parsed_intent: dict | None = None):
         """
         אלגוריתם לפי הדרישה:
 
         1) אם יש תשובה בקאש (use_count==3 + TTL) => מחזירים אותה (בלי להתחבר לביג)
+        1b) אם entry אחר בזיכרון מכיל את הבקשה (roll-up) => גוזרים ממנו בתהליך
         2) אחרת:
            - מגדילים use_count עד 3 בלבד (cap)
            - מריצים BigQuery
@@ -146,50 +504,222 @@ class CacheService:
            - אם עדיין <3 => לא שומרים result
         """
 
+        self.served_stale = False
+        self.served_derived = False
+        self.served_truncated = False
         cached = self.get_valid_cached_result(intent_key)
         if cached is not None:
-            logger.info(f"[CACHE] HIT (TTL valid, use_count=3). key={intent_key[:80]}...")
+            key_stats.record(intent_key, f"{cached.get('tier', 'bigquery')}_hits", stale=bool(cached.get("stale")))
+            if cached.get("stale"):
+                self._serve_stale(intent_key)
+                self._start_refresh(intent_key, lambda: self._refresh(intent_key, sql, run_bigquery_fn, json_safe))
+            else:
+                logger.info(f"[CACHE] HIT (TTL valid, use_count=3). key={intent_key[:80]}...")
+            self.served_truncated = bool(cached.get("truncated"))
             return cached["rows"], True
 
+        derived = self.get_derived_result(intent_key, sql, parsed_intent)
+        if derived is not None:
+            self.served_derived = True
+            key_stats.record(intent_key, "derived_hits")
+            return derived["rows"], True
+
+        key_stats.record(intent_key, "misses")
         now = datetime.now(timezone.utc)
 
+        if CACHE_ADMISSION != "count":
+            freq = self.admission.record(intent_key)
+            logger.info(f"[CACHE] MISS. estimated frequency={freq}. key={intent_key[:80]}...")
+            rows = run_bigquery_fn(sql)
+            self.served_truncated = is_truncated(rows)
+            safe_rows = rows if json_safe else self._make_json_safe(rows)
+            self._admit_and_save(
+                intent_key=intent_key, sql=sql, rows=safe_rows, now=now, freq=freq, truncated=self.served_truncated,
+            )
+            return safe_rows, False
+
         # מעלה מונה capped ל-3
-        use_count = self._upsert_and_increment_capped(intent_key=intent_key, sql=sql)
+        use_count = self._increment_use(intent_key=intent_key, sql=sql)
         logger.info(f"[CACHE] MISS. use_count(after increment, capped)={use_count}. key={intent_key[:80]}...")
 
         # מריצים ביג (אין תשובה תקפה בקאש)
         rows = run_bigquery_fn(sql)
-        safe_rows = self._make_json_safe(rows)
+        self.served_truncated = is_truncated(rows)
+        safe_rows = rows if json_safe else self._make_json_safe(rows)
 
         # שומרים תוצאה רק אם הגענו ל-3
         if use_count >= self.MAX_COUNT:
             logger.info("[CACHE] Reached 3rd ask => saving result + last_updated (count capped at 3).")
-            self._save_result(intent_key=intent_key, sql=sql, rows=safe_rows, now=now)
+            self._save_result(intent_key=intent_key, sql=sql, rows=safe_rows, now=now, truncated=self.served_truncated)
         else:
             logger.info("[CACHE] Warming (<3) => NOT saving result (only count updated).")
 
         return safe_rows, False
 
+    async def run_or_cache_async(self, *, intent_key: str, sql: str, run_bigquery_fn_async, json_safe: bool = False,
+                                 parsed_intent: dict | None = None):
+        """
+        אותו אלגוריתם כמו run_or_cache, בלי לחסום את ה-event loop:
+        - קריאות ה-cache (lookup, ובמצב dml גם MERGE / UPDATE) רצות ב-executor החסום של bq
+        - run_bigquery_fn_async היא coroutine שמריצה את השאילתה עצמה
+        json_safe=True => ה-runner כבר מחזיר שורות בטוחות ל-JSON (Arrow path), מדלגים על ההמרה.
+        parsed_intent (אופציונלי) — מאשר שה-SQL הוא roll-up שאפשר לגזור מ-entry אחר (ראו get_derived_result).
+        """
+
+        self.served_stale = False
+        self.served_derived = False
+        self.served_truncated = False
+        cached = await run_blocking(self.get_valid_cached_result, intent_key)
+        if cached is not None:
+            key_stats.record(intent_key, f"{cached.get('tier', 'bigquery')}_hits", stale=bool(cached.get("stale")))
+            if cached.get("stale"):
+                self._serve_stale(intent_key)
+                self._start_refresh_async(
+                    intent_key, self._refresh_async(intent_key, sql, run_bigquery_fn_async, json_safe)
+                )
+            else:
+                logger.info(f"[CACHE] HIT (TTL valid, use_count=3). key={intent_key[:80]}...")
+            self.served_truncated = bool(cached.get("truncated"))
+            return cached["rows"], True
+
+        derived = self.get_derived_result(intent_key, sql, parsed_intent)
+        if derived is not None:
+            self.served_derived = True
+            key_stats.record(intent_key, "derived_hits")
+            return derived["rows"], True
+
+        key_stats.record(intent_key, "misses")
+        now = datetime.now(timezone.utc)
+
+        if CACHE_ADMISSION != "count":
+            freq = self.admission.record(intent_key)
+            logger.info(f"[CACHE] MISS. estimated frequency={freq}. key={intent_key[:80]}...")
+            rows = await run_bigquery_fn_async(sql)
+            self.served_truncated = is_truncated(rows)
+            safe_rows = rows if json_safe else self._make_json_safe(rows)
+            await run_blocking(
+                self._admit_and_save, intent_key=intent_key, sql=sql, rows=safe_rows, now=now, freq=freq,
+                truncated=self.served_truncated,
+            )
+            return safe_rows, False
+
+        use_count = await run_blocking(self._increment_use, intent_key=intent_key, sql=sql)
+        logger.info(f"[CACHE] MISS. use_count(after increment, capped)={use_count}. key={intent_key[:80]}...")
+
+        rows = await run_bigquery_fn_async(sql)
+        self.served_truncated = is_truncated(rows)
+        safe_rows = rows if json_safe else self._make_json_safe(rows)
+
+        if use_count >= self.MAX_COUNT:
+            logger.info("[CACHE] Reached 3rd ask => saving result + last_updated (count capped at 3).")
+            await run_blocking(
+                self._save_result, intent_key=intent_key, sql=sql, rows=safe_rows, now=now,
+                truncated=self.served_truncated,
+            )
+        else:
+            logger.info("[CACHE] Warming (<3) => NOT saving result (only count updated).")
+
+        return safe_rows, False
+
+    # -------------------------------------------------------
+    # Stale-while-revalidate
+    # -------------------------------------------------------
+    def _serve_stale(self, intent_key: str):
+        self.served_stale = True
+        with _tier_lock:
+            _swr_stats["stale_served"] += 1
+        logger.info(f"[CACHE] STALE HIT (within grace) => serving, refreshing in background. key={intent_key[:80]}...")
+
+    def _claim_refresh(self, intent_key: str) -> bool:
+        with _tier_lock:
+            if intent_key in _refreshing:
+                _swr_stats["refresh_skipped"] += 1
+                return False
+            _refreshing.add(intent_key)
+            _swr_stats["refreshes"] += 1
+            return True
+
+    def _start_refresh(self, intent_key: str, fn):
+        if not self._claim_refresh(intent_key):
+            return
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(fn,), name="cache-refresh", daemon=True).start()
+
+    def _start_refresh_async(self, intent_key: str, coro):
+        if not self._claim_refresh(intent_key):
+            coro.close()
+            return
+        task = asyncio.ensure_future(coro)
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+
+    def _refresh_done(self, intent_key: str, error: Exception | None):
+        with _tier_lock:
+            _refreshing.discard(intent_key)
+            if error is not None:
+                _swr_stats["refresh_failures"] += 1
+        if error is not None:
+            # the stale entry keeps being served until it passes max staleness
+            logger.warning(f"[CACHE] background refresh failed key={intent_key[:80]}...: {error}")
+
+    def _refresh(self, intent_key: str, sql: str, run_bigquery_fn, json_safe: bool):
+        error = None
+        try:
+            now = datetime.now(timezone.utc)
+            rows = run_bigquery_fn(sql)
+            safe_rows = rows if json_safe else self._make_json_safe(rows)
+            self._save_result(
+                intent_key=intent_key, sql=sql, rows=safe_rows, now=now, truncated=is_truncated(rows),
+            )
+        except Exception as e:
+            error = e
+        finally:
+            self._refresh_done(intent_key, error)
+
+    async def _refresh_async(self, intent_key: str, sql: str, run_bigquery_fn_async, json_safe: bool):
+        error = None
+        try:
+            now = datetime.now(timezone.utc)
+            rows = await run_bigquery_fn_async(sql)
+            safe_rows = rows if json_safe else self._make_json_safe(rows)
+            await run_blocking(
+                self._save_result, intent_key=intent_key, sql=sql, rows=safe_rows, now=now,
+                truncated=is_truncated(rows),
+            )
+        except Exception as e:
+            error = e
+        finally:
+            self._refresh_done(intent_key, error)
+
     # -------------------------------------------------------
     # INTERNALS
     # -------------------------------------------------------
     def _load_entry(self, intent_key: str):
-        query = f"""
-            SELECT intent_key, sql, result, last_updated, use_count
-            FROM `{self.project}.{self.dataset}.{self.table}`
-            WHERE intent_key = @key
-            LIMIT 1
+        return self.backend.load(intent_key)
+
+    def table_summary(self, top_n: int = 10, near_expiry: timedelta = CACHE_NEAR_EXPIRY) -> dict:
+        """
+        מצב האחסון של ה-cache: מספר רשומות, bytes, כמה עברו / קרובות ל-TTL, והגדולות ביותר.
+        ב-BigQuery סורק את עמודת result — רק לבקשת admin מפורשת, לא במסלול של שאלה.
         """
+        now = datetime.now(timezone.utc)
+        return self.backend.summary(top_n, expired_before=now - self.TTL, near_before=now - self.TTL + near_expiry)
 
-        job = self.client.query(
-            query,
-            job_config=bigquery.QueryJobConfig(
-                query_parameters=[bigquery.ScalarQueryParameter("key", "STRING", intent_key)]
-            ),
-        )
+    def hot_entries(self, limit: int) -> list[dict]:
+        """ה-keys הכי מבוקשים באחסון (use_count, ואז הכי מעודכנים) — ל-warm-up אחרי הפעלה."""
+        return self.backend.hot_entries(limit)
+
+    def _increment_use(self, *, intent_key: str, sql: str) -> int:
+        """
+        מעלה use_count (capped) ומחזיר את הערך אחרי ההגדלה.
+        events: בלי I/O — הערך מהטבלה (מה-lookup שכבר רץ) + בקשות של התהליך שעוד לא קופלו.
+        """
+        if not self._use_events():
+            return self._upsert_and_increment_capped(intent_key=intent_key, sql=sql)
 
-        rows = list(job)
-        return dict(rows[0]) if rows else None
+        seen = self._seen_use_counts.get(intent_key, 0)
+        pending = cache_events.record_use(intent_key, sql)
+        return min(seen + pending, self.MAX_COUNT)
 
     def _upsert_and_increment_capped(self, *, intent_key: str, sql: str) -> int:
         """
@@ -197,56 +727,48 @@ class CacheService:
         אם אין רשומה — יוצר use_count=1.
         מחזיר את הערך בפועל אחרי העדכון.
         """
-        merge_sql = f"""
-            MERGE `{self.project}.{self.dataset}.{self.table}` T
-            USING (SELECT @key AS intent_key, @sql AS sql) S
-            ON T.intent_key = S.intent_key
-            WHEN MATCHED THEN
-              UPDATE SET
-                use_count = LEAST(IFNULL(T.use_count, 0) + 1, {self.MAX_COUNT}),
-                sql = S.sql
-            WHEN NOT MATCHED THEN
-              INSERT (intent_key, sql, result, last_updated, use_count)
-              VALUES (S.intent_key, S.sql, CAST(NULL AS STRING), CAST(NULL AS TIMESTAMP), 1)
-        """
+        return self.backend.increment_use(intent_key, sql, self.MAX_COUNT)
 
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("key", "STRING", intent_key),
-                bigquery.ScalarQueryParameter("sql", "STRING", sql),
-            ]
-        )
+    def _use_events(self) -> bool:
+        # append-only events exist only for BigQuery; disk / kv / memory backends write directly
+        return CACHE_BOOKKEEPING != "dml" and self.backend.supports_events
 
-        self.client.query(merge_sql, job_config=job_config).result()
+    def _admit_and_save(self, *, intent_key: str, sql: str, rows, now: datetime, freq: int, truncated: bool = False):
+        """tinylfu: שומר את התוצאה רק אם ה-key תדיר מספיק לגודלה (ויותר מכל מי שיפונה מהזיכרון)."""
+        if not self.admission.frequent_enough(freq):
+            logger.info(f"[CACHE] Not admitted (frequency {freq} < {self.admission.min_freq}) => NOT saving.")
+            return
 
-        entry = self._load_entry(intent_key)
-        return int(entry.get("use_count") or 0) if entry else 0
-
-    def _save_result(self, *, intent_key: str, sql: str, rows, now: datetime):
-        json_string = json.dumps(rows, ensure_ascii=False)
-
-        update_sql = f"""
-            UPDATE `{self.project}.{self.dataset}.{self.table}`
-            SET
-                result = @res,
-                last_updated = @ts,
-                sql = @sql,
-                use_count = {self.MAX_COUNT}
-            WHERE intent_key = @key
-        """
+        encoded = encode_rows(rows, truncated)
+        victims = self.memory.eviction_candidates(encoded[1] + len(intent_key))
+        if not self.admission.admit(intent_key, encoded[1], victims):
+            logger.info(f"[CACHE] Not admitted (size={encoded[1]}, victims={len(victims)}) => NOT saving.")
+            return
 
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("res", "STRING", json_string),
-                bigquery.ScalarQueryParameter("ts", "TIMESTAMP", now.isoformat()),
-                bigquery.ScalarQueryParameter("sql", "STRING", sql),
-                bigquery.ScalarQueryParameter("key", "STRING", intent_key),
-            ]
+        logger.info(f"[CACHE] Admitted (frequency={freq}) => saving result + last_updated.")
+        self._save_result(intent_key=intent_key, sql=sql, rows=rows, now=now, encoded=encoded, truncated=truncated)
+
+    def _save_result(self, *, intent_key: str, sql: str, rows, now: datetime, encoded: tuple | None = None,
+                     truncated: bool = False):
+        payload, decoded_size = encoded or encode_rows(rows, truncated)
+
+        if not self._use_events():
+            self._update_result(intent_key=intent_key, sql=sql, payload=payload, now=now)
+        else:
+            cache_events.record_result(intent_key, sql, payload, now)
+
+        self._memory_put(
+            intent_key, rows=rows, sql=sql, last_updated=now, size=decoded_size,
+            validity=self._source_validity(sql, now), truncated=truncated,
         )
 
-        self.client.query(update_sql, job_config=job_config).result()
+    def _update_result(self, *, intent_key: str, sql: str, payload: str, now: datetime):
+        self.backend.save_result(intent_key, sql, payload, now, self.MAX_COUNT)
 
     def _make_json_safe(self, result_list):
+        if isinstance(result_list, ArrowRows):
+            return result_list  # its rows are built JSON-safe (bq.arrow_to_records)
+
         from datetime import datetime as _dt, date as _date
 
         def fix(v):
@@ -256,4 +778,71 @@ class CacheService:
                 return v.isoformat()
             return v
 
-        return [{k: fix(v) for k, v in row.items()} for row in result_list]
\ No newline at end of file
+        return [{k: fix(v) for k, v in row.items()} for row in result_list]
+
+
+cache_events = CacheEventLog("practicode-2025", "cache", "cached_queries", max_count=CacheService.MAX_COUNT)
+
+# don't lose buffered events on a clean shutdown
+atexit.register(cache_events.flush_at_exit)
+
+source_versions = SourceVersions()
+source_versions.on_invalidate(lambda key: CacheService.memory.invalidate(key))
+# an entry that left the memory tier (evicted / expired) no longer needs its partitions watched
+CacheService.memory.on_remove(source_versions.forget)
+
+
+def start_source_polling():
+    """מה-lifespan של האפליקציה: ה-poller של גרסאות טבלאות המקור (רק ב-CACHE_VALIDITY=source)."""
+    if CACHE_VALIDITY == "source":
+        source_versions.start()
+
+# per-key traffic / sizes in this process (see /admin/cache/keys)
+key_stats = KeyStats()
+
+
+def cache_stats() -> dict:
+    """hits / misses לכל שכבה (memory -> BigQuery)."""
+    with _tier_lock:
+        bq_stats = dict(_bq_tier_stats)
+        swr = dict(_swr_stats, refreshing=len(_refreshing))
+    lookups = bq_stats["hits"] + bq_stats["misses"]
+    bq_stats["hit_rate"] = (bq_stats["hits"] / lookups) if lookups else 0.0
+    bq_stats["read_through"] = CACHE_READ_THROUGH
+
+    return {
+        "memory": CacheService.memory.stats(),
+        "bigquery": bq_stats,
+        "backend": {"name": CACHE_BACKEND},
+        "bookkeeping": {"mode": CACHE_BOOKKEEPING, **cache_events.stats()},
+        "payload": codec_stats(),
+        "admission": {"mode": CACHE_ADMISSION, **CacheService.admission.stats()},
+        "source_validity": {"mode": CACHE_VALIDITY, **source_versions.stats()},
+        "subsumption": {"enabled": CACHE_SUBSUMPTION, **CacheService.rollups.stats()},
+        "stale_while_revalidate": {
+            "grace_seconds": _stale_window(CacheService.TTL).total_seconds(),
+            "max_staleness_seconds": CACHE_MAX_STALENESS.total_seconds(),
+            **swr,
+        },
+    }
+
+
+def cache_introspection(top_n: int = 20, include_table: bool = False) -> dict:
+    """
+    cache_stats() + מונים לכל key (top-N לפי תעבורה ולפי גודל) + גילאים / גדלים / קרובים ל-TTL בכל שכבה.
+    include_table=True מוסיף את מצב הטבלה ב-BigQuery (שתי שאילתות).
+    """
+    out = {
+        "ttl_seconds": CacheService.TTL.total_seconds(),
+        "near_expiry_seconds": CACHE_NEAR_EXPIRY.total_seconds(),
+        "tiers": cache_stats(),
+        "keys": key_stats.stats(top_n),
+        "memory_entries": CacheService.memory.describe(top_n),
+    }
+    if include_table:
+        try:
+            out["table"] = CacheService().table_summary(top_n)
+        except Exception as e:
+            logger.warning(f"[CACHE] table summary failed: {e}")
+            out["table"] = {"error": str(e)}
+    return out
@@ -0,0 +1,720 @@
+import os
+import json
+import sqlite3
+import socket
+import threading
+import socketserver
+from abc import ABC, abstractmethod
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from google.cloud import bigquery
+
+try:
+    import redis
+except ImportError:  # redis:// URLs need the redis package; kv:// (the local stand-in) doesn't
+    redis = None
+
+from ...bq import get_bq_client
+from ...job_stats import job_labels, record_job
+from .cache_keys import resolve_schema, key_hash, key_params, key_filter, key_join, key_source_columns, key_insert_columns
+
+# Where the persistent table of CacheService lives:
+# "bigquery" (default): cache.cached_queries; "disk": a local SQLite file that survives restarts;
+# "kv": a shared key-value store (Redis, or the local stand-in server below) for several API replicas;
+# "memory": this process only (tests / development)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "bigquery")
+CACHE_DISK_PATH = os.getenv("CACHE_DISK_PATH", str(Path(__file__).parents[2] / "logs" / "cache.sqlite3"))
+# redis://host:port/db (needs the redis package) or kv://host:port (LocalKVServer)
+CACHE_KV_URL = os.getenv("CACHE_KV_URL", "kv://127.0.0.1:6390")
+CACHE_KV_PREFIX = os.getenv("CACHE_KV_PREFIX", "cache:")
+# entries() on BigQuery reads at most this many rows (most used first) — the table is not scanned whole
+CACHE_BQ_MAX_ENTRIES = int(os.getenv("CACHE_BQ_MAX_ENTRIES", "1000"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_datetime(value) -> datetime | None:
+    if value in (None, ""):
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class CacheBackend(ABC):
+    """
+    האחסון המתמשך של CacheService (השכבה שמאחורי שכבת הזיכרון).
+    רשומה: intent_key, sql, result (payload), last_updated, use_count — כמו cached_queries.
+
+    load(key)                          -> dict | None
+    increment_use(key, sql, max_count) -> use_count אחרי ההגדלה (capped, upsert)
+    save_result(key, sql, payload, now, max_count)
+    hot_entries(limit)                 -> [{"intent_key", "sql"}] הכי מבוקשים קודם
+    summary(top_n, expired_before, near_before) -> מצב האחסון (ל-/admin/cache/keys)
+    """
+
+    name = "base"
+    # append-only bookkeeping (cache_events) is a BigQuery-side optimization; other backends write directly
+    supports_events = False
+
+    @abstractmethod
+    def load(self, intent_key: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def increment_use(self, intent_key: str, sql: str, max_count: int) -> int:
+        ...
+
+    @abstractmethod
+    def save_result(self, intent_key: str, sql: str, payload: str, now: datetime, max_count: int):
+        ...
+
+    @abstractmethod
+    def entries(self) -> list[dict]:
+        """כל הרשומות (ב-BigQuery: עד CACHE_BQ_MAX_ENTRIES, הכי מבוקשות קודם)."""
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def hot_entries(self, limit: int) -> list[dict]:
+        rows = [e for e in self.entries() if e.get("sql")]
+        rows.sort(key=lambda e: (e["use_count"] or 0, e["last_updated"] or _EPOCH), reverse=True)
+        return [{"intent_key": e["intent_key"], "sql": e["sql"]} for e in rows[:limit]]
+
+    def summary(self, top_n: int, expired_before: datetime, near_before: datetime) -> dict:
+        now = datetime.now(timezone.utc)
+        stored = [e for e in self.entries() if e["result"] is not None]
+        largest = sorted(stored, key=lambda e: len(e["result"]), reverse=True)[:top_n]
+        return {
+            "entries": len(self.entries()),
+            "with_result": len(stored),
+            "result_bytes": sum(len(e["result"]) for e in stored),
+            "past_ttl": sum(1 for e in stored if e["last_updated"] and e["last_updated"] < expired_before),
+            "near_expiry": sum(
+                1 for e in stored if e["last_updated"] and expired_before <= e["last_updated"] < near_before
+            ),
+            "largest": [
+                {
+                    "intent_key": e["intent_key"], "use_count": e["use_count"], "bytes": len(e["result"]),
+                    "age_seconds": round((now - e["last_updated"]).total_seconds(), 3) if e["last_updated"] else None,
+                }
+                for e in largest
+            ],
+        }
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+
+# =========================
+# BigQuery (cache.cached_queries)
+# =========================
+class BigQueryBackend(CacheBackend):
+    """cached_queries ב-BigQuery, point lookups לפי key_hash (ראו cache_keys; לפי intent_key בטבלה שלא הועברה)."""
+
+    name = "bigquery"
+    supports_events = True
+
+    def __init__(self, project: str, dataset: str, table: str):
+        self.project = project
+        self.dataset = dataset
+        self.table = table
+        self.client = get_bq_client(project, "EU")
+
+    @property
+    def table_id(self) -> str:
+        return f"{self.project}.{self.dataset}.{self.table}"
+
+    def load(self, intent_key: str) -> dict | None:
+        resolve_schema(self.client, self.table_id)
+        # point lookup on the clustering (and partitioning) columns: bytes read don't grow with the table
+        query = f"""
+            SELECT intent_key, sql, result, last_updated, use_count
+            FROM `{self.table_id}`
+            WHERE {key_filter()}
+            LIMIT 1
+        """
+
+        job = self.client.query(
+            query,
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=key_params(intent_key),
+                labels=job_labels("cache_lookup"),
+            ),
+        )
+
+        rows = list(job)
+        record_job(job, "cache_lookup", query)
+        if not rows or rows[0]["intent_key"] != intent_key:
+            return None  # hash collision: a different key
+        return dict(rows[0])
+
+    def increment_use(self, intent_key: str, sql: str, max_count: int) -> int:
+        resolve_schema(self.client, self.table_id)
+        key_columns, key_values = key_insert_columns()
+        merge_sql = f"""
+            MERGE `{self.table_id}` T
+            USING (SELECT {key_source_columns()}, @sql AS sql) S
+            ON {key_join()}
+            WHEN MATCHED THEN
+              UPDATE SET
+                use_count = LEAST(IFNULL(T.use_count, 0) + 1, {max_count}),
+                sql = S.sql
+            WHEN NOT MATCHED THEN
+              INSERT ({key_columns}, sql, result, last_updated, use_count)
+              VALUES ({key_values}, S.sql, CAST(NULL AS STRING), CAST(NULL AS TIMESTAMP), 1)
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                *key_params(intent_key),
+                bigquery.ScalarQueryParameter("sql", "STRING", sql),
+            ],
+            labels=job_labels("cache_merge"),
+        )
+
+        job = self.client.query(merge_sql, job_config=job_config)
+        job.result()
+        record_job(job, "cache_merge", merge_sql)
+
+        entry = self.load(intent_key)
+        return int(entry.get("use_count") or 0) if entry else 0
+
+    def save_result(self, intent_key: str, sql: str, payload: str, now: datetime, max_count: int):
+        # upsert: with tinylfu admission there is no use_count row before the first save
+        resolve_schema(self.client, self.table_id)
+        key_columns, key_values = key_insert_columns()
+        update_sql = f"""
+            MERGE `{self.table_id}` T
+            USING (SELECT {key_source_columns()}, @sql AS sql, @res AS result, @ts AS last_updated) S
+            ON {key_join()}
+            WHEN MATCHED THEN
+              UPDATE SET
+                result = S.result,
+                last_updated = S.last_updated,
+                sql = S.sql,
+                use_count = {max_count}
+            WHEN NOT MATCHED THEN
+              INSERT ({key_columns}, sql, result, last_updated, use_count)
+              VALUES ({key_values}, S.sql, S.result, S.last_updated, {max_count})
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("res", "STRING", payload),
+                bigquery.ScalarQueryParameter("ts", "TIMESTAMP", now.isoformat()),
+                bigquery.ScalarQueryParameter("sql", "STRING", sql),
+                *key_params(intent_key),
+            ],
+            labels=job_labels("cache_save"),
+        )
+
+        job = self.client.query(update_sql, job_config=job_config)
+        job.result()
+        record_job(job, "cache_save", update_sql)
+
+    def entries(self) -> list[dict]:
+        query = f"""
+            SELECT intent_key, sql, result, last_updated, use_count
+            FROM `{self.table_id}`
+            ORDER BY use_count DESC, last_updated DESC
+            LIMIT @limit
+        """
+
+        job = self.client.query(
+            query,
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter("limit", "INT64", CACHE_BQ_MAX_ENTRIES)],
+                labels=job_labels("cache_stats"),
+            ),
+        )
+
+        rows = [{**dict(r), "last_updated": _as_datetime(r["last_updated"])} for r in job]
+        record_job(job, "cache_stats", query)
+        return rows
+
+    def clear(self):
+        query = f"DELETE FROM `{self.table_id}` WHERE TRUE"
+        job = self.client.query(query, job_config=bigquery.QueryJobConfig(labels=job_labels("cache_clear")))
+        job.result()
+        record_job(job, "cache_clear", query)
+
+    def hot_entries(self, limit: int) -> list[dict]:
+        query = f"""
+            SELECT intent_key, sql
+            FROM `{self.table_id}`
+            WHERE sql IS NOT NULL AND sql != ''
+            ORDER BY use_count DESC, last_updated DESC
+            LIMIT @limit
+        """
+
+        job = self.client.query(
+            query,
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ScalarQueryParameter("limit", "INT64", limit)],
+                labels=job_labels("cache_warmup"),
+            ),
+        )
+
+        rows = [dict(r) for r in job]
+        record_job(job, "cache_warmup", query)
+        return rows
+
+    def summary(self, top_n: int, expired_before: datetime, near_before: datetime) -> dict:
+        # scans the result column: only on an explicit admin request, never on a question's path
+        now = datetime.now(timezone.utc)
+        table = f"`{self.table_id}`"
+        params = [
+            bigquery.ScalarQueryParameter("expired_before", "TIMESTAMP", expired_before),
+            bigquery.ScalarQueryParameter("near_before", "TIMESTAMP", near_before),
+            bigquery.ScalarQueryParameter("limit", "INT64", top_n),
+        ]
+        queries = {
+            "summary": f"""
+                SELECT
+                  COUNT(*) AS entries,
+                  SUM(IF(result IS NOT NULL, 1, 0)) AS with_result,
+                  SUM(IF(result IS NOT NULL, LENGTH(result), 0)) AS result_bytes,
+                  SUM(IF(result IS NOT NULL AND last_updated < @expired_before, 1, 0)) AS past_ttl,
+                  SUM(IF(result IS NOT NULL AND last_updated >= @expired_before
+                         AND last_updated < @near_before, 1, 0)) AS near_expiry
+                FROM {table}
+            """,
+            "largest": f"""
+                SELECT intent_key, use_count, LENGTH(result) AS bytes, last_updated
+                FROM {table}
+                WHERE result IS NOT NULL
+                ORDER BY bytes DESC
+                LIMIT @limit
+            """,
+        }
+
+        out = {}
+        for name, query in queries.items():
+            job = self.client.query(
+                query,
+                job_config=bigquery.QueryJobConfig(query_parameters=params, labels=job_labels("cache_stats")),
+            )
+            out[name] = [dict(r) for r in job]
+            record_job(job, "cache_stats", query)
+
+        summary = {k: v or 0 for k, v in out["summary"][0].items()}
+        for row in out["largest"]:
+            last_updated = _as_datetime(row.pop("last_updated"))
+            row["age_seconds"] = round((now - last_updated).total_seconds(), 3) if last_updated else None
+        return {**summary, "largest": out["largest"]}
+
+
+# =========================
+# Memory (this process)
+# =========================
+class MemoryBackend(CacheBackend):
+    """dict בתהליך — בלי I/O ובלי הגבלת גודל (לבדיקות ופיתוח; לא שורד restart)."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._rows: dict = {}
+        self._lock = threading.Lock()
+
+    def load(self, intent_key: str) -> dict | None:
+        with self._lock:
+            row = self._rows.get(intent_key)
+            return dict(row) if row else None
+
+    def increment_use(self, intent_key: str, sql: str, max_count: int) -> int:
+        with self._lock:
+            row = self._rows.setdefault(intent_key, {
+                "intent_key": intent_key, "sql": sql, "result": None, "last_updated": None, "use_count": 0,
+            })
+            row["use_count"] = min(row["use_count"] + 1, max_count)
+            row["sql"] = sql
+            return row["use_count"]
+
+    def save_result(self, intent_key: str, sql: str, payload: str, now: datetime, max_count: int):
+        with self._lock:
+            self._rows[intent_key] = {
+                "intent_key": intent_key, "sql": sql, "result": payload, "last_updated": now, "use_count": max_count,
+            }
+
+    def entries(self) -> list[dict]:
+        with self._lock:
+            return [dict(r) for r in self._rows.values()]
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "entries": len(self._rows)}
+
+
+# =========================
+# Local disk (SQLite)
+# =========================
+class DiskBackend(CacheBackend):
+    """
+    קובץ SQLite מקומי (WAL) — שורד restart, ומשותף לכמה תהליכים על אותה מכונה.
+    אותה סכמה כמו cached_queries, עם key_hash כמפתח ראשי.
+    """
+
+    name = "disk"
+
+    def __init__(self, path: str = CACHE_DISK_PATH):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cached_queries ("
+            "key_hash TEXT PRIMARY KEY, intent_key TEXT, sql TEXT, result TEXT, last_updated TEXT, use_count INTEGER)"
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row(r) -> dict:
+        return {
+            "intent_key": r[0], "sql": r[1], "result": r[2],
+            "last_updated": _as_datetime(r[3]), "use_count": r[4],
+        }
+
+    def load(self, intent_key: str) -> dict | None:
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT intent_key, sql, result, last_updated, use_count FROM cached_queries WHERE key_hash = ?",
+                (key_hash(intent_key),),
+            ).fetchone()
+        if r is None or r[0] != intent_key:
+            return None
+        return self._row(r)
+
+    def increment_use(self, intent_key: str, sql: str, max_count: int) -> int:
+        hashed = key_hash(intent_key)
+        # upsert + read back in one write transaction (no RETURNING: that needs SQLite 3.35+)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO cached_queries VALUES (?, ?, ?, NULL, NULL, 1) "
+                    "ON CONFLICT(key_hash) DO UPDATE SET use_count = MIN(IFNULL(use_count, 0) + 1, ?), "
+                    "sql = excluded.sql",
+                    (hashed, intent_key, sql, max_count),
+                )
+                r = self._conn.execute("SELECT use_count FROM cached_queries WHERE key_hash = ?", (hashed,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return int(r[0])
+
+    def save_result(self, intent_key: str, sql: str, payload: str, now: datetime, max_count: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cached_queries VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key_hash) DO UPDATE SET sql = excluded.sql, result = excluded.result, "
+                "last_updated = excluded.last_updated, use_count = excluded.use_count",
+                (key_hash(intent_key), intent_key, sql, payload, now.isoformat(), max_count),
+            )
+
+    def hot_entries(self, limit: int) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT intent_key, sql FROM cached_queries WHERE sql IS NOT NULL AND sql != '' "
+                "ORDER BY use_count DESC, last_updated DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"intent_key": k, "sql": s} for k, s in rows]
+
+    def entries(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT intent_key, sql, result, last_updated, use_count FROM cached_queries"
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cached_queries")
+
+    def close(self):
+        self._conn.close()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "path": self.path}
+
+
+# =========================
+# Shared key-value store
+# =========================
+# KEYS: entry hash, hot set; ARGV: max_count, intent_key, sql, key_hash
+INCREMENT_USE_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], 'use_count', 1)
+if count > tonumber(ARGV[1]) then
+    count = tonumber(ARGV[1])
+    redis.call('HSET', KEYS[1], 'use_count', count)
+end
+redis.call('HSET', KEYS[1], 'intent_key', ARGV[2], 'sql', ARGV[3])
+redis.call('ZADD', KEYS[2], count, ARGV[4])
+return count
+"""
+
+
+class KVBackend(CacheBackend):
+    """
+    key-value משותף לכמה replicas: hash לכל רשומה (<prefix>e:<key_hash>) ו-sorted set לפי use_count לבקשות ה-warm-up.
+    הלקוח: redis.Redis (redis://) או LocalKVClient (kv://) — אותן פקודות.
+    """
+
+    name = "kv"
+
+    def __init__(self, url: str = CACHE_KV_URL, client=None, prefix: str = CACHE_KV_PREFIX):
+        self.url = url
+        self.client = client or kv_connect(url)
+        self.prefix = prefix
+        self.hot_key = f"{prefix}hot"
+
+    def _key(self, hashed: str) -> str:
+        return f"{self.prefix}e:{hashed}"
+
+    def _row(self, h: dict) -> dict:
+        return {
+            "intent_key": h.get("intent_key"),
+            "sql": h.get("sql"),
+            "result": h.get("result"),
+            "last_updated": _as_datetime(h.get("last_updated")),
+            "use_count": int(h.get("use_count") or 0),
+        }
+
+    def load(self, intent_key: str) -> dict | None:
+        h = self.client.hgetall(self._key(key_hash(intent_key)))
+        if not h or h.get("intent_key") != intent_key:
+            return None
+        return self._row(h)
+
+    def increment_use(self, intent_key: str, sql: str, max_count: int) -> int:
+        # one script: the increment, the cap and the hot-set score can't interleave with another replica
+        hashed = key_hash(intent_key)
+        count = self.client.eval(
+            INCREMENT_USE_SCRIPT, 2, self._key(hashed), self.hot_key, max_count, intent_key, sql, hashed,
+        )
+        return int(count)
+
+    def save_result(self, intent_key: str, sql: str, payload: str, now: datetime, max_count: int):
+        hashed = key_hash(intent_key)
+        self.client.hset(self._key(hashed), mapping={
+            "intent_key": intent_key, "sql": sql, "result": payload,
+            "last_updated": now.isoformat(), "use_count": max_count,
+        })
+        self.client.zadd(self.hot_key, {hashed: max_count})
+
+    def hot_entries(self, limit: int) -> list[dict]:
+        out = []
+        for hashed in self.client.zrevrange(self.hot_key, 0, max(limit, 1) * 2 - 1):
+            h = self.client.hgetall(self._key(hashed))
+            if h.get("sql"):
+                out.append({"intent_key": h["intent_key"], "sql": h["sql"]})
+            if len(out) >= limit:
+                break
+        return out
+
+    def entries(self) -> list[dict]:
+        rows = (self.client.hgetall(self._key(h)) for h in self.client.zrange(self.hot_key, 0, -1))
+        return [self._row(h) for h in rows if h]
+
+    def clear(self):
+        members = self.client.zrange(self.hot_key, 0, -1)
+        if members:
+            self.client.delete(*[self._key(h) for h in members])
+        self.client.delete(self.hot_key)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "url": self.url}
+
+
+class LocalKVServer(socketserver.ThreadingTCPServer):
+    """
+    תחליף מקומי לשירות ה-KV: שרת TCP (JSON לכל שורה) עם תת-הקבוצה של פקודות Redis ש-KVBackend משתמש בהן.
+    כמה תהליכי API על אותה מכונה מתחברים אליו כמו ל-Redis משותף.
+
+        python -m backend.flow_manager_agent.utils.cache_backends 127.0.0.1:6390
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _KVHandler)
+        self.hashes: dict = {}
+        self.zsets: dict = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"kv://{host}:{port}"
+
+    def start(self) -> "LocalKVServer":
+        threading.Thread(target=self.serve_forever, name="local-kv", daemon=True).start()
+        return self
+
+    def execute(self, op: str, args: list, kwargs: dict):
+        with self.lock:
+            if op == "hgetall":
+                return dict(self.hashes.get(args[0], {}))
+            if op == "hset":
+                h = self.hashes.setdefault(args[0], {})
+                h.update({k: str(v) for k, v in kwargs["mapping"].items()})
+                return len(kwargs["mapping"])
+            if op == "zadd":
+                z = self.zsets.setdefault(args[0], {})
+                added = sum(1 for m in args[1] if m not in z)
+                z.update(args[1])
+                return added
+            if op in ("zrange", "zrevrange"):
+                z = self.zsets.get(args[0], {})
+                ordered = sorted(z, key=lambda m: (z[m], m), reverse=op == "zrevrange")
+                stop = len(ordered) if args[2] == -1 else args[2] + 1
+                return ordered[args[1]:stop]
+            if op == "eval":
+                if args[0] != INCREMENT_USE_SCRIPT:
+                    raise ValueError("only INCREMENT_USE_SCRIPT is supported")
+                return self._increment_use(*args[2:])
+            if op == "delete":
+                removed = 0
+                for name in args:
+                    removed += (self.hashes.pop(name, None) is not None) + (self.zsets.pop(name, None) is not None)
+                return removed
+        raise ValueError(f"unknown op {op}")
+
+    def _increment_use(self, key: str, hot_key: str, max_count, intent_key: str, sql: str, hashed: str) -> int:
+        """INCREMENT_USE_SCRIPT (נקרא תחת self.lock)."""
+        h = self.hashes.setdefault(key, {})
+        count = min(int(h.get("use_count", 0)) + 1, int(max_count))
+        h.update({"use_count": str(count), "intent_key": intent_key, "sql": sql})
+        self.zsets.setdefault(hot_key, {})[hashed] = count
+        return count
+
+
+class _KVHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                reply = {"ok": self.server.execute(req["op"], req.get("args", []), req.get("kwargs", {}))}
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class LocalKVClient:
+    """
+    לקוח ל-LocalKVServer עם אותן חתימות כמו redis.Redis(decode_responses=True). חיבור אחד לכל thread;
+    חיבור שנכשל נסגר, והקריאה הבאה פותחת חדש (בלי לשלוח שוב — הפקודה אולי כבר בוצעה).
+    """
+
+    def __init__(self, host: str, port: int):
+        self.address = (host, port)
+        self._local = threading.local()
+
+    def _close(self):
+        conn = self._local.__dict__.pop("conn", None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def _call(self, op: str, *args, **kwargs):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        sock, reader = conn
+        try:
+            sock.sendall(json.dumps({"op": op, "args": list(args), "kwargs": kwargs}).encode("utf-8") + b"\n")
+            line = reader.readline()
+            if not line:
+                raise ConnectionError(f"local kv {self.address}: connection closed")
+        except OSError:
+            self._close()
+            raise
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"local kv: {reply['error']}")
+        return reply["ok"]
+
+    def hgetall(self, name):
+        return self._call("hgetall", name)
+
+    def hset(self, name, mapping):
+        return self._call("hset", name, mapping=mapping)
+
+    def zadd(self, name, mapping):
+        return self._call("zadd", name, mapping)
+
+    def zrange(self, name, start, end):
+        return self._call("zrange", name, start, end)
+
+    def zrevrange(self, name, start, end):
+        return self._call("zrevrange", name, start, end)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        return self._call("eval", script, numkeys, *keys_and_args)
+
+    def delete(self, *names):
+        return self._call("delete", *names)
+
+
+def kv_connect(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "kv":
+        return LocalKVClient(parsed.hostname or "127.0.0.1", parsed.port or 6390)
+    if parsed.scheme in ("redis", "rediss"):
+        if redis is None:
+            raise RuntimeError("CACHE_KV_URL is a redis:// URL but the redis package is not installed")
+        return redis.Redis.from_url(url, decode_responses=True)
+    raise ValueError(f"unsupported CACHE_KV_URL: {url}")
+
+
+# =========================
+# Selection
+# =========================
+_shared: dict = {}
+_shared_lock = threading.Lock()
+
+
+def make_backend(project: str, dataset: str, table: str, name: str | None = None) -> CacheBackend:
+    """
+    ה-backend לפי CACHE_BACKEND. bigquery — חדש לכל CacheService (הלקוח עצמו משותף ב-bq);
+    memory / disk / kv — מופע אחד לתהליך.
+    """
+    name = name or CACHE_BACKEND
+    if name == "bigquery":
+        return BigQueryBackend(project, dataset, table)
+
+    with _shared_lock:
+        backend = _shared.get(name)
+        if backend is None:
+            if name == "memory":
+                backend = MemoryBackend()
+            elif name == "disk":
+                backend = DiskBackend(CACHE_DISK_PATH)
+            elif name == "kv":
+                backend = KVBackend(CACHE_KV_URL)
+            else:
+                raise ValueError(f"unknown CACHE_BACKEND: {name}")
+            _shared[name] = backend
+        return backend
+
+
+if __name__ == "__main__":
+    import sys
+
+    host, _, port = (sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1:6390").partition(":")
+    server = LocalKVServer(host, int(port or 6390))
+    print(f"local kv listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,217 @@
+import os
+import io
+import json
+import time
+import base64
+import logging
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow is optional — payloads stay JSON
+    pa = None
+    ipc = None
+
+from ...bq import ArrowRows, as_records
+
+logger = logging.getLogger(__name__)
+
+# "arrow" (default): columnar Arrow IPC + compression for results with enough rows; "json": the original format
+CACHE_PAYLOAD_FORMAT = os.getenv("CACHE_PAYLOAD_FORMAT", "arrow")
+# Below this many rows the IPC framing costs more than it saves — plain JSON
+CACHE_PAYLOAD_MIN_ROWS = int(os.getenv("CACHE_PAYLOAD_MIN_ROWS", "50"))
+CACHE_PAYLOAD_CODEC = os.getenv("CACHE_PAYLOAD_CODEC", "zstd")
+
+# Payload layout (stored in the STRING `result` column):
+#   ARROW_MAGIC + <header JSON> + "\n" + base64(Arrow IPC stream, compressed buffers)
+# The header (columns, types, row count, sizes) is readable without decoding the body.
+# JSON payloads are the bare rows list, except a truncated result: JSON_MAGIC + <header JSON> + "\n" + rows.
+ARROW_MAGIC = "arrow1:"
+JSON_MAGIC = "json1:"
+
+_SCALAR_TYPES = (str, bool, int, float)
+
+_lock = threading.Lock()
+_stats = {
+    "encoded": {"json": 0, "arrow": 0},
+    "decoded": {"json": 0, "arrow": 0},
+    # over everything encoded: stored payload size vs. in-memory size of the same result
+    "encoded_bytes": 0,
+    "decoded_bytes": 0,
+    "encode_seconds": {"json": 0.0, "arrow": 0.0},
+    "decode_seconds": {"json": 0.0, "arrow": 0.0},
+    "arrow_fallbacks": 0,
+}
+
+
+def _codec() -> str | None:
+    if pa is not None and CACHE_PAYLOAD_CODEC and pa.Codec.is_available(CACHE_PAYLOAD_CODEC):
+        return CACHE_PAYLOAD_CODEC
+    return None
+
+
+def _columnar_schema(rows: list[dict]) -> list[str] | None:
+    """
+    מחזיר את שמות העמודות אם השורות ניתנות ל-round-trip מדויק דרך Arrow:
+    אותם מפתחות בכל שורה, וכל עמודה מטיפוס סקלרי אחד (או None). אחרת None.
+    """
+    names = list(rows[0])
+    kinds: dict = {}
+    for row in rows:
+        if list(row) != names:
+            return None
+        for k, v in row.items():
+            if v is None:
+                continue
+            t = type(v)
+            if t not in _SCALAR_TYPES or kinds.setdefault(k, t) is not t:
+                return None
+    return names
+
+
+def _record_encode(fmt: str, seconds: float, encoded_bytes: int, decoded_bytes: int):
+    with _lock:
+        _stats["encoded"][fmt] += 1
+        _stats["encode_seconds"][fmt] += seconds
+        _stats["encoded_bytes"] += encoded_bytes
+        _stats["decoded_bytes"] += decoded_bytes
+
+
+def _record_decode(fmt: str, seconds: float):
+    with _lock:
+        _stats["decoded"][fmt] += 1
+        _stats["decode_seconds"][fmt] += seconds
+
+
+def _as_table(rows):
+    """ה-Table לקידוד: של ArrowRows כמו שהוא (בלי לבנות dicts), מ-list[dict] רק אם ה-round-trip מדויק."""
+    if isinstance(rows, ArrowRows):
+        return rows.table
+    names = _columnar_schema(rows)
+    if names is None:
+        return None
+    return pa.Table.from_pydict({n: [r[n] for r in rows] for n in names})
+
+
+def encode_rows(rows: list[dict], truncated: bool = False) -> tuple[str, int]:
+    """
+    מקודד rows (ArrowRows מ-BigQuery, או list[dict] בטוחות ל-JSON) ל-payload לשמירה.
+    מחזיר (payload, decoded_size) — decoded_size הוא גודל התוצאה בזיכרון (לתקציב שכבת הזיכרון).
+    truncated — התוצאה נעצרה בתקרת שורות / bytes; נשמר ב-header ומוחזר עם ה-entry.
+    """
+    start = time.perf_counter()
+
+    if CACHE_PAYLOAD_FORMAT == "arrow" and pa is not None and len(rows) >= CACHE_PAYLOAD_MIN_ROWS:
+        try:
+            table = _as_table(rows)
+            if table is not None:
+                sink = io.BytesIO()
+                options = ipc.IpcWriteOptions(compression=_codec())
+                with ipc.new_stream(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+
+                header = {
+                    "rows": table.num_rows,
+                    "columns": [[f.name, str(f.type)] for f in table.schema],
+                    "codec": _codec(),
+                    "decoded_bytes": table.nbytes,
+                }
+                if truncated:
+                    header["truncated"] = True
+                body = base64.b64encode(sink.getvalue()).decode("ascii")
+                payload = ARROW_MAGIC + json.dumps(header, separators=(",", ":")) + "\n" + body
+                _record_encode("arrow", time.perf_counter() - start, len(payload), table.nbytes)
+                return payload, table.nbytes
+        except (pa.ArrowException, OverflowError) as e:
+            logger.info(f"[CACHE] arrow encoding failed, storing JSON: {e}")
+
+        with _lock:
+            _stats["arrow_fallbacks"] += 1
+
+    payload = json.dumps(as_records(rows), ensure_ascii=False)
+    size = len(payload)
+    if truncated:
+        header = {"rows": len(rows), "decoded_bytes": size, "truncated": True}
+        payload = JSON_MAGIC + json.dumps(header, separators=(",", ":")) + "\n" + payload
+    _record_encode("json", time.perf_counter() - start, len(payload), size)
+    return payload, size
+
+
+def read_header(payload: str) -> dict:
+    """מטא-דאטה של payload בלי לפענח את גוף התוצאה."""
+    for fmt, magic in (("arrow", ARROW_MAGIC), ("json", JSON_MAGIC)):
+        if payload.startswith(magic):
+            line, _, _ = payload.partition("\n")
+            return {"format": fmt, "encoded_bytes": len(payload), **json.loads(line[len(magic):])}
+    return {"format": "json", "encoded_bytes": len(payload), "decoded_bytes": len(payload)}
+
+
+def decode_rows(payload: str) -> list[dict]:
+    """
+    מפענח payload ל-rows: Arrow -> ArrowRows (עמודתי, dicts רק בגישה לשורות), JSON -> list[dict].
+    זורק חריגה אם ה-payload לא תקין.
+    """
+    start = time.perf_counter()
+
+    if not payload.startswith(ARROW_MAGIC):
+        if payload.startswith(JSON_MAGIC):
+            payload = payload.partition("\n")[2]
+        rows = json.loads(payload)
+        _record_decode("json", time.perf_counter() - start)
+        return rows
+
+    if pa is None:
+        raise RuntimeError("pyarrow is required to decode arrow cache payloads")
+
+    line, _, body = payload.partition("\n")
+    table = ipc.open_stream(base64.b64decode(body)).read_all()
+    rows = ArrowRows(table, truncated=bool(json.loads(line[len(ARROW_MAGIC):]).get("truncated")))
+    _record_decode("arrow", time.perf_counter() - start)
+    return rows
+
+
+class CachedPayload:
+    """
+    payload שנקרא מהטבלה: ה-header זמין מיד, ה-rows מפוענחות רק בגישה הראשונה (ופעם אחת).
+    """
+
+    def __init__(self, payload: str):
+        self.payload = payload
+        self.header = read_header(payload)
+        self._rows = None
+
+    @property
+    def row_count(self) -> int | None:
+        return self.header.get("rows")
+
+    @property
+    def decoded_bytes(self) -> int:
+        return self.header["decoded_bytes"]
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.header.get("truncated"))
+
+    @property
+    def rows(self) -> list[dict]:
+        if self._rows is None:
+            self._rows = decode_rows(self.payload)
+        return self._rows
+
+
+def codec_stats() -> dict:
+    with _lock:
+        stats = json.loads(json.dumps(_stats))
+
+    for kind, op in (("encoded", "encode"), ("decoded", "decode")):
+        stats[f"{op}_avg_ms"] = {
+            fmt: (stats[f"{op}_seconds"][fmt] / n * 1000) if n else 0.0
+            for fmt, n in stats[kind].items()
+        }
+    stats["format"] = CACHE_PAYLOAD_FORMAT if pa is not None else "json"
+    stats["codec"] = _codec()
+    stats["compression_ratio"] = (
+        stats["decoded_bytes"] / stats["encoded_bytes"] if stats["encoded_bytes"] else 0.0
+    )
+    return stats
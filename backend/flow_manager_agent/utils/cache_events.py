@@ -0,0 +1,344 @@
+import os
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+from google.cloud import bigquery
+
+from ...bq import get_bq_client
+from ...job_stats import job_labels, record_job
+from .cache_keys import resolve_schema, key_fields, key_join, key_insert_columns, hashed
+
+logger = logging.getLogger(__name__)
+
+# How often buffered events are streamed to BigQuery, and the batch size that forces an early flush
+CACHE_EVENT_FLUSH_SECONDS = float(os.getenv("CACHE_EVENT_FLUSH_SECONDS", "5"))
+CACHE_EVENT_BATCH_SIZE = int(os.getenv("CACHE_EVENT_BATCH_SIZE", "500"))
+
+# How often events are folded into cached_queries, and how far back each compaction looks
+CACHE_COMPACT_SECONDS = float(os.getenv("CACHE_COMPACT_SECONDS", "60"))
+CACHE_EVENT_WINDOW = timedelta(hours=int(os.getenv("CACHE_EVENT_WINDOW_HOURS", "24")))
+
+# One streaming insert request is capped at 10 MB by BigQuery: flushes are split into requests of at most
+# this many serialized bytes / rows
+CACHE_EVENT_MAX_REQUEST_BYTES = int(os.getenv("CACHE_EVENT_MAX_REQUEST_BYTES", str(9 * 1024 ** 2)))
+CACHE_EVENT_MAX_REQUEST_ROWS = int(os.getenv("CACHE_EVENT_MAX_REQUEST_ROWS", "500"))
+
+# Larger results stay in the memory tier only (well below the request cap, so a request holds several)
+CACHE_EVENT_MAX_RESULT_BYTES = int(os.getenv("CACHE_EVENT_MAX_RESULT_BYTES", str(1024 ** 2)))
+
+# Events kept while BigQuery is unreachable (oldest are dropped beyond this)
+CACHE_EVENT_MAX_BUFFER = 10_000
+
+EVENTS_TABLE = "cache_events"
+
+
+def _chunks(events: list[dict], rejected: list):
+    """מחלק אירועים לבקשות insert של עד CACHE_EVENT_MAX_REQUEST_BYTES / _ROWS; אירוע גדול מבקשה שלמה -> rejected."""
+    chunk, size = [], 0
+    for e in events:
+        n = len(json.dumps(e)) + 64  # + event_time and request framing
+        if n > CACHE_EVENT_MAX_REQUEST_BYTES:
+            rejected.append(e)
+            continue
+        if chunk and (size + n > CACHE_EVENT_MAX_REQUEST_BYTES or len(chunk) >= CACHE_EVENT_MAX_REQUEST_ROWS):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(e)
+        size += n
+    if chunk:
+        yield chunk
+
+
+class CacheEventLog:
+    """
+    Bookkeeping של ה-cache כאירועים append-only במקום DML על cached_queries:
+    - "use": בקשה שלא נענתה מה-cache (מחליף את ה-MERGE של use_count)
+    - "result": תוצאה שנשמרה (מחליף את ה-UPDATE)
+
+    האירועים נאספים בזיכרון ונשלחים ב-streaming insert ברקע; compaction תקופתי
+    מקפל אותם ל-cached_queries ב-MERGE אחד. ה-compaction אידמפוטנטי (מחשב מחדש מתוך חלון
+    האירועים), כך שכמה תהליכים יכולים להריץ אותו במקביל.
+    """
+
+    def __init__(self, project: str, dataset: str, table: str, max_count: int):
+        self.project = project
+        self.dataset = dataset
+        self.table = table
+        self.max_count = max_count
+        self._buffer: list[dict] = []
+        # use events of this process not yet folded into cached_queries: key -> [flush time | None]
+        self._pending: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._table_ready = False
+        self._last_compaction = 0.0
+        self._dirty = False  # events flushed since the last compaction
+        self._stats = {
+            "events_recorded": 0, "events_flushed": 0, "events_dropped": 0, "events_rejected": 0,
+            "results_skipped": 0,
+            "flushes": 0, "flush_failures": 0, "compactions": 0, "compaction_failures": 0,
+        }
+
+    @property
+    def events_table(self) -> str:
+        return f"{self.project}.{self.dataset}.{EVENTS_TABLE}"
+
+    # ---------------------------------------------------
+    # Request path (no I/O)
+    # ---------------------------------------------------
+    def _append(self, event: dict):
+        with self._lock:
+            self._buffer.append(event)
+            self._stats["events_recorded"] += 1
+            if len(self._buffer) > CACHE_EVENT_MAX_BUFFER:
+                dropped = len(self._buffer) - CACHE_EVENT_MAX_BUFFER
+                del self._buffer[:dropped]
+                self._stats["events_dropped"] += dropped
+            full = len(self._buffer) >= CACHE_EVENT_BATCH_SIZE
+        self._ensure_worker()
+        if full:
+            self._wake.set()
+
+    def record_use(self, intent_key: str, sql: str) -> int:
+        """רושם בקשה; מחזיר כמה בקשות של התהליך הזה עוד לא קופלו לטבלה (כולל זו)."""
+        self._append({**key_fields(intent_key), "sql": sql, "event_type": "use", "result": None, "result_time": None})
+        with self._lock:
+            pending = self._pending.setdefault(intent_key, [])
+            pending.append(None)
+            return len(pending)
+
+    def record_result(self, intent_key: str, sql: str, payload: str, result_time: datetime):
+        if len(payload) > CACHE_EVENT_MAX_RESULT_BYTES:
+            with self._lock:
+                self._stats["results_skipped"] += 1
+            return
+        self._append({
+            **key_fields(intent_key), "sql": sql, "event_type": "result",
+            "result": payload, "result_time": result_time.isoformat(),
+        })
+
+    # ---------------------------------------------------
+    # Background worker
+    # ---------------------------------------------------
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-events", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(CACHE_EVENT_FLUSH_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self._dirty and time.monotonic() - self._last_compaction >= CACHE_COMPACT_SECONDS:
+                    self.compact()
+            except Exception:
+                logger.exception("[CACHE] event worker iteration failed")
+
+    def _client(self):
+        return get_bq_client(self.project, "EU")
+
+    def _ensure_table(self, client):
+        if self._table_ready:
+            return
+        ddl = f"""
+            CREATE TABLE IF NOT EXISTS `{self.events_table}` (
+              intent_key STRING, sql STRING, event_type STRING,
+              result STRING, result_time TIMESTAMP, event_time TIMESTAMP,
+              key_hash STRING, key_bucket INT64
+            )
+            PARTITION BY DATE(event_time)
+            OPTIONS (partition_expiration_days = 7)
+        """
+        # tables created before the hashed key schema
+        alter = f"""
+            ALTER TABLE `{self.events_table}`
+            ADD COLUMN IF NOT EXISTS key_hash STRING,
+            ADD COLUMN IF NOT EXISTS key_bucket INT64
+        """
+        try:
+            resolve_schema(client, f"{self.project}.{self.dataset}.{self.table}")
+            for statement in (ddl, alter) if hashed() else (ddl,):
+                client.query(statement, job_config=bigquery.QueryJobConfig(labels=job_labels("cache_events_ddl"))).result()
+        except Exception as e:
+            logger.warning(f"[CACHE] could not ensure {self.events_table}: {e}")
+        self._table_ready = True
+
+    def flush(self) -> int:
+        """
+        שולח את האירועים שבזיכרון ב-streaming inserts (בחלקים לפי CACHE_EVENT_MAX_REQUEST_*). מחזיר כמה נשלחו.
+        שורה ש-BigQuery דוחה בפני עצמה נזרקת (events_rejected); שאר האירועים חוזרים לתור רק כשהבקשה נכשלה.
+        """
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+
+        flushed_at = datetime.now(timezone.utc)
+        sent, rejected, retry = [], [], []
+        try:
+            client = self._client()
+            self._ensure_table(client)
+        except Exception as e:
+            logger.warning(f"[CACHE] event flush failed ({len(batch)} events kept): {e}")
+            retry = batch
+            client = None
+
+        chunks = list(_chunks(batch, rejected)) if client is not None else []
+        for i, chunk in enumerate(chunks):
+            rows = [{**e, "event_time": flushed_at.isoformat()} for e in chunk]
+            try:
+                errors = client.insert_rows_json(self.events_table, rows)
+            except Exception as e:
+                retry += [event for c in chunks[i:] for event in c]
+                logger.warning(f"[CACHE] event flush failed ({len(retry)} events kept): {e}")
+                break
+            # rows with their own error are dropped; "stopped" rows were valid but not inserted because of them
+            bad = {
+                err["index"] for err in errors
+                if not err.get("errors") or any(r.get("reason") != "stopped" for r in err["errors"])
+            }
+            stopped = {err["index"] for err in errors} - bad
+            if bad:
+                logger.warning(f"[CACHE] {len(bad)} events rejected by BigQuery and dropped: {errors[:3]}")
+            sent += [e for j, e in enumerate(chunk) if j not in bad | stopped]
+            rejected += [chunk[j] for j in sorted(bad)]
+            retry += [chunk[j] for j in sorted(stopped)]
+
+        with self._lock:
+            if retry:
+                self._buffer[:0] = retry
+                self._stats["flush_failures"] += 1
+            # stamp this process's pending use events with the time they became visible; a rejected one never will
+            for events, visible in ((sent, True), (rejected, False)):
+                for e in events:
+                    if e["event_type"] != "use":
+                        continue
+                    pending = self._pending.get(e["intent_key"], [])
+                    if None in pending:
+                        if visible:
+                            pending[pending.index(None)] = flushed_at
+                        else:
+                            pending.remove(None)
+            if sent:
+                self._stats["flushes"] += 1
+                self._stats["events_flushed"] += len(sent)
+                self._dirty = True
+            self._stats["events_rejected"] += len(rejected)
+        return len(sent)
+
+    def compact(self) -> bool:
+        """מקפל את חלון האירועים ל-cached_queries (MERGE אחד, אידמפוטנטי)."""
+        started = datetime.now(timezone.utc)
+        self._last_compaction = time.monotonic()
+        self._dirty = False
+        target = f"{self.project}.{self.dataset}.{self.table}"
+        try:
+            resolve_schema(self._client(), target)
+        except Exception as e:
+            logger.warning(f"[CACHE] compaction failed: {e}")
+            with self._lock:
+                self._stats["compaction_failures"] += 1
+                self._dirty = True
+            return False
+
+        # hashed key schema: carry key_hash / key_bucket (events from before the migration have none)
+        key_select, key_outer, key_where = "", "", ""
+        if hashed():
+            key_select = "MAX(key_hash) AS key_hash, MAX(key_bucket) AS key_bucket, "
+            key_outer = "u.key_hash, u.key_bucket, "
+            key_where = " AND key_hash IS NOT NULL"
+        key_columns, key_values = key_insert_columns()
+
+        merge_sql = f"""
+            MERGE `{target}` T
+            USING (
+              SELECT
+                {key_outer}u.intent_key, u.sql, r.result, r.result_time,
+                -- a stored result counts as fully warmed (same as the DML save)
+                IF(r.result IS NULL, LEAST(u.uses, @max_count), @max_count) AS uses
+              FROM (
+                SELECT {key_select}intent_key, MAX(sql) AS sql, SUM(IF(event_type = 'use', 1, 0)) AS uses
+                FROM `{self.events_table}`
+                WHERE event_time >= @since{key_where}
+                GROUP BY intent_key
+              ) u
+              LEFT JOIN (
+                SELECT intent_key, result, result_time
+                FROM (
+                  SELECT intent_key, result, result_time,
+                         ROW_NUMBER() OVER (PARTITION BY intent_key ORDER BY result_time DESC) AS rn
+                  FROM `{self.events_table}`
+                  WHERE event_type = 'result' AND event_time >= @since{key_where}
+                )
+                WHERE rn = 1
+              ) r
+              ON u.intent_key = r.intent_key
+            ) S
+            ON {key_join()}
+            WHEN MATCHED THEN
+              UPDATE SET
+                use_count = GREATEST(IFNULL(T.use_count, 0), S.uses),
+                sql = S.sql,
+                result = IF(S.result_time > IFNULL(T.last_updated, TIMESTAMP('1970-01-01')), S.result, T.result),
+                last_updated = IF(S.result_time > IFNULL(T.last_updated, TIMESTAMP('1970-01-01')), S.result_time, T.last_updated)
+            WHEN NOT MATCHED THEN
+              INSERT ({key_columns}, sql, result, last_updated, use_count)
+              VALUES ({key_values}, S.sql, S.result, S.result_time, S.uses)
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("since", "TIMESTAMP", (started - CACHE_EVENT_WINDOW).isoformat()),
+                bigquery.ScalarQueryParameter("max_count", "INT64", self.max_count),
+            ],
+            labels=job_labels("cache_compact"),
+        )
+
+        try:
+            job = self._client().query(merge_sql, job_config=job_config)
+            job.result()
+            record_job(job, "cache_compact", merge_sql)
+        except Exception as e:
+            logger.warning(f"[CACHE] compaction failed: {e}")
+            with self._lock:
+                self._stats["compaction_failures"] += 1
+                self._dirty = True
+            return False
+
+        with self._lock:
+            for key in list(self._pending):
+                remaining = [t for t in self._pending[key] if t is None or t > started]
+                if remaining:
+                    self._pending[key] = remaining
+                else:
+                    del self._pending[key]
+            self._stats["compactions"] += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "buffered": len(self._buffer),
+                "pending_keys": len(self._pending),
+            }
+
+    def reset(self):
+        """מוחק אירועים שלא נשלחו (לבדיקות)."""
+        with self._lock:
+            self._buffer.clear()
+            self._pending.clear()
+            self._dirty = False
+
+    def flush_at_exit(self):
+        # only processes that actually recorded events (the worker is started lazily)
+        if self._thread is not None:
+            self.flush()
@@ -0,0 +1,140 @@
+import os
+import logging
+import hashlib
+import threading
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+# "auto" (default) / "hashed": cached_queries is looked up by key_hash (fixed length, table clustered on it)
+# once its schema shows a key_hash column — a table not yet migrated (see cache_migrate.py) falls back
+# to the full intent_key; "legacy": always by intent_key
+CACHE_KEY_SCHEMA = os.getenv("CACHE_KEY_SCHEMA", "auto")
+# >0: the table is also integer-range partitioned on key_bucket (= hash mod this), so a lookup reads
+# one partition even before clustering prunes blocks. Must match the table (set at migration time).
+CACHE_KEY_BUCKETS = int(os.getenv("CACHE_KEY_BUCKETS", "0"))
+
+# Hex characters kept from SHA-256 (128 bits — collisions are also re-checked against intent_key)
+KEY_HASH_LENGTH = 32
+
+
+def key_hash(intent_key: str) -> str:
+    """זהה ל-SUBSTR(TO_HEX(SHA256(intent_key)), 1, 32) ב-BigQuery."""
+    return hashlib.sha256(intent_key.encode("utf-8")).hexdigest()[:KEY_HASH_LENGTH]
+
+
+def key_bucket(hashed: str, buckets: int | None = None) -> int | None:
+    """זהה ל-MOD(CAST(CONCAT('0x', SUBSTR(key_hash, 1, 8)) AS INT64), buckets)."""
+    buckets = CACHE_KEY_BUCKETS if buckets is None else buckets
+    return int(hashed[:8], 16) % buckets if buckets else None
+
+
+# key_hash column present in cached_queries (None: not checked yet — intent_key matching works on both layouts)
+_schema_lock = threading.Lock()
+_has_key_hash: bool | None = None
+
+
+def resolve_schema(client, table_id: str) -> bool:
+    """
+    פעם אחת לתהליך: האם ל-cached_queries יש עמודת key_hash (metadata בלבד, בלי job).
+    טבלה שלא הועברה — או שאי אפשר לקרוא את ה-schema — נשארת בהתאמה לפי intent_key.
+    אחרי ה-swap של cache_migrate: restart כדי לעבור ל-key_hash.
+    """
+    global _has_key_hash
+    if CACHE_KEY_SCHEMA == "legacy":
+        return False
+    with _schema_lock:
+        if _has_key_hash is None:
+            try:
+                _has_key_hash = any(f.name == "key_hash" for f in client.get_table(table_id).schema)
+            except Exception as e:
+                logger.warning(f"[CACHE] could not read the schema of {table_id}, matching by intent_key: {e}")
+                _has_key_hash = False
+            if not _has_key_hash:
+                log = logger.warning if CACHE_KEY_SCHEMA == "hashed" else logger.info
+                log(f"[CACHE] {table_id} has no key_hash column (not migrated): matching by intent_key")
+        return _has_key_hash
+
+
+def hashed() -> bool:
+    return CACHE_KEY_SCHEMA != "legacy" and bool(_has_key_hash)
+
+
+def reset():
+    """לבדיקות."""
+    global _has_key_hash
+    with _schema_lock:
+        _has_key_hash = None
+
+
+def key_fields(intent_key: str) -> dict:
+    """עמודות המפתח של שורה (intent_key קריא + hash / bucket במצב hashed)."""
+    if not hashed():
+        return {"intent_key": intent_key}
+    h = key_hash(intent_key)
+    return {"key_hash": h, "key_bucket": key_bucket(h), "intent_key": intent_key}
+
+
+def key_params(intent_key: str) -> list:
+    """@key, ובמצב hashed גם @key_hash / @key_bucket."""
+    params = [bigquery.ScalarQueryParameter("key", "STRING", intent_key)]
+    if hashed():
+        h = key_hash(intent_key)
+        params.append(bigquery.ScalarQueryParameter("key_hash", "STRING", h))
+        params.append(bigquery.ScalarQueryParameter("key_bucket", "INT64", key_bucket(h)))
+    return params
+
+
+def key_filter(alias: str = "") -> str:
+    """תנאי point lookup על הטבלה (hash + bucket, כך ש-clustering / partitioning חותכים את הסריקה)."""
+    p = f"{alias}." if alias else ""
+    if not hashed():
+        return f"{p}intent_key = @key"
+    cond = f"{p}key_hash = @key_hash"
+    if CACHE_KEY_BUCKETS:
+        cond += f" AND {p}key_bucket = @key_bucket"
+    return cond
+
+
+def key_join(target: str = "T", source: str = "S") -> str:
+    """תנאי ה-ON של MERGE לפי עמודות המפתח."""
+    if not hashed():
+        return f"{target}.intent_key = {source}.intent_key"
+    cond = f"{target}.key_hash = {source}.key_hash"
+    if CACHE_KEY_BUCKETS:
+        cond += f" AND {target}.key_bucket = {source}.key_bucket"
+    return cond
+
+
+def key_source_columns() -> str:
+    """עמודות המפתח ב-USING (SELECT ...) של MERGE, מהפרמטרים."""
+    if not hashed():
+        return "@key AS intent_key"
+    return "@key_hash AS key_hash, @key_bucket AS key_bucket, @key AS intent_key"
+
+
+def key_insert_columns(source: str = "S") -> tuple[str, str]:
+    """(רשימת עמודות, ערכים) של המפתח ל-INSERT ב-MERGE."""
+    names = ["key_hash", "key_bucket", "intent_key"] if hashed() else ["intent_key"]
+    return ", ".join(names), ", ".join(f"{source}.{n}" for n in names)
+
+
+def table_ddl(table: str, buckets: int = CACHE_KEY_BUCKETS) -> str:
+    """
+    cached_queries בפריסה ל-point lookups: clustered לפי key_hash, ואופציונלית partitioned לפי bucket.
+    key_hash nullable: שורות שנכתבות במצב legacy בזמן המעבר מקבלות hash ב-backfill של cache_migrate.
+    """
+    partition = f"PARTITION BY RANGE_BUCKET(key_bucket, GENERATE_ARRAY(0, {buckets}, 1))\n" if buckets else ""
+    return f"""
+        CREATE TABLE IF NOT EXISTS `{table}` (
+          key_hash STRING,
+          key_bucket INT64,
+          intent_key STRING,
+          sql STRING,
+          result STRING,
+          last_updated TIMESTAMP,
+          use_count INT64
+        )
+        {partition}CLUSTER BY key_hash
+    """
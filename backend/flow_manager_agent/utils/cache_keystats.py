@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Keys tracked individually; past this the least recently requested key's counters are dropped
+# (the per-outcome totals stay exact)
+CACHE_KEY_STATS_MAX_KEYS = int(os.getenv("CACHE_KEY_STATS_MAX_KEYS", "2000"))
+
+# Outcomes of a cache lookup in run_or_cache
+OUTCOMES = ("memory_hits", "bigquery_hits", "derived_hits", "misses")
+
+
+def _new_counters(now: float) -> dict:
+    return {
+        **dict.fromkeys(OUTCOMES, 0),
+        "requests": 0,
+        "stale_hits": 0,
+        "bytes": 0,          # in-memory size of the last stored result
+        "first_seen": now,
+        "last_seen": now,
+    }
+
+
+class KeyStats:
+    """
+    מונים לכל intent_key בתוך התהליך: בקשות, hits לפי שכבה, stale, derived, misses וגודל התוצאה.
+    מוגבל ב-max_keys (LRU לפי הבקשה האחרונה), כך שהזיכרון חסום גם עם הרבה שאלות חד-פעמיות.
+    """
+
+    def __init__(self, max_keys: int = CACHE_KEY_STATS_MAX_KEYS):
+        self.max_keys = max_keys
+        self._keys: OrderedDict = OrderedDict()
+        self._totals = {**dict.fromkeys(OUTCOMES, 0), "stale_hits": 0, "dropped_keys": 0}
+        self._lock = threading.Lock()
+
+    def _touch(self, key: str, now: float) -> dict:
+        counters = self._keys.get(key)
+        if counters is None:
+            counters = self._keys[key] = _new_counters(now)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+                self._totals["dropped_keys"] += 1
+        else:
+            self._keys.move_to_end(key)
+        return counters
+
+    def record(self, key: str, outcome: str, stale: bool = False):
+        now = time.time()
+        with self._lock:
+            counters = self._touch(key, now)
+            counters["requests"] += 1
+            counters[outcome] += 1
+            counters["last_seen"] = now
+            self._totals[outcome] += 1
+            if stale:
+                counters["stale_hits"] += 1
+                self._totals["stale_hits"] += 1
+
+    def record_size(self, key: str, size: int):
+        with self._lock:
+            counters = self._keys.get(key)
+            if counters is not None:
+                counters["bytes"] = size
+
+    def top(self, n: int, by: str = "requests") -> list[dict]:
+        now = time.time()
+        with self._lock:
+            items = sorted(self._keys.items(), key=lambda kv: kv[1][by], reverse=True)[:n]
+            out = []
+            for key, c in items:
+                hits = c["memory_hits"] + c["bigquery_hits"] + c["derived_hits"]
+                out.append({
+                    "intent_key": key,
+                    **{k: c[k] for k in ("requests", *OUTCOMES, "stale_hits", "bytes")},
+                    "hit_rate": (hits / c["requests"]) if c["requests"] else 0.0,
+                    "last_seen_age_seconds": round(now - c["last_seen"], 3),
+                })
+            return out
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._totals = {**dict.fromkeys(OUTCOMES, 0), "stale_hits": 0, "dropped_keys": 0}
+
+    def stats(self, top_n: int = 10) -> dict:
+        with self._lock:
+            totals = dict(self._totals)
+            tracked = len(self._keys)
+        requests = sum(totals[o] for o in OUTCOMES)
+        return {
+            **totals,
+            "requests": requests,
+            "hit_rate": ((requests - totals["misses"]) / requests) if requests else 0.0,
+            "tracked_keys": tracked,
+            "max_keys": self.max_keys,
+            "top_by_requests": self.top(top_n, "requests"),
+            "top_by_bytes": [k for k in self.top(top_n, "bytes") if k["bytes"]],
+        }
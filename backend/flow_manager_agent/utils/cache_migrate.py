@@ -0,0 +1,153 @@
+"""
+מעביר את cache.cached_queries לפריסת המפתחות המגובבים (ראו cache_keys):
+  1) יוצר טבלה חדשה, clustered לפי key_hash (ואופציונלית partitioned לפי key_bucket)
+  2) מעתיק את השורות עם ה-hash מחושב ב-BigQuery (בלי להעביר נתונים דרך התהליך)
+  3) משלים hash לשורות בלי hash (נכתבו במצב legacy), ומוסיף את העמודות ל-cache_events
+  4) בודק שמספר המפתחות תואם
+  5) עם --swap: משנה שמות — הטבלה הישנה נשמרת כ-<table>_legacy
+
+ההרצה אידמפוטנטית (אפשר להריץ שוב עד ה-swap). עם CACHE_KEY_SCHEMA=auto (ברירת המחדל) השרת מזהה
+טבלה שלא הועברה ומחפש לפי intent_key; אחרי --swap: restart (ואותו CACHE_KEY_BUCKETS) כדי לעבור ל-key_hash.
+
+    python -m backend.flow_manager_agent.utils.cache_migrate --dry-run
+    python -m backend.flow_manager_agent.utils.cache_migrate --buckets 0 --swap
+"""
+import argparse
+import logging
+
+from google.cloud import bigquery
+
+from ...bq import get_bq_client
+from ...job_stats import job_labels, record_job
+from .cache_keys import CACHE_KEY_BUCKETS, KEY_HASH_LENGTH, table_ddl
+from .cache_events import EVENTS_TABLE
+
+logger = logging.getLogger(__name__)
+
+
+def hash_sql(column: str = "intent_key") -> str:
+    """אותו hash כמו cache_keys.key_hash, ב-SQL של BigQuery."""
+    return f"SUBSTR(TO_HEX(SHA256({column})), 1, {KEY_HASH_LENGTH})"
+
+
+def bucket_sql(hash_column: str, buckets: int) -> str:
+    """אותו bucket כמו cache_keys.key_bucket."""
+    if not buckets:
+        return "CAST(NULL AS INT64)"
+    return f"MOD(CAST(CONCAT('0x', SUBSTR({hash_column}, 1, 8)) AS INT64), {buckets})"
+
+
+def migration_statements(project: str, dataset: str, table: str, buckets: int = CACHE_KEY_BUCKETS) -> dict:
+    """ה-SQL של כל שלב (לפי הסדר). target = <table>_hashed עד ה-swap."""
+    source = f"{project}.{dataset}.{table}"
+    target = f"{source}_hashed"
+    events = f"{project}.{dataset}.{EVENTS_TABLE}"
+
+    return {
+        "create": table_ddl(target, buckets),
+        # newest row per key; keys already copied by an earlier run are skipped
+        "copy": f"""
+            INSERT INTO `{target}` (key_hash, key_bucket, intent_key, sql, result, last_updated, use_count)
+            SELECT h, {bucket_sql("h", buckets)}, intent_key, sql, result, last_updated, use_count
+            FROM (
+              SELECT {hash_sql()} AS h, intent_key, sql, result, last_updated, use_count
+              FROM `{source}`
+              WHERE intent_key IS NOT NULL
+              QUALIFY ROW_NUMBER() OVER (PARTITION BY intent_key ORDER BY last_updated DESC) = 1
+            )
+            WHERE h NOT IN (SELECT key_hash FROM `{target}` WHERE key_hash IS NOT NULL)
+        """,
+        # rows inserted without a hash (intent_key matching writing to the new layout)
+        "backfill": f"""
+            UPDATE `{target}`
+            SET key_hash = {hash_sql()},
+                key_bucket = {bucket_sql(hash_sql(), buckets)}
+            WHERE key_hash IS NULL AND intent_key IS NOT NULL
+        """,
+        "events": f"""
+            ALTER TABLE `{events}`
+            ADD COLUMN IF NOT EXISTS key_hash STRING,
+            ADD COLUMN IF NOT EXISTS key_bucket INT64
+        """,
+        "verify": f"""
+            SELECT
+              (SELECT COUNT(DISTINCT intent_key) FROM `{source}` WHERE intent_key IS NOT NULL) AS source_keys,
+              (SELECT COUNT(*) FROM `{target}`) AS target_rows,
+              (SELECT COUNT(*) FROM `{target}` WHERE key_hash IS NULL) AS unhashed_rows
+        """,
+        # the new table doesn't exist yet on a dry run: the copy reads the source once
+        "estimate": f"SELECT intent_key, sql, result, last_updated, use_count FROM `{source}`",
+        "swap": [
+            f"ALTER TABLE `{source}` RENAME TO `{table}_legacy`",
+            f"ALTER TABLE `{target}` RENAME TO `{table}`",
+        ],
+    }
+
+
+def _run(client, sql: str, dry_run: bool):
+    config = bigquery.QueryJobConfig(dry_run=dry_run, labels=job_labels("cache_migrate"))
+    job = client.query(sql, job_config=config)
+    if dry_run:
+        return job.total_bytes_processed
+    rows = [dict(r) for r in job.result()]
+    record_job(job, "cache_migrate", sql)
+    return rows
+
+
+def migrate(project: str, dataset: str, table: str, buckets: int = CACHE_KEY_BUCKETS,
+            swap: bool = False, dry_run: bool = False, client=None) -> dict:
+    client = client or get_bq_client(project, "EU")
+    steps = migration_statements(project, dataset, table, buckets)
+    report = {"buckets": buckets, "dry_run": dry_run, "steps": {}}
+
+    for name in ("create", "events"):
+        if dry_run:
+            report["steps"][name] = "skipped (DDL)"
+            continue
+        try:
+            _run(client, steps[name], dry_run=False)
+            report["steps"][name] = "ok"
+        except Exception as e:
+            if name == "create":
+                raise
+            # no events table yet: it is created with the new columns on first use
+            report["steps"][name] = f"skipped: {e}"
+
+    if dry_run:
+        report["steps"]["copy"] = {"estimated_bytes": _run(client, steps["estimate"], dry_run=True)}
+        return report
+
+    for name in ("copy", "backfill"):
+        _run(client, steps[name], dry_run=False)
+        report["steps"][name] = "ok"
+
+    verify = _run(client, steps["verify"], dry_run=False)[0]
+    report["verify"] = verify
+    complete = verify["target_rows"] >= verify["source_keys"] and not verify["unhashed_rows"]
+    if not complete:
+        logger.warning(f"[CACHE-MIGRATE] verification failed, not swapping: {verify}")
+    if swap and complete:
+        for sql in steps["swap"]:
+            _run(client, sql, dry_run=False)
+        report["steps"]["swap"] = "ok"
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate cache.cached_queries to hashed, clustered keys")
+    parser.add_argument("--project", default="practicode-2025")
+    parser.add_argument("--dataset", default="cache")
+    parser.add_argument("--table", default="cached_queries")
+    parser.add_argument("--buckets", type=int, default=CACHE_KEY_BUCKETS,
+                        help="integer-range partitions on key_bucket (0 = clustering only)")
+    parser.add_argument("--swap", action="store_true", help="rename the tables once the copy is verified")
+    parser.add_argument("--dry-run", action="store_true", help="only estimate the bytes the copy reads")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = migrate(args.project, args.dataset, args.table, args.buckets, swap=args.swap, dry_run=args.dry_run)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
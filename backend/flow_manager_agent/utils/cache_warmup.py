@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from ...bq import run_blocking
+from .cache import CacheService
+from .sql_canonical import canonicalize_sql
+
+logger = logging.getLogger(__name__)
+
+# "0" disables warm-up (the cache fills on demand only)
+CACHE_WARMUP = os.getenv("CACHE_WARMUP", "1") not in ("0", "false", "False")
+# How many of the most-used keys in cache.cached_queries are replayed
+CACHE_WARMUP_TOP_N = int(os.getenv("CACHE_WARMUP_TOP_N", "25"))
+# Optional JSON file: [{"sql": ..., "intent_key": ...}, ...] or ["SELECT ...", ...] — replayed before the table's keys
+CACHE_WARMUP_FILE = os.getenv("CACHE_WARMUP_FILE", "")
+# Replays running at once (each is a cache lookup, on a miss a BigQuery job)
+CACHE_WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", "4"))
+# Re-run the warm-up every this many seconds after startup (0 = startup only)
+CACHE_WARMUP_INTERVAL_SECONDS = float(os.getenv("CACHE_WARMUP_INTERVAL_SECONDS", "900"))
+# The cache counts as warm once this share of the targets of a pass was answered
+CACHE_WARMUP_READY_RATIO = float(os.getenv("CACHE_WARMUP_READY_RATIO", "0.8"))
+
+
+def _load_file(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [{"sql": i, "intent_key": None} if isinstance(i, str) else i for i in items]
+
+
+class CacheWarmer:
+    """
+    מריץ מחדש את השאילתות הפופולריות (רשימה מוגדרת + ה-keys הכי מבוקשים בטבלת ה-cache)
+    דרך run_fn — אותו מסלול כמו בקשה רגילה — בהפעלה ואחר כך כל CACHE_WARMUP_INTERVAL_SECONDS.
+    תשובות בתוקף בטבלה רק נטענות לשכבת הזיכרון; שפג תוקפן — מחושבות ונשמרות מחדש.
+
+    run_fn(sql, intent_key=...) היא coroutine שמחזירה dict עם status (run_bigquery_async).
+    """
+
+    def __init__(self, run_fn, targets_fn=None, enabled: bool = CACHE_WARMUP):
+        self.run_fn = run_fn
+        self.targets_fn = targets_fn or self.default_targets
+        self.enabled = enabled
+        self.state = "disabled" if not enabled else "pending"
+        self.warm = not enabled  # nothing to wait for when warm-up is off
+        self.last_pass: dict | None = None
+        self.passes = 0
+        self._task = None
+
+    # ---- targets ----
+    @staticmethod
+    def default_targets() -> list[dict]:
+        targets = _load_file(CACHE_WARMUP_FILE) if CACHE_WARMUP_FILE else []
+        if CACHE_WARMUP_TOP_N > 0:
+            targets += CacheService().hot_entries(CACHE_WARMUP_TOP_N)
+
+        seen, unique = set(), []
+        for t in targets:
+            key = t.get("intent_key") or t["sql"]
+            if key not in seen:
+                seen.add(key)
+                unique.append(t)
+        return unique
+
+    # ---- one pass ----
+    async def _replay(self, target: dict, sem: asyncio.Semaphore) -> str:
+        async with sem:
+            key = target.get("intent_key") or canonicalize_sql(target["sql"])[1]
+            # known demand: the replay's own miss then reaches the admission threshold
+            CacheService.admission.record(key)
+            try:
+                result = await self.run_fn(target["sql"], intent_key=key)
+            except Exception as e:
+                logger.warning(f"[CACHE-WARMUP] replay failed: {e}")
+                return "failed"
+            if result.get("status") != "ok":
+                logger.warning(f"[CACHE-WARMUP] replay failed: {result.get('message')}")
+                return "failed"
+            return "cached" if result.get("from_cache") else "computed"
+
+    async def warm_once(self) -> dict:
+        start = time.monotonic()
+        self.state = "warming"
+        error = None
+        try:
+            targets = await run_blocking(self.targets_fn)
+        except Exception as e:
+            logger.warning(f"[CACHE-WARMUP] could not read hot keys: {e}")
+            targets, error = [], str(e)
+
+        outcomes = []
+        if targets:
+            sem = asyncio.Semaphore(max(1, CACHE_WARMUP_CONCURRENCY))
+            outcomes = await asyncio.gather(*(self._replay(t, sem) for t in targets))
+
+        summary = {
+            "targets": len(targets),
+            "cached": outcomes.count("cached"),
+            "computed": outcomes.count("computed"),
+            "failed": outcomes.count("failed"),
+            "error": error,
+            "seconds": round(time.monotonic() - start, 3),
+            "finished_at": time.time(),
+        }
+        answered = summary["cached"] + summary["computed"]
+        ready = error is None and (not targets or answered / len(targets) >= CACHE_WARMUP_READY_RATIO)
+
+        self.last_pass = summary
+        self.passes += 1
+        self.warm = self.warm or ready
+        self.state = "warm" if ready else "cold"
+        logger.info(f"[CACHE-WARMUP] pass {self.passes}: {summary}")
+        return summary
+
+    # ---- schedule ----
+    async def run_forever(self, interval: float = CACHE_WARMUP_INTERVAL_SECONDS):
+        while True:
+            await self.warm_once()
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    def start(self):
+        """מתחיל ברקע (ב-event loop הנוכחי). לא חוסם את ההפעלה — הבקשות הראשונות פשוט לא מחכות."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "warm": self.warm,
+            "state": self.state,
+            "passes": self.passes,
+            "last_pass": self.last_pass,
+            "interval_seconds": CACHE_WARMUP_INTERVAL_SECONDS,
+        }
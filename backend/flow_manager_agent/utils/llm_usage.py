@@ -0,0 +1,51 @@
+"""
+כמה בקשות נענו בלי אף קריאת LLM. RootAgent רושם לכל turn איך כל שלב רץ:
+"llm", או "rules" / "compiler" / "template" כשהתשובה נבנתה דטרמיניסטית.
+"""
+import threading
+from collections import deque
+
+LLM = "llm"
+STAGES = ("intent", "clarifier", "sql", "insights")
+
+# recent turns kept for /admin/llm/usage
+RECENT_TURNS = 50
+
+_lock = threading.Lock()
+_stats = {"turns": 0, "without_llm": 0, "llm_calls": 0, "stages": {s: {} for s in STAGES}}
+_recent: deque = deque(maxlen=RECENT_TURNS)
+
+
+def record_turn(turn: dict):
+    """turn: {stage: "llm" | אופן דטרמיניסטי} — רק השלבים שרצו."""
+    llm_calls = sum(1 for how in turn.values() if how == LLM)
+    with _lock:
+        _stats["turns"] += 1
+        _stats["llm_calls"] += llm_calls
+        if not llm_calls:
+            _stats["without_llm"] += 1
+        for stage, how in turn.items():
+            counts = _stats["stages"].setdefault(stage, {})
+            counts[how] = counts.get(how, 0) + 1
+        _recent.append(dict(turn))
+
+
+def llm_usage_stats(recent: int = 10) -> dict:
+    with _lock:
+        turns = _stats["turns"]
+        return {
+            "turns": turns,
+            "without_llm": _stats["without_llm"],
+            "without_llm_share": (_stats["without_llm"] / turns) if turns else 0.0,
+            "llm_calls": _stats["llm_calls"],
+            "llm_calls_per_turn": (_stats["llm_calls"] / turns) if turns else 0.0,
+            "stages": {s: dict(c) for s, c in _stats["stages"].items()},
+            "recent": list(_recent)[-recent:] if recent else [],
+        }
+
+
+def reset():
+    """לבדיקות."""
+    with _lock:
+        _stats.update(turns=0, without_llm=0, llm_calls=0, stages={s: {} for s in STAGES})
+        _recent.clear()
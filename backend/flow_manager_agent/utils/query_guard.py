@@ -0,0 +1,156 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+from ...bq import BQClient, BQ_MAX_BYTES_BILLED, run_blocking
+from .sql_canonical import canonical_key
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Tables
+# =========================
+RAW_TABLE = "practicode-2025.clicks_data_prac.partial_encoded_clicks_part"
+
+AGG_TABLES = {
+    "app_id": "practicode-2025.clicks_data_prac.hourly_clicks_by_app",
+    "media_source": "practicode-2025.clicks_data_prac.hourly_clicks_by_media_source",
+    "site_id": "practicode-2025.clicks_data_prac.hourly_clicks_by_site",
+}
+
+RAW_COLUMNS = {
+    "event_time", "hr", "is_engaged_view", "is_retargeting", "media_source",
+    "partner", "app_id", "site_id", "engagement_type", "total_events",
+}
+
+# Estimates are stable for a given SQL text, so they are kept for the process lifetime
+DRY_RUN_CACHE_SIZE = 1024
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """SQL שה-dry run שלו חורג מ-maximum_bytes_billed ואין לו מסלול חלופי."""
+
+    def __init__(self, sql: str, estimated_bytes: int, limit: int):
+        self.sql = sql
+        self.estimated_bytes = estimated_bytes
+        self.limit = limit
+        super().__init__(
+            f"Query would scan {estimated_bytes / 1024 ** 3:.2f} GB, "
+            f"over the {limit / 1024 ** 3:.2f} GB limit. "
+            f"Please narrow the request (e.g. add a date range)."
+        )
+
+
+_estimates: OrderedDict = OrderedDict()
+_estimates_lock = threading.Lock()
+
+
+def _estimate_key(sql: str) -> str:
+    return canonical_key(sql)
+
+
+def estimate_bytes(sql: str, bq: BQClient | None = None) -> int:
+    """bytes שהשאילתה תסרוק לפי dry run, עם cache לפי ה-SQL הקנוני."""
+    key = _estimate_key(sql)
+    with _estimates_lock:
+        if key in _estimates:
+            _estimates.move_to_end(key)
+            return _estimates[key]
+
+    estimated = (bq or BQClient()).dry_run(sql)
+
+    with _estimates_lock:
+        _estimates[key] = estimated
+        while len(_estimates) > DRY_RUN_CACHE_SIZE:
+            _estimates.popitem(last=False)
+
+    return estimated
+
+
+# =========================
+# Re-routing raw -> agg
+# =========================
+_RAW_FROM_RE = re.compile(r"`?" + re.escape(RAW_TABLE) + r"`?")
+
+# The builder's raw date-range predicate (either order after canonicalization)
+_RAW_START_RE = re.compile(
+    r"event_time\s*>=\s*TIMESTAMP\(\s*'(\d{4}-\d{2}-\d{2})\s+00:00:00'\s*\)", re.IGNORECASE
+)
+_RAW_END_RE = re.compile(
+    r"event_time\s*<=\s*TIMESTAMP\(\s*'(\d{4}-\d{2}-\d{2})\s+23:59:59'\s*\)", re.IGNORECASE
+)
+
+
+def _referenced_columns(sql: str) -> set:
+    words = set(re.findall(r"\b[a-z_]+\b", re.sub(r"'[^']*'", "", sql.lower())))
+    return words & RAW_COLUMNS
+
+
+def reroute_to_agg(sql: str) -> str | None:
+    """
+    אם שאילתה על הטבלה הגולמית משתמשת רק בעמודות של אחת מטבלאות ה-agg
+    (event_time + hr + מזהה אחד + total_events) — מחזיר את אותה שאילתה מול טבלת ה-agg.
+    אחרת None.
+    """
+    if not _RAW_FROM_RE.search(sql):
+        return None
+
+    columns = _referenced_columns(sql)
+    identifiers = columns & set(AGG_TABLES)
+    if len(identifiers) != 1:
+        return None
+
+    identifier = next(iter(identifiers))
+    if not columns <= {"event_time", "hr", "total_events", identifier}:
+        return None
+
+    # event_time must appear only inside the standard date-range predicate
+    rewritten = _RAW_START_RE.sub(r"event_date >= '\1'", sql)
+    rewritten = _RAW_END_RE.sub(r"event_date <= '\1'", rewritten)
+    if "event_time" in rewritten.lower():
+        return None
+
+    return _RAW_FROM_RE.sub(f"`{AGG_TABLES[identifier]}`", rewritten)
+
+
+# =========================
+# Guard
+# =========================
+def guard_query(sql: str, *, max_bytes: int | None = None, reroute: bool = True, bq: BQClient | None = None) -> dict:
+    """
+    שלב לפני הרצה: dry run + בדיקת תקציב.
+
+    מחזיר:
+      {"status": "ok" | "rerouted", "sql": <sql להרצה>, "estimated_bytes": int, "original_sql": str}
+    זורק QueryBudgetExceeded אם אין דרך להריץ בתוך התקציב.
+    """
+    limit = BQ_MAX_BYTES_BILLED if max_bytes is None else max_bytes
+    bq = bq or BQClient()
+
+    estimated = estimate_bytes(sql, bq)
+    logger.info(f"[GUARD] dry run: {estimated} bytes (limit={limit})")
+
+    if not limit or estimated <= limit:
+        return {"status": "ok", "sql": sql, "estimated_bytes": estimated, "original_sql": sql}
+
+    if reroute:
+        alternative = reroute_to_agg(sql)
+        if alternative:
+            alt_estimated = estimate_bytes(alternative, bq)
+            logger.info(f"[GUARD] re-routed raw -> agg: {estimated} -> {alt_estimated} bytes")
+            if alt_estimated <= limit:
+                return {
+                    "status": "rerouted",
+                    "sql": alternative,
+                    "estimated_bytes": alt_estimated,
+                    "original_sql": sql,
+                }
+
+    logger.warning(f"[GUARD] rejected query over budget ({estimated} > {limit})")
+    raise QueryBudgetExceeded(sql, estimated, limit)
+
+
+async def guard_query_async(sql: str, **kwargs) -> dict:
+    return await run_blocking(guard_query, sql, **kwargs)
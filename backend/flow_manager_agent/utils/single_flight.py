@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    מאחד קריאות זהות שרצות במקביל: הקורא הראשון לכל key מריץ את הפונקציה,
+    וכל מי שמגיע בזמן שהיא רצה מחכה לאותה תוצאה (או לאותה שגיאה) במקום להריץ שוב.
+
+    do()       — לקוד סינכרוני (threads)
+    do_async() — ל-coroutines; העבודה רצה כ-task משותף, ומבוטלת רק כשכל הממתינים ביטלו.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self._async_calls: dict = {}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    def do(self, key: str, fn):
+        """מחזיר (result, shared) — shared=True אם התוצאה הגיעה מקריאה אחרת שכבר רצה."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            logger.info(f"[SINGLE-FLIGHT] waiting for in-flight key={key[:80]}...")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: str, fn):
+        """כמו do(), כש-fn היא פונקציה שמחזירה coroutine."""
+        with self._lock:
+            call = self._async_calls.get(key)
+            shared = call is not None
+            if shared:
+                self._stats["coalesced"] += 1
+            else:
+                call = _AsyncCall(asyncio.ensure_future(fn()))
+                self._async_calls[key] = call
+                self._stats["executions"] += 1
+                call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        if shared:
+            logger.info(f"[SINGLE-FLIGHT] awaiting in-flight key={key[:80]}...")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # every caller went away (disconnect / deadline): stop the shared work too
+                call.task.cancel()
+
+    def _forget(self, key: str, call):
+        with self._lock:
+            if self._async_calls.get(key) is call:
+                del self._async_calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self._stats["executions"] + self._stats["coalesced"]
+            return {
+                **self._stats,
+                "coalesced_rate": (self._stats["coalesced"] / requests) if requests else 0.0,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
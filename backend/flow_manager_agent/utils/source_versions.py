@@ -0,0 +1,360 @@
+import os
+import time
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # without sqlglot dependencies can't be derived — every entry stays TTL-bound
+    sqlglot = None
+    exp = None
+
+from ...bq import BQClient
+from .query_guard import RAW_TABLE, AGG_TABLES
+
+logger = logging.getLogger(__name__)
+
+# How often INFORMATION_SCHEMA.PARTITIONS of the watched datasets is re-read (one metadata query per dataset)
+CACHE_SOURCE_POLL_SECONDS = float(os.getenv("CACHE_SOURCE_POLL_SECONDS", "120"))
+# Without a successful poll for this long, source validity is unknown and entries fall back to the TTL
+CACHE_SOURCE_STALE_AFTER = float(os.getenv("CACHE_SOURCE_STALE_AFTER_SECONDS", str(3 * CACHE_SOURCE_POLL_SECONDS)))
+
+# Datasets whose tables can be tracked (anything else keeps the TTL)
+WATCHED_DATASETS = {"practicode-2025.clicks_data_prac"}
+
+# Columns that map a filter to day partitions (raw: event_time, agg tables: event_date)
+PARTITION_FILTER_COLUMNS = {"event_time", "event_date"}
+
+# The cost guard may answer a raw-table query from an agg table (same data, same dates)
+DERIVED_TABLES = {RAW_TABLE: list(AGG_TABLES.values())}
+
+# Functions whose value changes with the clock: such answers can't be tied to table versions
+_CLOCK_FUNCTIONS = ("CurrentDate", "CurrentDatetime", "CurrentTimestamp", "CurrentTime")
+_CLOCK_NAMES = {"NOW", "CURRENT_DATE", "CURRENT_TIMESTAMP", "CURRENT_DATETIME", "UNIX_SECONDS"}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# last_modified_time vs. our clock: a write this close to computed_at counts as "after" it
+_CLOCK_SLACK = timedelta(seconds=1)
+
+
+# =========================
+# Dependencies of a query
+# =========================
+def _as_date(node) -> date | None:
+    """'2025-10-25' / DATE '...' / TIMESTAMP('...') / CAST('...' AS ...) — literal בלבד, לא ביטוי שמחשב ממנו."""
+    if isinstance(node, (exp.Cast, exp.Date, exp.Timestamp)):
+        node = node.this
+    if not isinstance(node, exp.Literal) or not node.is_string:
+        return None
+    try:
+        return date.fromisoformat(node.this[:10])
+    except ValueError:
+        return None
+
+
+def _filters_partition_column(node) -> bool:
+    column = node if isinstance(node, exp.Column) else None
+    if isinstance(node, (exp.Date, exp.Cast)) and isinstance(node.this, exp.Column):
+        column = node.this
+    return column is not None and column.name.lower() in PARTITION_FILTER_COLUMNS
+
+
+def _bound(node) -> tuple | None:
+    """(lo, hi) של תנאי אחד `column op literal` על עמודת partition, או None אם הוא לא כזה."""
+    if isinstance(node, exp.Between):
+        if not _filters_partition_column(node.this):
+            return None
+        lo, hi = _as_date(node.args["low"]), _as_date(node.args["high"])
+        return (lo, hi) if lo and hi else None
+    if isinstance(node, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.EQ)) and _filters_partition_column(node.this):
+        d = _as_date(node.expression)
+        if d is None:
+            return None
+        return (
+            d if isinstance(node, (exp.GT, exp.GTE, exp.EQ)) else None,
+            d if isinstance(node, (exp.LT, exp.LTE, exp.EQ)) else None,
+        )
+    return None
+
+
+def _conjuncts(node):
+    """a AND (b AND c) -> a, b, c."""
+    node = node.unnest()
+    if isinstance(node, exp.And):
+        yield from _conjuncts(node.this)
+        yield from _conjuncts(node.expression)
+    else:
+        yield node
+
+
+def _date_range(tree) -> tuple | None:
+    """
+    טווח התאריכים (כולל) שהשאילתה קוראת, רק מתנאי AND ברמה העליונה של ה-WHERE החיצוני
+    (event_time / event_date מול literal). None = לא ניתן לתחום => תלות בכל הטבלה:
+    כמה טבלאות, בלי תנאי, או עמודת partition בכל מקום אחר (NOT, !=, OR, IF / CASE, תת-שאילתה, SELECT).
+    """
+    if not isinstance(tree, exp.Select) or len(list(tree.find_all(exp.Table))) != 1:
+        return None
+    where = tree.args.get("where")
+    if where is None:
+        return None
+
+    lo = hi = None
+    bounded = set()
+    for conjunct in _conjuncts(where.this):
+        bound = _bound(conjunct)
+        if bound is None:
+            continue
+        bounded.update(id(c) for c in conjunct.find_all(exp.Column))
+        if bound[0]:
+            lo = bound[0] if lo is None else max(lo, bound[0])
+        if bound[1]:
+            hi = bound[1] if hi is None else min(hi, bound[1])
+
+    partition_columns = [c for c in tree.find_all(exp.Column) if c.name.lower() in PARTITION_FILTER_COLUMNS]
+    if any(id(c) not in bounded for c in partition_columns):
+        return None
+    return (lo, hi) if (lo or hi) else None
+
+
+@lru_cache(maxsize=2048)
+def source_dependencies(sql: str) -> tuple | None:
+    """
+    ((table, date_range | None), ...) שהתשובה ל-sql תלויה בהם.
+    None => אי אפשר לקשור את התשובה לגרסאות טבלה (אין טבלאות, טבלה לא במעקב, תלוי בשעון).
+    """
+    if sqlglot is None or not sql:
+        return None
+    try:
+        tree = sqlglot.parse_one(sql, read="bigquery")
+    except Exception:
+        return None
+
+    if any(tree.find(getattr(exp, name)) for name in _CLOCK_FUNCTIONS if hasattr(exp, name)):
+        return None
+    if any(a.name.upper() in _CLOCK_NAMES for a in tree.find_all(exp.Anonymous)):
+        return None
+
+    ctes = {c.alias_or_name for c in tree.find_all(exp.CTE)}
+    tables = set()
+    for t in tree.find_all(exp.Table):
+        if not t.db and t.name in ctes:
+            continue
+        name = ".".join(p for p in (t.catalog, t.db, t.name) if p)
+        if name.rsplit(".", 1)[0] not in WATCHED_DATASETS:
+            return None
+        tables.add(name)
+    if not tables:
+        return None
+
+    rng = _date_range(tree)
+    for table in list(tables):
+        tables.update(DERIVED_TABLES.get(table, ()))
+    return tuple((table, rng) for table in sorted(tables))
+
+
+def _partition_date(partition_id) -> date | None:
+    if partition_id and partition_id[:8].isdigit():
+        return datetime.strptime(partition_id[:8], "%Y%m%d").date()
+    return None  # __NULL__ / __UNPARTITIONED__ / streaming buffer / non-partitioned table
+
+
+def _in_range(partition_id, rng) -> bool:
+    d = _partition_date(partition_id)
+    if d is None or rng is None:
+        return True  # rows without a partition date could be anywhere
+    lo, hi = rng
+    return (lo is None or d >= lo) and (hi is None or d <= hi)
+
+
+def _as_utc(value) -> datetime | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+# =========================
+# Table versions
+# =========================
+class SourceVersions:
+    """
+    last_modified_time לכל partition של טבלאות המקור, מתוך INFORMATION_SCHEMA.PARTITIONS
+    (שאילתת metadata אחת לכל dataset בכל poll, ברקע).
+
+    תשובה שחושבה ב-computed_at תקפה כל עוד אף partition שהיא קוראת לא השתנה אחריה —
+    כך תשובות על ימים שלא משתנים נשארות בתוקף בלי TTL, ו-backfill מבטל רק את מה שתלוי בו.
+    """
+
+    def __init__(self, bq: BQClient | None = None):
+        self._bq = bq
+        self._lock = threading.Lock()
+        self._partitions: dict = {}          # table -> {partition_id: last_modified}
+        self._watched: set = set()
+        self._dependents: dict = {}          # table -> {intent_key: date_range}
+        self._listeners: list = []
+        self._last_success = None            # monotonic time of the last successful poll
+        self._thread = None
+        self._wake = threading.Event()
+        self._stats = {"polls": 0, "poll_failures": 0, "changed_partitions": 0, "invalidations": 0}
+
+    # ---- request path (no I/O) ----
+    def on_invalidate(self, fn):
+        """fn(intent_key) נקרא לכל entry שתלוי ב-partition שהשתנה."""
+        self._listeners.append(fn)
+
+    def fresh(self) -> bool:
+        return self._last_success is not None and time.monotonic() - self._last_success <= CACHE_SOURCE_STALE_AFTER
+
+    def validity(self, sql: str, computed_at: datetime) -> str | None:
+        """
+        "valid"   — כל ה-partitions שהתשובה קוראת לא השתנו מאז computed_at
+        "changed" — לפחות אחד השתנה אחריה
+        None      — לא ידוע (אין תלויות / עוד לא נקרא metadata / ה-poll לא עדכני) => TTL
+        """
+        deps = source_dependencies(sql)
+        if deps is None:
+            return None
+
+        self.watch(deps)  # no I/O: the poller (started with the app, see start()) picks the table up
+        if not self.fresh():
+            return None
+
+        with self._lock:
+            if any(table not in self._partitions for table, _ in deps):
+                return None
+            modified = max(
+                (m for table, rng in deps for pid, m in self._partitions[table].items() if _in_range(pid, rng)),
+                default=_EPOCH,
+            )
+        return "changed" if modified > computed_at - _CLOCK_SLACK else "valid"
+
+    def watch(self, deps, intent_key: str | None = None):
+        new = False
+        with self._lock:
+            for table, rng in deps:
+                if table not in self._watched:
+                    self._watched.add(table)
+                    new = True
+                if intent_key is not None:
+                    self._dependents.setdefault(table, {})[intent_key] = rng
+        if new:
+            self._wake.set()
+
+    def register(self, intent_key: str, sql: str):
+        """entry שנשמר בזיכרון כתלוי-מקור: יבוטל כשה-partitions שלו משתנים."""
+        deps = source_dependencies(sql)
+        if deps:
+            self.watch(deps, intent_key)
+
+    def forget(self, intent_key: str):
+        """ה-entry יצא משכבת הזיכרון (פינוי / תפוגה / ביטול): אין יותר מה לבטל עבורו."""
+        with self._lock:
+            for table in list(self._dependents):
+                dependents = self._dependents[table]
+                dependents.pop(intent_key, None)
+                if not dependents:
+                    del self._dependents[table]
+
+    # ---- background ----
+    def start(self):
+        """מפעיל את ה-poller (מה-lifespan של האפליקציה). בלעדיו fresh() שקר וכל entry נשאר ב-TTL."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-source-versions", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("[CACHE] source version poll failed")
+            self._wake.wait(CACHE_SOURCE_POLL_SECONDS)
+            self._wake.clear()
+
+    def _load(self, dataset: str) -> dict:
+        query = f"""
+            SELECT table_name, partition_id, last_modified_time
+            FROM `{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        """
+        bq = self._bq or BQClient()
+        partitions: dict = {}
+        for r in bq.execute_query(query, "source_versions"):
+            table = f"{dataset}.{r['table_name']}"
+            partitions.setdefault(table, {})[r["partition_id"]] = _as_utc(r["last_modified_time"])
+        return partitions
+
+    def poll(self) -> list:
+        """קורא metadata, מבטל entries שתלויים ב-partitions שהשתנו. מחזיר [(table, partition_id)] שהשתנו."""
+        with self._lock:
+            datasets = {t.rsplit(".", 1)[0] for t in self._watched}
+        if not datasets:
+            return []
+
+        loaded: dict = {}
+        try:
+            for dataset in sorted(datasets):
+                loaded.update(self._load(dataset))
+        except Exception as e:
+            logger.warning(f"[CACHE] source metadata unavailable: {e}")
+            with self._lock:
+                self._stats["poll_failures"] += 1
+            return []
+
+        changed, invalidated = [], []
+        with self._lock:
+            for table, partitions in loaded.items():
+                previous = self._partitions.get(table)
+                self._partitions[table] = partitions
+                if previous is None:
+                    continue  # first sight: nothing to compare with
+                for pid, modified in partitions.items():
+                    if previous.get(pid) != modified:
+                        changed.append((table, pid))
+                for pid in set(previous) - set(partitions):
+                    changed.append((table, pid))  # dropped / expired partition
+
+            for table, pid in changed:
+                dependents = self._dependents.get(table, {})
+                for key, rng in list(dependents.items()):
+                    if _in_range(pid, rng):
+                        invalidated.append(key)
+                        del dependents[key]
+
+            self._last_success = time.monotonic()
+            self._stats["polls"] += 1
+            self._stats["changed_partitions"] += len(changed)
+            self._stats["invalidations"] += len(set(invalidated))
+
+        for key in set(invalidated):
+            for fn in self._listeners:
+                fn(key)
+        if changed:
+            logger.info(f"[CACHE] source change: {len(changed)} partitions, {len(set(invalidated))} entries invalidated")
+        return changed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "watched_tables": sorted(self._watched),
+                "tracked_entries": len({k for d in self._dependents.values() for k in d}),
+                "fresh": self.fresh(),
+                "last_poll_age_seconds": (time.monotonic() - self._last_success) if self._last_success else None,
+            }
+
+    def reset(self):
+        """שוכח metadata ותלויות (לבדיקות)."""
+        with self._lock:
+            self._partitions.clear()
+            self._watched.clear()
+            self._dependents.clear()
+            self._last_success = None
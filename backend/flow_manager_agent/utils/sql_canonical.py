@@ -0,0 +1,180 @@
+import re
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # sqlglot is optional — fall back to whitespace-only normalization
+    sqlglot = None
+    exp = None
+
+logger = logging.getLogger(__name__)
+
+_SIMPLE_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# How many distinct canonical keys to track for the hit-rate counters
+STATS_MAX_KEYS = 10_000
+
+
+# =========================
+# AST transforms
+# =========================
+def _is_qualified_table_part(node) -> bool:
+    parent = node.parent
+    return (
+        isinstance(parent, exp.Table)
+        and node.arg_key in ("this", "db", "catalog")
+        and parent.args.get("db") is not None
+    )
+
+
+def _normalize_identifiers(tree):
+    """
+    - שמות טבלאות מלאים: נשארים case-sensitive, תמיד `project.dataset.table`
+    - עמודות / aliases / שמות CTE: lowercase, בלי backticks כשלא צריך (BigQuery לא רגיש לרישיות שלהם;
+      שמות העמודות בתוצאה כן נשמרים — ראו _canonicalize)
+    """
+    for table in tree.find_all(exp.Table):
+        if table.args.get("db") is not None:
+            table.meta["quoted_table"] = True
+
+    for ident in tree.find_all(exp.Identifier):
+        if _is_qualified_table_part(ident):
+            ident.set("quoted", True)
+            continue
+        name = ident.this.lower()
+        ident.set("this", name)
+        ident.set("quoted", not _SIMPLE_IDENTIFIER_RE.match(name))
+
+
+def _output_identifiers(tree) -> list:
+    """ה-identifiers שקובעים את שמות העמודות בתוצאה: alias או עמודה ב-projection העליון."""
+    idents = []
+    for projection in tree.selects if isinstance(tree, exp.Query) else []:
+        if isinstance(projection, exp.Alias):
+            idents.append(projection.args["alias"])
+        elif isinstance(projection, exp.Column) and isinstance(projection.this, exp.Identifier):
+            idents.append(projection.this)
+    return idents
+
+
+def _canonical_predicate(pred):
+    """BETWEEN -> >= / <=, וליטרל תמיד בצד ימין של '='."""
+    if isinstance(pred, exp.Between):
+        return [
+            exp.GTE(this=pred.this.copy(), expression=pred.args["low"].copy()),
+            exp.LTE(this=pred.this.copy(), expression=pred.args["high"].copy()),
+        ]
+    if isinstance(pred, exp.EQ) and isinstance(pred.this, exp.Literal) and not isinstance(pred.expression, exp.Literal):
+        return [exp.EQ(this=pred.expression.copy(), expression=pred.this.copy())]
+    return [pred]
+
+
+def _normalize_where(tree):
+    """מפרק את ה-AND ברמה העליונה של כל WHERE, מנרמל כל predicate וממיין."""
+    for where in list(tree.find_all(exp.Where)):
+        top = where.this.unnest()
+        preds = list(top.flatten()) if isinstance(top, exp.And) else [top]
+
+        conjuncts = []
+        for pred in preds:
+            conjuncts.extend(_canonical_predicate(pred.unnest()))
+
+        conjuncts.sort(key=lambda p: p.sql(dialect="bigquery"))
+        where.set("this", exp.and_(*conjuncts, copy=False))
+
+
+@lru_cache(maxsize=2048)
+def _canonicalize(sql: str) -> tuple[str, str]:
+    """
+    מחזיר (SQL קנוני להרצה, SQL קנוני ל-hash).
+    ל-hash כל ה-identifiers ב-lowercase; בגרסה שרצה שמות העמודות בתוצאה נשארים כמו שנכתבו
+    (BigQuery מחזיר אותם כך, ו-insights / גרפים קוראים אותם).
+    אם אין sqlglot או שה-parse נכשל — מחזירים את ה-SQL כמו שהוא
+    (כדי לא לשבור הערות `--`), וה-key מחושב על גרסה עם רווחים מנורמלים.
+    """
+    text = sql.strip().rstrip(";").strip()
+    if sqlglot is None:
+        return text, text
+
+    try:
+        tree = sqlglot.parse_one(text, read="bigquery")
+        written = [(ident, ident.this, ident.args.get("quoted")) for ident in _output_identifiers(tree)]
+        _normalize_identifiers(tree)
+        _normalize_where(tree)
+        hashed = tree.sql(dialect="bigquery", comments=False, normalize_functions="upper")
+        for ident, name, quoted in written:
+            ident.set("this", name)
+            ident.set("quoted", bool(quoted) or not _SIMPLE_IDENTIFIER_RE.match(name))
+        return tree.sql(dialect="bigquery", comments=False, normalize_functions="upper"), hashed
+    except Exception as e:
+        logger.warning(f"[SQL] canonicalization failed, using SQL as-is: {e}")
+        return text, text
+
+
+def sql_hash(canonical_sql: str) -> str:
+    normalized = " ".join(canonical_sql.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# =========================
+# Hit-rate counters
+# =========================
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "key_reuse": 0,         # canonical key seen before
+    "collapsed_reuse": 0,   # ...but the raw SQL text was new => only matched thanks to canonicalization
+}
+_seen_raw_by_key: dict = {}
+
+
+def _record(raw: str, key: str):
+    raw_digest = hash(" ".join(raw.split()))
+    with _stats_lock:
+        _stats["calls"] += 1
+        seen = _seen_raw_by_key.get(key)
+        if seen is None:
+            if len(_seen_raw_by_key) < STATS_MAX_KEYS:
+                _seen_raw_by_key[key] = {raw_digest}
+            return
+
+        _stats["key_reuse"] += 1
+        if raw_digest not in seen:
+            _stats["collapsed_reuse"] += 1
+            seen.add(raw_digest)
+
+
+def canonical_stats() -> dict:
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            **_stats,
+            "unique_canonical": len(_seen_raw_by_key),
+            "unique_raw": sum(len(v) for v in _seen_raw_by_key.values()),
+            "collapsed_rate": (_stats["collapsed_reuse"] / calls) if calls else 0.0,
+            "ast_enabled": sqlglot is not None,
+        }
+
+
+# =========================
+# Public
+# =========================
+def canonicalize_sql(sql: str) -> tuple[str, str]:
+    """
+    מחזיר (canonical_sql, hash).
+    canonical_sql היא השאילתה שנשלחת ל-BigQuery (כך שגם ה-result cache של BQ משותף),
+    וה-hash (על הגרסה בלי רישיות) משמש כ-cache key.
+    """
+    canonical, folded = _canonicalize(sql)
+    key = sql_hash(folded)
+    _record(sql, key)
+    return canonical, key
+
+
+def canonical_key(sql: str) -> str:
+    """hash קנוני בלי לעדכן מונים (לשימוש פנימי, למשל normalize_intent_key)."""
+    return sql_hash(_canonicalize(sql)[1])
@@ -0,0 +1,349 @@
+import os
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # sqlglot is optional — without it SQL is left untouched
+    sqlglot = None
+    exp = None
+
+from ...bq import BQClient
+from .query_guard import RAW_TABLE, AGG_TABLES, estimate_bytes
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Table metadata
+# =========================
+# Raw table is partitioned by DAY on event_time
+PARTITION_COLUMN = "event_time"
+
+TABLE_COLUMNS = {
+    RAW_TABLE: [
+        "event_time", "hr", "is_engaged_view", "is_retargeting", "media_source",
+        "partner", "app_id", "site_id", "engagement_type", "total_events",
+    ],
+    AGG_TABLES["app_id"]: ["event_date", "hr", "app_id", "total_events"],
+    AGG_TABLES["media_source"]: ["event_date", "hr", "media_source", "total_events"],
+    AGG_TABLES["site_id"]: ["event_date", "hr", "site_id", "total_events"],
+}
+
+# Partition row counts change slowly; re-read them at most this often
+PARTITION_METADATA_TTL_SECONDS = 600
+
+# Log dry-run bytes before/after every rewrite. "after" is the estimate the guard reads next (cached);
+# "before" costs one extra dry run per new SQL unless it is already cached. LOG_REWRITE_BYTES=0 turns it off
+LOG_REWRITE_BYTES = os.getenv("LOG_REWRITE_BYTES", "1") not in ("0", "false", "False")
+
+
+def _table_name(table) -> str:
+    return ".".join(p for p in (table.catalog, table.db, table.name) if p)
+
+
+def _from_source(select):
+    # the FROM arg key is "from_" in newer sqlglot, "from" in older releases
+    from_ = select.args.get("from_") or select.args.get("from")
+    return from_.this if from_ else None
+
+
+# =========================
+# Partition predicates
+# =========================
+def _is_date_of_partition_column(node) -> bool:
+    return (
+        isinstance(node, exp.Date)
+        and isinstance(node.this, exp.Column)
+        and node.this.name.lower() == PARTITION_COLUMN
+        and not node.args.get("zone")
+    )
+
+
+def _date_value(node):
+    """'2025-10-24' / DATE('2025-10-24') / DATE '2025-10-24' -> date, אחרת None."""
+    if isinstance(node, exp.Date) and isinstance(node.this, exp.Literal):
+        node = node.this
+    if isinstance(node, exp.Cast) and isinstance(node.this, exp.Literal) and node.to.is_type("date"):
+        node = node.this
+    if isinstance(node, exp.Literal) and node.is_string:
+        try:
+            return datetime.strptime(node.this, "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return None
+
+
+def _ts(d: date):
+    return exp.Anonymous(this="TIMESTAMP", expressions=[exp.Literal.string(d.isoformat())])
+
+
+def _range(column, start: date, end_exclusive: date):
+    return exp.and_(
+        exp.GTE(this=column.copy(), expression=_ts(start)),
+        exp.LT(this=column.copy(), expression=_ts(end_exclusive)),
+    )
+
+
+def _merge_days(days) -> list[tuple[date, date]]:
+    """ימים בודדים -> טווחים רציפים [start, end_exclusive)."""
+    ranges = []
+    for d in sorted(set(days)):
+        if ranges and ranges[-1][1] == d:
+            ranges[-1] = (ranges[-1][0], d + timedelta(days=1))
+        else:
+            ranges.append((d, d + timedelta(days=1)))
+    return ranges
+
+
+_FLIP = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE, exp.EQ: exp.EQ}
+
+
+def _sargable(pred):
+    """
+    מחזיר ביטוי שקול בלי פונקציה על עמודת ה-partition, או None אם אין מה לשכתב.
+    DATE(event_time) <op> 'YYYY-MM-DD'  ->  event_time <op'> TIMESTAMP('YYYY-MM-DD')
+    """
+    one_day = timedelta(days=1)
+
+    if isinstance(pred, exp.Between) and _is_date_of_partition_column(pred.this):
+        low, high = _date_value(pred.args["low"]), _date_value(pred.args["high"])
+        if low and high:
+            return _range(pred.this.this, low, high + one_day)
+        return None
+
+    if isinstance(pred, exp.In) and _is_date_of_partition_column(pred.this) and pred.expressions:
+        days = [_date_value(e) for e in pred.expressions]
+        if not all(days):
+            return None
+        ranges = [_range(pred.this.this, s, e) for s, e in _merge_days(days)]
+        return exp.or_(*ranges) if len(ranges) > 1 else ranges[0]
+
+    op = type(pred)
+    if op not in _FLIP:
+        return None
+
+    left, right = pred.this, pred.expression
+    if _is_date_of_partition_column(right) and not _is_date_of_partition_column(left):
+        left, right, op = right, left, _FLIP[op]
+    if not _is_date_of_partition_column(left):
+        return None
+
+    d = _date_value(right)
+    if d is None:
+        return None
+
+    column = left.this
+    if op is exp.EQ:
+        return _range(column, d, d + one_day)
+    if op is exp.GTE:
+        return exp.GTE(this=column.copy(), expression=_ts(d))
+    if op is exp.GT:
+        return exp.GTE(this=column.copy(), expression=_ts(d + one_day))
+    if op is exp.LTE:
+        return exp.LT(this=column.copy(), expression=_ts(d + one_day))
+    return exp.LT(this=column.copy(), expression=_ts(d))
+
+
+def _rewrite_partition_predicates(tree) -> bool:
+    changed = False
+    candidates = (exp.Between, exp.In, exp.EQ, exp.GT, exp.GTE, exp.LT, exp.LTE)
+    for pred in list(tree.find_all(*candidates)):
+        new = _sargable(pred)
+        if new is None:
+            continue
+        if not isinstance(pred.parent, (exp.And, exp.Where)):
+            new = exp.Paren(this=new)
+        pred.replace(new)
+        changed = True
+    return changed
+
+
+# =========================
+# Unbounded retrieval (ORDER BY event_time DESC LIMIT n)
+# =========================
+def _bound_retrieval(tree, lower_bound_fn) -> bool:
+    if lower_bound_fn is None:
+        return False
+
+    changed = False
+    for select in list(tree.find_all(exp.Select)):
+        table = _from_source(select)
+        if not isinstance(table, exp.Table) or _table_name(table) != RAW_TABLE:
+            continue
+        # any other filter could leave fewer than n rows in the newest partitions
+        if select.args.get("joins") or select.args.get("where"):
+            continue
+
+        order = select.args.get("order")
+        limit = select.args.get("limit")
+        if not order or not limit or not order.expressions:
+            continue
+        first = order.expressions[0]
+        if not (first.args.get("desc") and isinstance(first.this, exp.Column)
+                and first.this.name.lower() == PARTITION_COLUMN):
+            continue
+
+        limit_value = limit.expression if limit.expression is not None else limit.this
+        if not (isinstance(limit_value, exp.Literal) and limit_value.is_int):
+            continue
+
+        bound = lower_bound_fn(int(limit_value.this))
+        if bound is None:
+            continue
+
+        select.where(exp.GTE(this=exp.column(PARTITION_COLUMN), expression=_ts(bound)), copy=False)
+        changed = True
+
+    return changed
+
+
+# =========================
+# Column pruning (SELECT * from a base table inside a CTE / subquery)
+# =========================
+def _prune_star_projections(tree) -> bool:
+    changed = False
+    referenced = {c.name.lower() for c in tree.find_all(exp.Column)}
+
+    for select in list(tree.find_all(exp.Select)):
+        if select is tree:
+            continue  # never change the columns the caller gets back
+        if not (len(select.expressions) == 1 and isinstance(select.expressions[0], exp.Star)):
+            continue
+
+        table = _from_source(select)
+        if not isinstance(table, exp.Table) or select.args.get("joins"):
+            continue
+        columns = TABLE_COLUMNS.get(_table_name(table))
+        if not columns:
+            continue
+
+        # the CTE / subquery must never be read back with * (that would need every column)
+        alias = select.parent.alias_or_name if isinstance(select.parent, (exp.CTE, exp.Subquery)) else None
+        if not alias:
+            continue
+        if _star_reads(tree, alias.lower()):
+            continue
+
+        keep = [c for c in columns if c in referenced]
+        if not keep or len(keep) == len(columns):
+            continue
+
+        select.set("expressions", [exp.column(c) for c in keep])
+        changed = True
+
+    return changed
+
+
+def _star_reads(tree, alias: str) -> bool:
+    for select in tree.find_all(exp.Select):
+        for projection in select.expressions:
+            if isinstance(projection, exp.Star):
+                sources = [_from_source(select)] if _from_source(select) else []
+                sources += [j.this for j in select.args.get("joins") or []]
+                if any(s.alias_or_name.lower() == alias for s in sources):
+                    return True
+            if isinstance(projection, exp.Column) and isinstance(projection.this, exp.Star):
+                if projection.table.lower() == alias:
+                    return True
+    return False
+
+
+# =========================
+# Public
+# =========================
+def rewrite_for_pruning(sql: str, lower_bound_fn=None) -> str:
+    """
+    שכתוב SQL כך ש-BigQuery יוכל לעשות partition pruning:
+    - DATE(event_time) <op> 'YYYY-MM-DD' / BETWEEN / IN  ->  טווחי event_time מול TIMESTAMP(...)
+    - retrieval (ORDER BY event_time DESC LIMIT n) בלי גבול -> גבול תחתון לפי metadata של partitions
+    - SELECT * מטבלת בסיס בתוך CTE -> רק העמודות שבשימוש
+    אם לא היה מה לשנות (או אין sqlglot / parse נכשל) — מחזיר את ה-SQL המקורי.
+    """
+    if sqlglot is None:
+        return sql
+
+    try:
+        tree = sqlglot.parse_one(sql, read="bigquery")
+    except Exception as e:
+        logger.warning(f"[REWRITE] parse failed, SQL left as-is: {e}")
+        return sql
+
+    changed = _rewrite_partition_predicates(tree)
+    changed = _bound_retrieval(tree, lower_bound_fn) or changed
+    changed = _prune_star_projections(tree) or changed
+
+    if not changed:
+        return sql
+    return tree.sql(dialect="bigquery", comments=False)
+
+
+_partitions_cache: dict = {}
+_partitions_lock = threading.Lock()
+
+
+def _load_partitions(bq: BQClient, table: str):
+    project, dataset, name = table.split(".")
+    query = f"""
+        SELECT partition_id, total_rows
+        FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = '{name}'
+        ORDER BY partition_id DESC
+    """
+    return [(r["partition_id"], int(r["total_rows"] or 0)) for r in bq.execute_query(query, "partition_metadata")]
+
+
+def latest_partitions_lower_bound(min_rows: int, bq: BQClient | None = None, table: str = RAW_TABLE):
+    """
+    התאריך של ה-partition הישן ביותר מבין ה-partitions האחרונים שביחד מכילים לפחות min_rows שורות.
+    None אם אי אפשר לקבוע גבול בטוח (שורות ב-streaming buffer, מעט מדי שורות, שגיאה).
+    """
+    now = time.monotonic()
+    with _partitions_lock:
+        cached = _partitions_cache.get(table)
+    if cached and now - cached[0] < PARTITION_METADATA_TTL_SECONDS:
+        partitions = cached[1]
+    else:
+        try:
+            partitions = _load_partitions(bq or BQClient(), table)
+        except Exception as e:
+            logger.warning(f"[REWRITE] partition metadata unavailable: {e}")
+            return None
+        with _partitions_lock:
+            _partitions_cache[table] = (now, partitions)
+
+    total = 0
+    for partition_id, rows in partitions:
+        if partition_id in ("__NULL__", "__UNPARTITIONED__", "__STREAMING_UNPARTITIONED__"):
+            if rows:
+                return None  # rows without a partition date could be the newest ones
+            continue
+        total += rows
+        if total >= min_rows:
+            return datetime.strptime(partition_id[:8], "%Y%m%d").date()
+
+    return None
+
+
+def prune_stage(sql: str, bq: BQClient | None = None) -> str:
+    """שלב אחרי ה-SQL builder: שכתוב ל-pruning + לוג של bytes לפני/אחרי (dry run, דרך ה-cache של query_guard)."""
+    bq = bq or BQClient()
+    rewritten = rewrite_for_pruning(sql, lambda n: latest_partitions_lower_bound(n, bq))
+    if rewritten == sql:
+        return sql
+
+    if not LOG_REWRITE_BYTES:
+        logger.info("[REWRITE] partition pruning applied")
+        return rewritten
+
+    try:
+        after = estimate_bytes(rewritten, bq)
+        before = estimate_bytes(sql, bq)
+        logger.info(f"[REWRITE] partition pruning: {before} -> {after} bytes ({before - after} saved)")
+    except Exception as e:
+        logger.warning(f"[REWRITE] dry-run comparison failed: {e}")
+
+    return rewritten
@@ -0,0 +1,349 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # without sqlglot no query has a known shape — nothing is derived
+    sqlglot = None
+    exp = None
+
+# Tables that hold the same total_events at different granularity (the cost guard treats them as equivalent)
+ROLLUP_DATASET = "practicode-2025.clicks_data_prac"
+MEASURE_COLUMN = "total_events"
+
+# parsed_intent.intent values whose answers are SUM(total_events) roll-ups
+ROLLUP_INTENTS = {"analytics", "find top", "find bottom"}
+
+# Entries (intent keys) remembered as possible sources
+ROLLUP_INDEX_SIZE = 4096
+
+
+# =========================
+# Query shape
+# =========================
+def _day(value: str, time_part: str | None = None) -> date | None:
+    """'YYYY-MM-DD' או 'YYYY-MM-DD HH:MM:SS' כשהשעה היא time_part (גבול של יום שלם)."""
+    try:
+        d = date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    rest = value[10:].strip()
+    if rest and rest != time_part:
+        return None
+    return d
+
+
+def _literal(node):
+    if isinstance(node, (exp.Cast, exp.Timestamp, exp.Date)) and isinstance(node.this, exp.Literal):
+        node = node.this
+    if isinstance(node, exp.Boolean):
+        return "true" if node.this else "false"
+    if isinstance(node, exp.Literal):
+        return node.this
+    if isinstance(node, exp.Neg) and isinstance(node.this, exp.Literal):
+        return "-" + node.this.this
+    return None
+
+
+def _time_column(node) -> str | None:
+    """'date' ל-event_date / DATE(event_time), 'ts' ל-event_time, אחרת None."""
+    if isinstance(node, exp.Column) and node.name.lower() == "event_date":
+        return "date"
+    if isinstance(node, exp.Column) and node.name.lower() == "event_time":
+        return "ts"
+    if isinstance(node, exp.Date) and isinstance(node.this, exp.Column) and node.this.name.lower() == "event_time" \
+            and not node.args.get("zone"):
+        return "date"
+    return None
+
+
+def _day_bounds(node):
+    """תנאי זמן -> (lo, hi) בימים שלמים (כולל). None אם התנאי לא מכסה ימים שלמים."""
+    kind = _time_column(node.this)
+    if isinstance(node, exp.Between):
+        lo, hi = _literal(node.args["low"]), _literal(node.args["high"])
+        if lo is None or hi is None:
+            return None
+        bounds = (_day(lo), _day(hi)) if kind == "date" else (_day(lo, "00:00:00"), _day(hi, "23:59:59"))
+        return None if None in bounds else bounds
+
+    value = _literal(node.expression)
+    if value is None:
+        return None
+    if kind == "date":
+        d = _day(value)
+        if d is None:
+            return None
+        return {
+            exp.EQ: (d, d), exp.GTE: (d, None), exp.LTE: (None, d),
+            exp.GT: (d + timedelta(days=1), None), exp.LT: (None, d - timedelta(days=1)),
+        }.get(type(node))
+    if isinstance(node, exp.GTE):
+        d = _day(value, "00:00:00")
+        return (d, None) if d else None
+    if isinstance(node, exp.LTE):
+        d = _day(value, "23:59:59")
+        return (None, d) if d else None
+    if isinstance(node, exp.LT):
+        d = _day(value, "00:00:00")
+        return (None, d - timedelta(days=1)) if d else None
+    return None
+
+
+def _conjuncts(node):
+    if isinstance(node, exp.And):
+        yield from _conjuncts(node.this)
+        yield from _conjuncts(node.expression)
+    elif isinstance(node, exp.Paren):
+        yield from _conjuncts(node.this)
+    else:
+        yield node
+
+
+def _base_shape(select) -> dict | None:
+    """SELECT <dims>, SUM(total_events) AS m FROM <clicks table> [WHERE ...] [GROUP BY <dims>]"""
+    if not isinstance(select, exp.Select) or select.args.get("joins") or select.args.get("having") \
+            or select.args.get("distinct"):
+        return None
+    from_ = select.args.get("from_") or select.args.get("from")
+    table = from_.this if from_ else None
+    if not isinstance(table, exp.Table) or f"{table.catalog}.{table.db}" != ROLLUP_DATASET:
+        return None
+
+    dims, measure = [], None
+    for e in select.expressions:
+        if isinstance(e, exp.Column):
+            dims.append(e.name)
+        elif isinstance(e, exp.Alias) and isinstance(e.this, exp.Sum) \
+                and isinstance(e.this.this, exp.Column) and e.this.this.name == MEASURE_COLUMN and measure is None:
+            measure = e.alias
+        else:
+            return None
+    if measure is None:
+        return None
+
+    group = select.args.get("group")
+    grouped = [g.name for g in group.expressions if isinstance(g, exp.Column)] if group else []
+    if sorted(grouped) != sorted(dims) or (group and len(grouped) != len(group.expressions)):
+        return None
+
+    filters, lo, hi, has_time = {}, None, None, False
+    where = select.args.get("where")
+    for cond in _conjuncts(where.this) if where else ():
+        if isinstance(cond, (exp.EQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)) and _time_column(cond.this):
+            bounds = _day_bounds(cond)
+            if bounds is None:
+                return None
+            has_time = True
+            if bounds[0]:
+                lo = bounds[0] if lo is None else max(lo, bounds[0])
+            if bounds[1]:
+                hi = bounds[1] if hi is None else min(hi, bounds[1])
+        elif isinstance(cond, exp.EQ) and isinstance(cond.this, exp.Column) and _literal(cond.expression) is not None:
+            if cond.this.name in filters:
+                return None
+            filters[cond.this.name] = _literal(cond.expression)
+        else:
+            return None
+
+    return {
+        "dims": dims,
+        "measure": measure,
+        "filters": filters,
+        "days": (lo, hi) if has_time else None,
+    }
+
+
+@lru_cache(maxsize=2048)
+def rollup_shape(sql: str) -> dict | None:
+    """
+    הצורה של שאילתת roll-up (SUM(total_events) לפי dimensions עם סינון שוויון וטווח ימים), או None.
+    כולל find top/bottom (CTE agg + WHERE m = (SELECT MAX/MIN(m) FROM agg)).
+    """
+    if sqlglot is None or not sql:
+        return None
+    try:
+        tree = sqlglot.parse_one(sql, read="bigquery")
+    except Exception:
+        return None
+    if not isinstance(tree, exp.Select):
+        return None
+
+    pick = None
+    with_ = tree.args.get("with_") or tree.args.get("with")
+    if with_:
+        if len(with_.expressions) != 1:
+            return None
+        cte = with_.expressions[0]
+        shape = _base_shape(cte.this)
+        from_ = tree.args.get("from_") or tree.args.get("from")
+        if shape is None or not from_ or from_.this.name != cte.alias or tree.args.get("group") \
+                or not (len(tree.expressions) == 1 and isinstance(tree.expressions[0], exp.Star)):
+            return None
+        where = tree.args.get("where")
+        if where is not None:
+            cond = where.this
+            sub = cond.expression.this if isinstance(cond, exp.EQ) and isinstance(cond.expression, exp.Subquery) else None
+            agg = sub.expressions[0] if isinstance(sub, exp.Select) and len(sub.expressions) == 1 else None
+            if not (isinstance(cond.this, exp.Column) and cond.this.name == shape["measure"]
+                    and isinstance(agg, (exp.Max, exp.Min)) and agg.this.name == shape["measure"]):
+                return None
+            pick = "max" if isinstance(agg, exp.Max) else "min"
+    else:
+        shape = _base_shape(tree)
+        if shape is None:
+            return None
+
+    order = []
+    for o in (tree.args.get("order").expressions if tree.args.get("order") else []):
+        if not isinstance(o.this, exp.Column) or o.this.name not in shape["dims"] + [shape["measure"]]:
+            return None
+        order.append((o.this.name, bool(o.args.get("desc"))))
+
+    limit = tree.args.get("limit")
+    limit_value = None
+    if limit is not None:
+        value = limit.expression if limit.expression is not None else limit.this
+        if not (isinstance(value, exp.Literal) and not value.is_string):
+            return None
+        limit_value = int(value.this)
+
+    return {**shape, "pick": pick, "order": order, "limit": limit_value}
+
+
+# =========================
+# Derivation
+# =========================
+def _norm(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def complete_breakdown(shape: dict | None, row_count: int) -> bool:
+    """תוצאה שמכילה את כל הקבוצות (לא top-k / max בלבד) ולכן אפשר לגזור ממנה."""
+    return (
+        shape is not None and shape["pick"] is None
+        and (shape["limit"] is None or row_count < shape["limit"])
+    )
+
+
+def can_derive(source: dict, request: dict) -> bool:
+    if source["days"] != request["days"]:
+        return False
+    if any(request["filters"].get(k) != v for k, v in source["filters"].items()):
+        return False
+    needed = set(request["dims"]) | (set(request["filters"]) - set(source["filters"]))
+    return needed <= set(source["dims"])
+
+
+def derive_rows(source: dict, rows: list[dict], request: dict) -> list[dict]:
+    """מסנן ומאגרג מחדש את rows (של source) לצורה של request — כמו ש-BigQuery היה מחזיר."""
+    extra = {k: v for k, v in request["filters"].items() if k not in source["filters"]}
+    dims, measure = request["dims"], request["measure"]
+
+    groups: dict = {}
+    for row in rows:
+        if any(_norm(row.get(k)) != v for k, v in extra.items()):
+            continue
+        key = tuple(row.get(d) for d in dims)
+        value = row.get(source["measure"])
+        current = groups.get(key)
+        if current is None:
+            groups[key] = value
+        elif value is not None:
+            groups[key] = current + value
+
+    if not dims and not groups:
+        groups[()] = None  # SUM over no rows is one NULL row
+
+    out = [{**dict(zip(dims, key)), measure: total} for key, total in groups.items()]
+
+    if request["pick"]:
+        values = [r[measure] for r in out if r[measure] is not None]
+        target = (max if request["pick"] == "max" else min)(values) if values else None
+        out = [r for r in out if r[measure] is not None and r[measure] == target]
+
+    # ORDER BY, last key first (stable sort); NULLs first ascending / last descending, as in BigQuery
+    for name, desc in reversed(request["order"]):
+        present = [r for r in out if r[name] is not None]
+        nulls = [r for r in out if r[name] is None]
+        present.sort(key=lambda r: r[name], reverse=desc)
+        out = present + nulls if desc else nulls + present
+
+    if request["limit"] is not None:
+        out = out[:request["limit"]]
+    return out
+
+
+def intent_matches(parsed_intent: dict | None, shape: dict) -> bool:
+    """ה-SQL שנבנה תואם ל-parsed_intent (אחרת לא סומכים על הצורה שלו)."""
+    if not parsed_intent:
+        return True
+    if parsed_intent.get("intent") not in ROLLUP_INTENTS or parsed_intent.get("metric") not in (None, MEASURE_COLUMN):
+        return False
+    if set(parsed_intent.get("dimensions") or []) != set(shape["dims"]):
+        return False
+    filters = {k: _norm(v) for k, v in (parsed_intent.get("filters") or {}).items()}
+    if filters != shape["filters"]:
+        return False
+    dr = parsed_intent.get("date_range") or {}
+    if dr.get("start_date") or dr.get("end_date"):
+        return shape["days"] == (_day(dr.get("start_date") or ""), _day(dr.get("end_date") or ""))
+    return shape["days"] is None
+
+
+class RollupIndex:
+    """
+    אינדקס בזיכרון של entries ב-cache שהם breakdown מלא (intent_key -> shape), לפי טווח ימים.
+    ה-rows עצמם נשארים בשכבת הזיכרון של ה-cache (ושם גם התוקף / invalidation).
+    """
+
+    def __init__(self, max_entries: int = ROLLUP_INDEX_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"registered": 0, "lookups": 0, "derived": 0, "candidates_checked": 0}
+
+    def register(self, intent_key: str, sql: str, row_count: int):
+        shape = rollup_shape(sql)
+        if not complete_breakdown(shape, row_count):
+            return
+        with self._lock:
+            self._entries[intent_key] = (shape, row_count)
+            self._entries.move_to_end(intent_key)
+            self._stats["registered"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, intent_key: str):
+        with self._lock:
+            self._entries.pop(intent_key, None)
+
+    def candidates(self, request: dict, exclude: str | None = None) -> list:
+        """entries שאפשר לגזור מהם את request, הקטן ביותר קודם."""
+        with self._lock:
+            self._stats["lookups"] += 1
+            found = [
+                (count, key, shape) for key, (shape, count) in self._entries.items()
+                if key != exclude and can_derive(shape, request)
+            ]
+            self._stats["candidates_checked"] += len(self._entries)
+        return [(key, shape) for _, key, shape in sorted(found, key=lambda c: c[0])]
+
+    def record_derived(self):
+        with self._lock:
+            self._stats["derived"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# How many finished jobs to keep in memory for /admin/bq/jobs
+JOB_LOG_RING_SIZE = int(os.getenv("BQ_JOB_LOG_RING_SIZE", "500"))
+
+# Append-only JSON-lines log of every job ("" disables the file)
+JOB_LOG_PATH = os.getenv("BQ_JOB_LOG_PATH", str(Path(__file__).parent / "logs" / "bq_jobs.jsonl"))
+
+# SQL kept per record (the full text lives in BigQuery job history)
+JOB_LOG_SQL_CHARS = 500
+
+# Session of the request currently running (labels every job it issues)
+current_session: ContextVar[str | None] = ContextVar("bq_session", default=None)
+
+_LABEL_BAD_CHARS_RE = re.compile(r"[^a-z0-9_-]")
+
+
+def _label_value(value) -> str:
+    """BigQuery labels: lowercase, [a-z0-9_-], עד 63 תווים."""
+    return _LABEL_BAD_CHARS_RE.sub("_", str(value).lower())[:63]
+
+
+def set_session(session_id: str | None):
+    """קובע את ה-session של ה-request הנוכחי (מחזיר token ל-reset)."""
+    return current_session.set(session_id)
+
+
+def job_labels(query_type: str) -> dict:
+    labels = {"query_type": _label_value(query_type)}
+    session = current_session.get()
+    if session:
+        labels["session"] = _label_value(session)
+    return labels
+
+
+# =========================
+# Ring + log file
+# =========================
+_lock = threading.Lock()
+_ring: deque = deque(maxlen=JOB_LOG_RING_SIZE)
+_file_lock = threading.Lock()
+
+
+def _ms_between(start, end):
+    if start is None or end is None:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+def _job_record(job, query_type: str, sql: str | None, error: Exception | None) -> dict:
+    created = getattr(job, "created", None)
+    started = getattr(job, "started", None)
+    ended = getattr(job, "ended", None)
+    labels = getattr(job, "labels", None) or {}
+
+    return {
+        "logged_at": datetime.now(timezone.utc).isoformat(),
+        "job_id": getattr(job, "job_id", None),
+        "query_type": query_type,
+        "session": labels.get("session") or current_session.get(),
+        "status": "error" if error else "done",
+        "error": str(error) if error else None,
+        "total_bytes_processed": int(getattr(job, "total_bytes_processed", None) or 0),
+        "total_bytes_billed": int(getattr(job, "total_bytes_billed", None) or 0),
+        "slot_millis": int(getattr(job, "slot_millis", None) or 0),
+        "cache_hit": bool(getattr(job, "cache_hit", False)),
+        "queue_ms": _ms_between(created, started),
+        "run_ms": _ms_between(started, ended),
+        "sql": (sql or getattr(job, "query", None) or "")[:JOB_LOG_SQL_CHARS],
+    }
+
+
+def _append_to_file(record: dict):
+    if not JOB_LOG_PATH:
+        return
+    try:
+        with _file_lock:
+            Path(JOB_LOG_PATH).parent.mkdir(parents=True, exist_ok=True)
+            with open(JOB_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning("BQ job log write failed: %s", e)
+
+
+def record_job(job, query_type: str, sql: str | None = None, error: Exception | None = None) -> dict | None:
+    """
+    רושם סטטיסטיקות של job שהסתיים (או נכשל) ב-ring ובקובץ הלוג.
+    לעולם לא זורק — רישום לא אמור להפיל שאילתה.
+    """
+    try:
+        record = _job_record(job, query_type, sql, error)
+    except Exception as e:
+        logger.warning("BQ job stats unavailable for %s: %s", query_type, e)
+        return None
+
+    with _lock:
+        _ring.append(record)
+    _append_to_file(record)
+    return record
+
+
+def recent_jobs(limit: int = 50) -> list[dict]:
+    with _lock:
+        return list(_ring)[-limit:][::-1]
+
+
+def job_summary(top: int = 10) -> dict:
+    """סיכום לפי query_type + ה-jobs היקרים ביותר (bytes) מתוך ה-ring."""
+    with _lock:
+        records = list(_ring)
+
+    by_type: dict = {}
+    for r in records:
+        s = by_type.setdefault(r["query_type"], {
+            "jobs": 0, "errors": 0, "cache_hits": 0,
+            "bytes_processed": 0, "bytes_billed": 0, "slot_millis": 0, "run_ms": 0,
+        })
+        s["jobs"] += 1
+        s["errors"] += r["status"] == "error"
+        s["cache_hits"] += r["cache_hit"]
+        s["bytes_processed"] += r["total_bytes_processed"]
+        s["bytes_billed"] += r["total_bytes_billed"]
+        s["slot_millis"] += r["slot_millis"]
+        s["run_ms"] += r["run_ms"] or 0
+
+    for s in by_type.values():
+        s["avg_run_ms"] = s.pop("run_ms") / s["jobs"]
+
+    expensive = sorted(records, key=lambda r: r["total_bytes_processed"], reverse=True)[:top]
+
+    return {
+        "jobs": len(records),
+        "ring_size": JOB_LOG_RING_SIZE,
+        "log_path": JOB_LOG_PATH or None,
+        "bytes_processed": sum(r["total_bytes_processed"] for r in records),
+        "bytes_billed": sum(r["total_bytes_billed"] for r in records),
+        "slot_millis": sum(r["slot_millis"] for r in records),
+        "cache_hit_rate": (sum(r["cache_hit"] for r in records) / len(records)) if records else 0.0,
+        "by_query_type": by_type,
+        "most_expensive": expensive,
+    }
+
+
+def reset_job_log():
+    """מנקה את ה-ring (לבדיקות). הקובץ הוא append-only ולא נמחק."""
+    with _lock:
+        _ring.clear()
@@ -1,9 +1,18 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from .flow_manager_agent.agent import root_agent
-from .bq import BQClient
+from .bq import BQClient, pool_stats, cancellation_stats
+from .job_stats import job_summary, recent_jobs
+from .flow_manager_agent.utils.sql_canonical import canonical_stats
+from .flow_manager_agent.utils.cache import cache_stats, cache_introspection, start_source_polling
+from .flow_manager_agent.utils.cache_warmup import CacheWarmer
+from .flow_manager_agent.sub_agents.query_executor_agent.agent import single_flight_stats, run_bigquery_async
+from .flow_manager_agent.sub_agents.intent_analyzer_agent import fast_path_stats
+from .flow_manager_agent.sub_agents.protected_query_builder_agent import compiler_stats
+from .flow_manager_agent.sub_agents.response_insights_agent import template_stats
+from .flow_manager_agent.utils.llm_usage import llm_usage_stats
 
 from google.adk.apps import App
 from google.adk.runners import Runner
@@ -11,13 +20,28 @@ from google.adk.sessions.in_memory_session_service import InMemorySessionService
 from google.adk.utils.context_utils import Aclosing
 from google.genai import types
 
+import asyncio
 import logging
+import os
+from contextlib import asynccontextmanager
 from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Replays popular questions at startup and on a timer (see cache_warmup.py)
+cache_warmer = CacheWarmer(run_bigquery_async)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    start_source_polling()
+    cache_warmer.start()
+    yield
+    await cache_warmer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ---- CORS ----
 app.add_middleware(
@@ -37,6 +61,10 @@ runner = Runner(app=adk_app, session_service=session_service)
 USER_ID = "default_user"
 SESSION_ID = "default_session"
 
+# Request deadline for /chat, and how often to check whether the client is still connected
+CHAT_TIMEOUT_SECONDS = float(os.getenv("CHAT_TIMEOUT_SECONDS", "120"))
+DISCONNECT_POLL_SECONDS = 0.5
+
 # ---- Initialize BigQuery ----
 try:
     bq_client = BQClient()
@@ -49,10 +77,79 @@ except Exception as e:
 
 # ---- Health check ----
 @app.get("/health")
-def health():
+def health(cache: bool = False):
+    # /health?cache=true also reports whether the warm-up has warmed the query cache
+    if cache:
+        return {"ok": True, "cache": cache_warmer.status()}
     return {"ok": True}
 
 
+# ---- Per-key cache statistics: traffic, sizes, ages, near-expiry (table=true also reads the BigQuery tier) ----
+@app.get("/admin/cache/keys")
+def cache_keys(top: int = 20, table: bool = False):
+    return cache_introspection(top, include_table=table)
+
+
+# ---- Cache warm-up status ----
+@app.get("/admin/cache/warmup")
+def cache_warmup():
+    return cache_warmer.status()
+
+
+# ---- BigQuery connection pool stats ----
+@app.get("/admin/bq/pool")
+def bq_pool():
+    return pool_stats()
+
+
+# ---- Cancelled BigQuery jobs ----
+@app.get("/admin/bq/cancellations")
+def bq_cancellations():
+    return cancellation_stats()
+
+
+# ---- BigQuery job statistics ----
+@app.get("/admin/bq/jobs")
+def bq_jobs(recent: int = 20):
+    return {**job_summary(), "recent": recent_jobs(recent)}
+
+
+# ---- Query cache hit / miss per tier ----
+@app.get("/admin/cache")
+def cache_tiers():
+    return cache_stats()
+
+
+# ---- Coalesced identical in-flight queries ----
+@app.get("/admin/query/single-flight")
+def query_single_flight():
+    return single_flight_stats()
+
+
+# ---- SQL canonicalization hit-rate ----
+@app.get("/admin/sql/canonical")
+def sql_canonical():
+    return canonical_stats()
+
+
+# ---- Questions answered by the deterministic intent parser (without the NLU LLM call) ----
+@app.get("/admin/intent/fast-path")
+def intent_fast_path():
+    return fast_path_stats()
+
+
+# ---- SQL built by the deterministic compiler (without the SQL-builder LLM call) ----
+@app.get("/admin/sql/compiler")
+def sql_compiler():
+    return compiler_stats()
+
+
+# ---- Share of requests answered without any LLM call (per stage: NLU, clarifier, SQL, insights) ----
+@app.get("/admin/llm/usage")
+def llm_usage(recent: int = 10):
+    return {**llm_usage_stats(recent), "insights_templates": template_stats()}
+
+
 # ---- Request schema ----
 class ChatRequest(BaseModel):
     message: str
@@ -146,9 +243,49 @@ async def run_agent(message: str):
     return {"error": "No response from agent"}
 
 
+class ChatCancelled(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(reason)
+
+
+async def _run_until_disconnect(request: Request, coro, timeout: float = CHAT_TIMEOUT_SECONDS):
+    """
+    מריץ את ה-agent כ-task ומבטל אותו אם הלקוח התנתק או שעבר ה-deadline.
+    הביטול עובר דרך Runner.run_async עד BQClient (job.cancel) ועוצר את שאר השלבים.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    task = asyncio.create_task(coro)
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if task in done:
+                return task.result()
+
+            if await request.is_disconnected():
+                reason = "client_disconnected"
+            elif loop.time() >= deadline:
+                reason = "timeout"
+            else:
+                continue
+
+            logger.warning(f"[chat] cancelling agent run: {reason}")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            raise ChatCancelled(reason)
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 # ---- API endpoint ----
 @app.post("/chat")
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
     try:
         # שמירת הודעת המשתמש
         if bq_client:
@@ -162,8 +299,8 @@ async def chat(req: ChatRequest):
             except Exception as e:
                 logger.error(f"Failed to save user message: {e}")
 
-        # הרצת האגנט
-        response = await run_agent(req.message)
+        # הרצת האגנט (מבוטלת אם הלקוח מתנתק / deadline)
+        response = await _run_until_disconnect(request, run_agent(req.message))
 
         # שמירת תשובת האגנט
         if bq_client:
@@ -179,6 +316,10 @@ async def chat(req: ChatRequest):
 
         return response
 
+    except ChatCancelled as e:
+        # 504 on deadline; on disconnect nobody is listening, but return something well-formed
+        raise HTTPException(status_code=504 if e.reason == "timeout" else 499, detail=e.reason)
+
     except Exception as e:
         logger.exception("Chat endpoint failed")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,92 @@
+"""
+Benchmark - cache backends: get (load) / put (save_result) / increment_use latency and throughput
+
+memory, disk (a temporary SQLite file) and kv (the local stand-in server, or --kv-url redis://...);
+optionally bigquery with --bigquery (uses the configured BQ_BACKEND):
+    python -m tests.benchmarks.bench_cache_backends
+    python -m tests.benchmarks.bench_cache_backends --threads 8 --payload-bytes 50000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from backend.flow_manager_agent.utils.cache_backends import (
+    BigQueryBackend, DiskBackend, KVBackend, LocalKVServer, MemoryBackend,
+)
+
+MAX_COUNT = 3
+
+
+def _ops(backend, keys: list[str], payload: str) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "put": lambda k: backend.save_result(k, "SELECT 1", payload, now, MAX_COUNT),
+        "get": lambda k: backend.load(k),
+        "increment": lambda k: backend.increment_use(k, "SELECT 1", MAX_COUNT),
+    }
+
+
+def _measure(fn, keys: list[str], threads: int) -> tuple[list[float], float]:
+    def timed(key):
+        start = time.perf_counter()
+        fn(key)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            latencies = list(pool.map(timed, keys))
+    else:
+        latencies = [timed(k) for k in keys]
+    return latencies, time.perf_counter() - start
+
+
+def _pct(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else values[0]
+
+
+def run(n: int, threads: int, payload_bytes: int, kv_url: str | None, with_bigquery: bool):
+    payload = "x" * payload_bytes
+    keys = [f'{{"intent": "analytics", "n": {i}}}' for i in range(n)]
+
+    tmp = tempfile.TemporaryDirectory()
+    server = None if kv_url else LocalKVServer().start()
+    backends = {
+        "memory": MemoryBackend(),
+        "disk": DiskBackend(str(Path(tmp.name) / "cache.sqlite3")),
+        "kv": KVBackend(kv_url or server.url, prefix="bench:"),
+    }
+    if with_bigquery:
+        backends["bigquery"] = BigQueryBackend("practicode-2025", "cache", "cached_queries")
+
+    print(f"keys={n} threads={threads} payload={payload_bytes}B")
+    print(f"{'backend':<9} {'op':<10} {'p50':>9} {'p95':>9} {'ops/s':>10}")
+    try:
+        for name, backend in backends.items():
+            for op, fn in _ops(backend, keys, payload).items():
+                latencies, wall = _measure(fn, keys, threads)
+                print(f"{name:<9} {op:<10} {_pct(latencies, 50) * 1e6:>7.0f}us {_pct(latencies, 95) * 1e6:>7.0f}us "
+                      f"{n / wall:>10.0f}")
+            if name != "bigquery":
+                backend.clear()
+    finally:
+        backends["disk"].close()
+        if server:
+            server.shutdown()
+            server.server_close()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--payload-bytes", type=int, default=2000)
+    parser.add_argument("--kv-url", default=None, help="redis://host:port/db (default: an in-process local kv server)")
+    parser.add_argument("--bigquery", action="store_true", help="also measure cache.cached_queries (slow, billed)")
+    args = parser.parse_args()
+    run(args.keys, args.threads, args.payload_bytes, args.kv_url, args.bigquery)
@@ -0,0 +1,77 @@
+"""
+Benchmark - cache payload encoding: JSON (json.dumps / json.loads) vs compressed Arrow IPC
+
+Offline, on synthetic breakdown / retrieval results:
+    python -m tests.benchmarks.bench_cache_codec
+"""
+import argparse
+import json
+import time
+
+from backend.flow_manager_agent.utils import cache_codec
+from backend.flow_manager_agent.utils.cache_codec import decode_rows, encode_rows
+
+SIZES = [100, 10_000, 200_000]
+
+
+def _breakdown(n: int) -> list[dict]:
+    return [
+        {
+            "event_date": f"2025-10-{i % 3 + 24}",
+            "media_source": f"media_source_{i % 200}",
+            "app_id": f"app_{i % 37}",
+            "total_events": (i * 7919) % 977,
+            "share": ((i * 7919) % 977) / 977,
+        }
+        for i in range(n)
+    ]
+
+
+def _retrieval(n: int) -> list[dict]:
+    return [
+        {
+            "event_time": f"2025-10-26T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}+00:00",
+            "media_source": f"media_source_{i % 200}",
+            "app_id": f"app_{i % 37}",
+            "hr": i % 24,
+            "total_events": (i * 31) % 50,
+        }
+        for i in range(n)
+    ]
+
+
+def _timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def run(repeat: int):
+    print(f"codec={cache_codec._codec()}")
+    print(f"{'shape':<10} {'rows':>8} {'json bytes':>11} {'arrow bytes':>12} {'ratio':>6} "
+          f"{'json enc':>9} {'arrow enc':>10} {'json dec':>9} {'arrow dec':>10}")
+
+    for name, make in (("breakdown", _breakdown), ("retrieval", _retrieval)):
+        for n in SIZES:
+            rows = make(n)
+
+            json_payload, json_enc = _timed(lambda: json.dumps(rows, ensure_ascii=False), repeat)
+            _, json_dec = _timed(lambda: json.loads(json_payload), repeat)
+            (arrow_payload, _), arrow_enc = _timed(lambda: encode_rows(rows), repeat)
+            decoded, arrow_dec = _timed(lambda: decode_rows(arrow_payload), repeat)
+            assert decoded == rows
+
+            print(f"{name:<10} {n:>8} {len(json_payload):>11} {len(arrow_payload):>12} "
+                  f"{len(json_payload) / len(arrow_payload):>5.1f}x "
+                  f"{json_enc * 1000:>7.1f}ms {arrow_enc * 1000:>8.1f}ms "
+                  f"{json_dec * 1000:>7.1f}ms {arrow_dec * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.repeat)
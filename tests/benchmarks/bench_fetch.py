@@ -0,0 +1,81 @@
+"""
+Benchmark - result fetch paths (REST/pandas vs Arrow / Storage Read API)
+
+Offline (default): compares only the conversion step on a synthetic Arrow table
+    python -m tests.benchmarks.bench_fetch
+
+Live: runs a generated query in BigQuery and compares end-to-end fetch
+    python -m tests.benchmarks.bench_fetch --live
+"""
+import argparse
+import time
+
+import pyarrow as pa
+
+from backend.bq import BQClient, arrow_to_records, json_safe_records
+
+SIZES = [1_000, 100_000, 1_000_000]
+
+LIVE_SQL = """
+SELECT
+  n AS row_id,
+  CONCAT('media_source_', CAST(MOD(n, 200) AS STRING)) AS media_source,
+  DATE_ADD(DATE '2025-10-24', INTERVAL MOD(n, 3) DAY) AS event_date,
+  TIMESTAMP_ADD(TIMESTAMP '2025-10-24 00:00:00', INTERVAL n SECOND) AS event_time,
+  MOD(n, 977) AS total_events
+FROM UNNEST(GENERATE_ARRAY(1, {n})) AS n
+"""
+
+
+def _synthetic_table(n: int):
+    import datetime as dt
+    base = dt.datetime(2025, 10, 24, tzinfo=dt.timezone.utc)
+    return pa.table({
+        "row_id": pa.array(range(n), pa.int64()),
+        "media_source": pa.array([f"media_source_{i % 200}" for i in range(n)]),
+        "event_date": pa.array([(base + dt.timedelta(days=i % 3)).date() for i in range(n)], pa.date32()),
+        "event_time": pa.array([base + dt.timedelta(seconds=i) for i in range(n)], pa.timestamp("us", tz="UTC")),
+        "total_events": pa.array([i % 977 for i in range(n)], pa.int64()),
+    })
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def run_offline():
+    print(f"{'rows':>10} | {'pandas+json_safe (s)':>22} | {'arrow_to_records (s)':>22} | speedup")
+    print("-" * 75)
+    for n in SIZES:
+        table = _synthetic_table(n)
+        _, t_rest = _timed(lambda: json_safe_records(table.to_pandas().to_dict(orient="records")))
+        _, t_arrow = _timed(lambda: arrow_to_records(table))
+        print(f"{n:>10} | {t_rest:>22.3f} | {t_arrow:>22.3f} | {t_rest / t_arrow:6.1f}x")
+
+
+def run_live():
+    bq = BQClient()
+    print(f"{'rows':>10} | {'rest (s)':>10} | {'storage api (s)':>16}")
+    print("-" * 45)
+    for n in SIZES:
+        sql = LIVE_SQL.format(n=n)
+        # the same SQL text hits BigQuery's result cache on the second run,
+        # so both fetch paths read an identical, already-materialized result
+        bq.execute_query(sql, "bench_warmup")
+
+        _, t_rest = _timed(lambda: bq.fetch_records(bq.execute_query(sql, "bench_rest"), mode="rest"))
+        _, t_arrow = _timed(lambda: bq.fetch_records(bq.execute_query(sql, "bench_arrow"), mode="arrow"))
+        print(f"{n:>10} | {t_rest:>10.2f} | {t_arrow:>16.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="run against live BigQuery")
+    args = parser.parse_args()
+
+    if args.live:
+        run_live()
+    else:
+        run_offline()
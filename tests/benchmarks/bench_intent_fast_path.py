@@ -0,0 +1,58 @@
+"""
+Benchmark - deterministic intent fast path: coverage (share of questions answered without the NLU LLM call)
+and parse latency over a corpus of questions
+
+    python -m tests.benchmarks.bench_intent_fast_path
+    python -m tests.benchmarks.bench_intent_fast_path --corpus questions.txt --show
+"""
+import argparse
+import statistics
+import time
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+from backend.flow_manager_agent.sub_agents.intent_analyzer_agent.fast_path import _parse
+
+CORPUS = Path(__file__).with_name("intent_corpus.txt")
+
+
+def load_corpus(path: Path) -> list[str]:
+    lines = path.read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def run(corpus: Path, today: date, repeat: int, show: bool):
+    questions = load_corpus(corpus)
+    statuses = Counter()
+    latencies = []
+
+    for q in questions:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = _parse(q, today)
+            best = min(best, time.perf_counter() - start)
+        latencies.append(best)
+        statuses[result["status"] if result else "deferred to LLM"] += 1
+        if show:
+            print(f"{(result or {}).get('status', '-'):<22} {q}")
+
+    handled = len(questions) - statuses["deferred to LLM"]
+    print(f"corpus={corpus.name} questions={len(questions)} today={today}")
+    print(f"coverage: {handled}/{len(questions)} ({handled / len(questions):.0%}) answered without the LLM")
+    for status, n in statuses.most_common():
+        print(f"  {status:<22} {n:>4}")
+    q = statistics.quantiles(latencies, n=100)
+    print(f"parse latency: p50={q[49] * 1e6:.0f}us p95={q[94] * 1e6:.0f}us max={max(latencies) * 1e6:.0f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS, help="one question per line")
+    parser.add_argument("--today", type=date.fromisoformat, default=date(2025, 10, 27),
+                        help="the date relative dates resolve against (default: the day after the dataset)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--show", action="store_true", help="print the outcome of every question")
+    args = parser.parse_args()
+    run(args.corpus, args.today, args.repeat, args.show)
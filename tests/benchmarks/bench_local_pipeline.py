@@ -0,0 +1,86 @@
+"""
+Benchmark - query execution + cache pipeline on the local emulated backend (no network)
+
+Runs a mix of builder-style queries through run_bigquery_async with N concurrent requests
+against SQLite + synthetic data, with injected per-job latency:
+    python -m tests.benchmarks.bench_local_pipeline --rows 200000 --latency-ms 300 --concurrency 8
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from backend import bq, bq_local
+from backend.job_stats import job_summary
+
+QUERY_MIX = [
+    # (weight, sql)
+    (5, """SELECT media_source, SUM(total_events) AS total_events
+FROM `practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`
+WHERE event_date BETWEEN '{day}' AND '{day}'
+GROUP BY media_source ORDER BY total_events DESC LIMIT 10"""),
+    (3, """SELECT app_id, SUM(total_events) AS total_events
+FROM `practicode-2025.clicks_data_prac.partial_encoded_clicks_part`
+WHERE event_time >= TIMESTAMP('{day} 00:00:00') AND event_time <= TIMESTAMP('{day} 23:59:59')
+GROUP BY app_id ORDER BY total_events DESC LIMIT 10"""),
+    (1, """SELECT event_time, media_source, app_id, total_events
+FROM `practicode-2025.clicks_data_prac.partial_encoded_clicks_part`
+ORDER BY event_time DESC LIMIT 10"""),
+]
+DAYS = ["2025-10-24", "2025-10-25", "2025-10-26"]
+
+
+def _workload(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    weights = [w for w, _ in QUERY_MIX]
+    return [
+        rnd.choices(QUERY_MIX, weights)[0][1].format(day=rnd.choice(DAYS))
+        for _ in range(n)
+    ]
+
+
+async def run(requests: int, concurrency: int, seed: int):
+    from backend.flow_manager_agent.sub_agents.query_executor_agent.agent import run_bigquery_async
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    hits = 0
+
+    async def one(sql):
+        nonlocal hits
+        async with sem:
+            start = time.perf_counter()
+            result = await run_bigquery_async(sql)
+            latencies.append(time.perf_counter() - start)
+            hits += bool(result.get("from_cache"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(sql) for sql in _workload(requests, seed)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    jobs = job_summary()
+    print(f"requests={requests} concurrency={concurrency} wall={wall:.2f}s")
+    print(f"p50={statistics.median(latencies) * 1000:.0f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms "
+          f"cache_hit_rate={hits / requests:.0%}")
+    print(f"bq jobs={jobs['jobs']} by type: " +
+          ", ".join(f"{t}={s['jobs']}" for t, s in sorted(jobs["by_query_type"].items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    bq.BQ_BACKEND = "local"
+    bq_local._local_client = bq_local.LocalBigQueryClient(
+        rows=args.rows, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed
+    )
+    asyncio.run(run(args.requests, args.concurrency, args.seed))
@@ -0,0 +1,106 @@
+"""
+Benchmark - SQL builder: deterministic compiler vs the protected_query_builder_agent LLM call
+
+Intents come from the fast-path parser over the intent corpus, plus ranking / retrieval shapes.
+Offline it times the compiler only; --llm also calls Gemini with the builder prompt (needs credentials)
+and reports its latency and how often both produce the same canonical SQL:
+    python -m tests.benchmarks.bench_sql_compiler
+    python -m tests.benchmarks.bench_sql_compiler --llm --limit 20
+"""
+import argparse
+import json
+import re
+import statistics
+import time
+from datetime import date
+
+from backend.flow_manager_agent.sub_agents.intent_analyzer_agent.fast_path import _parse
+from backend.flow_manager_agent.sub_agents.protected_query_builder_agent import protected_query_builder_agent
+from backend.flow_manager_agent.sub_agents.protected_query_builder_agent.compiler import _compile, NotCovered
+from backend.flow_manager_agent.utils.sql_canonical import canonical_key
+from tests.benchmarks.bench_intent_fast_path import CORPUS, load_corpus
+
+TODAY = date(2025, 10, 27)
+DAY = {"start_date": "2025-10-25", "end_date": "2025-10-25"}
+
+
+def _intents() -> list[dict]:
+    out = []
+    for q in load_corpus(CORPUS):
+        result = _parse(q, TODAY)
+        if result and result.get("status") == "ok":
+            out.append(result["parsed_intent"])
+
+    base = {"metric": "total_events", "filters": {}, "invalid_fields": [], "number_of_rows": None, "row_selection": None}
+    for dim in ("media_source", "app_id", "site_id", "partner", "hr"):
+        out.append({**base, "intent": "find top", "dimensions": [dim], "date_range": DAY})
+        out.append({**base, "intent": "find bottom", "dimensions": [dim], "date_range": DAY})
+    out.append({**base, "intent": "retrieval", "metric": None, "dimensions": [], "date_range": None,
+                "number_of_rows": 10, "row_selection": "first"})
+    return out
+
+
+def _pct(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def _llm_sql(client, parsed_intent: dict) -> str | None:
+    response = client.models.generate_content(
+        model=protected_query_builder_agent.model,
+        contents=json.dumps({"status": "ok", "parsed_intent": parsed_intent}),
+        config={"system_instruction": protected_query_builder_agent.instruction},
+    )
+    cleaned = re.sub(r"```json|```", "", response.text or "").strip()
+    try:
+        return json.loads(cleaned).get("sql")
+    except ValueError:
+        return None
+
+
+def run(repeat: int, llm: bool, limit: int | None):
+    intents = _intents()[:limit]
+    compiled, latencies = [], []
+    for parsed_intent in intents:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                built = _compile(parsed_intent)
+            except NotCovered:
+                built = None
+            best = min(best, time.perf_counter() - start)
+        compiled.append(built)
+        latencies.append(best)
+
+    covered = sum(1 for b in compiled if b is not None)
+    print(f"intents={len(intents)} compiled={covered} ({covered / len(intents):.0%})")
+    print(f"compiler: p50={_pct(latencies, 50) * 1e6:.0f}us p95={_pct(latencies, 95) * 1e6:.0f}us")
+
+    if not llm:
+        return
+
+    from google import genai
+
+    client = genai.Client()
+    llm_latencies, same, malformed = [], 0, 0
+    for parsed_intent, built in zip(intents, compiled):
+        start = time.perf_counter()
+        sql = _llm_sql(client, parsed_intent)
+        llm_latencies.append(time.perf_counter() - start)
+        if not sql:
+            malformed += 1
+        elif built and built.get("sql") and canonical_key(sql) == canonical_key(built["sql"]):
+            same += 1
+
+    print(f"llm:      p50={_pct(llm_latencies, 50) * 1000:.0f}ms p95={_pct(llm_latencies, 95) * 1000:.0f}ms "
+          f"(x{_pct(llm_latencies, 50) / _pct(latencies, 50):.0f} the compiler)")
+    print(f"same canonical SQL: {same}/{len(intents)}  malformed / no SQL from the LLM: {malformed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--llm", action="store_true", help="also time the Gemini builder (billed, needs credentials)")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+    run(args.repeat, args.llm, args.limit)
@@ -0,0 +1,147 @@
+"""
+Replay - cache admission policies on a request log: fixed use_count==3 rule vs TinyLFU
+
+Each request is (time, key, result size). A policy sees every request; hits are
+requests answered by a stored result still within the TTL.
+
+Synthetic Zipf workload (default):
+    python -m tests.benchmarks.replay_admission --requests 20000 --keys 5000 --zipf 1.1
+
+Replay a JSON-lines log (intent_key or sql, logged_at/ts, optional size/total_bytes_processed),
+e.g. the BigQuery job log:
+    python -m tests.benchmarks.replay_admission --log backend/logs/bq_jobs.jsonl --query-type adk_query
+"""
+import argparse
+import json
+import random
+from collections import OrderedDict
+from datetime import datetime
+
+from backend.flow_manager_agent.utils.admission import CountMinSketch, TinyLFUAdmission
+from backend.flow_manager_agent.utils.cache import CacheService
+from backend.flow_manager_agent.utils.sql_canonical import canonical_key
+
+TTL_SECONDS = CacheService.TTL.total_seconds()
+
+
+class _Store:
+    """TTL + LRU bounded by bytes — the memory tier, without the payloads."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None or now - entry[0] > TTL_SECONDS:
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def victims(self, size):
+        over, out = self.bytes + size - self.max_bytes, []
+        for k, (_, s) in self.entries.items():
+            if over <= 0:
+                break
+            out.append(k)
+            over -= s
+        return out
+
+    def put(self, key, now, size):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (now, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, s) = self.entries.popitem(last=False)
+            self.bytes -= s
+
+
+def replay_count_rule(requests, max_bytes):
+    store, counts = _Store(max_bytes), {}
+    hits = writes = 0
+    for now, key, size in requests:
+        if store.get(key, now):
+            hits += 1
+            continue
+        counts[key] = min(counts.get(key, 0) + 1, CacheService.MAX_COUNT)
+        writes += 1                                   # MERGE of use_count
+        if counts[key] >= CacheService.MAX_COUNT:
+            store.put(key, now, size)
+            writes += 1                               # UPDATE of the result
+    return {"hits": hits, "bookkeeping_writes": writes, "table_rows": len(counts)}
+
+
+def replay_tinylfu(requests, max_bytes, width):
+    store = _Store(max_bytes)
+    policy = TinyLFUAdmission(CountMinSketch(width=width))
+    hits = writes = 0
+    stored = set()
+    for now, key, size in requests:
+        if store.get(key, now):
+            hits += 1
+            continue
+        freq = policy.record(key)
+        if policy.frequent_enough(freq) and policy.admit(key, size, store.victims(size)):
+            store.put(key, now, size)
+            stored.add(key)
+            writes += 1                               # result event
+    return {"hits": hits, "bookkeeping_writes": writes, "table_rows": len(stored)}
+
+
+def synthetic(n, keys, zipf, rate, seed):
+    rnd = random.Random(seed)
+    weights = [1 / (i + 1) ** zipf for i in range(keys)]
+    sizes = [int(rnd.lognormvariate(9, 1.5)) for _ in range(keys)]
+    now, out = 0.0, []
+    for key in rnd.choices(range(keys), weights, k=n):
+        now += rnd.expovariate(rate)
+        out.append((now, f"k{key}", sizes[key]))
+    return out
+
+
+def from_log(path, query_type=None):
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if query_type and rec.get("query_type") != query_type:
+                continue
+            key = rec.get("intent_key") or (canonical_key(rec["sql"]) if rec.get("sql") else None)
+            if not key:
+                continue
+            ts = rec.get("ts") or rec.get("logged_at")
+            now = datetime.fromisoformat(ts).timestamp() if isinstance(ts, str) else float(ts or len(out))
+            size = int(rec.get("size") or rec.get("total_bytes_processed") or 1024)
+            out.append((now, key, size))
+    out.sort(key=lambda r: r[0])
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log")
+    parser.add_argument("--query-type")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--keys", type=int, default=5_000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--rate", type=float, default=2.0, help="requests per second")
+    parser.add_argument("--max-mb", type=float, default=64)
+    parser.add_argument("--width", type=int, default=8192)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.log:
+        reqs = from_log(args.log, args.query_type)
+    else:
+        reqs = synthetic(args.requests, args.keys, args.zipf, args.rate, args.seed)
+    max_bytes = int(args.max_mb * 1024 ** 2)
+
+    print(f"requests={len(reqs)} distinct_keys={len({k for _, k, _ in reqs})} ttl={TTL_SECONDS:.0f}s")
+    for name, result in (
+        ("count==3", replay_count_rule(reqs, max_bytes)),
+        ("tinylfu", replay_tinylfu(reqs, max_bytes, args.width)),
+    ):
+        print(f"{name:<9} hit_rate={result['hits'] / max(len(reqs), 1):.1%} "
+              f"bookkeeping_writes={result['bookkeeping_writes']} table_rows={result['table_rows']}")
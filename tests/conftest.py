@@ -9,6 +9,36 @@ from pathlib import Path
 backend_path = Path(__file__).parent.parent / "backend"
 sys.path.insert(0, str(backend_path))
 
+
+@pytest.fixture(autouse=True)
+def isolated_job_log(tmp_path, monkeypatch):
+    """Keep BigQuery job stats written during tests out of backend/logs"""
+    from backend import job_stats
+    monkeypatch.setattr(job_stats, "JOB_LOG_PATH", str(tmp_path / "bq_jobs.jsonl"))
+    job_stats.reset_job_log()
+
+
+@pytest.fixture(autouse=True)
+def discard_cache_events():
+    """Cache bookkeeping events recorded by a test are never flushed to BigQuery"""
+    yield
+    from backend.flow_manager_agent.utils import cache_keys
+    from backend.flow_manager_agent.utils.cache import CacheService, cache_events, key_stats
+    cache_events.reset()
+    cache_keys.reset()
+    key_stats.clear()
+    CacheService.admission.clear()
+    CacheService.rollups.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_source_polling():
+    """Source-table metadata is only read when a test calls poll() itself (the poller starts with the app)"""
+    from backend.flow_manager_agent.utils.cache import source_versions
+    yield
+    source_versions.reset()
+
+
 @pytest.fixture
 def sample_user_query():
     """Sample user query for testing"""
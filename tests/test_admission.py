@@ -0,0 +1,78 @@
+"""
+Unit tests for the TinyLFU admission policy (count-min sketch + size-aware admission)
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from backend.flow_manager_agent.utils.admission import CountMinSketch, TinyLFUAdmission
+from backend.flow_manager_agent.utils.cache import MemoryTier
+
+
+class TestCountMinSketch:
+
+    def test_estimates_never_undercount(self):
+        sketch = CountMinSketch(width=64, depth=4, sample_size=10_000)
+        for i in range(200):
+            for _ in range(i % 5):
+                sketch.increment(f"k{i}")
+        assert all(sketch.estimate(f"k{i}") >= i % 5 for i in range(200))
+
+    def test_unseen_key_is_zero(self):
+        sketch = CountMinSketch(width=1024)
+        sketch.increment("a")
+        assert sketch.estimate("b") == 0
+
+    def test_aging_halves_counters(self):
+        sketch = CountMinSketch(width=64, sample_size=10)
+        for _ in range(8):
+            sketch.increment("hot")
+        assert sketch.estimate("hot") == 8
+        sketch.increment("x")
+        sketch.increment("y")        # 10th addition => halve
+        assert sketch.estimate("hot") == 4
+        assert sketch.resets == 1
+
+
+class TestTinyLFUAdmission:
+
+    def test_requires_min_frequency(self):
+        policy = TinyLFUAdmission(CountMinSketch(width=1024), min_freq=2)
+        policy.record("k")
+        assert not policy.admit("k", size=100)
+        policy.record("k")
+        assert policy.admit("k", size=100)
+        assert policy.stats()["rejected_frequency"] == 1
+
+    def test_large_results_need_more_requests(self):
+        policy = TinyLFUAdmission(CountMinSketch(width=1024), min_freq=2, size_unit=1000)
+        assert policy.required_frequency(1000) == 2
+        assert policy.required_frequency(4000) == 4
+        for _ in range(3):
+            policy.record("big")
+        assert not policy.admit("big", size=4000)
+        policy.record("big")
+        assert policy.admit("big", size=4000)
+
+    def test_loses_to_more_frequent_victim(self):
+        policy = TinyLFUAdmission(CountMinSketch(width=1024), min_freq=2)
+        for _ in range(5):
+            policy.record("resident")
+        for _ in range(2):
+            policy.record("newcomer")
+        assert not policy.admit("newcomer", size=10, victims=["resident"])
+        assert policy.admit("resident", size=10, victims=["newcomer"])
+
+
+class TestEvictionCandidates:
+
+    def test_lru_victims_until_it_fits(self):
+        now = datetime.now(timezone.utc)
+        t = MemoryTier(max_bytes=60, max_entry_bytes=60, ttl=timedelta(seconds=300))
+        for key in ("a", "b", "c"):
+            t.put(key, rows=[], executed_sql="", last_updated=now, size=19)   # 20 bytes each
+        assert t.eviction_candidates(0) == []
+        assert t.eviction_candidates(30) == ["a", "b"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
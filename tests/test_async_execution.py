@@ -0,0 +1,131 @@
+"""
+Unit tests for the non-blocking query execution path
+"""
+import pytest
+import asyncio
+from unittest.mock import Mock, patch
+
+from backend import bq
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService
+from backend.flow_manager_agent.utils.cache_backends import MemoryBackend
+
+
+class FakeJob:
+    """Query job that reports done() only after a few polls"""
+
+    def __init__(self, polls_until_done=3, rows=None):
+        self.polls_left = polls_until_done
+        self.rows = rows or []
+
+    def done(self):
+        self.polls_left -= 1
+        return self.polls_left <= 0
+
+    def result(self, page_size=None):
+        return self.rows
+
+
+@pytest.fixture
+def bq_client():
+    with patch.object(bq, "_load_credentials", return_value=(Mock(), "sa@test", "proj")), \
+         patch.object(bq, "get_bq_client") as mock_get:
+        client = bq.BQClient()
+        yield client, mock_get.return_value
+
+
+class TestExecuteQueryAsync:
+
+    @pytest.mark.asyncio
+    async def test_polls_until_done(self, bq_client, monkeypatch):
+        client, raw = bq_client
+        job = FakeJob(polls_until_done=3, rows=[{"total_events": 5}])
+        raw.query.return_value = job
+        monkeypatch.setattr(bq, "BQ_POLL_INITIAL", 0.001)
+
+        result = await client.execute_query_async("SELECT 1", "test")
+
+        assert result == [{"total_events": 5}]
+        assert job.polls_left == 0
+
+    @pytest.mark.asyncio
+    async def test_does_not_block_event_loop(self, bq_client, monkeypatch):
+        client, raw = bq_client
+        raw.query.side_effect = lambda q, **kw: FakeJob(polls_until_done=5)
+        monkeypatch.setattr(bq, "BQ_POLL_INITIAL", 0.01)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            for _ in range(5):
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        await asyncio.gather(
+            client.execute_query_async("SELECT 1", "a"),
+            client.execute_query_async("SELECT 2", "b"),
+            ticker(),
+        )
+        assert ticks == 5
+
+    @pytest.mark.asyncio
+    async def test_cancel_stops_bigquery_job(self, bq_client, monkeypatch):
+        client, raw = bq_client
+        raw.query.side_effect = lambda q, **kw: FakeJob(polls_until_done=10_000)
+        raw.cancel_job.return_value = Mock(total_bytes_processed=100)
+        monkeypatch.setattr(bq, "BQ_POLL_INITIAL", 0.01)
+        before = bq.cancellation_stats()
+
+        task = asyncio.create_task(client.execute_query_async("SELECT 1", "adk_query", estimated_bytes=1000))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # cancel_job runs on the executor in the background
+        for _ in range(100):
+            if bq.cancellation_stats()["jobs_cancelled"] > before["jobs_cancelled"]:
+                break
+            await asyncio.sleep(0.01)
+
+        job_id = raw.cancel_job.call_args.args[0]
+        assert job_id.startswith("adk_query_")
+        after = bq.cancellation_stats()
+        assert after["jobs_cancelled"] == before["jobs_cancelled"] + 1
+        assert after["bytes_saved_estimate"] == before["bytes_saved_estimate"] + 900
+
+
+class TestRunOrCacheAsync:
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_query(self):
+        cs = CacheService(backend=MemoryBackend())
+        cs.get_valid_cached_result = Mock(return_value={"rows": [{"a": 1}]})
+
+        async def runner(sql):
+            raise AssertionError("should not run")
+
+        rows, from_cache = await cs.run_or_cache_async(intent_key="k", sql="SELECT 1", run_bigquery_fn_async=runner)
+        assert from_cache is True
+        assert rows == [{"a": 1}]
+
+    @pytest.mark.asyncio
+    async def test_miss_runs_query_and_saves_on_third(self, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        cs = CacheService(backend=MemoryBackend())
+        cs.get_valid_cached_result = Mock(return_value=None)
+        cs._increment_use = Mock(return_value=3)
+        cs._save_result = Mock()
+
+        async def runner(sql):
+            return [{"a": 1}]
+
+        rows, from_cache = await cs.run_or_cache_async(intent_key="k", sql="SELECT 1", run_bigquery_fn_async=runner)
+        assert from_cache is False
+        assert rows == [{"a": 1}]
+        cs._save_result.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,118 @@
+"""
+Unit tests for the local emulated BigQuery backend
+"""
+import pytest
+import time
+from datetime import datetime
+
+pytest.importorskip("sqlglot")
+
+from backend import bq, bq_local
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService
+
+RAW = "`practicode-2025.clicks_data_prac.partial_encoded_clicks_part`"
+AGG = "`practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`"
+
+
+@pytest.fixture(scope="module")
+def local_client():
+    client = LocalBigQueryClient(rows=2000, days=3)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def local_backend(local_client, monkeypatch):
+    """BQClient / CacheService wired to the local client"""
+    monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+    monkeypatch.setattr(bq_local, "_local_client", local_client)
+    monkeypatch.setattr(bq, "_clients", {})
+    local_client._conn.execute("DELETE FROM cache__cached_queries")
+    CacheService.memory.clear()
+    return local_client
+
+
+class TestLocalQueries:
+
+    def test_raw_and_agg_agree(self, local_client):
+        raw = local_client.query(f"""
+            SELECT SUM(total_events) AS t FROM {RAW}
+            WHERE event_time >= TIMESTAMP('2025-10-24 00:00:00')
+              AND event_time <= TIMESTAMP('2025-10-24 23:59:59')
+        """).result()
+        agg = local_client.query(
+            f"SELECT SUM(total_events) AS t FROM {AGG} WHERE event_date BETWEEN '2025-10-24' AND '2025-10-24'"
+        ).result()
+        assert list(raw)[0]["t"] == list(agg)[0]["t"] > 0
+
+    def test_result_pages_and_types(self, local_client):
+        it = local_client.query(f"SELECT event_time, hr FROM {RAW} ORDER BY event_time DESC LIMIT 25").result(
+            page_size=10
+        )
+        pages = list(it.pages)
+        assert [len(p) for p in pages] == [10, 10, 5]
+        assert isinstance(pages[0][0]["event_time"], datetime)
+
+    def test_dry_run_counts_referenced_columns(self, local_client):
+        from google.cloud import bigquery
+        config = bigquery.QueryJobConfig(dry_run=True)
+        narrow = local_client.query(f"SELECT hr FROM {RAW}", job_config=config).total_bytes_processed
+        wide = local_client.query(f"SELECT * FROM {RAW}", job_config=config).total_bytes_processed
+        agg = local_client.query(f"SELECT hr FROM {AGG}", job_config=config).total_bytes_processed
+        assert narrow < wide
+        assert agg < narrow
+
+    def test_invalid_sql_raises_bad_request(self, local_client):
+        from google.api_core.exceptions import BadRequest
+        with pytest.raises(BadRequest):
+            local_client.query(f"SELECT no_such_column FROM {RAW}").result()
+
+    def test_injected_latency(self, local_client, monkeypatch):
+        monkeypatch.setattr(local_client, "latency_ms", 50)
+        job = local_client.query("SELECT 1 AS x")
+        assert not job.done()
+        start = time.perf_counter()
+        assert list(job.result()) == [{"x": 1}]
+        assert time.perf_counter() - start >= 0.03
+
+
+class TestLocalBackendWiring:
+
+    def test_bq_client_uses_local_engine(self, local_backend):
+        client = bq.BQClient()
+        rows = client.fetch_records(client.execute_query(f"SELECT COUNT(*) AS n FROM {RAW}", "test"))
+        assert rows == [{"n": 2000}]
+
+    def test_cache_merge_and_ttl_roundtrip(self, local_backend, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        cs = CacheService()
+        calls = []
+
+        def runner(sql):
+            calls.append(sql)
+            return [{"n": 1}]
+
+        for _ in range(CacheService.MAX_COUNT):
+            rows, from_cache = cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner)
+            assert not from_cache
+
+        rows, from_cache = cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner)
+        assert from_cache and rows == [{"n": 1}]
+        assert len(calls) == CacheService.MAX_COUNT
+
+    def test_hot_entries_most_used_first(self, local_backend, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        cs = CacheService()
+        for key, asks in (("rare", 1), ("hot", 3), ("warm", 2)):
+            for _ in range(asks):
+                cs.run_or_cache(intent_key=key, sql=f"SELECT '{key}'", run_bigquery_fn=lambda s: [])
+
+        assert [e["intent_key"] for e in cs.hot_entries(2)] == ["hot", "warm"]
+        assert cs.hot_entries(1)[0]["sql"] == "SELECT 'hot'"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
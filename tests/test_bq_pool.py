@@ -0,0 +1,207 @@
+"""
+Unit tests for the shared BigQuery client registry
+"""
+import pytest
+import threading
+from unittest.mock import Mock, patch
+
+from backend import bq
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    bq.reset_bq_clients()
+    yield
+    bq.reset_bq_clients()
+
+
+@pytest.fixture
+def fake_creds():
+    creds = Mock(name="creds")
+    with patch.object(bq, "_load_credentials", return_value=(creds, "sa@test", "proj")):
+        yield creds
+
+
+class TestBQClientRegistry:
+    """Test cases for get_bq_client / BQClient sharing"""
+
+    @patch("backend.bq.bigquery.Client")
+    def test_same_client_is_reused(self, mock_client, fake_creds):
+        """Two BQClient instances share one underlying bigquery.Client"""
+        a = bq.BQClient()
+        b = bq.BQClient()
+
+        assert a.bq_client is b.bq_client
+        assert mock_client.call_count == 1
+        assert bq.pool_stats()["clients"] == 1
+        assert bq.pool_stats()["http_sessions"] == 1
+
+    @patch("backend.bq.bigquery.Client")
+    def test_client_per_location(self, mock_client, fake_creds):
+        """Different locations get different clients but one HTTP session"""
+        bq.get_bq_client("proj", "EU")
+        bq.get_bq_client("proj", "US")
+
+        assert mock_client.call_count == 2
+        stats = bq.pool_stats()
+        assert stats["clients"] == 2
+        assert stats["http_sessions"] == 1
+
+    @patch("backend.bq.bigquery.Client")
+    def test_concurrent_creation(self, mock_client, fake_creds):
+        """Concurrent first calls create a single client"""
+        results = []
+
+        def worker():
+            results.append(bq.get_bq_client())
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert mock_client.call_count == 1
+        assert all(r is results[0] for r in results)
+
+
+class TestResultConversion:
+    """Test cases for Arrow / REST row conversion"""
+
+    def test_arrow_records_match_rest_path(self):
+        """arrow_to_records gives the same JSON-safe rows as the pandas path"""
+        pa = pytest.importorskip("pyarrow")
+        import datetime as dt
+
+        ts = dt.datetime(2025, 10, 24, 10, 30, tzinfo=dt.timezone.utc)
+        table = pa.table({
+            "media_source": ["a", "b"],
+            "event_date": pa.array([ts.date(), None], pa.date32()),
+            "event_time": pa.array([ts, ts], pa.timestamp("us", tz="UTC")),
+            "total_events": [1, 2],
+        })
+
+        rows = bq.arrow_to_records(table)
+
+        assert rows[0] == {
+            "media_source": "a",
+            "event_date": "2025-10-24",
+            "event_time": "2025-10-24T10:30:00+00:00",
+            "total_events": 1,
+        }
+        assert rows[1]["event_date"] is None
+
+    def test_json_safe_records(self):
+        """REST fallback converts dates and decimals"""
+        import datetime as dt
+        from decimal import Decimal
+
+        rows = bq.json_safe_records([{"d": dt.date(2025, 10, 24), "n": Decimal("1.5"), "s": "x"}])
+        assert rows == [{"d": "2025-10-24", "n": 1.5, "s": "x"}]
+
+
+class FakeRow(dict):
+    """BigQuery Row stand-in (Row.items() returns key/value pairs)"""
+
+
+class FakePages:
+    """RowIterator stand-in that counts how many pages were pulled"""
+
+    def __init__(self, pages):
+        self._pages = pages
+        self.pulled = 0
+        self.total_rows = sum(len(p) for p in pages)
+
+    @property
+    def pages(self):
+        for page in self._pages:
+            self.pulled += 1
+            yield [FakeRow(r) for r in page]
+
+
+class TestPagedCollection:
+    """Test cases for BQClient.collect_records row / byte caps"""
+
+    @pytest.fixture
+    def client(self):
+        c = bq.BQClient.__new__(bq.BQClient)
+        return c
+
+    def _pages(self, n_pages, per_page):
+        return FakePages([
+            [{"media_source": f"m{p}_{i}", "total_events": i} for i in range(per_page)]
+            for p in range(n_pages)
+        ])
+
+    def test_collects_everything_under_cap(self, client):
+        it = self._pages(3, 10)
+        rows, truncated = client.collect_records(it, max_rows=100, max_bytes=10**9, mode="rest")
+        assert len(rows) == 30
+        assert truncated is False
+        assert not isinstance(rows, bq.TruncatedRows)
+
+    def test_exactly_the_cap_is_complete(self, client):
+        rows, truncated = client.collect_records(self._pages(3, 5), max_rows=15, max_bytes=10**9, mode="rest")
+        assert len(rows) == 15 and truncated is False
+
+    def test_row_cap_stops_pulling_pages(self, client):
+        it = self._pages(10, 10)
+        rows, truncated = client.collect_records(it, max_rows=15, max_bytes=10**9, mode="rest")
+        assert len(rows) == 15
+        assert truncated is True and isinstance(rows, bq.TruncatedRows)
+        assert it.pulled == 2
+
+    def test_byte_cap(self, client):
+        it = self._pages(10, 10)
+        rows, truncated = client.collect_records(it, max_rows=10**6, max_bytes=100, mode="rest")
+        assert truncated is True and isinstance(rows, bq.TruncatedRows)
+        assert it.pulled == 1
+        assert len(rows) == 10
+
+
+class FakeArrowPages(FakePages):
+    """RowIterator stand-in for the arrow path: one RecordBatch per page"""
+
+    def to_arrow_iterable(self, **_):
+        import pyarrow as pa
+        for page in self._pages:
+            self.pulled += 1
+            yield pa.RecordBatch.from_pylist(page)
+
+
+class TestArrowCollection:
+    """Test cases for collect_records keeping the result columnar"""
+
+    @pytest.fixture
+    def client(self):
+        pytest.importorskip("pyarrow")
+        return bq.BQClient.__new__(bq.BQClient)
+
+    def _pages(self, n_pages, per_page):
+        return FakeArrowPages([
+            [{"media_source": f"m{p}_{i}", "total_events": i} for i in range(per_page)]
+            for p in range(n_pages)
+        ])
+
+    def test_rows_stay_an_arrow_table(self, client):
+        rows, truncated = client.collect_records(self._pages(3, 10), max_rows=100, max_bytes=10**9, mode="auto")
+        assert isinstance(rows, bq.ArrowRows) and rows.table.num_rows == 30
+        assert truncated is False and not bq.is_truncated(rows)
+        assert rows[0] == {"media_source": "m0_0", "total_events": 0}
+        assert rows[-1] == {"media_source": "m2_9", "total_events": 9}
+        assert bq.as_records(rows) == list(rows)
+
+    def test_row_cap_slices_the_last_batch(self, client):
+        it = self._pages(10, 10)
+        rows, truncated = client.collect_records(it, max_rows=15, max_bytes=10**9, mode="auto")
+        assert len(rows) == 15 and truncated is True and bq.is_truncated(rows)
+        assert it.pulled == 2
+        assert rows[10:12] == [{"media_source": "m1_0", "total_events": 0}, {"media_source": "m1_1", "total_events": 1}]
+
+    def test_empty_result(self, client):
+        rows, truncated = client.collect_records(self._pages(0, 0), max_rows=15, max_bytes=10**9, mode="auto")
+        assert rows == [] and truncated is False
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
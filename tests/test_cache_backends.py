@@ -0,0 +1,146 @@
+"""
+Unit tests for the pluggable cache backends (memory / disk / kv) behind CacheService
+"""
+import pytest
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+from backend.flow_manager_agent.utils import cache, cache_backends
+from backend import bq, bq_local
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.utils.cache import (
+    BigQueryBackend, CacheBackend, CacheService, DiskBackend, KVBackend, MemoryBackend, make_backend,
+)
+from backend.flow_manager_agent.utils.cache_backends import LocalKVServer
+
+MAX = CacheService.MAX_COUNT
+
+
+@pytest.fixture(params=["memory", "disk", "kv"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "disk":
+        disk = DiskBackend(str(tmp_path / "cache.sqlite3"))
+        yield disk
+        disk.close()
+    else:
+        server = LocalKVServer().start()
+        yield KVBackend(server.url)
+        server.shutdown()
+        server.server_close()
+
+
+class TestContract:
+
+    def test_increment_is_capped_upsert(self, backend):
+        assert backend.load("k") is None
+        assert [backend.increment_use("k", "SELECT 1", MAX) for _ in range(MAX + 2)] == [1, 2, 3, 3, 3]
+        entry = backend.load("k")
+        assert (entry["sql"], entry["result"], entry["last_updated"], entry["use_count"]) == ("SELECT 1", None, None, 3)
+
+    def test_cap_holds_under_concurrent_increments(self, backend):
+        counts = []
+        threads = [
+            threading.Thread(target=lambda: counts.extend(backend.increment_use("k", "SELECT 1", MAX) for _ in range(5)))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(counts)[:MAX] == [1, 2, 3] and max(counts) == MAX
+        assert backend.load("k")["use_count"] == MAX
+
+    def test_save_and_load(self, backend):
+        now = datetime.now(timezone.utc)
+        backend.save_result("k", "SELECT 2", "payload", now, MAX)
+        entry = backend.load("k")
+        assert (entry["intent_key"], entry["result"], entry["use_count"]) == ("k", "payload", MAX)
+        assert entry["last_updated"] == now
+
+    def test_hot_entries_and_summary(self, backend):
+        now = datetime.now(timezone.utc)
+        backend.save_result("hot", "SELECT 1", "x" * 100, now - timedelta(hours=1), MAX)
+        backend.increment_use("cold", "SELECT 2", MAX)
+        assert [e["intent_key"] for e in backend.hot_entries(5)] == ["hot", "cold"]
+
+        summary = backend.summary(1, expired_before=now - timedelta(minutes=5), near_before=now)
+        assert (summary["entries"], summary["with_result"], summary["past_ttl"]) == (2, 1, 1)
+        assert summary["largest"][0]["bytes"] == 100
+
+        backend.clear()
+        assert backend.load("hot") is None and backend.hot_entries(5) == []
+
+
+class TestBackends:
+
+    def test_backend_must_implement_the_contract(self):
+        class Partial(CacheBackend):
+            def load(self, intent_key):
+                return None
+
+        with pytest.raises(TypeError):
+            Partial()
+
+    def test_bigquery_entries_are_bounded_and_clear_empties(self, monkeypatch):
+        pytest.importorskip("sqlglot")
+        client = LocalBigQueryClient(rows=10, days=1)
+        monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+        monkeypatch.setattr(bq_local, "_local_client", client)
+        monkeypatch.setattr(bq, "_clients", {})
+        monkeypatch.setattr(cache_backends, "CACHE_BQ_MAX_ENTRIES", 2)
+        backend = BigQueryBackend("practicode-2025", "cache", "cached_queries")
+
+        now = datetime.now(timezone.utc)
+        backend.save_result("a", "SELECT 1", "payload", now, MAX)
+        backend.increment_use("b", "SELECT 2", MAX)
+        backend.increment_use("c", "SELECT 3", MAX)
+        entries = backend.entries()
+        assert len(entries) == 2 and entries[0]["intent_key"] == "a"
+        assert abs(entries[0]["last_updated"] - now) < timedelta(seconds=1)
+
+        backend.clear()
+        assert backend.entries() == [] and backend.load("a") is None
+        client.close()
+
+    def test_kv_client_reconnects_after_a_broken_connection(self):
+        server = LocalKVServer().start()
+        kv = KVBackend(server.url)
+        kv.increment_use("k", "SELECT 1", MAX)
+        kv.client._local.conn[0].shutdown(socket.SHUT_RDWR)
+
+        with pytest.raises(OSError):
+            kv.load("k")
+        assert kv.load("k")["use_count"] == 1
+        server.shutdown()
+        server.server_close()
+
+
+class TestCacheService:
+
+    def test_runs_on_disk_without_events(self, tmp_path, monkeypatch):
+        disk = DiskBackend(str(tmp_path / "cache.sqlite3"))
+        monkeypatch.setattr(cache_backends, "_shared", {"disk": disk})
+        monkeypatch.setattr(cache_backends, "CACHE_BACKEND", "disk")
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        CacheService.memory.clear()
+
+        calls = []
+        cs = CacheService()
+        for _ in range(MAX + 1):
+            cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=lambda s: calls.append(s) or [{"n": 1}])
+
+        assert len(calls) == MAX
+        assert cs.backend is disk and disk.load("k")["result"] is not None
+        assert cache.cache_events.stats()["buffered"] == 0
+
+        # a restarted process (empty memory tier) reads the saved result from disk
+        CacheService.memory.clear()
+        assert cs.get_valid_cached_result("k")["rows"] == [{"n": 1}]
+        disk.close()
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            make_backend("p", "d", "t", name="nope")
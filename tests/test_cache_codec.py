@@ -0,0 +1,105 @@
+"""
+Unit tests for the columnar cache payload encoding
+"""
+import json
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from backend.flow_manager_agent.utils import cache_codec
+from backend.flow_manager_agent.utils.cache_codec import (
+    ARROW_MAGIC, CachedPayload, codec_stats, decode_rows, encode_rows, read_header,
+)
+
+
+def breakdown(n=500):
+    return [
+        {"event_date": f"2025-10-{i % 28 + 1:02d}", "media_source": f"src_{i % 7}",
+         "total_events": i * 3, "ratio": i / 7, "is_organic": i % 2 == 0, "app_id": None if i % 5 else "a"}
+        for i in range(n)
+    ]
+
+
+class TestEncoding:
+
+    def test_arrow_roundtrip_is_exact(self):
+        rows = breakdown()
+        payload, decoded_size = encode_rows(rows)
+        assert payload.startswith(ARROW_MAGIC)
+        assert decode_rows(payload) == rows
+        assert decoded_size > 0
+
+    def test_arrow_payload_is_smaller_than_json(self):
+        rows = breakdown(2000)
+        payload, _ = encode_rows(rows)
+        assert len(payload) < len(json.dumps(rows, ensure_ascii=False)) / 2
+
+    @pytest.mark.parametrize("n", [1, 500])
+    def test_truncated_flag_is_kept(self, n):
+        rows = breakdown(n)
+        payload, _ = encode_rows(rows, truncated=True)
+        cached = CachedPayload(payload)
+        assert cached.truncated and cached.row_count == n
+        assert cached.rows == rows
+        assert not CachedPayload(encode_rows(rows)[0]).truncated
+
+    def test_small_results_stay_json(self):
+        rows = [{"n": 1}]
+        payload, _ = encode_rows(rows)
+        assert payload == '[{"n": 1}]'
+        assert decode_rows(payload) == rows
+
+    @pytest.mark.parametrize("rows", [
+        [{"a": 1}, {"a": 1.5}] * 50,          # int/float mix would come back as floats
+        [{"a": 1}, {"b": 2}] * 50,            # ragged keys
+        [{"a": [1, 2]}] * 100,                # nested values
+    ])
+    def test_non_columnar_rows_fall_back_to_json(self, rows):
+        payload, _ = encode_rows(rows)
+        assert not payload.startswith(ARROW_MAGIC)
+        assert decode_rows(payload) == rows
+
+    def test_json_format_switch(self, monkeypatch):
+        monkeypatch.setattr(cache_codec, "CACHE_PAYLOAD_FORMAT", "json")
+        payload, _ = encode_rows(breakdown())
+        assert payload.startswith("[")
+
+    def test_arrow_rows_are_encoded_without_dicts(self, monkeypatch):
+        import pyarrow as pa
+        from backend.bq import ArrowRows
+        rows = ArrowRows(pa.Table.from_pylist(breakdown()), truncated=True)
+        monkeypatch.setattr(cache_codec, "as_records", lambda _: pytest.fail("rows were converted to dicts"))
+        payload, _ = encode_rows(rows, truncated=True)
+        decoded = decode_rows(payload)
+        assert isinstance(decoded, ArrowRows) and decoded.truncated
+        assert decoded.table.equals(rows.table)
+        assert list(decoded) == breakdown()
+
+
+class TestLazyPayload:
+
+    def test_header_without_decoding(self):
+        payload, _ = encode_rows(breakdown(100))
+        cached = CachedPayload(payload)
+        assert cached.row_count == 100
+        assert [c[0] for c in cached.header["columns"]][:2] == ["event_date", "media_source"]
+        assert cached._rows is None
+
+        before = codec_stats()["decoded"]["arrow"]
+        assert cached.rows == cached.rows
+        assert codec_stats()["decoded"]["arrow"] == before + 1
+
+    def test_legacy_json_header(self):
+        header = read_header('[{"n": 1}]')
+        assert header["format"] == "json" and header["encoded_bytes"] == 10
+
+    def test_stats_report_sizes_and_timings(self):
+        encode_rows(breakdown())
+        stats = codec_stats()
+        assert stats["encoded"]["arrow"] >= 1
+        assert stats["compression_ratio"] > 0
+        assert set(stats["encode_avg_ms"]) == {"json", "arrow"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
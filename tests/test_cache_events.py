@@ -0,0 +1,178 @@
+"""
+Unit tests for append-only cache bookkeeping (events + compaction)
+"""
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from backend import bq, bq_local
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.utils import cache, cache_events as events_module
+from backend.flow_manager_agent.utils.cache import CacheService, cache_events
+from backend.flow_manager_agent.utils.cache_events import CacheEventLog
+
+
+@pytest.fixture(scope="module")
+def local_client():
+    client = LocalBigQueryClient(rows=100, days=1)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def client(local_client, monkeypatch):
+    monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+    monkeypatch.setattr(bq_local, "_local_client", local_client)
+    monkeypatch.setattr(bq, "_clients", {})
+    local_client._conn.execute("DELETE FROM cache__cached_queries")
+    local_client._conn.execute("DELETE FROM cache__cache_events")
+    monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+    CacheService.memory.clear()
+    cache_events.reset()
+
+    submitted = []
+    original = local_client.query
+    monkeypatch.setattr(local_client, "query", lambda q, **kw: submitted.append(q) or original(q, **kw))
+    local_client.submitted = submitted
+    return local_client
+
+
+def ask(key="k"):
+    return CacheService().run_or_cache(intent_key=key, sql="SELECT 1", run_bigquery_fn=lambda sql: [{"n": 1}])
+
+
+def table_row(client, key="k"):
+    return client._conn.execute(
+        "SELECT use_count, result FROM cache__cached_queries WHERE intent_key = ?", (key,)
+    ).fetchone()
+
+
+class TestEventBookkeeping:
+
+    def test_miss_issues_no_dml(self, client):
+        for _ in range(CacheService.MAX_COUNT):
+            ask()
+        assert not any("MERGE" in q or "UPDATE" in q for q in client.submitted)
+        # third ask saved the result: served from memory without BigQuery
+        assert ask() == ([{"n": 1}], True)
+
+    def test_compaction_folds_events_into_table(self, client):
+        for _ in range(CacheService.MAX_COUNT):
+            ask()
+        assert cache_events.flush() == CacheService.MAX_COUNT + 1   # 3 uses + 1 result
+        assert cache_events.compact()
+
+        assert table_row(client) == (CacheService.MAX_COUNT, '[{"n": 1}]')
+
+        # another process (empty memory tier) now gets a hit from the table
+        CacheService.memory.clear()
+        assert ask() == ([{"n": 1}], True)
+
+    def test_compaction_is_idempotent(self, client):
+        ask()
+        ask()
+        cache_events.flush()
+        cache_events.compact()
+        cache_events.compact()
+        assert table_row(client) == (2, None)
+
+    def test_use_count_continues_from_table(self, client):
+        ask()
+        ask()
+        cache_events.flush()
+        cache_events.compact()
+        CacheService.memory.clear()
+
+        # pending uses were folded in: the count comes from the table, not double counted
+        assert ask() == ([{"n": 1}], False)
+        assert CacheService.memory.get("k") is not None
+
+
+class TestAdmissionBookkeeping:
+
+    def test_tinylfu_one_off_leaves_no_trace(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "tinylfu")
+        assert ask("once") == ([{"n": 1}], False)
+        assert cache_events.stats()["buffered"] == 0
+        assert all(q.lstrip().startswith("SELECT") for q in client.submitted)   # only the lookup
+
+    def test_tinylfu_admitted_result_is_compacted(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "tinylfu")
+        ask()
+        ask()                                    # second request reaches CACHE_ADMIT_MIN_FREQ
+        assert cache_events.flush() == 1         # just the result event
+        cache_events.compact()
+        assert table_row(client) == (CacheService.MAX_COUNT, '[{"n": 1}]')
+
+
+class TestDmlBookkeeping:
+
+    def test_dml_mode_keeps_original_statements(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        for _ in range(CacheService.MAX_COUNT):
+            ask()
+        assert any("MERGE" in q for q in client.submitted)
+        assert table_row(client) == (CacheService.MAX_COUNT, '[{"n": 1}]')
+        assert cache_events.stats()["buffered"] == 0
+
+
+class FakeInsertClient:
+    def __init__(self, errors=None, fail=False):
+        self.requests = []
+        self.errors = errors or (lambda rows: [])
+        self.fail = fail
+
+    def insert_rows_json(self, table, rows):
+        if self.fail:
+            raise ConnectionError("unreachable")
+        self.requests.append(rows)
+        return self.errors(rows)
+
+
+class TestFlushLimits:
+
+    @pytest.fixture
+    def log(self):
+        log = CacheEventLog("p", "cache", "cached_queries", max_count=CacheService.MAX_COUNT)
+        log._table_ready = True
+        return log
+
+    def result_event(self, key, size):
+        return {"intent_key": key, "sql": "SELECT 1", "event_type": "result", "result": "x" * size, "result_time": None}
+
+    def test_split_by_bytes_and_rows(self, log, monkeypatch):
+        monkeypatch.setattr(events_module, "CACHE_EVENT_MAX_REQUEST_BYTES", 10_000)
+        monkeypatch.setattr(events_module, "CACHE_EVENT_MAX_REQUEST_ROWS", 3)
+        client = FakeInsertClient()
+        monkeypatch.setattr(log, "_client", lambda: client)
+        log._buffer = [self.result_event("big", 4_000) for _ in range(3)] + [self.result_event("s", 10) for _ in range(4)]
+
+        assert log.flush() == 7
+        assert [len(r) for r in client.requests] == [2, 3, 2]
+        assert log.stats()["buffered"] == 0
+
+    def test_oversized_and_rejected_events_are_dropped(self, log, monkeypatch):
+        monkeypatch.setattr(events_module, "CACHE_EVENT_MAX_REQUEST_BYTES", 10_000)
+        bad_row = lambda rows: [
+            {"index": i, "errors": [{"reason": "invalid" if r["intent_key"] == "bad" else "stopped"}]}
+            for i, r in enumerate(rows)
+        ] if any(r["intent_key"] == "bad" for r in rows) else []
+        client = FakeInsertClient(bad_row)
+        monkeypatch.setattr(log, "_client", lambda: client)
+        log._buffer = [self.result_event("huge", 20_000), self.result_event("bad", 10), self.result_event("ok", 10)]
+
+        # the valid row stopped by the bad one is retried, on its own, in the next flush
+        assert log.flush() == 0
+        assert log.stats()["events_rejected"] == 2 and log.stats()["buffered"] == 1
+        assert log.flush() == 1
+        assert log.stats()["buffered"] == 0
+
+    def test_unreachable_keeps_events(self, log, monkeypatch):
+        monkeypatch.setattr(log, "_client", lambda: FakeInsertClient(fail=True))
+        log._buffer = [self.result_event("k", 10)]
+        assert log.flush() == 0
+        assert log.stats()["buffered"] == 1 and log.stats()["flush_failures"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,182 @@
+"""
+Unit tests for the hashed, clustered cache-key schema and its migration
+"""
+import pytest
+from datetime import datetime, timezone
+
+from backend import bq, bq_local
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.utils import cache, cache_keys
+from backend.flow_manager_agent.utils.cache import CacheService, cache_events
+from backend.flow_manager_agent.utils.cache_keys import key_hash, key_bucket, key_filter, key_params
+from backend.flow_manager_agent.utils.cache_migrate import migration_statements, migrate
+
+LONG_KEY = '{"intent": "analytics", "dimensions": ["media_source"], "filters": {"app_id": "app_id_2"}}' * 20
+
+
+class TestKeys:
+
+    def test_fixed_length_and_stable(self):
+        assert len(key_hash("k")) == len(key_hash(LONG_KEY)) == cache_keys.KEY_HASH_LENGTH
+        assert key_hash(LONG_KEY) == key_hash(LONG_KEY) != key_hash("k")
+
+    def test_bucket(self):
+        h = key_hash(LONG_KEY)
+        assert key_bucket(h, 0) is None
+        assert 0 <= key_bucket(h, 64) < 64
+        assert key_bucket(h, 64) == int(h[:8], 16) % 64
+
+    def test_filter_uses_hash_and_bucket(self, monkeypatch):
+        monkeypatch.setattr(cache_keys, "_has_key_hash", True)
+        assert key_filter() == "key_hash = @key_hash"
+        monkeypatch.setattr(cache_keys, "CACHE_KEY_BUCKETS", 16)
+        assert key_filter("T") == "T.key_hash = @key_hash AND T.key_bucket = @key_bucket"
+        assert {p.name for p in key_params("k")} == {"key", "key_hash", "key_bucket"}
+
+    def test_legacy_mode(self, monkeypatch):
+        monkeypatch.setattr(cache_keys, "_has_key_hash", True)
+        monkeypatch.setattr(cache_keys, "CACHE_KEY_SCHEMA", "legacy")
+        assert key_filter() == "intent_key = @key"
+        assert [p.name for p in key_params("k")] == ["key"]
+
+    def test_intent_key_until_the_schema_is_checked(self):
+        assert key_filter() == "intent_key = @key"
+
+
+class TestHashedTable:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        client = LocalBigQueryClient(rows=10, days=1)
+        monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+        monkeypatch.setattr(bq_local, "_local_client", client)
+        monkeypatch.setattr(bq, "_clients", {})
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        CacheService.memory.clear()
+        yield client
+        client.close()
+
+    def rows(self, client):
+        cur = client._conn.execute("SELECT key_hash, intent_key, use_count FROM cache__cached_queries")
+        return [tuple(r) for r in cur.fetchall()]
+
+    def test_dml_writes_and_reads_by_hash(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        cs = CacheService()
+        for _ in range(CacheService.MAX_COUNT):
+            cs.run_or_cache(intent_key=LONG_KEY, sql="SELECT 1", run_bigquery_fn=lambda s: [{"n": 1}])
+
+        assert self.rows(client) == [(key_hash(LONG_KEY), LONG_KEY, CacheService.MAX_COUNT)]
+        CacheService.memory.clear()
+        assert cs._load_entry(LONG_KEY)["use_count"] == CacheService.MAX_COUNT
+
+    def test_compaction_writes_hash(self, client):
+        # in the service the lookup (which checks the schema) always precedes the use event
+        assert cache_keys.resolve_schema(client, "practicode-2025.cache.cached_queries")
+        cache_events.record_use("k", "SELECT 1")
+        cache_events.flush()
+        assert cache_events.compact()
+        assert self.rows(client) == [(key_hash("k"), "k", 1)]
+
+    def test_collision_is_not_served(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        cs = CacheService()
+        cs._update_result(intent_key="a", sql="SELECT 1", payload="[]", now=datetime.now(timezone.utc))
+
+        monkeypatch.setattr(cache_keys, "key_hash", lambda key: key_hash("a"))
+        assert cs._load_entry("b") is None
+        assert cs._load_entry("a")["intent_key"] == "a"
+
+
+class TestUnmigratedTable:
+    """cached_queries as created before the hashed schema: no key_hash / key_bucket columns"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        client = LocalBigQueryClient(rows=10, days=1)
+        client._conn.execute("DROP TABLE cache__cached_queries")
+        client._conn.execute(
+            "CREATE TABLE cache__cached_queries "
+            "(intent_key TEXT, sql TEXT, result TEXT, last_updated BQTIMESTAMP, use_count INTEGER)"
+        )
+        monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+        monkeypatch.setattr(bq_local, "_local_client", client)
+        monkeypatch.setattr(bq, "_clients", {})
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        CacheService.memory.clear()
+        yield client
+        client.close()
+
+    def rows(self, client):
+        cur = client._conn.execute("SELECT intent_key, use_count FROM cache__cached_queries")
+        return [tuple(r) for r in cur.fetchall()]
+
+    @pytest.mark.parametrize("schema", ["auto", "hashed"])
+    def test_falls_back_to_intent_key(self, client, monkeypatch, schema):
+        monkeypatch.setattr(cache_keys, "CACHE_KEY_SCHEMA", schema)
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        cs = CacheService()
+        for _ in range(CacheService.MAX_COUNT):
+            rows, _ = cs.run_or_cache(intent_key=LONG_KEY, sql="SELECT 1", run_bigquery_fn=lambda s: [{"n": 1}])
+        assert rows == [{"n": 1}]
+
+        assert self.rows(client) == [(LONG_KEY, CacheService.MAX_COUNT)]
+        assert not cache_keys.hashed()
+        CacheService.memory.clear()
+        assert cs._load_entry(LONG_KEY)["use_count"] == CacheService.MAX_COUNT
+
+    def test_compaction(self, client):
+        assert not cache_keys.resolve_schema(client, "practicode-2025.cache.cached_queries")
+        cache_events.record_use("k", "SELECT 1")
+        cache_events.flush()
+        assert cache_events.compact()
+        assert self.rows(client) == [("k", 1)]
+
+
+class FakeClient:
+    def __init__(self, verify):
+        self.verify = verify
+        self.statements = []
+
+    def query(self, sql, job_config=None):
+        self.statements.append(" ".join(sql.split()))
+        client = self
+
+        class Job:
+            total_bytes_processed = 123
+            job_id, cache_hit, total_bytes_billed, slot_millis = "j", False, 0, 0
+            created = started = ended = None
+
+            def result(self):
+                return [client.verify] if "AS unhashed_rows" in sql else []
+
+        return Job()
+
+
+class TestMigration:
+
+    def test_statements_parse_as_bigquery(self):
+        sqlglot = pytest.importorskip("sqlglot")
+        steps = migration_statements("p", "cache", "cached_queries", buckets=16)
+        for name in ("copy", "backfill", "verify"):
+            sqlglot.parse_one(steps[name], read="bigquery")
+        assert "CLUSTER BY key_hash" in steps["create"]
+        assert "RANGE_BUCKET(key_bucket" in steps["create"]
+        assert "SUBSTR(TO_HEX(SHA256(intent_key)), 1, 32)" in steps["copy"]
+
+    def test_swap_only_after_verification(self):
+        ok = FakeClient({"source_keys": 5, "target_rows": 5, "unhashed_rows": 0})
+        report = migrate("p", "cache", "cached_queries", swap=True, client=ok)
+        assert report["steps"]["swap"] == "ok"
+        assert ok.statements[-1] == "ALTER TABLE `p.cache.cached_queries_hashed` RENAME TO `cached_queries`"
+
+        short = FakeClient({"source_keys": 5, "target_rows": 4, "unhashed_rows": 0})
+        report = migrate("p", "cache", "cached_queries", swap=True, client=short)
+        assert "swap" not in report["steps"]
+        assert not any("RENAME" in s for s in short.statements)
+
+    def test_dry_run_only_estimates(self):
+        client = FakeClient({})
+        report = migrate("p", "cache", "cached_queries", dry_run=True, client=client)
+        assert report["steps"]["copy"] == {"estimated_bytes": 123}
+        assert len(client.statements) == 1
@@ -0,0 +1,102 @@
+"""
+Unit tests for per-key cache statistics and cache introspection
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService, MemoryTier, cache_introspection, key_stats
+from backend.flow_manager_agent.utils.cache_backends import MemoryBackend
+from backend.flow_manager_agent.utils.cache_keystats import KeyStats
+
+
+class TestKeyStats:
+
+    def test_counts_per_key_and_totals(self):
+        ks = KeyStats()
+        ks.record("a", "misses")
+        ks.record("a", "memory_hits")
+        ks.record("a", "bigquery_hits", stale=True)
+        ks.record("b", "misses")
+        ks.record_size("a", 500)
+
+        stats = ks.stats(top_n=5)
+        assert (stats["requests"], stats["misses"], stats["stale_hits"]) == (4, 2, 1)
+        assert stats["hit_rate"] == 0.5
+
+        top = stats["top_by_requests"][0]
+        assert top["intent_key"] == "a" and top["requests"] == 3
+        assert top["hit_rate"] == pytest.approx(2 / 3)
+        assert [k["intent_key"] for k in stats["top_by_bytes"]] == ["a"]
+
+    def test_bounded_by_least_recently_requested(self):
+        ks = KeyStats(max_keys=2)
+        for key in ("a", "b", "a", "c"):
+            ks.record(key, "misses")
+
+        stats = ks.stats()
+        assert {k["intent_key"] for k in stats["top_by_requests"]} == {"a", "c"}
+        assert stats["dropped_keys"] == 1
+        assert stats["misses"] == 4  # totals stay exact
+
+
+class TestCacheIntrospection:
+
+    @pytest.fixture
+    def memory(self, monkeypatch):
+        tier = MemoryTier(max_bytes=10_000, max_entry_bytes=10_000, ttl=timedelta(seconds=300))
+        monkeypatch.setattr(CacheService, "memory", tier)
+        monkeypatch.setattr(cache, "CACHE_READ_THROUGH", False)
+        monkeypatch.setattr(cache, "CACHE_ADMISSION", "count")
+        return tier
+
+    def test_memory_ages_and_near_expiry(self, memory):
+        now = datetime.now(timezone.utc)
+        memory.put("fresh", rows=[], executed_sql="", last_updated=now, size=10)
+        memory.put("near", rows=[], executed_sql="", last_updated=now - timedelta(seconds=270), size=90)
+        memory.put("stale", rows=[], executed_sql="", last_updated=now - timedelta(seconds=400), size=10)
+
+        d = memory.describe(top_n=1, near_expiry=timedelta(seconds=60), now=now)
+        assert (d["entries"], d["near_expiry"], d["stale_entries"]) == (3, 1, 1)
+        assert d["largest"][0]["intent_key"] == "near"
+        assert d["age_seconds"]["max"] == 400
+
+    def test_run_or_cache_records_outcomes(self, memory):
+        cs = CacheService(backend=MemoryBackend())
+        cs._increment_use = lambda **_: CacheService.MAX_COUNT
+        cs._save_result = lambda **kw: cs._memory_put(
+            kw["intent_key"], rows=kw["rows"], sql=kw["sql"], last_updated=kw["now"], size=42, validity=None,
+        )
+
+        for _ in range(3):
+            cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=lambda s: [{"n": 1}])
+
+        keys = cache_introspection(top_n=5)["keys"]
+        assert (keys["misses"], keys["memory_hits"]) == (1, 2)
+        assert keys["top_by_bytes"][0]["bytes"] == 42
+        assert key_stats.top(1)[0]["intent_key"] == "k"
+
+
+class TestTableSummary:
+
+    def test_local_backend(self, monkeypatch):
+        from backend import bq, bq_local
+        from backend.bq_local import LocalBigQueryClient
+
+        client = LocalBigQueryClient(rows=10, days=1)
+        monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+        monkeypatch.setattr(bq_local, "_local_client", client)
+        monkeypatch.setattr(bq, "_clients", {})
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        try:
+            cs = CacheService()
+            old = datetime.now(timezone.utc) - timedelta(hours=1)
+            cs._save_result(intent_key="big", sql="SELECT 1", rows=[{"s": "x" * 100}], now=old)
+            cs._save_result(intent_key="small", sql="SELECT 2", rows=[{"s": "x"}], now=datetime.now(timezone.utc))
+
+            summary = cs.table_summary(top_n=1)
+            assert (summary["entries"], summary["with_result"], summary["past_ttl"]) == (2, 2, 1)
+            assert summary["largest"][0]["intent_key"] == "big"
+            assert summary["largest"][0]["age_seconds"] >= 3600 - 5
+        finally:
+            client.close()
@@ -0,0 +1,182 @@
+"""
+Unit tests for the in-process memory tier in front of the BigQuery cache table
+"""
+import asyncio
+import json
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService, MemoryTier, cache_stats
+from backend.flow_manager_agent.utils.cache_backends import MemoryBackend
+
+NOW = datetime.now(timezone.utc)
+
+
+def tier(max_bytes=100, ttl=300, grace=0):
+    return MemoryTier(
+        max_bytes=max_bytes, max_entry_bytes=60, ttl=timedelta(seconds=ttl), grace=timedelta(seconds=grace)
+    )
+
+
+def put(t, key, size=20, age=0):
+    t.put(key, rows=[{"k": key}], executed_sql="SELECT 1", last_updated=NOW - timedelta(seconds=age), size=size)
+
+
+class TestMemoryTier:
+
+    def test_hit_and_miss(self):
+        t = tier()
+        put(t, "a")
+        assert t.get("a", NOW)["rows"] == [{"k": "a"}]
+        assert t.get("b", NOW) is None
+        assert (t.stats()["hits"], t.stats()["misses"]) == (1, 1)
+
+    def test_expires_with_entry_ttl(self):
+        t = tier(ttl=300)
+        put(t, "a", age=299)
+        assert t.get("a", NOW + timedelta(seconds=2)) is None
+        assert t.stats()["expired"] == 1
+        assert t.stats()["entries"] == 0
+
+    def test_lru_eviction_by_bytes(self):
+        t = tier(max_bytes=50)
+        put(t, "a")
+        put(t, "b")
+        t.get("a", NOW)          # "b" is now least recently used
+        put(t, "c")
+        assert t.get("b", NOW) is None
+        assert t.get("a", NOW) is not None
+        assert t.stats()["evictions"] == 1
+
+    def test_expired_entries_go_before_lru(self):
+        t = tier(max_bytes=50, ttl=300)
+        put(t, "old", age=1000)
+        put(t, "a")
+        put(t, "b")
+        assert t.get("a", NOW) is not None
+        assert t.stats()["evictions"] == 0
+
+    def test_stale_within_grace(self):
+        t = tier(ttl=300, grace=100)
+        put(t, "a", age=350)
+        entry = t.get("a", NOW)
+        assert entry["stale"] and entry["rows"] == [{"k": "a"}]
+        assert t.get("a", NOW + timedelta(seconds=60)) is None
+        assert (t.stats()["stale_hits"], t.stats()["expired"]) == (1, 1)
+
+    def test_oversized_entry_rejected(self):
+        t = tier()
+        put(t, "big", size=500)
+        assert t.get("big", NOW) is None
+        assert t.stats()["rejected"] == 1
+
+
+class TestCacheServiceTiers:
+
+    @pytest.fixture
+    def cs(self, monkeypatch):
+        monkeypatch.setattr(CacheService, "memory", tier(max_bytes=10_000))
+        monkeypatch.setattr(cache, "_bq_tier_stats", {"hits": 0, "misses": 0})
+        service = CacheService(backend=MemoryBackend())
+        service._load_entry = Mock(return_value={
+            "intent_key": "k",
+            "sql": "SELECT 1",
+            "result": json.dumps([{"n": 1}]),
+            "last_updated": datetime.now(timezone.utc),
+            "use_count": CacheService.MAX_COUNT,
+        })
+        return service
+
+    def test_read_through_warms_memory(self, cs):
+        assert cs.get_valid_cached_result("k")["rows"] == [{"n": 1}]
+        assert cs.get_valid_cached_result("k")["rows"] == [{"n": 1}]
+        assert cs._load_entry.call_count == 1
+
+        stats = cache_stats()
+        assert stats["bigquery"]["hits"] == 1
+        assert stats["memory"]["hits"] == 1
+
+    def test_no_read_through(self, cs, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_READ_THROUGH", False)
+        assert cs.get_valid_cached_result("k") is None
+        cs._load_entry.assert_not_called()
+
+
+class TestStaleWhileRevalidate:
+
+    @pytest.fixture
+    def cs(self, monkeypatch):
+        monkeypatch.setattr(CacheService, "memory", tier(max_bytes=10_000, grace=600))
+        monkeypatch.setattr(cache, "CACHE_READ_THROUGH", False)
+        monkeypatch.setattr(cache, "_swr_stats", dict.fromkeys(cache._swr_stats, 0))
+        service = CacheService(backend=MemoryBackend())
+        service._save_result = Mock(side_effect=lambda intent_key, sql, rows, now, **_: CacheService.memory.put(
+            intent_key, rows=rows, executed_sql=sql, last_updated=now, size=10,
+        ))
+        CacheService.memory.put(
+            "k", rows=[{"n": "old"}], executed_sql="SELECT 1",
+            last_updated=datetime.now(timezone.utc) - timedelta(seconds=400), size=10,
+        )
+        return service
+
+    def wait_refreshed(self):
+        for _ in range(200):
+            if not cache._refreshing:
+                return
+            time.sleep(0.01)
+
+    def test_serves_stale_and_refreshes_once(self, cs):
+        calls = []
+
+        def runner(sql):
+            calls.append(sql)
+            time.sleep(0.05)
+            return [{"n": "new"}]
+
+        assert cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner) == ([{"n": "old"}], True)
+        assert cs.served_stale
+        # a second stale hit while the refresh runs doesn't start another one
+        cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner)
+        self.wait_refreshed()
+
+        assert len(calls) == 1
+        assert cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner) == ([{"n": "new"}], True)
+        assert not cs.served_stale
+        stats = cache_stats()["stale_while_revalidate"]
+        assert (stats["stale_served"], stats["refreshes"], stats["refresh_skipped"]) == (2, 1, 1)
+
+    def test_failed_refresh_keeps_stale_entry(self, cs):
+        def runner(sql):
+            raise RuntimeError("bq down")
+
+        cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner)
+        self.wait_refreshed()
+        assert cs.run_or_cache(intent_key="k", sql="SELECT 1", run_bigquery_fn=runner) == ([{"n": "old"}], True)
+        assert cache_stats()["stale_while_revalidate"]["refresh_failures"] >= 1
+
+    def test_async_refresh(self, cs):
+        async def runner(sql):
+            return [{"n": "new"}]
+
+        async def main():
+            first = await cs.run_or_cache_async(intent_key="k", sql="SELECT 1", run_bigquery_fn_async=runner)
+            stale = cs.served_stale
+            await asyncio.gather(*cache._refresh_tasks)
+            second = await cs.run_or_cache_async(intent_key="k", sql="SELECT 1", run_bigquery_fn_async=runner)
+            return first, stale, second
+
+        first, stale, second = asyncio.run(main())
+        assert first == ([{"n": "old"}], True) and stale
+        assert second == ([{"n": "new"}], True) and not cs.served_stale
+
+    def test_max_staleness_caps_grace(self, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_STALE_GRACE", timedelta(hours=2))
+        monkeypatch.setattr(cache, "CACHE_MAX_STALENESS", timedelta(minutes=30))
+        assert cache._stale_window(CacheService.TTL) == timedelta(minutes=25)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+"""
+Unit tests for cache warm-up of popular intents (startup + schedule)
+"""
+import asyncio
+import json
+
+from backend.flow_manager_agent.utils import cache_backends, cache_warmup
+from backend.flow_manager_agent.utils.cache import CacheService
+from backend.flow_manager_agent.utils.cache_warmup import CacheWarmer
+
+TARGETS = [{"intent_key": f"k{i}", "sql": f"SELECT {i}"} for i in range(6)]
+
+
+class FakeRunner:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, sql, intent_key=None):
+        self.calls.append(intent_key)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if intent_key in self.fail:
+            return {"status": "error", "message": "boom"}
+        return {"status": "ok", "from_cache": intent_key == "k0"}
+
+
+class TestCacheWarmer:
+
+    def test_replays_every_target_with_bounded_concurrency(self, monkeypatch):
+        monkeypatch.setattr(cache_warmup, "CACHE_WARMUP_CONCURRENCY", 2)
+        run = FakeRunner()
+        warmer = CacheWarmer(run, targets_fn=lambda: TARGETS, enabled=True)
+
+        summary = asyncio.run(warmer.warm_once())
+
+        assert sorted(run.calls) == [t["intent_key"] for t in TARGETS]
+        assert run.max_active == 2
+        assert (summary["cached"], summary["computed"], summary["failed"]) == (1, 5, 0)
+        assert warmer.status()["warm"] and warmer.state == "warm"
+
+    def test_replayed_keys_pass_admission(self):
+        asyncio.run(CacheWarmer(FakeRunner(), targets_fn=lambda: TARGETS[:1], enabled=True).warm_once())
+        assert CacheService.admission.sketch.estimate("k0") == 1
+
+    def test_too_many_failures_is_cold(self):
+        warmer = CacheWarmer(FakeRunner(fail={"k1", "k2"}), targets_fn=lambda: TARGETS, enabled=True)
+        summary = asyncio.run(warmer.warm_once())
+        assert summary["failed"] == 2
+        assert (warmer.warm, warmer.state) == (False, "cold")
+
+    def test_unreadable_hot_keys(self):
+        def broken():
+            raise RuntimeError("no table")
+
+        warmer = CacheWarmer(FakeRunner(), targets_fn=broken, enabled=True)
+        summary = asyncio.run(warmer.warm_once())
+        assert summary["error"] == "no table" and not warmer.warm
+
+    def test_configured_list_comes_first(self, tmp_path, monkeypatch):
+        path = tmp_path / "warm.json"
+        path.write_text(json.dumps(["SELECT 1", {"intent_key": "k1", "sql": "SELECT 1"}]))
+        monkeypatch.setattr(cache_warmup, "CACHE_WARMUP_FILE", str(path))
+        monkeypatch.setattr(cache_warmup, "CACHE_WARMUP_TOP_N", 2)
+        monkeypatch.setattr(cache_backends, "CACHE_BACKEND", "memory")
+        monkeypatch.setattr(CacheService, "hot_entries", lambda self, n: TARGETS[:n])
+
+        keys = [t.get("intent_key") for t in CacheWarmer.default_targets()]
+        assert keys == [None, "k1", "k0"]
+
+    def test_disabled_is_ready_and_never_runs(self):
+        warmer = CacheWarmer(FakeRunner(), targets_fn=lambda: TARGETS, enabled=False)
+        assert warmer.start() is None
+        assert warmer.status()["warm"] and warmer.state == "disabled"
+
+    def test_schedule_repeats_until_stopped(self, monkeypatch):
+        run = FakeRunner()
+        warmer = CacheWarmer(run, targets_fn=lambda: TARGETS[:1], enabled=True)
+
+        async def main():
+            task = asyncio.ensure_future(warmer.run_forever(interval=0.01))
+            await asyncio.sleep(0.1)
+            warmer._task = task
+            await warmer.stop()
+
+        asyncio.run(main())
+        assert warmer.passes >= 2
@@ -0,0 +1,93 @@
+"""
+Template insights (no LLM) for future dates, empty results and single totals, plus the per-turn LLM usage telemetry
+"""
+import pytest
+
+from backend.flow_manager_agent.sub_agents.response_insights_agent import templates
+from backend.flow_manager_agent.sub_agents.response_insights_agent.templates import (
+    FUTURE_TEXT, template_insights, template_stats,
+)
+from backend.flow_manager_agent.utils import llm_usage
+
+SCHEMA = {"summary", "table_profile", "insights", "next_steps", "presentation", "final_text"}
+DAY = {"start_date": "2025-10-25", "end_date": "2025-10-25"}
+
+
+def payload(status="ok", row_count=1, has_data=True, total_events=1234, is_future_date=False,
+            requested_date="2025-10-25"):
+    return {
+        "execution_result": {"status": status, "row_count": row_count, "executed_sql": "SELECT 1",
+                             "result": "", "truncated": False},
+        "requested_date": requested_date,
+        "is_future_date": is_future_date,
+        "has_data": has_data,
+        "extracted_values": {"total_events": total_events},
+    }
+
+
+def intent(dimensions=(), filters=None):
+    return {"intent": "analytics", "metric": "total_events", "dimensions": list(dimensions),
+            "filters": filters or {}, "date_range": DAY}
+
+
+class TestTemplates:
+
+    def test_future_date(self):
+        result = template_insights(payload(is_future_date=True, requested_date="2026-01-01"))
+        assert set(result) == SCHEMA
+        assert result["final_text"] == FUTURE_TEXT
+        assert result["presentation"]["show_table"] is False
+
+    def test_no_data(self):
+        result = template_insights(payload(row_count=0, has_data=False, total_events=None), [],
+                                   intent(filters={"app_id": "app_id_2"}))
+        assert set(result) == SCHEMA
+        assert result["summary"]["data_presence"] == "no_data"
+        assert "app_id=app_id_2" in result["final_text"]
+        assert result["next_steps"]["suggested_questions"]
+
+    def test_single_value(self):
+        result = template_insights(payload(), [{"total_events": 1234}], intent(filters={"media_source": "m_1"}))
+        assert set(result) == SCHEMA
+        assert "total_events: 1234" in result["presentation"]["sections"][0]["text"]
+        assert result["final_text"] == "There were 1,234 total_events for media_source=m_1 on 2025-10-25."
+        assert "media_source" not in result["next_steps"]["suggested_drilldowns"]
+        assert result["table_profile"]["numeric_columns"] == ["total_events"]
+
+    def test_single_labelled_row(self):
+        rows = [{"media_source": "m_7", "total_events": 99}]
+        result = template_insights(payload(total_events=99), rows, intent(dimensions=["media_source"]))
+        assert "(media_source=m_7)" in result["final_text"]
+        assert result["presentation"]["show_table"] is True
+
+    @pytest.mark.parametrize("p", [
+        payload(row_count=5),                       # breakdown -> LLM
+        payload(total_events=None),                 # retrieval without a total
+        payload(status="error"),
+    ])
+    def test_everything_else_goes_to_the_llm(self, p):
+        assert template_insights(p, [{"total_events": 1}] * (p["execution_result"]["row_count"] or 1)) is None
+
+    def test_stats(self):
+        templates.reset_stats()
+        template_insights(payload())
+        template_insights(payload(row_count=3))
+        stats = template_stats()
+        assert (stats["templated"], stats["llm"], stats["templated_share"]) == (1, 1, 0.5)
+        assert stats["by_case"] == {"single_value": 1}
+
+
+class TestLlmUsage:
+
+    def test_share_without_llm(self):
+        llm_usage.reset()
+        llm_usage.record_turn({"intent": "rules", "sql": "compiler", "insights": "template"})
+        llm_usage.record_turn({"intent": "rules", "sql": "compiler", "insights": "llm"})
+        llm_usage.record_turn({"intent": "llm", "clarifier": "llm"})
+        llm_usage.record_turn({"intent": "rules", "sql": "compiler", "insights": "template"})
+
+        stats = llm_usage.llm_usage_stats(recent=2)
+        assert (stats["turns"], stats["without_llm"], stats["without_llm_share"]) == (4, 2, 0.5)
+        assert stats["llm_calls_per_turn"] == 0.75
+        assert stats["stages"]["insights"] == {"template": 2, "llm": 1}
+        assert len(stats["recent"]) == 2
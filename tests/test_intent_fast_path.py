@@ -0,0 +1,102 @@
+"""
+Unit tests for the deterministic intent fast path (questions answered without the NLU LLM call)
+"""
+import pytest
+from datetime import date
+
+from backend.flow_manager_agent.sub_agents.intent_analyzer_agent import fast_path
+from backend.flow_manager_agent.sub_agents.intent_analyzer_agent.fast_path import fast_parse, fast_path_stats
+
+TODAY = date(2025, 10, 27)
+
+
+def parsed(message: str) -> dict:
+    result = fast_parse(message, TODAY)
+    assert result and result["status"] == "ok", result
+    return result["parsed_intent"]
+
+
+class TestFastPath:
+
+    @pytest.mark.parametrize("message", ["hi", "Hello!", "שלום", "בוקר טוב"])
+    def test_greetings(self, message):
+        assert fast_parse(message, TODAY) == {"status": "not_relevant", "message": fast_path.GREETING_MESSAGE}
+
+    @pytest.mark.parametrize("message", ["thanks", "Thank you!", "תודה רבה", "אלוף אתה"])
+    def test_thanks(self, message):
+        assert fast_parse(message, TODAY)["message"] == fast_path.THANKS_MESSAGE
+
+    def test_same_shape_as_the_llm(self):
+        assert parsed("how many clicks for media_source_90 on 25/10") == {
+            "intent": "analytics",
+            "metric": "total_events",
+            "dimensions": [],
+            "filters": {"media_source": "media_source_90"},
+            "invalid_fields": [],
+            "date_range": {"start_date": "2025-10-25", "end_date": "2025-10-25"},
+            "number_of_rows": None,
+            "row_selection": None,
+        }
+
+    @pytest.mark.parametrize("message, filters", [
+        ("clicks for app id 2 on 25/10", {"app_id": "app_id_2"}),
+        ("clicks for app_id 2 on 25/10", {"app_id": "app_id_2"}),
+        ("כמה קליקים היו לmedia source 10 ב-25/10?", {"media_source": "media_source_10"}),
+        ("total_events for partner 7 and site id 55 on 25/10", {"partner": "partner_7", "site_id": "site_id_55"}),
+    ])
+    def test_id_normalization(self, message, filters):
+        assert parsed(message)["filters"] == filters
+
+    @pytest.mark.parametrize("message, start, end", [
+        ("clicks yesterday", "2025-10-26", "2025-10-26"),
+        ("כמה אירועים היו שלשום", "2025-10-25", "2025-10-25"),
+        ("clicks on 24.10.2025", "2025-10-24", "2025-10-24"),
+        ("clicks on Oct 24", "2025-10-24", "2025-10-24"),
+        ("כמה קליקים ב-24 באוקטובר", "2025-10-24", "2025-10-24"),
+        ("כמה קליקים בין 24/10 ל-26/10", "2025-10-24", "2025-10-26"),
+        ("how many clicks between 24/10 and 26/10?", "2025-10-24", "2025-10-26"),
+        ("clicks 24/10 - 26/10", "2025-10-24", "2025-10-26"),
+        ("clicks from 24/10 until yesterday", "2025-10-24", "2025-10-26"),
+    ])
+    def test_dates(self, message, start, end):
+        assert parsed(message)["date_range"] == {"start_date": start, "end_date": end}
+
+    def test_single_dimension(self):
+        assert parsed("clicks per hour for app_id_2 today")["dimensions"] == ["hr"]
+        assert parsed("כמה קליקים לפי media source ב-26/10")["dimensions"] == ["media_source"]
+
+    def test_missing_date_and_future_date(self):
+        missing = fast_parse("clicks for app id 2", TODAY)
+        assert missing["status"] == "clarification_needed" and missing["missing_fields"] == ["date_range"]
+        assert missing["partial_intent"]["filters"] == {"app_id": "app_id_2"}
+        assert fast_parse("how many clicks on 30/10?", TODAY)["status"] == "error"
+
+    @pytest.mark.parametrize("message", [
+        "app_id 3",                                      # value only
+        "which media source had the most clicks?",       # ranking
+        "תן לי חריגות של אתמול",                          # anomaly
+        "show first 3 rows",                             # retrieval
+        "all clicks",                                    # wide query
+        "clicks by country yesterday",                   # invalid field
+        "clicks on android yesterday",                   # ambiguous entity
+        "clicks this week",                              # relative range
+        "clicks per day from 24/10 to 26/10",            # unsupported breakdown
+        "clicks by hour and by app on 25/10",            # two dimensions
+        "clicks on 32/10",                               # invalid date
+        "events 24/10 25/10",                            # two dates, no range
+        "how many clicks were there on 25/10 and 27/10", # two days, not the range between them
+        "כמה קליקים ב-25/10 ו-27/10",
+        "clicks on 24/10 ל-26/10",
+        "compare app id 2 and app id 3 yesterday",       # two values for one field
+        "אני עייפה",
+    ])
+    def test_defers_to_llm_when_not_confident(self, message):
+        assert fast_parse(message, TODAY) is None
+
+    def test_stats(self):
+        fast_path.reset_stats()
+        fast_parse("hi", TODAY)
+        fast_parse("show anomalies", TODAY)
+        stats = fast_path_stats()
+        assert (stats["calls"], stats["handled"], stats["deferred"]) == (2, 1, 1)
+        assert stats["by_status"] == {"not_relevant": 1} and stats["coverage"] == 0.5
@@ -0,0 +1,89 @@
+"""
+Unit tests for BigQuery job labels and the job statistics log
+"""
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from backend import bq, job_stats
+from backend.job_stats import job_labels, job_summary, record_job, recent_jobs, set_session
+
+T0 = datetime(2025, 10, 26, 12, 0, tzinfo=timezone.utc)
+
+
+def finished_job(job_id="adk_query_1", bytes_processed=1000, cache_hit=False):
+    return SimpleNamespace(
+        job_id=job_id,
+        created=T0,
+        started=T0 + timedelta(milliseconds=150),
+        ended=T0 + timedelta(milliseconds=1150),
+        total_bytes_processed=bytes_processed,
+        total_bytes_billed=bytes_processed,
+        slot_millis=42,
+        cache_hit=cache_hit,
+        labels={},
+        query="SELECT 1",
+        result=lambda page_size=None: [],
+    )
+
+
+class TestLabels:
+
+    def test_labels_are_sanitized(self):
+        token = set_session("Default Session#1")
+        try:
+            assert job_labels("adk_query") == {"query_type": "adk_query", "session": "default_session_1"}
+        finally:
+            job_stats.current_session.reset(token)
+
+    def test_no_session_label_outside_request(self):
+        assert job_labels("anomaly_spike") == {"query_type": "anomaly_spike"}
+
+
+class TestRecordJob:
+
+    def test_record_goes_to_ring_and_file(self):
+        record = record_job(finished_job(), "adk_query")
+
+        assert record["queue_ms"] == 150
+        assert record["run_ms"] == 1000
+        assert recent_jobs() == [record]
+        with open(job_stats.JOB_LOG_PATH, encoding="utf-8") as f:
+            assert json.loads(f.readline())["job_id"] == "adk_query_1"
+
+    def test_failed_submit_is_recorded(self):
+        record = record_job(None, "adk_query", "SELECT broken", error=RuntimeError("bad"))
+        assert record["status"] == "error"
+        assert record["total_bytes_processed"] == 0
+
+    def test_summary_by_query_type(self):
+        record_job(finished_job("a", 1000), "adk_query")
+        record_job(finished_job("b", 5000, cache_hit=True), "adk_query")
+        record_job(finished_job("c", 10), "cache_lookup")
+
+        summary = job_summary(top=1)
+        assert summary["jobs"] == 3
+        assert summary["by_query_type"]["adk_query"]["bytes_processed"] == 6000
+        assert summary["by_query_type"]["adk_query"]["cache_hits"] == 1
+        assert summary["most_expensive"][0]["job_id"] == "b"
+
+
+class TestExecuteQueryRecordsStats:
+
+    def test_job_labelled_and_recorded(self):
+        with patch.object(bq, "_load_credentials", return_value=(Mock(), "sa@test", "proj")), \
+             patch.object(bq, "get_bq_client") as mock_get:
+            raw = mock_get.return_value
+            raw.query.return_value = finished_job()
+
+            bq.BQClient().execute_query("SELECT 1", "anomaly_spike")
+
+        config = raw.query.call_args.kwargs["job_config"]
+        assert config.labels == {"query_type": "anomaly_spike"}
+        assert recent_jobs()[0]["query_type"] == "anomaly_spike"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,94 @@
+"""
+Unit tests for the dry-run cost guard
+"""
+import pytest
+from unittest.mock import Mock
+
+from backend.flow_manager_agent.utils import query_guard
+from backend.flow_manager_agent.utils.query_guard import (
+    QueryBudgetExceeded,
+    guard_query,
+    reroute_to_agg,
+)
+
+RAW_BY_MEDIA = """
+SELECT media_source, SUM(total_events) AS total_events
+FROM `practicode-2025.clicks_data_prac.partial_encoded_clicks_part`
+WHERE event_time >= TIMESTAMP('2025-10-24 00:00:00')
+  AND event_time <= TIMESTAMP('2025-10-24 23:59:59')
+GROUP BY media_source
+ORDER BY total_events DESC
+LIMIT 100
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_estimates():
+    query_guard._estimates.clear()
+    yield
+    query_guard._estimates.clear()
+
+
+def fake_bq(bytes_by_table):
+    bq = Mock()
+
+    def dry_run(sql):
+        for table, size in bytes_by_table.items():
+            if table in sql:
+                return size
+        return 0
+
+    bq.dry_run.side_effect = dry_run
+    return bq
+
+
+class TestReroute:
+
+    def test_raw_single_identifier_goes_to_agg(self):
+        sql = reroute_to_agg(RAW_BY_MEDIA)
+        assert "hourly_clicks_by_media_source" in sql
+        assert "event_date >= '2025-10-24'" in sql
+        assert "event_date <= '2025-10-24'" in sql
+        assert "event_time" not in sql
+
+    def test_unsupported_column_is_not_rerouted(self):
+        sql = RAW_BY_MEDIA.replace("GROUP BY media_source", "AND partner = 'x' GROUP BY media_source")
+        assert reroute_to_agg(sql) is None
+
+    def test_retrieval_is_not_rerouted(self):
+        sql = (
+            "SELECT event_time, media_source FROM "
+            "`practicode-2025.clicks_data_prac.partial_encoded_clicks_part` "
+            "ORDER BY event_time DESC LIMIT 10"
+        )
+        assert reroute_to_agg(sql) is None
+
+
+class TestGuard:
+
+    def test_under_budget(self):
+        bq = fake_bq({"partial_encoded_clicks_part": 100})
+        decision = guard_query(RAW_BY_MEDIA, max_bytes=1000, bq=bq)
+        assert decision["status"] == "ok"
+        assert decision["sql"] == RAW_BY_MEDIA
+
+    def test_over_budget_rerouted(self):
+        bq = fake_bq({"partial_encoded_clicks_part": 10_000, "hourly_clicks_by_media_source": 10})
+        decision = guard_query(RAW_BY_MEDIA, max_bytes=1000, bq=bq)
+        assert decision["status"] == "rerouted"
+        assert decision["estimated_bytes"] == 10
+
+    def test_over_budget_rejected(self):
+        bq = fake_bq({"partial_encoded_clicks_part": 10_000})
+        with pytest.raises(QueryBudgetExceeded):
+            guard_query(RAW_BY_MEDIA, max_bytes=1000, reroute=False, bq=bq)
+
+    def test_estimate_is_cached(self):
+        bq = fake_bq({"partial_encoded_clicks_part": 100})
+        guard_query(RAW_BY_MEDIA, max_bytes=1000, bq=bq)
+        guard_query("  " + RAW_BY_MEDIA, max_bytes=1000, bq=bq)
+        assert bq.dry_run.call_count == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+"""
+Unit tests for single-flight coalescing of identical concurrent queries
+"""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from backend.flow_manager_agent.utils import cache_backends
+from backend.flow_manager_agent.utils.single_flight import SingleFlight
+from backend.flow_manager_agent.sub_agents.query_executor_agent import agent as executor
+
+
+class TestSingleFlight:
+
+    def test_threads_share_one_call(self):
+        sf = SingleFlight()
+        calls = []
+        gate = threading.Event()
+
+        def slow():
+            calls.append(1)
+            gate.wait(2)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(sf.do("k", slow))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while sf.stats()["coalesced"] < 4:
+            time.sleep(0.01)
+        gate.set()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert sorted(r[1] for r in results) == [False, True, True, True, True]
+        assert {r[0] for r in results} == {42}
+        assert sf.stats()["in_flight"] == 0
+
+    def test_error_reaches_followers(self):
+        sf = SingleFlight()
+        gate = threading.Event()
+        errors = []
+
+        def failing():
+            gate.wait(2)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                sf.do("k", failing)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for t in threads:
+            t.start()
+        while sf.stats()["coalesced"] < 2:
+            time.sleep(0.01)
+        gate.set()
+        for t in threads:
+            t.join()
+        assert len(errors) == 3
+
+    def test_sequential_calls_are_not_coalesced(self):
+        sf = SingleFlight()
+        assert sf.do("k", lambda: 1) == (1, False)
+        assert sf.do("k", lambda: 2) == (2, False)
+        assert sf.stats()["coalesced"] == 0
+
+    def test_async_gather_shares_one_execution(self):
+        sf = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return "rows"
+
+        async def main():
+            return await asyncio.gather(*(sf.do_async("k", work) for _ in range(4)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert [shared for _, shared in results] == [False, True, True, True]
+        assert sf.stats()["coalesced_rate"] == 0.75
+
+    def test_async_cancel_of_one_waiter_keeps_work(self):
+        sf = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return 1
+
+        async def main():
+            first = asyncio.ensure_future(sf.do_async("k", work))
+            second = asyncio.ensure_future(sf.do_async("k", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(main()) == (1, True)
+
+    def test_async_cancel_of_all_waiters_cancels_work(self):
+        sf = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.2)
+            finished.append(1)
+
+        async def main():
+            callers = [asyncio.ensure_future(sf.do_async("k", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for c in callers:
+                c.cancel()
+            await asyncio.sleep(0.3)
+
+        asyncio.run(main())
+        assert finished == []
+        assert sf.stats()["in_flight"] == 0
+
+
+class TestExecutorCoalescing:
+
+    def test_concurrent_async_requests_run_once(self, monkeypatch):
+        monkeypatch.setattr(executor, "_flights", SingleFlight())
+        monkeypatch.setattr(cache_backends, "CACHE_BACKEND", "memory")
+        runs = []
+
+        async def fake_run_or_cache_async(self, intent_key, sql, run_bigquery_fn_async, json_safe=False, **_):
+            runs.append(intent_key)
+            await asyncio.sleep(0.02)
+            return [{"n": 1}], False
+
+        async def main():
+            return await asyncio.gather(*(executor.run_bigquery_async("SELECT 1") for _ in range(3)))
+
+        with patch.object(executor.CacheService, "run_or_cache_async", fake_run_or_cache_async):
+            results = asyncio.run(main())
+
+        assert len(runs) == 1
+        assert all(r["status"] == "ok" and r["rows"] == [{"n": 1}] for r in results)
+        assert [r["coalesced"] for r in results] == [False, True, True]
+        assert executor.single_flight_stats()["coalesced"] == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,227 @@
+"""
+Unit tests for cache validity tied to source-table partition modification times
+"""
+import pytest
+from datetime import date, datetime, timedelta, timezone
+
+pytest.importorskip("sqlglot")
+
+from backend import bq, bq_local
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService, source_versions
+from backend.flow_manager_agent.utils.source_versions import SourceVersions, source_dependencies
+
+DATASET = "practicode-2025.clicks_data_prac"
+RAW = f"{DATASET}.partial_encoded_clicks_part"
+AGG = f"{DATASET}.hourly_clicks_by_media_source"
+
+T0 = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+def agg_sql(day):
+    return f"SELECT media_source, SUM(total_events) AS t FROM `{AGG}` WHERE event_date = '{day}' GROUP BY media_source"
+
+
+class TestDependencies:
+
+    def test_date_range_from_partition_filters(self):
+        deps = source_dependencies(
+            f"SELECT COUNT(*) FROM `{RAW}` WHERE event_time >= TIMESTAMP('2025-10-24 00:00:00') "
+            f"AND event_time < TIMESTAMP('2025-10-25 00:00:00')"
+        )
+        assert (RAW, (date(2025, 10, 24), date(2025, 10, 25))) in deps
+        # the guard may answer from an agg table: those count as sources too
+        assert {t for t, _ in deps} >= {RAW, AGG}
+
+    def test_between_on_event_date(self):
+        assert source_dependencies(
+            f"SELECT * FROM `{AGG}` WHERE event_date BETWEEN '2025-10-24' AND '2025-10-26'"
+        ) == ((AGG, (date(2025, 10, 24), date(2025, 10, 26))),)
+
+    def test_or_depends_on_whole_table(self):
+        assert source_dependencies(
+            f"SELECT * FROM `{AGG}` WHERE event_date = '2025-10-24' OR hr = 3"
+        ) == ((AGG, None),)
+
+    @pytest.mark.parametrize("sql", [
+        f"SELECT * FROM `{AGG}` WHERE event_date = CURRENT_DATE()",
+        "SELECT * FROM `other-project.ds.t`",
+        "SELECT 1",
+    ])
+    def test_untrackable(self, sql):
+        assert source_dependencies(sql) is None
+
+    @pytest.mark.parametrize("sql", [
+        # a partition column outside the WHERE, or not as a top-level bound, doesn't narrow the range
+        f"SELECT SUM(IF(event_date = '2025-10-25', total_events, 0)), SUM(total_events) FROM `{AGG}`",
+        f"SELECT SUM(total_events) FROM `{AGG}` WHERE NOT event_date = '2025-10-25'",
+        f"SELECT SUM(total_events) FROM `{AGG}` WHERE event_date != '2025-10-25'",
+        f"SELECT SUM(total_events) FROM `{AGG}` WHERE event_date = '2025-10-25' "
+        f"AND hr = IF(event_date = '2025-10-24', 1, 2)",
+        f"SELECT event_date, SUM(total_events) FROM `{AGG}` WHERE event_date >= '2025-10-25' GROUP BY event_date",
+        f"SELECT SUM(total_events) FROM `{AGG}` WHERE event_date <= DATE_ADD('2025-10-20', INTERVAL 9 DAY)",
+    ])
+    def test_only_top_level_where_bounds(self, sql):
+        assert source_dependencies(sql) == ((AGG, None),)
+
+    def test_nested_conjuncts(self):
+        assert source_dependencies(
+            f"SELECT SUM(total_events) FROM `{AGG}` "
+            f"WHERE (event_date >= DATE '2025-10-24' AND hr = 3) AND (event_date <= '2025-10-25')"
+        ) == ((AGG, (date(2025, 10, 24), date(2025, 10, 25))),)
+
+    def test_cte_names_are_not_tables(self):
+        deps = source_dependencies(f"WITH x AS (SELECT * FROM `{AGG}`) SELECT * FROM x")
+        assert deps == ((AGG, None),)
+
+
+class FakeMetadata:
+    def __init__(self):
+        self.partitions = {"20251024": T0, "20251025": T0}
+
+    def execute_query(self, sql, query_type):
+        return [
+            {"table_name": "hourly_clicks_by_media_source", "partition_id": pid, "last_modified_time": ts}
+            for pid, ts in self.partitions.items()
+        ]
+
+
+class TestSourceVersions:
+
+    @pytest.fixture
+    def tracker(self):
+        meta = FakeMetadata()
+        sv = SourceVersions(bq=meta)
+        sv.meta = meta
+        return sv
+
+    def test_unknown_until_polled(self, tracker):
+        computed = T0 + timedelta(hours=1)
+        assert tracker.validity(agg_sql("2025-10-24"), computed) is None
+        tracker.poll()
+        assert tracker.validity(agg_sql("2025-10-24"), computed) == "valid"
+        assert tracker.validity(agg_sql("2025-10-24"), T0 - timedelta(hours=1)) == "changed"
+
+    def test_backfill_invalidates_only_dependents(self, tracker):
+        invalidated = []
+        tracker.on_invalidate(invalidated.append)
+        tracker.register("day24", agg_sql("2025-10-24"))
+        tracker.register("day25", agg_sql("2025-10-25"))
+        tracker.register("all", f"SELECT COUNT(*) FROM `{AGG}`")
+        tracker.poll()
+
+        tracker.meta.partitions["20251024"] = T0 + timedelta(days=1)
+        changed = tracker.poll()
+
+        assert changed == [(AGG, "20251024")]
+        assert sorted(invalidated) == ["all", "day24"]
+        computed = T0 + timedelta(hours=1)
+        assert tracker.validity(agg_sql("2025-10-25"), computed) == "valid"
+        assert tracker.validity(agg_sql("2025-10-24"), computed) == "changed"
+
+    def test_new_partition_is_a_change(self, tracker):
+        invalidated = []
+        tracker.on_invalidate(invalidated.append)
+        tracker.register("day26", agg_sql("2025-10-26"))
+        tracker.poll()
+        tracker.meta.partitions["20251026"] = T0 + timedelta(days=1)
+        tracker.poll()
+        assert invalidated == ["day26"]
+
+    def test_forgotten_entries_are_not_tracked(self, tracker):
+        invalidated = []
+        tracker.on_invalidate(invalidated.append)
+        tracker.register("day24", agg_sql("2025-10-24"))
+        tracker.poll()
+        tracker.forget("day24")
+        assert tracker.stats()["tracked_entries"] == 0
+
+        tracker.meta.partitions["20251024"] = T0 + timedelta(days=1)
+        tracker.poll()
+        assert invalidated == []
+
+    def test_failed_poll_goes_stale(self, tracker, monkeypatch):
+        monkeypatch.setattr("backend.flow_manager_agent.utils.source_versions.CACHE_SOURCE_STALE_AFTER", 0)
+        tracker.poll()
+        assert tracker.validity(agg_sql("2025-10-24"), T0 + timedelta(hours=1)) is None
+
+
+class TestCacheSourceValidity:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        client = LocalBigQueryClient(rows=200, days=2)
+        monkeypatch.setattr(bq, "BQ_BACKEND", "local")
+        monkeypatch.setattr(bq_local, "_local_client", client)
+        monkeypatch.setattr(bq, "_clients", {})
+        monkeypatch.setattr(cache, "CACHE_BOOKKEEPING", "dml")
+        CacheService.memory.clear()
+        for table in bq_local.AGG_SOURCES:
+            client.mark_modified(table, when=datetime.now(timezone.utc) - timedelta(hours=2))
+        client.mark_modified(bq_local.RAW_TABLE, when=datetime.now(timezone.utc) - timedelta(hours=2))
+        yield client
+        client.close()
+
+    def ask(self, day):
+        sql = agg_sql(day)
+        return CacheService().run_or_cache(intent_key=day, sql=sql, run_bigquery_fn=lambda s: [{"day": day}])
+
+    def age_entries(self, client, hours=1):
+        old = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+        client._conn.execute("UPDATE cache__cached_queries SET last_updated = ?", (old,))
+        client._conn.commit()
+        CacheService.memory.clear()
+
+    def test_unchanged_sources_outlive_the_ttl(self, client):
+        for _ in range(2):
+            self.ask("2025-10-24")
+        source_versions.poll()
+        self.age_entries(client)
+
+        assert self.ask("2025-10-24") == ([{"day": "2025-10-24"}], True)
+
+    def test_backfill_invalidates_dependent_entries(self, client):
+        for day in ("2025-10-24", "2025-10-25"):
+            self.ask(day)
+            self.ask(day)
+        source_versions.poll()
+        self.age_entries(client)
+        for day in ("2025-10-24", "2025-10-25"):
+            assert self.ask(day)[1]        # back in memory, source-bound
+
+        client.mark_modified(f"{AGG}", partition_id="20251024")
+        source_versions.poll()
+
+        assert self.ask("2025-10-24")[1] is False
+        assert self.ask("2025-10-25")[1] is True
+
+    def test_evicted_entries_stop_being_tracked(self, client, monkeypatch):
+        for day in ("2025-10-24", "2025-10-25"):
+            self.ask(day)
+            self.ask(day)
+        source_versions.poll()
+        self.age_entries(client)
+        for day in ("2025-10-24", "2025-10-25"):
+            self.ask(day)
+        assert source_versions.stats()["tracked_entries"] == 2
+
+        # one more entry doesn't fit: the least recently used one is evicted, and so is its dependency
+        monkeypatch.setattr(CacheService.memory, "max_bytes", CacheService.memory.stats()["bytes"] - 1)
+        CacheService.memory.put("k", rows=[], executed_sql="", last_updated=datetime.now(timezone.utc), size=0)
+        assert source_versions.stats()["tracked_entries"] == 1
+        CacheService.memory.clear()
+        assert source_versions.stats()["tracked_entries"] == 0
+
+    def test_ttl_mode_unchanged(self, client, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_VALIDITY", "ttl")
+        monkeypatch.setattr(cache, "CACHE_STALE_GRACE", timedelta(0))
+        for _ in range(2):
+            self.ask("2025-10-24")
+        source_versions.poll()
+        self.age_entries(client)
+        assert self.ask("2025-10-24")[1] is False
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
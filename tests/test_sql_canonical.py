@@ -0,0 +1,74 @@
+"""
+Unit tests for SQL canonicalization
+"""
+import pytest
+
+from backend.flow_manager_agent.utils.sql_canonical import canonicalize_sql, canonical_key
+
+pytest.importorskip("sqlglot")
+
+BUILDER_SQL = """
+SELECT media_source, SUM(total_events) AS total_events
+FROM `practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`
+WHERE event_date BETWEEN '2025-10-24' AND '2025-10-24' AND hr = 3
+GROUP BY media_source
+ORDER BY total_events DESC
+LIMIT 100
+"""
+
+
+class TestCanonicalizeSQL:
+    """Equivalent SQL variants must share one canonical text and key"""
+
+    @pytest.mark.parametrize("variant", [
+        # casing of keywords, functions, columns and aliases
+        """select Media_Source, sum(TOTAL_EVENTS) as Total_Events
+           from `practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`
+           where event_date between '2025-10-24' and '2025-10-24' and HR = 3
+           group by media_source order by total_events desc limit 100""",
+        # predicate order + literal on the left
+        """SELECT media_source, SUM(total_events) AS total_events
+           FROM `practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`
+           WHERE 3 = hr AND event_date BETWEEN '2025-10-24' AND '2025-10-24'
+           GROUP BY media_source ORDER BY total_events DESC LIMIT 100""",
+        # BETWEEN vs >= / <=, no backticks, trailing semicolon
+        """SELECT media_source, SUM(total_events) AS total_events
+           FROM practicode-2025.clicks_data_prac.hourly_clicks_by_media_source
+           WHERE event_date >= '2025-10-24' AND event_date <= '2025-10-24' AND hr = 3
+           GROUP BY media_source ORDER BY total_events DESC LIMIT 100;""",
+    ])
+    def test_variants_share_key(self, variant):
+        base_sql, base_key = canonicalize_sql(BUILDER_SQL)
+        sql, key = canonicalize_sql(variant)
+        assert key == base_key
+        assert sql.lower() == base_sql.lower()
+
+    def test_output_names_keep_their_case(self):
+        sql, key = canonicalize_sql(
+            "select Media_Source, sum(TOTAL_EVENTS) as TotalClicks, `Hr` from `p.d.T` "
+            "where HR = 3 group by media_source, hr order by totalclicks"
+        )
+        assert sql.startswith("SELECT Media_Source, SUM(total_events) AS TotalClicks, `Hr` FROM `p.d.T`")
+        assert "WHERE hr = 3 GROUP BY media_source, hr ORDER BY totalclicks" in sql
+        assert key == canonical_key(
+            "SELECT media_source, SUM(total_events) AS totalclicks, hr FROM `p.d.T` "
+            "WHERE hr = 3 GROUP BY media_source, hr ORDER BY totalclicks"
+        )
+
+    def test_different_filters_differ(self):
+        other = BUILDER_SQL.replace("hr = 3", "hr = 4")
+        assert canonical_key(other) != canonical_key(BUILDER_SQL)
+
+    def test_table_name_case_is_kept(self):
+        sql, _ = canonicalize_sql(BUILDER_SQL)
+        assert "`practicode-2025.clicks_data_prac.hourly_clicks_by_media_source`" in sql
+
+    def test_unparsable_sql_is_returned_as_is(self):
+        raw = "-- only a comment\nSELECT FROM WHERE"
+        sql, key = canonicalize_sql(raw)
+        assert sql == raw
+        assert len(key) == 64
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,129 @@
+"""
+Golden tests for the deterministic SQL compiler (parsed_intent -> built_query, same rules as the builder prompt)
+"""
+import pytest
+
+from backend.bq_local import LocalBigQueryClient
+from backend.flow_manager_agent.sub_agents.protected_query_builder_agent import compiler
+from backend.flow_manager_agent.sub_agents.protected_query_builder_agent.compiler import compile_query, compiler_stats
+from backend.flow_manager_agent.utils.subsumption import rollup_shape
+
+RAW = "practicode-2025.clicks_data_prac.partial_encoded_clicks_part"
+BY_APP = "practicode-2025.clicks_data_prac.hourly_clicks_by_app"
+BY_MEDIA = "practicode-2025.clicks_data_prac.hourly_clicks_by_media_source"
+DAY = {"start_date": "2025-10-24", "end_date": "2025-10-24"}
+RAW_DAY = "event_time >= TIMESTAMP('2025-10-24 00:00:00')\n  AND event_time <= TIMESTAMP('2025-10-24 23:59:59')"
+
+
+def intent(intent="analytics", dimensions=(), filters=None, date_range=DAY, **extra):
+    return {
+        "intent": intent, "metric": "total_events", "dimensions": list(dimensions), "filters": filters or {},
+        "invalid_fields": [], "date_range": date_range, "number_of_rows": None, "row_selection": None, **extra,
+    }
+
+
+GOLDEN = {
+    "total_raw": (
+        intent(),
+        f"SELECT SUM(total_events) AS total_events\nFROM `{RAW}`\nWHERE {RAW_DAY}",
+    ),
+    "single_identifier_uses_agg": (
+        intent(filters={"media_source": "media_source_90"}),
+        f"SELECT SUM(total_events) AS total_events\nFROM `{BY_MEDIA}`\n"
+        f"WHERE event_date BETWEEN '2025-10-24' AND '2025-10-24'\n  AND media_source = 'media_source_90'",
+    ),
+    "single_identifier_without_date_is_raw": (
+        intent(filters={"app_id": "app_id_2"}, date_range=None),
+        f"SELECT SUM(total_events) AS total_events\nFROM `{RAW}`\nWHERE app_id = 'app_id_2'",
+    ),
+    "breakdown_uses_agg": (
+        intent(dimensions=["app_id"], date_range={"start_date": "2025-10-24", "end_date": "2025-10-26"}),
+        f"SELECT app_id, SUM(total_events) AS total_events\nFROM `{BY_APP}`\n"
+        f"WHERE event_date BETWEEN '2025-10-24' AND '2025-10-26'\n"
+        f"GROUP BY app_id\nORDER BY total_events DESC\nLIMIT 100",
+    ),
+    "unsupported_filter_falls_back_to_raw": (
+        intent(dimensions=["app_id"], filters={"partner": "ironSource"}),
+        f"SELECT app_id, SUM(total_events) AS total_events\nFROM `{RAW}`\n"
+        f"WHERE {RAW_DAY}\n  AND partner = 'ironSource'\n"
+        f"GROUP BY app_id\nORDER BY total_events DESC\nLIMIT 100",
+    ),
+    "hour_breakdown_with_identifier": (
+        intent(dimensions=["hr"], filters={"app_id": "app_id_2"}),
+        f"SELECT hr, SUM(total_events) AS total_events\nFROM `{BY_APP}`\n"
+        f"WHERE event_date BETWEEN '2025-10-24' AND '2025-10-24'\n  AND app_id = 'app_id_2'\n"
+        f"GROUP BY hr\nORDER BY total_events DESC\nLIMIT 100",
+    ),
+    "typed_literals": (
+        intent(filters={"hr": "3", "is_retargeting": "true", "engagement_type": "o'brien"}),
+        f"SELECT SUM(total_events) AS total_events\nFROM `{RAW}`\n"
+        f"WHERE {RAW_DAY}\n  AND hr = 3\n  AND is_retargeting = TRUE\n  AND engagement_type = 'o\\'brien'",
+    ),
+    "find_top": (
+        intent("find top", dimensions=["media_source"]),
+        f"WITH agg AS (\n  SELECT media_source, SUM(total_events) AS total_events\n  FROM `{BY_MEDIA}`\n"
+        f"  WHERE event_date BETWEEN '2025-10-24' AND '2025-10-24'\n  GROUP BY media_source\n)\n"
+        f"SELECT *\nFROM agg\nWHERE total_events = (SELECT MAX(total_events) FROM agg)\nORDER BY total_events DESC",
+    ),
+    "find_bottom_hour_without_date": (
+        intent("find bottom", dimensions=["hr"], date_range=None),
+        f"WITH agg AS (\n  SELECT hr, SUM(total_events) AS total_events\n  FROM `{RAW}`\n  GROUP BY hr\n)\n"
+        f"SELECT *\nFROM agg\nWHERE total_events = (SELECT MIN(total_events) FROM agg)\nORDER BY total_events DESC",
+    ),
+    "retrieval": (
+        intent("retrieval", metric=None, date_range=None, number_of_rows=10, row_selection="first"),
+        f"SELECT event_time, hr, is_engaged_view, is_retargeting, media_source, partner, app_id, site_id, "
+        f"engagement_type, total_events\nFROM `{RAW}`\nORDER BY event_time DESC\nLIMIT 10",
+    ),
+}
+
+
+class TestGolden:
+
+    @pytest.mark.parametrize("name", GOLDEN)
+    def test_sql(self, name):
+        parsed_intent, sql = GOLDEN[name]
+        assert compile_query(parsed_intent) == {
+            "status": "ok", "sql": sql, "clarification_questions": [], "invalid_fields": [], "message": "",
+        }
+
+    def test_runs_on_local_backend(self):
+        client = LocalBigQueryClient(rows=200, days=3)
+        try:
+            for parsed_intent, sql in GOLDEN.values():
+                assert isinstance(list(client.query(sql).result()), list)
+        finally:
+            client.close()
+
+    def test_breakdowns_are_recognised_for_rollups(self):
+        parsed_intent, sql = GOLDEN["unsupported_filter_falls_back_to_raw"]
+        assert rollup_shape(sql)["dims"] == ["app_id"]
+
+
+class TestErrorsAndFallback:
+
+    def test_builder_errors(self):
+        assert compile_query(intent(invalid_fields=["country"]))["status"] == "invalid_fields"
+        assert compile_query(intent(metric=None))["message"] == "No metrics provided."
+        assert compile_query(intent("find top"))["status"] == "error"
+
+    @pytest.mark.parametrize("parsed_intent", [
+        intent("anomaly"),
+        intent(metric="ctr"),
+        intent(dimensions=["country"]),
+        intent(filters={"hr": "night"}),
+        intent(filters={"app_id": ["app_id_1", "app_id_2"]}),
+        intent(date_range={"start_date": "2025-10-24"}),
+        intent(date_range={"start_date": "2025-10-26", "end_date": "2025-10-24"}),
+        intent("retrieval", number_of_rows=None),
+        None,
+    ])
+    def test_uncovered_shapes_go_to_the_llm(self, parsed_intent):
+        assert compile_query(parsed_intent) is None
+
+    def test_stats(self):
+        compiler.reset_stats()
+        compile_query(intent())
+        compile_query(intent("anomaly"))
+        stats = compiler_stats()
+        assert (stats["compiled"], stats["fallback"], stats["coverage"]) == (1, 1, 0.5)
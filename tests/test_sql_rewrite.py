@@ -0,0 +1,149 @@
+"""
+Unit tests for the partition-pruning SQL rewriter
+"""
+import pytest
+from datetime import date
+from unittest.mock import Mock
+
+from backend.flow_manager_agent.utils import query_guard, sql_rewrite
+from backend.flow_manager_agent.utils.sql_rewrite import (
+    latest_partitions_lower_bound,
+    prune_stage,
+    rewrite_for_pruning,
+)
+
+pytest.importorskip("sqlglot")
+
+RAW = "`practicode-2025.clicks_data_prac.partial_encoded_clicks_part`"
+
+
+class TestPartitionPredicates:
+
+    @pytest.mark.parametrize("predicate, expected", [
+        ("DATE(event_time) = '2025-10-24'",
+         "event_time >= TIMESTAMP('2025-10-24') AND event_time < TIMESTAMP('2025-10-25')"),
+        ("DATE(event_time) = DATE('2025-10-24')",
+         "event_time >= TIMESTAMP('2025-10-24') AND event_time < TIMESTAMP('2025-10-25')"),
+        ("DATE(event_time) > '2025-10-24'", "event_time >= TIMESTAMP('2025-10-25')"),
+        ("DATE(event_time) <= '2025-10-24'", "event_time < TIMESTAMP('2025-10-25')"),
+        ("'2025-10-24' > DATE(event_time)", "event_time < TIMESTAMP('2025-10-24')"),
+        ("DATE(event_time) BETWEEN DATE '2025-10-24' AND DATE '2025-10-26'",
+         "event_time >= TIMESTAMP('2025-10-24') AND event_time < TIMESTAMP('2025-10-27')"),
+        ("DATE(event_time) IN ('2025-10-24', '2025-10-25')",
+         "event_time >= TIMESTAMP('2025-10-24') AND event_time < TIMESTAMP('2025-10-26')"),
+    ])
+    def test_rewritten_to_timestamp_range(self, predicate, expected):
+        sql = rewrite_for_pruning(f"SELECT hr FROM {RAW} WHERE {predicate}")
+        assert "DATE(event_time)" not in sql
+        assert expected in sql
+
+    def test_non_contiguous_in_becomes_or(self):
+        sql = rewrite_for_pruning(
+            f"SELECT hr FROM {RAW} WHERE DATE(event_time) IN ('2025-10-24', '2025-10-26') AND hr = 1"
+        )
+        assert "(event_time >= TIMESTAMP('2025-10-24') AND event_time < TIMESTAMP('2025-10-25')) OR" in sql
+        assert sql.endswith("AND hr = 1")
+
+    def test_projection_is_left_alone(self):
+        sql = f"SELECT DATE(event_time) AS d, hr FROM {RAW} GROUP BY d, hr"
+        assert rewrite_for_pruning(sql) == sql
+
+    def test_untouched_sql_is_returned_verbatim(self):
+        sql = f"SELECT hr FROM {RAW}\nWHERE event_time >= TIMESTAMP('2025-10-24 00:00:00')"
+        assert rewrite_for_pruning(sql) is sql
+
+
+class TestRetrievalBound:
+
+    RETRIEVAL = f"SELECT event_time, media_source FROM {RAW} ORDER BY event_time DESC LIMIT 10"
+
+    def test_bound_added_from_partition_metadata(self):
+        bound_fn = Mock(return_value=date(2025, 10, 26))
+        sql = rewrite_for_pruning(self.RETRIEVAL, bound_fn)
+        bound_fn.assert_called_once_with(10)
+        assert "WHERE event_time >= TIMESTAMP('2025-10-26') ORDER BY" in sql
+
+    def test_no_bound_when_filtered(self):
+        sql = self.RETRIEVAL.replace("ORDER BY", "WHERE hr = 3 ORDER BY")
+        assert rewrite_for_pruning(sql, Mock(return_value=date(2025, 10, 26))) == sql
+
+    def test_no_bound_when_metadata_unavailable(self):
+        assert rewrite_for_pruning(self.RETRIEVAL, Mock(return_value=None)) == self.RETRIEVAL
+
+
+class TestColumnPruning:
+
+    def test_star_cte_reads_only_used_columns(self):
+        sql = rewrite_for_pruning(
+            f"WITH base AS (SELECT * FROM {RAW}) "
+            "SELECT media_source, SUM(total_events) AS t FROM base GROUP BY media_source"
+        )
+        assert "WITH base AS (SELECT media_source, total_events FROM" in sql
+
+    def test_star_read_back_keeps_all_columns(self):
+        sql = f"WITH base AS (SELECT * FROM {RAW}) SELECT * FROM base"
+        assert rewrite_for_pruning(sql) == sql
+
+
+class TestPartitionMetadata:
+
+    @pytest.fixture(autouse=True)
+    def clear_partitions(self):
+        sql_rewrite._partitions_cache.clear()
+        yield
+        sql_rewrite._partitions_cache.clear()
+
+    def fake_bq(self, partitions):
+        bq = Mock()
+        bq.execute_query.return_value = [
+            {"partition_id": pid, "total_rows": rows} for pid, rows in partitions
+        ]
+        return bq
+
+    def test_accumulates_newest_partitions(self):
+        bq = self.fake_bq([("20251026", 4), ("20251025", 4), ("20251024", 100)])
+        assert latest_partitions_lower_bound(6, bq) == date(2025, 10, 25)
+        # metadata is cached
+        latest_partitions_lower_bound(6, bq)
+        assert bq.execute_query.call_count == 1
+
+    def test_streaming_rows_disable_bound(self):
+        bq = self.fake_bq([("__STREAMING_UNPARTITIONED__", 5), ("20251026", 100)])
+        assert latest_partitions_lower_bound(10, bq) is None
+
+    def test_not_enough_rows(self):
+        assert latest_partitions_lower_bound(10, self.fake_bq([("20251026", 3)])) is None
+
+
+class TestPruneStage:
+
+    SQL = f"SELECT COUNT(*) FROM {RAW} WHERE DATE(event_time) = '2025-10-24'"
+
+    @pytest.fixture(autouse=True)
+    def clear_estimates(self):
+        query_guard._estimates.clear()
+        yield
+        query_guard._estimates.clear()
+
+    def test_logged_bytes_reuse_the_guard_estimates(self, caplog):
+        bq = Mock()
+        bq.dry_run.side_effect = [10, 100]
+        with caplog.at_level("INFO", logger=sql_rewrite.__name__):
+            rewritten = prune_stage(self.SQL, bq)
+        assert "100 -> 10 bytes (90 saved)" in caplog.text
+        # the guard's estimate of the rewritten SQL is the one already logged
+        assert query_guard.estimate_bytes(rewritten, bq) == 10
+        assert bq.dry_run.call_count == 2
+
+        # unchanged SQL: nothing to compare
+        prune_stage(rewritten, bq)
+        assert bq.dry_run.call_count == 2
+
+    def test_log_can_be_turned_off(self, monkeypatch):
+        monkeypatch.setattr(sql_rewrite, "LOG_REWRITE_BYTES", False)
+        bq = Mock()
+        assert prune_stage(self.SQL, bq) != self.SQL
+        bq.dry_run.assert_not_called()
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,174 @@
+"""
+Unit tests for answering roll-up queries from cached finer-grained results (subsumption)
+"""
+import pytest
+from datetime import date, datetime, timezone
+
+pytest.importorskip("sqlglot")
+
+from backend.flow_manager_agent.utils import cache
+from backend.flow_manager_agent.utils.cache import CacheService, cache_stats
+from backend.flow_manager_agent.utils.cache_backends import MemoryBackend
+from backend.flow_manager_agent.utils.subsumption import (
+    RollupIndex, rollup_shape, can_derive, derive_rows, complete_breakdown, intent_matches,
+)
+
+RAW = "practicode-2025.clicks_data_prac.partial_encoded_clicks_part"
+DAY = "event_time >= TIMESTAMP('2025-10-24 00:00:00') AND event_time <= TIMESTAMP('2025-10-24 23:59:59')"
+
+BY_SOURCE = (
+    f"SELECT media_source, SUM(total_events) AS total_events FROM `{RAW}` WHERE {DAY} "
+    f"GROUP BY media_source ORDER BY total_events DESC LIMIT 100"
+)
+BY_SOURCE_APP = (
+    f"SELECT media_source, app_id, SUM(total_events) AS total_events FROM `{RAW}` WHERE {DAY} "
+    f"GROUP BY media_source, app_id ORDER BY total_events DESC LIMIT 100"
+)
+GRAND_TOTAL = f"SELECT SUM(total_events) AS total_events FROM `{RAW}` WHERE {DAY}"
+ONE_SOURCE = f"SELECT SUM(total_events) AS total_events FROM `{RAW}` WHERE {DAY} AND media_source = 'google'"
+TOP_APP = (
+    f"WITH agg AS (SELECT app_id, SUM(total_events) AS total_events FROM `{RAW}` WHERE {DAY} GROUP BY app_id) "
+    f"SELECT * FROM agg WHERE total_events = (SELECT MAX(total_events) FROM agg) ORDER BY total_events DESC"
+)
+
+ROWS = [
+    {"media_source": "google", "app_id": "a1", "total_events": 10},
+    {"media_source": "google", "app_id": "a2", "total_events": 5},
+    {"media_source": "meta", "app_id": "a1", "total_events": 7},
+    {"media_source": "tiktok", "app_id": "a2", "total_events": 1},
+]
+
+
+class TestShape:
+
+    def test_grouped_rollup(self):
+        shape = rollup_shape(BY_SOURCE)
+        assert shape["dims"] == ["media_source"]
+        assert shape["measure"] == "total_events"
+        assert shape["days"] == (date(2025, 10, 24), date(2025, 10, 24))
+        assert shape["order"] == [("total_events", True)] and shape["limit"] == 100
+
+    def test_filters_and_agg_table_dates(self):
+        shape = rollup_shape(
+            "SELECT SUM(total_events) AS total_events FROM `practicode-2025.clicks_data_prac.daily_clicks` "
+            "WHERE event_date BETWEEN '2025-10-20' AND '2025-10-24' AND hr = 3 AND is_retargeting = TRUE"
+        )
+        assert shape["filters"] == {"hr": "3", "is_retargeting": "true"}
+        assert shape["days"] == (date(2025, 10, 20), date(2025, 10, 24))
+
+    def test_find_top(self):
+        shape = rollup_shape(TOP_APP)
+        assert shape["pick"] == "max" and shape["dims"] == ["app_id"]
+
+    @pytest.mark.parametrize("sql", [
+        f"SELECT media_source, COUNT(*) AS n FROM `{RAW}` WHERE {DAY} GROUP BY media_source",
+        f"SELECT SUM(total_events) AS t FROM `{RAW}` WHERE {DAY} AND (hr = 1 OR hr = 2)",
+        f"SELECT SUM(total_events) AS t FROM `{RAW}` WHERE event_time >= TIMESTAMP('2025-10-24 12:00:00')",
+        "SELECT SUM(total_events) AS t FROM `other-project.ds.t`",
+    ])
+    def test_ineligible(self, sql):
+        assert rollup_shape(sql) is None
+
+
+class TestDerivation:
+
+    def test_subset_rules(self):
+        src = rollup_shape(BY_SOURCE)
+        assert can_derive(src, rollup_shape(GRAND_TOTAL))
+        assert can_derive(src, rollup_shape(ONE_SOURCE))
+        # needs app_id, which the source grouped away
+        assert not can_derive(src, rollup_shape(TOP_APP))
+        # other dates
+        assert not can_derive(src, rollup_shape(GRAND_TOTAL.replace("2025-10-24", "2025-10-25")))
+
+    def test_filter_and_reaggregate(self):
+        src = rollup_shape(BY_SOURCE_APP)
+        assert derive_rows(src, ROWS, rollup_shape(GRAND_TOTAL)) == [{"total_events": 23}]
+        assert derive_rows(src, ROWS, rollup_shape(ONE_SOURCE)) == [{"total_events": 15}]
+        assert derive_rows(src, ROWS, rollup_shape(BY_SOURCE)) == [
+            {"media_source": "google", "total_events": 15},
+            {"media_source": "meta", "total_events": 7},
+            {"media_source": "tiktok", "total_events": 1},
+        ]
+        assert derive_rows(src, ROWS, rollup_shape(TOP_APP)) == [{"app_id": "a1", "total_events": 17}]
+
+    def test_no_matching_rows_is_one_null_row(self):
+        src = rollup_shape(BY_SOURCE_APP)
+        req = rollup_shape(ONE_SOURCE.replace("'google'", "'snap'"))
+        assert derive_rows(src, ROWS, req) == [{"total_events": None}]
+
+    def test_only_complete_breakdowns_are_sources(self):
+        assert complete_breakdown(rollup_shape(BY_SOURCE), 99)
+        assert not complete_breakdown(rollup_shape(BY_SOURCE), 100)   # may have been cut by LIMIT
+        assert not complete_breakdown(rollup_shape(TOP_APP), 1)
+
+    def test_parsed_intent_must_agree_with_sql(self):
+        shape = rollup_shape(ONE_SOURCE)
+        intent = {
+            "intent": "analytics", "metric": "total_events", "dimensions": [],
+            "filters": {"media_source": "google"},
+            "date_range": {"start_date": "2025-10-24", "end_date": "2025-10-24"},
+        }
+        assert intent_matches(intent, shape)
+        assert not intent_matches({**intent, "filters": {}}, shape)
+        assert not intent_matches({**intent, "intent": "compare"}, shape)
+
+
+class TestCacheSubsumption:
+
+    @pytest.fixture(autouse=True)
+    def memory_only(self, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_READ_THROUGH", False)
+        monkeypatch.setattr(cache, "CACHE_VALIDITY", "ttl")
+        monkeypatch.setattr(CacheService, "rollups", RollupIndex())
+        CacheService.memory.clear()
+        yield
+        CacheService.memory.clear()
+
+    def service(self):
+        return CacheService(backend=MemoryBackend())
+
+    def seed(self, key, sql, rows, truncated=False):
+        self.service()._memory_put(
+            key, rows=rows, sql=sql, last_updated=datetime.now(timezone.utc), size=100, validity=None,
+            truncated=truncated,
+        )
+
+    def test_rollup_is_answered_without_bigquery(self):
+        self.seed("by_source_app", BY_SOURCE_APP, ROWS)
+        cs = self.service()
+
+        def runner(sql):
+            raise AssertionError("should be derived")
+
+        rows, from_cache = cs.run_or_cache(intent_key="total", sql=GRAND_TOTAL, run_bigquery_fn=runner)
+        assert (rows, from_cache, cs.served_derived) == ([{"total_events": 23}], True, True)
+        assert cache_stats()["subsumption"]["derived"] == 1
+
+    def test_evicted_source_is_not_used(self):
+        self.seed("by_source_app", BY_SOURCE_APP, ROWS)
+        CacheService.memory.invalidate("by_source_app")
+        cs = self.service()
+        rows, from_cache = cs.run_or_cache(
+            intent_key="total", sql=GRAND_TOTAL, run_bigquery_fn=lambda s: [{"total_events": 99}]
+        )
+        assert (rows, from_cache, cs.served_derived) == ([{"total_events": 99}], False, False)
+
+    def test_truncated_result_is_not_a_source(self):
+        self.seed("by_source_app", BY_SOURCE_APP, ROWS, truncated=True)
+        cs = self.service()
+        cs.run_or_cache(intent_key="by_source_app", sql=BY_SOURCE_APP, run_bigquery_fn=lambda s: [])
+        assert cs.served_truncated  # still flagged when served from the cache
+
+        rows, from_cache = cs.run_or_cache(
+            intent_key="total", sql=GRAND_TOTAL, run_bigquery_fn=lambda s: [{"total_events": 99}]
+        )
+        assert (rows, from_cache, cs.served_derived, cs.served_truncated) == ([{"total_events": 99}], False, False, False)
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(cache, "CACHE_SUBSUMPTION", False)
+        self.seed("by_source_app", BY_SOURCE_APP, ROWS)
+        rows, from_cache = self.service().run_or_cache(
+            intent_key="total", sql=GRAND_TOTAL, run_bigquery_fn=lambda s: [{"total_events": 99}]
+        )
+        assert from_cache is False